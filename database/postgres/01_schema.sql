@@ -3,6 +3,9 @@
 
 -- Extensions
 CREATE EXTENSION IF NOT EXISTS pgcrypto; -- for gen_random_uuid()
+CREATE EXTENSION IF NOT EXISTS cube;          -- earthdistance の前提
+CREATE EXTENSION IF NOT EXISTS earthdistance; -- ll_to_earth / earth_box / earth_distance（近くの教室検索）
+CREATE EXTENSION IF NOT EXISTS btree_gist;    -- category と位置の複合 GiST
 
 -- Enums
 DO $$
@@ -77,7 +80,8 @@ CREATE TABLE IF NOT EXISTS schools (
   description TEXT,
   image_key   TEXT,
   location    POINT,
-  created_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+  created_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
 );
 
 CREATE TABLE IF NOT EXISTS instructors (
@@ -95,7 +99,8 @@ CREATE TABLE IF NOT EXISTS classes (
   title        TEXT NOT NULL,
   capacity     INTEGER NOT NULL CHECK (capacity > 0),
   duration_min INTEGER NOT NULL CHECK (duration_min > 0),
-  created_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+  created_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at   TIMESTAMPTZ NOT NULL DEFAULT now()
 );
 
 CREATE TABLE IF NOT EXISTS lesson_schedules (
@@ -104,6 +109,7 @@ CREATE TABLE IF NOT EXISTS lesson_schedules (
   instructor_id UUID NOT NULL REFERENCES instructors(id) ON DELETE RESTRICT,
   start_at      TIMESTAMPTZ NOT NULL,
   end_at        TIMESTAMPTZ NOT NULL,
+  reserved      INTEGER NOT NULL DEFAULT 0 CHECK (reserved >= 0),
   created_at    TIMESTAMPTZ NOT NULL DEFAULT now(),
   CONSTRAINT lesson_time_valid CHECK (end_at > start_at),
   CONSTRAINT lesson_unique_per_class_start UNIQUE (class_id, start_at)
@@ -117,7 +123,8 @@ CREATE TABLE IF NOT EXISTS subscriptions (
   current_period_start   TIMESTAMPTZ,
   current_period_end     TIMESTAMPTZ,
   stripe_subscription_id TEXT UNIQUE,
-  created_at             TIMESTAMPTZ NOT NULL DEFAULT now()
+  created_at             TIMESTAMPTZ NOT NULL DEFAULT now(),
+  stripe_event_at        TIMESTAMPTZ
 );
 
 CREATE TABLE IF NOT EXISTS payments (
@@ -128,7 +135,8 @@ CREATE TABLE IF NOT EXISTS payments (
   currency                  TEXT NOT NULL,
   status                    payment_status NOT NULL,
   created_at                TIMESTAMPTZ NOT NULL DEFAULT now(),
-  meta                      JSONB
+  meta                      JSONB,
+  stripe_event_at           TIMESTAMPTZ
 );
 
 CREATE TABLE IF NOT EXISTS webhook_events (
@@ -137,7 +145,11 @@ CREATE TABLE IF NOT EXISTS webhook_events (
   type          TEXT NOT NULL,
   payload       JSONB NOT NULL,
   received_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
-  processed_at  TIMESTAMPTZ
+  processed_at  TIMESTAMPTZ,
+  customer_id   TEXT,
+  event_created TIMESTAMPTZ,
+  attempts      INTEGER NOT NULL DEFAULT 0,
+  last_error    TEXT
 );
 
 CREATE TABLE IF NOT EXISTS ticket_balances (
@@ -145,6 +157,7 @@ CREATE TABLE IF NOT EXISTS ticket_balances (
   family_id  UUID NOT NULL REFERENCES families(id) ON DELETE CASCADE,
   month      DATE NOT NULL,
   balance    INTEGER NOT NULL CHECK (balance >= 0),
+  granted    INTEGER NOT NULL DEFAULT 0 CHECK (granted >= 0),
   created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
   CONSTRAINT ticket_balance_unique UNIQUE (family_id, month)
 );
@@ -171,7 +184,14 @@ CREATE TABLE IF NOT EXISTS conversations (
   booking_id  UUID REFERENCES bookings(id) ON DELETE SET NULL,
   family_id   UUID REFERENCES families(id) ON DELETE SET NULL,
   school_id   UUID REFERENCES schools(id) ON DELETE SET NULL,
-  created_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+  created_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+  activity_at          TIMESTAMPTZ NOT NULL DEFAULT now(),
+  last_message_id      UUID,
+  last_message_at      TIMESTAMPTZ,
+  last_sender_user_id  UUID,
+  last_body            TEXT,
+  family_unread        INTEGER NOT NULL DEFAULT 0 CHECK (family_unread >= 0),
+  school_unread        INTEGER NOT NULL DEFAULT 0 CHECK (school_unread >= 0)
 );
 
 CREATE TABLE IF NOT EXISTS messages (
@@ -189,7 +209,8 @@ CREATE TABLE IF NOT EXISTS points_transactions (
   type        points_transaction_type NOT NULL,
   amount      INTEGER NOT NULL,
   created_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
-  meta        JSONB
+  meta        JSONB,
+  xid         xid8 NOT NULL DEFAULT pg_current_xact_id()
 );
 
 CREATE TABLE IF NOT EXISTS referrals (
@@ -208,12 +229,501 @@ CREATE INDEX IF NOT EXISTS idx_classes_school ON classes(school_id);
 CREATE INDEX IF NOT EXISTS idx_schedules_class ON lesson_schedules(class_id);
 CREATE INDEX IF NOT EXISTS idx_schedules_instructor_start ON lesson_schedules(instructor_id, start_at);
 CREATE INDEX IF NOT EXISTS idx_bookings_user ON bookings(user_id);
+CREATE INDEX IF NOT EXISTS idx_bookings_user_created ON bookings(user_id, created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_bookings_schedule ON bookings(schedule_id);
 CREATE INDEX IF NOT EXISTS idx_conversations_family ON conversations(family_id);
 CREATE INDEX IF NOT EXISTS idx_conversations_school ON conversations(school_id);
-CREATE INDEX IF NOT EXISTS idx_messages_conversation_created ON messages(conversation_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_keyset ON messages(conversation_id, created_at, id);
 CREATE INDEX IF NOT EXISTS idx_points_family_created ON points_transactions(family_id, created_at);
 CREATE INDEX IF NOT EXISTS idx_payments_family_created ON payments(family_id, created_at);
 CREATE INDEX IF NOT EXISTS idx_ticket_balances_family_month ON ticket_balances(family_id, month);
+-- 近くの教室（location は point(経度, 緯度)）。earth_box の範囲検索と <-> の k 近傍に使う
+CREATE INDEX IF NOT EXISTS idx_schools_earth ON schools USING gist (ll_to_earth(location[1], location[0]));
+CREATE INDEX IF NOT EXISTS idx_schools_category_earth ON schools USING gist (category, ll_to_earth(location[1], location[0]));
+
+
+
+-- キーワード検索（教室・クラス）。日本語は空白で区切れないため、正規化した文字列の 2-gram を
+-- text[] に持ち GIN（転置索引）で引く。pg_trgm は 3-gram で「英語」「書道」のような2文字語に効かないため使わない
+-- 正規化: NFKC（全角英数・半角カナを揃える）+ 小文字 + ひらがな→カタカナ
+CREATE OR REPLACE FUNCTION naraigoto_norm(t TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT translate(lower(normalize(coalesce(t, ''), NFKC)),
+    'ぁあぃいぅうぇえぉおかがきぎくぐけげこごさざしじすずせぜそぞただちぢっつづてでとどなにぬねのはばぱひびぴふぶぷへべぺほぼぽまみむめもゃやゅゆょよらりるれろゎわゐゑをんゔゕゖ',
+    'ァアィイゥウェエォオカガキギクグケゲコゴサザシジスズセゼソゾタダチヂッツヅテデトドナニヌネノハバパヒビピフブプヘベペホボポマミムメモャヤュユョヨラリルレロヮワヰヱヲンヴヵヶ')
+$$;
+
+-- 語（空白・記号で区切る。長音「ー」は語の一部）
+CREATE OR REPLACE FUNCTION naraigoto_terms(t TEXT) RETURNS TEXT[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT array_remove(regexp_split_to_array(naraigoto_norm(t), '[[:space:][:punct:]、。・「」『』【】]+'), '')
+$$;
+
+-- 各語の 2-gram（重複なし）。1文字の語は含めない
+CREATE OR REPLACE FUNCTION naraigoto_bigrams(t TEXT) RETURNS TEXT[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT coalesce(array_agg(DISTINCT substr(w, i, 2)), '{}')
+    FROM unnest(naraigoto_terms(t)) AS w, generate_series(1, length(w) - 1) AS i
+$$;
+
+-- 検索用ドキュメント: 教室（名前・紹介文・エリア・カテゴリ・講師の名前とプロフィール）と
+-- クラス（タイトル・教室名・エリア・カテゴリ）。元の行の変更はトリガで差分反映する
+CREATE TABLE IF NOT EXISTS search_documents (
+  doc_type    TEXT NOT NULL CHECK (doc_type IN ('school', 'class')),
+  doc_id      UUID NOT NULL,
+  school_id   UUID NOT NULL,
+  title       TEXT NOT NULL,
+  area        TEXT,
+  category    TEXT,
+  title_norm  TEXT NOT NULL,
+  body_norm   TEXT NOT NULL,
+  bigrams     TEXT[] NOT NULL,
+  boost       REAL NOT NULL DEFAULT 0,  -- 人気度などの加点（外部の集計で更新）
+  updated_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (doc_type, doc_id)
+);
+CREATE INDEX IF NOT EXISTS idx_search_bigrams ON search_documents USING gin (bigrams);
+-- 入力補完（タイトルの前方一致）
+CREATE INDEX IF NOT EXISTS idx_search_title_prefix ON search_documents (title_norm text_pattern_ops);
+
+CREATE OR REPLACE FUNCTION search_refresh_schools(ids UUID[]) RETURNS void
+LANGUAGE sql AS $$
+  INSERT INTO search_documents (doc_type, doc_id, school_id, title, area, category, title_norm, body_norm, bigrams)
+  SELECT 'school', s.id, s.id, s.name, s.area, s.category, naraigoto_norm(s.name), naraigoto_norm(b.body),
+         naraigoto_bigrams(concat_ws(' ', s.name, b.body))
+    FROM schools s
+   CROSS JOIN LATERAL (
+         SELECT concat_ws(' ', s.area, s.category, s.description,
+                          string_agg(concat_ws(' ', i.name, i.profile), ' ')) AS body
+           FROM instructors i WHERE i.school_id = s.id) b
+   WHERE s.id = ANY(ids)
+  ON CONFLICT (doc_type, doc_id) DO UPDATE
+     SET school_id = EXCLUDED.school_id, title = EXCLUDED.title, area = EXCLUDED.area, category = EXCLUDED.category,
+         title_norm = EXCLUDED.title_norm, body_norm = EXCLUDED.body_norm, bigrams = EXCLUDED.bigrams, updated_at = now();
+$$;
+
+CREATE OR REPLACE FUNCTION search_refresh_classes(ids UUID[]) RETURNS void
+LANGUAGE sql AS $$
+  INSERT INTO search_documents (doc_type, doc_id, school_id, title, area, category, title_norm, body_norm, bigrams)
+  SELECT 'class', c.id, c.school_id, c.title, s.area, s.category, naraigoto_norm(c.title),
+         naraigoto_norm(concat_ws(' ', s.name, s.area, s.category)),
+         naraigoto_bigrams(concat_ws(' ', c.title, s.name, s.area, s.category))
+    FROM classes c JOIN schools s ON s.id = c.school_id
+   WHERE c.id = ANY(ids)
+  ON CONFLICT (doc_type, doc_id) DO UPDATE
+     SET school_id = EXCLUDED.school_id, title = EXCLUDED.title, area = EXCLUDED.area, category = EXCLUDED.category,
+         title_norm = EXCLUDED.title_norm, body_norm = EXCLUDED.body_norm, bigrams = EXCLUDED.bigrams, updated_at = now();
+$$;
+
+-- 文単位のトリガ（COPY / 一括 INSERT でも1文につき1回）。検索対象の列が変わった行だけ反映する
+CREATE OR REPLACE FUNCTION search_schools_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    -- クラスは FK の ON DELETE CASCADE で classes 側のトリガが消す
+    DELETE FROM search_documents d USING old_rows o WHERE d.doc_type = 'school' AND d.doc_id = o.id;
+  ELSIF TG_OP = 'INSERT' THEN
+    PERFORM search_refresh_schools(ARRAY(SELECT id FROM new_rows));
+  ELSE
+    PERFORM search_refresh_schools(ARRAY(
+      SELECT n.id FROM new_rows n JOIN old_rows o ON o.id = n.id
+       WHERE (n.name, n.description, n.area, n.category) IS DISTINCT FROM (o.name, o.description, o.area, o.category)));
+    PERFORM search_refresh_classes(ARRAY(
+      SELECT c.id FROM classes c JOIN new_rows n ON n.id = c.school_id JOIN old_rows o ON o.id = n.id
+       WHERE (n.name, n.area, n.category) IS DISTINCT FROM (o.name, o.area, o.category)));
+  END IF;
+  RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION search_classes_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    DELETE FROM search_documents d USING old_rows o WHERE d.doc_type = 'class' AND d.doc_id = o.id;
+  ELSIF TG_OP = 'INSERT' THEN
+    PERFORM search_refresh_classes(ARRAY(SELECT id FROM new_rows));
+  ELSE
+    PERFORM search_refresh_classes(ARRAY(
+      SELECT n.id FROM new_rows n JOIN old_rows o ON o.id = n.id
+       WHERE (n.title, n.school_id) IS DISTINCT FROM (o.title, o.school_id)));
+  END IF;
+  RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION search_instructors_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM search_refresh_schools(ARRAY(SELECT DISTINCT school_id FROM new_rows));
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM search_refresh_schools(ARRAY(SELECT DISTINCT school_id FROM old_rows));
+  ELSE
+    PERFORM search_refresh_schools(ARRAY(
+      SELECT DISTINCT x.school_id FROM new_rows n JOIN old_rows o ON o.id = n.id,
+             LATERAL (VALUES (n.school_id), (o.school_id)) AS x(school_id)
+       WHERE (n.name, n.profile, n.school_id) IS DISTINCT FROM (o.name, o.profile, o.school_id)));
+  END IF;
+  RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS search_schools_ins ON schools;
+DROP TRIGGER IF EXISTS search_schools_upd ON schools;
+DROP TRIGGER IF EXISTS search_schools_del ON schools;
+CREATE TRIGGER search_schools_ins AFTER INSERT ON schools REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION search_schools_changed();
+CREATE TRIGGER search_schools_upd AFTER UPDATE ON schools REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION search_schools_changed();
+CREATE TRIGGER search_schools_del AFTER DELETE ON schools REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION search_schools_changed();
+
+DROP TRIGGER IF EXISTS search_classes_ins ON classes;
+DROP TRIGGER IF EXISTS search_classes_upd ON classes;
+DROP TRIGGER IF EXISTS search_classes_del ON classes;
+CREATE TRIGGER search_classes_ins AFTER INSERT ON classes REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION search_classes_changed();
+CREATE TRIGGER search_classes_upd AFTER UPDATE ON classes REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION search_classes_changed();
+CREATE TRIGGER search_classes_del AFTER DELETE ON classes REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION search_classes_changed();
+
+DROP TRIGGER IF EXISTS search_instructors_ins ON instructors;
+DROP TRIGGER IF EXISTS search_instructors_upd ON instructors;
+DROP TRIGGER IF EXISTS search_instructors_del ON instructors;
+CREATE TRIGGER search_instructors_ins AFTER INSERT ON instructors REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION search_instructors_changed();
+CREATE TRIGGER search_instructors_upd AFTER UPDATE ON instructors REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION search_instructors_changed();
+CREATE TRIGGER search_instructors_del AFTER DELETE ON instructors REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION search_instructors_changed();
+
+-- 全件作り直し（トリガ導入前のデータ・boost は保持）: SELECT search_rebuild();
+CREATE OR REPLACE FUNCTION search_rebuild() RETURNS BIGINT
+LANGUAGE plpgsql AS $$
+BEGIN
+  DELETE FROM search_documents d
+   WHERE (d.doc_type = 'school' AND NOT EXISTS (SELECT 1 FROM schools s WHERE s.id = d.doc_id))
+      OR (d.doc_type = 'class' AND NOT EXISTS (SELECT 1 FROM classes c WHERE c.id = d.doc_id));
+  PERFORM search_refresh_schools(ARRAY(SELECT id FROM schools));
+  PERFORM search_refresh_classes(ARRAY(SELECT id FROM classes));
+  RETURN (SELECT count(*) FROM search_documents);
+END $$;
+
+-- 残り席数の読み取りモデル: lesson_schedules.reserved（キャンセル以外の予約数）を bookings の文単位トリガで
+-- 予約・キャンセルと同じトランザクション内に更新する。残り席数 = classes.capacity - reserved で、bookings は数えない。
+-- クラスの期間検索は UNIQUE (class_id, start_at) の索引で開始日時順に引く
+ALTER TABLE lesson_schedules ADD COLUMN IF NOT EXISTS reserved INTEGER NOT NULL DEFAULT 0 CHECK (reserved >= 0);
+
+CREATE OR REPLACE FUNCTION schedules_reserved_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE lesson_schedules s SET reserved = s.reserved + d.n
+      FROM (SELECT schedule_id, count(*) AS n FROM new_rows WHERE status <> 'canceled' GROUP BY schedule_id) d
+     WHERE s.id = d.schedule_id;
+  ELSIF TG_OP = 'DELETE' THEN
+    UPDATE lesson_schedules s SET reserved = s.reserved - d.n
+      FROM (SELECT schedule_id, count(*) AS n FROM old_rows WHERE status <> 'canceled' GROUP BY schedule_id) d
+     WHERE s.id = d.schedule_id;
+  ELSE
+    UPDATE lesson_schedules s SET reserved = s.reserved + d.n
+      FROM (SELECT schedule_id, sum(n) AS n
+              FROM (SELECT schedule_id, 1 AS n FROM new_rows WHERE status <> 'canceled'
+                    UNION ALL
+                    SELECT schedule_id, -1 FROM old_rows WHERE status <> 'canceled') x
+             GROUP BY schedule_id HAVING sum(n) <> 0) d
+     WHERE s.id = d.schedule_id;
+  END IF;
+  RETURN NULL;
+END $$;
 
+DROP TRIGGER IF EXISTS schedules_reserved_ins ON bookings;
+DROP TRIGGER IF EXISTS schedules_reserved_upd ON bookings;
+DROP TRIGGER IF EXISTS schedules_reserved_del ON bookings;
+CREATE TRIGGER schedules_reserved_ins AFTER INSERT ON bookings REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION schedules_reserved_changed();
+CREATE TRIGGER schedules_reserved_upd AFTER UPDATE ON bookings REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION schedules_reserved_changed();
+CREATE TRIGGER schedules_reserved_del AFTER DELETE ON bookings REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION schedules_reserved_changed();
 
+-- 数え直し（トリガ導入前のデータ・不整合の確認用）。直した回数を返す: SELECT schedules_reserved_rebuild();
+CREATE OR REPLACE FUNCTION schedules_reserved_rebuild() RETURNS BIGINT
+LANGUAGE sql AS $$
+  WITH fixed AS (
+    UPDATE lesson_schedules s SET reserved = c.n
+      FROM (SELECT s2.id, count(b.id) FILTER (WHERE b.status <> 'canceled') AS n
+              FROM lesson_schedules s2 LEFT JOIN bookings b ON b.schedule_id = s2.id
+             GROUP BY s2.id) c
+     WHERE s.id = c.id AND s.reserved <> c.n
+    RETURNING 1)
+  SELECT count(*) FROM fixed;
+$$;
+
+-- DynamoDB の読み取りモデル（LessonsCatalog / SchoolsStats）への投影: Outbox（naraigoto.outbox）。
+-- アプリは RDS にだけ書き、schools / classes の変更は文単位のトリガが同じトランザクションで outbox に積む。
+-- リレーは FOR UPDATE SKIP LOCKED で行を取り、RDS の最新状態を読んで DynamoDB に書いてから行を消す。
+-- updated_at は行ごとに単調増加（行ロックで直列化された後の clock_timestamp()）で、投影側の版の比較に使う
+ALTER TABLE schools ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE classes ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  NEW.updated_at := greatest(clock_timestamp(), OLD.updated_at + interval '1 microsecond');
+  RETURN NEW;
+END $$;
+
+DROP TRIGGER IF EXISTS schools_touch ON schools;
+DROP TRIGGER IF EXISTS classes_touch ON classes;
+CREATE TRIGGER schools_touch BEFORE UPDATE ON schools FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+CREATE TRIGGER classes_touch BEFORE UPDATE ON classes FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+CREATE TABLE IF NOT EXISTS outbox (
+  id              BIGSERIAL PRIMARY KEY,
+  aggregate_type  TEXT NOT NULL CHECK (aggregate_type IN ('school', 'class')),
+  aggregate_id    UUID NOT NULL,
+  event_type      TEXT NOT NULL CHECK (event_type IN ('insert', 'update', 'delete')),
+  created_at      TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+-- 投影する列が変わった行だけ積む（教室の変更はリレー側でその教室のクラスにも反映する）
+CREATE OR REPLACE FUNCTION outbox_schools_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO outbox (aggregate_type, aggregate_id, event_type) SELECT 'school', id, 'insert' FROM new_rows;
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO outbox (aggregate_type, aggregate_id, event_type) SELECT 'school', id, 'delete' FROM old_rows;
+  ELSE
+    INSERT INTO outbox (aggregate_type, aggregate_id, event_type)
+    SELECT 'school', n.id, 'update' FROM new_rows n JOIN old_rows o ON o.id = n.id
+     WHERE (n.name, n.area, n.category, n.image_key, n.location::text)
+           IS DISTINCT FROM (o.name, o.area, o.category, o.image_key, o.location::text);
+  END IF;
+  RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION outbox_classes_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO outbox (aggregate_type, aggregate_id, event_type) SELECT 'class', id, 'insert' FROM new_rows;
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO outbox (aggregate_type, aggregate_id, event_type) SELECT 'class', id, 'delete' FROM old_rows;
+  ELSE
+    INSERT INTO outbox (aggregate_type, aggregate_id, event_type)
+    SELECT 'class', n.id, 'update' FROM new_rows n JOIN old_rows o ON o.id = n.id
+     WHERE (n.title, n.school_id, n.capacity, n.duration_min)
+           IS DISTINCT FROM (o.title, o.school_id, o.capacity, o.duration_min);
+  END IF;
+  RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS outbox_schools_ins ON schools;
+DROP TRIGGER IF EXISTS outbox_schools_upd ON schools;
+DROP TRIGGER IF EXISTS outbox_schools_del ON schools;
+CREATE TRIGGER outbox_schools_ins AFTER INSERT ON schools REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION outbox_schools_changed();
+CREATE TRIGGER outbox_schools_upd AFTER UPDATE ON schools REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION outbox_schools_changed();
+CREATE TRIGGER outbox_schools_del AFTER DELETE ON schools REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION outbox_schools_changed();
+
+DROP TRIGGER IF EXISTS outbox_classes_ins ON classes;
+DROP TRIGGER IF EXISTS outbox_classes_upd ON classes;
+DROP TRIGGER IF EXISTS outbox_classes_del ON classes;
+CREATE TRIGGER outbox_classes_ins AFTER INSERT ON classes REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION outbox_classes_changed();
+CREATE TRIGGER outbox_classes_upd AFTER UPDATE ON classes REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION outbox_classes_changed();
+CREATE TRIGGER outbox_classes_del AFTER DELETE ON classes REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION outbox_classes_changed();
+
+-- メッセージ（naraigoto.messaging）: 受信箱は conversations の要約列（最後のメッセージ・未読数）を読むだけにする。
+-- messages の文単位トリガが送信・既読・削除と同じトランザクションで要約を更新し、会話ごとに messages を数えない。
+-- 未読数は受け手の側ごと（family_unread = 教室からの未読、school_unread = 家庭からの未読）。
+-- activity_at は最後のメッセージ（なければ会話の作成）日時で、受信箱の並び順。
+-- メッセージの並びと既読・差分取得のカーソルは (conversation_id, created_at, id) の索引
+DROP INDEX IF EXISTS idx_messages_conversation_created;  -- idx_messages_conversation_keyset が兼ねる
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS activity_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS last_message_id UUID;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMPTZ;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS last_sender_user_id UUID;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS last_body TEXT;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS family_unread INTEGER NOT NULL DEFAULT 0 CHECK (family_unread >= 0);
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS school_unread INTEGER NOT NULL DEFAULT 0 CHECK (school_unread >= 0);
+-- 受信箱（新しい会話順のキーセット）
+CREATE INDEX IF NOT EXISTS idx_conversations_school_activity ON conversations(school_id, activity_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_conversations_family_activity ON conversations(family_id, activity_at DESC, id DESC);
+-- 未読だけ（既読にする UPDATE が読む）
+CREATE INDEX IF NOT EXISTS idx_messages_unread ON messages(conversation_id, created_at) WHERE read_at IS NULL;
+
+-- 送り手の側（教室 = school_owner / admin、それ以外は家庭）
+CREATE OR REPLACE FUNCTION naraigoto_side(r user_role) RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT CASE WHEN r IN ('school_owner', 'admin') THEN 'school' ELSE 'family' END;
+$$;
+
+CREATE OR REPLACE FUNCTION messages_summary_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE conversations c
+       SET family_unread = c.family_unread + d.to_family,
+           school_unread = c.school_unread + d.to_school
+      FROM (SELECT n.conversation_id,
+                   count(*) FILTER (WHERE naraigoto_side(u.type) = 'school') AS to_family,
+                   count(*) FILTER (WHERE naraigoto_side(u.type) = 'family') AS to_school
+              FROM new_rows n JOIN users u ON u.id = n.sender_user_id
+             WHERE n.read_at IS NULL
+             GROUP BY n.conversation_id) d
+     WHERE c.id = d.conversation_id;
+    UPDATE conversations c
+       SET last_message_id = l.id, last_message_at = l.created_at, last_sender_user_id = l.sender_user_id,
+           last_body = left(l.body, 200), activity_at = greatest(c.created_at, l.created_at)
+      FROM (SELECT DISTINCT ON (conversation_id) conversation_id, id, created_at, sender_user_id, body
+              FROM new_rows ORDER BY conversation_id, created_at DESC, id DESC) l
+     WHERE c.id = l.conversation_id
+       AND (c.last_message_id IS NULL OR (l.created_at, l.id) > (c.last_message_at, c.last_message_id));
+  ELSIF TG_OP = 'UPDATE' THEN
+    -- 既読・未読の切り替え
+    UPDATE conversations c
+       SET family_unread = c.family_unread + d.to_family,
+           school_unread = c.school_unread + d.to_school
+      FROM (SELECT x.conversation_id,
+                   coalesce(sum(x.n) FILTER (WHERE naraigoto_side(u.type) = 'school'), 0) AS to_family,
+                   coalesce(sum(x.n) FILTER (WHERE naraigoto_side(u.type) = 'family'), 0) AS to_school
+              FROM (SELECT conversation_id, sender_user_id, -1 AS n FROM old_rows WHERE read_at IS NULL
+                    UNION ALL
+                    SELECT conversation_id, sender_user_id, 1 FROM new_rows WHERE read_at IS NULL) x
+              JOIN users u ON u.id = x.sender_user_id
+             GROUP BY x.conversation_id HAVING sum(x.n) <> 0) d
+     WHERE c.id = d.conversation_id;
+  ELSE
+    -- 未読のまま消えた分を引き、最後のメッセージが消えたら1つ前を探す（まれ）
+    UPDATE conversations c
+       SET family_unread = c.family_unread - d.to_family,
+           school_unread = c.school_unread - d.to_school
+      FROM (SELECT o.conversation_id,
+                   count(*) FILTER (WHERE naraigoto_side(u.type) = 'school') AS to_family,
+                   count(*) FILTER (WHERE naraigoto_side(u.type) = 'family') AS to_school
+              FROM old_rows o JOIN users u ON u.id = o.sender_user_id
+             WHERE o.read_at IS NULL
+             GROUP BY o.conversation_id) d
+     WHERE c.id = d.conversation_id;
+    UPDATE conversations c
+       SET last_message_id = l.id, last_message_at = l.created_at, last_sender_user_id = l.sender_user_id,
+           last_body = left(l.body, 200)
+      FROM conversations c2
+      LEFT JOIN LATERAL (SELECT m.id, m.created_at, m.sender_user_id, m.body FROM messages m
+                          WHERE m.conversation_id = c2.id ORDER BY m.created_at DESC, m.id DESC LIMIT 1) l ON true
+     WHERE c.id = c2.id AND c.last_message_id IN (SELECT id FROM old_rows);
+  END IF;
+  RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS messages_summary_ins ON messages;
+DROP TRIGGER IF EXISTS messages_summary_upd ON messages;
+DROP TRIGGER IF EXISTS messages_summary_del ON messages;
+CREATE TRIGGER messages_summary_ins AFTER INSERT ON messages REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION messages_summary_changed();
+CREATE TRIGGER messages_summary_upd AFTER UPDATE ON messages REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION messages_summary_changed();
+CREATE TRIGGER messages_summary_del AFTER DELETE ON messages REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION messages_summary_changed();
+
+-- 数え直し（トリガ導入前のデータ・不整合の確認用）。直した会話数を返す: SELECT conversations_summary_rebuild();
+CREATE OR REPLACE FUNCTION conversations_summary_rebuild() RETURNS BIGINT
+LANGUAGE sql AS $$
+  WITH fixed AS (
+    UPDATE conversations c
+       SET last_message_id = l.id, last_message_at = l.created_at, last_sender_user_id = l.sender_user_id,
+           last_body = left(l.body, 200), activity_at = greatest(c.created_at, l.created_at),
+           family_unread = u.to_family, school_unread = u.to_school
+      FROM conversations c2
+      LEFT JOIN LATERAL (SELECT m.id, m.created_at, m.sender_user_id, m.body FROM messages m
+                          WHERE m.conversation_id = c2.id ORDER BY m.created_at DESC, m.id DESC LIMIT 1) l ON true
+      CROSS JOIN LATERAL (SELECT count(*) FILTER (WHERE naraigoto_side(us.type) = 'school') AS to_family,
+                                 count(*) FILTER (WHERE naraigoto_side(us.type) = 'family') AS to_school
+                            FROM messages m JOIN users us ON us.id = m.sender_user_id
+                           WHERE m.conversation_id = c2.id AND m.read_at IS NULL) u
+     WHERE c.id = c2.id
+       AND (c.last_message_id, c.activity_at, c.family_unread, c.school_unread)
+           IS DISTINCT FROM (l.id, greatest(c.created_at, l.created_at), u.to_family, u.to_school)
+    RETURNING 1)
+  SELECT count(*) FROM fixed;
+$$;
+
+-- Stripe Webhook（naraigoto.billing）: 受信は署名を確かめて webhook_events に INSERT ... ON CONFLICT DO NOTHING するだけで
+-- すぐ 200 を返し、ワーカーが未処理のイベントを顧客ごとに (event_created, id) 順でまとめて反映する。
+-- 同じ顧客のイベントはトランザクション単位の advisory lock で1つのワーカーだけが処理する。
+-- 遅れて届いた古いイベントは stripe_event_at（反映済みのイベント日時）より古ければ状態を巻き戻さない
+ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS customer_id TEXT;
+ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS event_created TIMESTAMPTZ;
+ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS last_error TEXT;
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS stripe_event_at TIMESTAMPTZ;
+ALTER TABLE payments ADD COLUMN IF NOT EXISTS stripe_event_at TIMESTAMPTZ;
+-- granted はその月にプランで付与した枚数。付与は granted との差分だけ balance に足す（何度実行しても1回分）
+ALTER TABLE ticket_balances ADD COLUMN IF NOT EXISTS granted INTEGER NOT NULL DEFAULT 0 CHECK (granted >= 0);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_pending ON webhook_events(customer_id, event_created, id)
+  WHERE processed_at IS NULL;
+
+-- プランごとの月間チケット数（料金ページと同じ）
+CREATE TABLE IF NOT EXISTS plans (
+  id                 TEXT PRIMARY KEY,
+  tickets_per_month  INTEGER NOT NULL CHECK (tickets_per_month >= 0)
+);
+INSERT INTO plans (id, tickets_per_month) VALUES ('free', 0), ('standard', 3), ('premium', 6)
+ON CONFLICT (id) DO NOTHING;
+
+-- 月次チケット付与（naraigoto.grants）: 有効な契約のプラン枚数まで ticket_balances を INSERT ... SELECT ... ON CONFLICT で
+-- まとめて付与する。families の UUID 範囲を segment に分け、各 segment を id のキーセット順にチャンクで進める。
+-- チャンクの付与と進捗（after_id）の更新は同じトランザクションなので、途中で止まっても続きから1回分だけ付与する
+CREATE INDEX IF NOT EXISTS idx_subscriptions_family_active ON subscriptions(family_id) INCLUDE (plan)
+  WHERE status = 'active';
+
+CREATE TABLE IF NOT EXISTS ticket_grant_progress (
+  month      DATE NOT NULL,
+  segment    INTEGER NOT NULL,
+  segments   INTEGER NOT NULL,
+  lower_id   UUID NOT NULL,              -- この segment は (lower_id, upper_id]
+  upper_id   UUID NOT NULL,
+  after_id   UUID NOT NULL,              -- 付与済みの最後の families.id（キーセットの再開位置）
+  families   INTEGER NOT NULL DEFAULT 0,
+  granted    INTEGER NOT NULL DEFAULT 0,
+  tickets    BIGINT NOT NULL DEFAULT 0,
+  chunks     INTEGER NOT NULL DEFAULT 0,
+  started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  done_at    TIMESTAMPTZ,
+  PRIMARY KEY (month, segment)
+);
+
+-- ポイント台帳（naraigoto.points）: points_transactions は追記のみ。残高 = points_balances（家庭ごとのスナップショット）
+-- + スナップショット以後の行の合計。各行は書いたトランザクションの xid を持ち、圧縮ジョブは実行中のどのトランザクション
+-- よりも古い行（xid < pg_snapshot_xmin）だけを畳んで through_xid を進める（後からコミットされる行を取りこぼさない）。
+-- 引き換え（redeem）は points_balances の行ロックの中で残高を確かめて負の行を書く
+ALTER TABLE points_transactions ADD COLUMN IF NOT EXISTS xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+CREATE INDEX IF NOT EXISTS idx_points_family_xid ON points_transactions(family_id, xid) INCLUDE (amount);
+CREATE INDEX IF NOT EXISTS idx_points_xid ON points_transactions(xid);
+-- 口コミ報酬は口コミ1件につき1回（ストリームの再処理は ON CONFLICT で捨てる）
+CREATE UNIQUE INDEX IF NOT EXISTS idx_points_review ON points_transactions((meta->>'reviewId'))
+  WHERE type = 'review';
+CREATE INDEX IF NOT EXISTS idx_families_parent ON families(parent_user_id);
+CREATE INDEX IF NOT EXISTS idx_family_members_child ON family_members(child_user_id);
+
+CREATE TABLE IF NOT EXISTS points_balances (
+  family_id   UUID PRIMARY KEY REFERENCES families(id) ON DELETE CASCADE,
+  balance     BIGINT NOT NULL DEFAULT 0,
+  through_xid xid8 NOT NULL DEFAULT '0',    -- xid < through_xid の行を balance に畳んである
+  updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- 前回の圧縮で畳み終えた xid（次の圧縮はこれ以後の行がある家庭だけを見る）
+CREATE TABLE IF NOT EXISTS points_compaction (
+  id         BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+  horizon    xid8 NOT NULL DEFAULT '0',
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO points_compaction DEFAULT VALUES ON CONFLICT (id) DO NOTHING;
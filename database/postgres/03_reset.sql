@@ -1,6 +1,37 @@
 -- Drop all Phase 2 objects (safe order), then optionally re-run 01_schema.sql
 
+-- Keyword search (tables below drop their triggers)
+DROP TABLE IF EXISTS search_documents CASCADE;
+DROP FUNCTION IF EXISTS search_rebuild();
+DROP FUNCTION IF EXISTS search_refresh_schools(UUID[]) CASCADE;
+DROP FUNCTION IF EXISTS search_refresh_classes(UUID[]) CASCADE;
+DROP FUNCTION IF EXISTS search_schools_changed() CASCADE;
+DROP FUNCTION IF EXISTS search_classes_changed() CASCADE;
+DROP FUNCTION IF EXISTS search_instructors_changed() CASCADE;
+DROP FUNCTION IF EXISTS naraigoto_bigrams(TEXT);
+DROP FUNCTION IF EXISTS naraigoto_terms(TEXT);
+DROP FUNCTION IF EXISTS naraigoto_norm(TEXT);
+
+-- Messaging (the messages triggers are dropped with the table)
+DROP FUNCTION IF EXISTS messages_summary_changed() CASCADE;
+DROP FUNCTION IF EXISTS conversations_summary_rebuild();
+DROP FUNCTION IF EXISTS naraigoto_side(user_role);
+
+-- Outbox (the schools / classes triggers are dropped with the tables)
+DROP TABLE IF EXISTS outbox CASCADE;
+DROP FUNCTION IF EXISTS outbox_schools_changed() CASCADE;
+DROP FUNCTION IF EXISTS outbox_classes_changed() CASCADE;
+DROP FUNCTION IF EXISTS touch_updated_at() CASCADE;
+
+-- Availability (the bookings triggers are dropped with the table)
+DROP FUNCTION IF EXISTS schedules_reserved_changed() CASCADE;
+DROP FUNCTION IF EXISTS schedules_reserved_rebuild();
+
 -- Tables (children first)
+DROP TABLE IF EXISTS points_compaction CASCADE;
+DROP TABLE IF EXISTS points_balances CASCADE;
+DROP TABLE IF EXISTS ticket_grant_progress CASCADE;
+DROP TABLE IF EXISTS plans CASCADE;
 DROP TABLE IF EXISTS messages CASCADE;
 DROP TABLE IF EXISTS conversations CASCADE;
 DROP TABLE IF EXISTS attendances CASCADE;
@@ -27,6 +58,6 @@ DO $$ BEGIN IF EXISTS (SELECT 1 FROM pg_type WHERE typname='payment_status') THE
 DO $$ BEGIN IF EXISTS (SELECT 1 FROM pg_type WHERE typname='subscription_status') THEN DROP TYPE subscription_status; END IF; END $$;
 DO $$ BEGIN IF EXISTS (SELECT 1 FROM pg_type WHERE typname='user_role') THEN DROP TYPE user_role; END IF; END $$;
 
--- Extension left installed intentionally (pgcrypto)
+-- Extensions left installed intentionally (pgcrypto, cube, earthdistance, btree_gist)
 
 
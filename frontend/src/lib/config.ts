@@ -96,6 +96,23 @@ export const API_ENDPOINTS = {
   LESSONS: {
     LIST: '/api/lessons',
     DETAIL: (id: string) => `/api/lessons/${id}`,
+    AVAILABILITY: (id: string) => `/api/lessons/${id}/availability`,
+  },
+  // 残り席数（回の一括取得）
+  AVAILABILITY: '/api/availability',
+  // キーワード検索・入力補完
+  SEARCH: {
+    QUERY: '/api/search',
+    SUGGEST: '/api/search/suggest',
+  },
+  // 人気ランキング（今週の人気。?area=&category=&limit=）
+  RANKINGS: '/api/rankings',
+  // メッセージ（受信箱・メッセージ・既読。since はロングポーリング）
+  CONVERSATIONS: {
+    LIST: '/api/conversations',
+    MESSAGES: (id: string) => `/api/conversations/${id}/messages`,
+    READ: (id: string) => `/api/conversations/${id}/read`,
+    READ_ALL: '/api/conversations/read',
   },
   // 予約
   BOOKINGS: {
@@ -122,6 +139,8 @@ export const API_ENDPOINTS = {
   LIKES: {
     LIST: '/api/likes',
     FAMILY: (familyId: string) => `/api/families/${familyId}/likes`,
+    CHECK: (userId: string) => `/api/users/${userId}/likes/check`,
+    BULK: '/api/likes/bulk',
   },
   // 決済
   BILLING: {
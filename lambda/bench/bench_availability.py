@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""カレンダー表示（--slots 回ぶんの残り席数）: 回ごとに読む素朴な実装と読み取りモデル（naraigoto.availability）の比較
+
+    python lambda/bench/bench_availability.py --slots 60 --latency-ms 5
+    python lambda/bench/bench_availability.py --slots 60 --dsn postgresql://postgres@localhost/naraigoto
+
+--lessons 件のレッスンにそれぞれ4週間で --slots 回の枠を作り、booking.book / cancel で予約を入れてから
+（座席カウンタは予約トランザクションが更新する）、1レッスンのカレンダー1ページを次の方法で --requests 回ずつ読む:
+  per-slot  … 回ごとに座席カウンタを GetItem（N+1）
+  batch     … availability.seats（scheduleId を BatchGetItem 1回）
+  range     … availability.slots（GSI lessonId-startAt を Query 1回）
+p50/p99・1ページあたりの呼び出し数・消費 RCU を出し、3通りの結果と Bookings の件数が一致することも確かめる。
+--dsn を指定すると PostgreSQL（ベンチ専用 DB。03_reset.sql で消える）で
+  count     … 回ごとに bookings を COUNT（これまでの実装）
+  count-join… 回の id 配列で bookings を JOIN して GROUP BY（1クエリだが予約を数える）
+  counter   … pg.availability（lesson_schedules.reserved を読むだけ）
+  range     … pg.class_slots（(class_id, start_at) の索引で期間を引く）
+を比べる。
+"""
+import os, sys, time, uuid, random, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+WEEK = 7 * 86400
+BASE = 1767225600  # 2026-01-01T00:00:00Z
+
+def _iso(epoch):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+
+def starts(n):
+    """4週間に n 回（1時間刻みで均等に）"""
+    step = 4 * WEEK // n // 3600 * 3600
+    return [_iso(BASE + 9 * 3600 + i * step) for i in range(n)]
+
+def seed(client, lessons, slots, capacity, fill):
+    """予約を入れて {scheduleId: 予約中の件数} を返す（一部はキャンセル）"""
+    from naraigoto import booking
+    rnd = random.Random(11)
+    expected, user = {}, 0
+    for l in range(lessons):
+        lesson_id = f"AV{l:03d}"
+        client.put_item(TableName=booking.LESSONS_TABLE, Item={"lessonId": lesson_id, "capacity": capacity})
+        for start_at in starts(slots):
+            sched = booking.schedule_id(lesson_id, start_at)
+            booking.init_seats(client, sched, lesson_id, start_at, capacity)
+            n = rnd.randint(0, int(capacity * fill)) if l == 0 else 0
+            ids = [booking.book(client, f"U{user + k}", lesson_id, start_at)["bookingId"] for k in range(n)]
+            user += n
+            canceled = [b for b in ids if rnd.random() < 0.2]
+            for b in canceled:
+                booking.cancel(client, b)
+            expected[sched] = n - len(canceled)
+    return expected
+
+def per_slot(client, ids):
+    from naraigoto import availability
+    out = {}
+    for s in ids:
+        it = client.get_item(TableName=availability.SEATS_TABLE, Key={"scheduleId": s, "sk": "SEATS"}).get("Item")
+        if it:
+            out[s] = availability.view(it)
+    return out
+
+def measure(name, fn, requests, meter):
+    lat_ms, calls, rcu = [], 0, 0.0
+    meter.take()
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        fn()
+        lat_ms.append((time.perf_counter() - t0) * 1000)
+        m = meter.take()
+        calls += sum(m["calls"].values())
+        rcu += m["rcu"]
+    print(f"{name:10s} p50={local.percentile(lat_ms, 50):8.2f}ms p99={local.percentile(lat_ms, 99):8.2f}ms "
+          f"calls/page={calls / requests:6.1f} rcu/page={rcu / requests:6.1f}")
+
+def run_pg(dsn, slots, capacity, fill, requests):
+    import bench_pg
+    from naraigoto import pg
+    if pg.psycopg is None:
+        raise SystemExit("psycopg が必要です（pip install 'psycopg[binary]'）")
+    pg.DSN = dsn
+    bench_pg.init(dsn)
+    rnd = random.Random(11)
+    ids = lambda kind, n: [str(uuid.uuid5(uuid.NAMESPACE_URL, f"naraigoto-availability/{kind}/{i}")) for i in range(n)]
+    school, instructor, klass = ids("school", 1)[0], ids("instructor", 1)[0], ids("class", 1)[0]
+    scheds, users = ids("schedule", slots), ids("user", capacity)
+    pg.execute("INSERT INTO schools (id, name, area, category) VALUES (%s, 'ベンチ教室', '杉並', 'dance')", (school,))
+    pg.execute("INSERT INTO instructors (id, school_id, name) VALUES (%s, %s, '講師')", (instructor, school))
+    pg.execute("INSERT INTO classes (id, school_id, title, capacity, duration_min) VALUES (%s, %s, 'ダンス', %s, 60)",
+               (klass, school, capacity))
+    pg.many("INSERT INTO users (id, type, email, name) VALUES (%s, 'parent', %s, %s)",
+            [(u, f"av{i}@example.com", f"保護者{i}") for i, u in enumerate(users)])
+    pg.many("INSERT INTO lesson_schedules (id, class_id, instructor_id, start_at, end_at) "
+            "VALUES (%s, %s, %s, %s::timestamptz, %s::timestamptz + interval '1 hour')",
+            [(s, klass, instructor, t, t) for s, t in zip(scheds, starts(slots))])
+    rows = [(u, s) for s in scheds for u in rnd.sample(users, rnd.randint(0, int(capacity * fill)))]
+    pg.many("INSERT INTO bookings (user_id, schedule_id) VALUES (%s, %s)", rows)
+    pg.execute("UPDATE bookings SET status = 'canceled' WHERE id IN (SELECT id FROM bookings TABLESAMPLE BERNOULLI (20))")
+    print(f"pg: {len(rows)} bookings on {slots} slots, rebuild fixed {pg.fetch_one('SELECT schedules_reserved_rebuild() AS n')['n']} rows")
+
+    count_one = "SELECT count(*) AS n FROM bookings WHERE schedule_id = %s AND status <> 'canceled'"
+    count_join = """
+        SELECT s.id AS schedule_id, c.capacity, count(b.id) FILTER (WHERE b.status <> 'canceled') AS booked
+          FROM lesson_schedules s JOIN classes c ON c.id = s.class_id LEFT JOIN bookings b ON b.schedule_id = s.id
+         WHERE s.id = ANY(%s::uuid[]) GROUP BY s.id, c.capacity"""
+    t0, t1 = starts(slots)[0], _iso(BASE + 4 * WEEK + 86400)
+    want = {str(r["schedule_id"]): r["booked"] for r in pg.fetch_all(count_join, (scheds,))}
+    assert {k: v["booked"] for k, v in pg.availability(scheds).items()} == want
+    assert {s["scheduleId"]: s["booked"] for s in pg.class_slots(klass, t0, t1)} == want
+    print("ok: counters match COUNT(*) on bookings")
+
+    with pg.connect(dsn) as conn:
+        def _run(name, fn, queries):
+            lat_ms = []
+            for _ in range(requests):
+                t = time.perf_counter()
+                fn()
+                lat_ms.append((time.perf_counter() - t) * 1000)
+            print(f"pg {name:10s} p50={local.percentile(lat_ms, 50):8.2f}ms p99={local.percentile(lat_ms, 99):8.2f}ms "
+                  f"queries/page={queries:4d}")
+
+        _run("count", lambda: [conn.execute(count_one, (s,), prepare=True).fetchone() for s in scheds], slots)
+        _run("count-join", lambda: conn.execute(count_join, (scheds,), prepare=True).fetchall(), 1)
+        _run("counter", lambda: conn.execute(pg.AVAILABILITY, (scheds,), prepare=True).fetchall(), 1)
+        _run("range", lambda: conn.execute(pg.CLASS_SLOTS, {"class_id": klass, "start": t0, "end": t1,
+                                                            "open_only": False}, prepare=True).fetchall(), 1)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--slots", type=int, default=60, help="カレンダー1ページの回数")
+    ap.add_argument("--lessons", type=int, default=20)
+    ap.add_argument("--capacity", type=int, default=10)
+    ap.add_argument("--fill", type=float, default=0.8, help="予約を入れる割合の上限（定員比）")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--latency-ms", type=float, default=0)
+    ap.add_argument("--dsn", help="PostgreSQL（lesson_schedules.reserved）も計測する")
+    ap.add_argument("--skip-dynamodb", action="store_true")
+    args = ap.parse_args()
+
+    os.environ["TICKET_DEBIT"] = "off"  # 座席だけを見る（チケット残高は用意しない）
+    if not args.skip_dynamodb:
+        local.start_dynamodb(separate_process=True)
+        try:
+            local.create_tables()
+            from naraigoto import runtime as rt, availability, booking
+            client = rt.client()
+            t0 = time.perf_counter()
+            expected = seed(client, args.lessons, args.slots, args.capacity, args.fill)
+            print(f"seeded {args.lessons} lessons x {args.slots} slots in {time.perf_counter() - t0:.1f}s")
+
+            ids = [booking.schedule_id("AV000", s) for s in starts(args.slots)]
+            want = {s: n for s, n in expected.items() if s in ids}
+            frm, to = starts(args.slots)[0], _iso(BASE + 4 * WEEK + 86400)
+            for got in (per_slot(client, ids), availability.seats(client, ids),
+                        {s["scheduleId"]: s for s in availability.slots(client, "AV000", frm, to)}):
+                assert {s: v["reserved"] for s, v in got.items()} == want, got
+            reserved = {s: 0 for s in ids}
+            for b in rt.table(booking.BOOKINGS_TABLE).scan()["Items"]:
+                if b["status"] == "reserved" and b["scheduleId"] in reserved:
+                    reserved[b["scheduleId"]] += 1
+            assert reserved == want
+            print(f"ok: per-slot / batch / range agree with Bookings ({sum(want.values())} reserved)")
+
+            meter = local.DdbMeter(client)
+            if args.latency_ms:
+                local.inject_latency(client, args.latency_ms)
+                print(f"injected latency: {args.latency_ms}ms / call")
+            measure("per-slot", lambda: per_slot(client, ids), args.requests, meter)
+            measure("batch", lambda: availability.seats(client, ids), args.requests, meter)
+            measure("range", lambda: availability.slots(client, "AV000", frm, to), args.requests, meter)
+        finally:
+            local.stop_dynamodb()
+    if args.dsn:
+        run_pg(args.dsn, args.slots, args.capacity, args.fill, args.requests)
+
+if __name__ == "__main__":
+    main()
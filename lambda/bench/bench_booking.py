@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""予約エンジンの同時実行スループット（満席クラスへの殺到）
+
+    python lambda/bench/bench_booking.py --requests 300 --capacity 10 --workers 64
+
+別々のユーザー（一部は同一ユーザーの二重送信）から同じスケジュールへ並列に予約し、
+スループット・レイテンシ・結果の内訳と、並列キャンセルの時間を出す。
+定員を超えない・キャンセルで座席とチケットが戻ることの検証は lambda/tests/test_booking.py。
+"""
+import os, sys, time, argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+LESSON_ID = "L-RUSH"
+START_AT = "2025-10-04T10:00:00Z"
+TICKETS = 3
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=300)
+    ap.add_argument("--capacity", type=int, default=10)
+    ap.add_argument("--workers", type=int, default=64)
+    ap.add_argument("--duplicate-every", type=int, default=5, help="N 件に1件を同一ユーザーの二重送信にする")
+    args = ap.parse_args()
+
+    os.environ.setdefault("DDB_MAX_POOL_CONNECTIONS", str(args.workers))
+    local.start_dynamodb()
+    try:
+        local.create_tables()
+        from naraigoto import runtime as rt, booking
+        client = rt.client()
+        n_users = args.requests - args.requests // max(args.duplicate_every, 1)
+        users = [f"U{i:05d}" for i in range(n_users)]
+        month = booking.ticket_month()
+        with rt.table("TicketBalances").batch_writer() as w:
+            for u in users:
+                w.put_item(Item={"userId": u, "month": month, "balance": TICKETS})
+        booking.init_seats(client, booking.schedule_id(LESSON_ID, START_AT), LESSON_ID, START_AT, args.capacity)
+
+        plan = [users[i % n_users] for i in range(args.requests)]
+
+        def attempt(user_id):
+            s = time.perf_counter()
+            try:
+                item = booking.book(client, user_id, LESSON_ID, START_AT, 1)
+                return "ok", item, time.perf_counter() - s
+            except booking.BookingError as e:
+                return e.code, None, time.perf_counter() - s
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(attempt, plan))
+        elapsed = time.perf_counter() - t0
+
+        outcome = Counter(code for code, _, _ in results)
+        lat = [d * 1000 for _, _, d in results]
+        booked = [item for code, item, _ in results if code == "ok"]
+        print(f"{args.requests} requests / {elapsed:.2f}s = {args.requests / elapsed:.1f} req/s "
+              f"p50={local.percentile(lat, 50):.1f}ms p99={local.percentile(lat, 99):.1f}ms")
+        print("outcomes:", dict(outcome))
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(lambda b: booking.cancel(client, b["bookingId"]), booked))
+        print(f"cancel {len(booked)} bookings in {time.perf_counter() - t0:.2f}s")
+    finally:
+        local.stop_dynamodb()
+
+if __name__ == "__main__":
+    main()
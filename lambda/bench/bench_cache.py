@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""レッスン詳細・口コミの読み取りキャッシュ: Zipf 分布の負荷でキャッシュあり/なしを比較
+
+    python lambda/bench/bench_cache.py --lessons 1000 --requests 5000 --zipf 1.1 --latency-ms 5
+
+人気順に偏ったアクセス（Zipf）で get_lesson_by_id / get_reviews を呼び、
+レイテンシ p50/p95/p99・ヒット率・DynamoDB 呼び出し回数を出す。
+--revalidate の割合で If-None-Match 付きの再検証（304）も混ぜる。
+"""
+import os, sys, time, json, random, bisect, argparse
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+def zipf_sampler(n, s, seed=7):
+    weights = [1.0 / (k ** s) for k in range(1, n + 1)]
+    cum, total = [], 0.0
+    for w in weights:
+        total += w
+        cum.append(total)
+    rnd = random.Random(seed)
+    return lambda: bisect.bisect_left(cum, rnd.random() * total)
+
+def seed_lessons(n, reviews_per_lesson):
+    from naraigoto import runtime as rt
+    with rt.table("Lessons").batch_writer() as w:
+        for i in range(n):
+            w.put_item(Item={"lessonId": f"L{i:05d}", "title": f"レッスン {i}", "area": "杉並",
+                             "genre": "dance", "description": "体験レッスンあり。" * 10})
+    for name, role in (("ParentReviews", "parent"), ("ChildReviews", "child")):
+        with rt.table(name).batch_writer() as w:
+            for i in range(min(n, 200)):
+                for j in range(reviews_per_lesson):
+                    w.put_item(Item={"lessonsId": f"L{i:05d}", "createdAt": f"2025-09-{1 + j % 28:02d}T10:{j % 60:02d}:00Z",
+                                     "reviewId": f"{role}-{i}-{j}", "userId": "u", "rating": Decimal(1 + j % 5),
+                                     "comment": "よかったです", "role": role})
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lessons", type=int, default=1000)
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--zipf", type=float, default=1.1)
+    ap.add_argument("--latency-ms", type=float, default=5)
+    ap.add_argument("--revalidate", type=float, default=0.2, help="If-None-Match 付きリクエストの割合")
+    args = ap.parse_args()
+
+    local.start_dynamodb()
+    try:
+        local.create_tables()
+        seed_lessons(args.lessons, 10)
+        from naraigoto import runtime as rt, cache
+        calls = {"n": 0}
+        def _count(**_):
+            calls["n"] += 1
+        rt.client().meta.events.register("before-send.dynamodb", _count)
+        local.inject_latency(rt.client(), args.latency_ms)
+        detail = local.load_handler(local.handler_path("get_lesson_by_id"))
+        reviews = local.load_handler(local.handler_path("get_reviews"))
+
+        sizes = {c.namespace: c.local.maxsize for c in (cache.LESSONS, cache.REVIEWS)}
+
+        def run(label, enabled):
+            for c in (cache.LESSONS, cache.REVIEWS):
+                c.local.maxsize = sizes[c.namespace] if enabled else 0
+                c.local._data.clear()
+                c.local.hits = c.local.misses = c.local.evictions = c.local.expired = 0
+                c.requests, c.shared_hits, c.hit_ms, c.load_ms = 0, 0, 0.0, 0.0
+            pick = zipf_sampler(args.lessons, args.zipf)
+            rnd = random.Random(11)
+            etags, lat, n304 = {}, [], 0
+            calls["n"] = 0
+            for i in range(args.requests):
+                lid = f"L{pick():05d}"
+                if i % 2:
+                    ev = local.http_event("GET", f"/lessons/{lid}", {"lessonId": lid})
+                    fn, key = detail, ("d", lid)
+                else:
+                    ev = local.http_event("GET", "/reviews", query={"lessonsId": lid})
+                    fn, key = reviews, ("r", lid)
+                if key in etags and rnd.random() < args.revalidate:
+                    ev["headers"] = {"if-none-match": etags[key]}
+                s = time.perf_counter()
+                r = fn(ev, None)
+                lat.append((time.perf_counter() - s) * 1000)
+                n304 += r["statusCode"] == 304
+                if r["headers"].get("ETag"):
+                    etags[key] = r["headers"]["ETag"]
+            print(f"{label:10s} p50={local.percentile(lat, 50):7.2f}ms p95={local.percentile(lat, 95):7.2f}ms "
+                  f"p99={local.percentile(lat, 99):7.2f}ms ddb_calls={calls['n']:6d} 304s={n304}")
+            if enabled:
+                for c in (cache.LESSONS, cache.REVIEWS):
+                    print("  ", json.dumps({"cache": c.namespace, **c.stats()}))
+
+        print(f"{args.requests} requests over {args.lessons} lessons, zipf s={args.zipf}, latency {args.latency_ms}ms/call")
+        run("no cache", False)
+        run("cache", True)
+    finally:
+        local.stop_dynamodb()
+
+if __name__ == "__main__":
+    main()
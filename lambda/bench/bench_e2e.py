@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""API Gateway イベントを全ハンドラへ再生する E2E ベンチ（コミット間の回帰検出用）
+
+    python lambda/bench/bench_e2e.py --latency-ms 10 --requests 200 --out e2e-after.json
+    python lambda/bench/bench_e2e.py --latency-ms 10 --compare e2e-before.json --out e2e-after.json
+
+イベント:
+  - 合成: local.default_events() を HTTP API(v2) / REST(v1) の両形式で。ボディのあるものは base64 版も
+  - 記録: events/*.json（{"handler", "event"}。API Gateway から取得した実イベントをそのまま置ける。
+    --events で別ディレクトリも指定可）
+post_booking は呼び出しごとに schedule をずらし、毎回新しい枠への予約として計測する。
+
+モード:
+  inprocess … ハンドラを同一プロセスで呼ぶ（応答の json.dumps まで含めて計測）
+  emulator  … lambda_emulator.py（関数ごとに1プロセス。init / 初回呼び出し / 往復時間も計測）
+DynamoDB は moto を別プロセスで起動する（AWS_ENDPOINT_URL_DYNAMODB 指定時は DynamoDB Local 等を使用）。
+--latency-ms でハンドラ側の各 API 呼び出しに遅延を入れる。
+
+1リクエストあたり p50/p95/p99・DynamoDB 呼び出し数（オペレーション別）・消費 RCU/WCU・
+メモリ確保のピーク（tracemalloc。遅延計測とは別パス）を JSON に出力する。
+inprocess では naraigoto.metrics の EMF を LocalSink で受け、フェーズ別（parse / validate / ddb /
+serialize）の p50 とリトライ数も出す（EMF の DynamoDB 呼び出し数が実際の呼び出し数と一致することも確認する）。
+--compare で以前のレポートと比べ、悪化があれば一覧を出して終了コード 1。
+moto は一部のオペレーション（BatchGetItem 等）しか ConsumedCapacity を返さないため、
+RCU/WCU の比較は DynamoDB Local（AWS_ENDPOINT_URL_DYNAMODB）で取ったレポート同士で行う。
+"""
+import os, sys, json, glob, time, base64, argparse, platform, subprocess, tracemalloc
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+EVENTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "events")
+EMULATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lambda_emulator.py")
+MODES = ("inprocess", "emulator")
+
+# --------- イベント ---------
+def _body(event):
+    raw = event.get("body")
+    if raw is None:
+        return None
+    if event.get("isBase64Encoded"):
+        raw = base64.b64decode(raw).decode("utf-8")
+    return json.loads(raw)
+
+def _set_body(event, body):
+    raw = json.dumps(body, ensure_ascii=False)
+    event["body"] = base64.b64encode(raw.encode("utf-8")).decode("ascii") if event.get("isBase64Encoded") else raw
+    return event
+
+_seq = Counter()
+
+def _replay(name, event):
+    """呼び出しごとに新しいイベントを返す関数（ハンドラがイベントを書き換えても次に影響しない）"""
+    raw = json.dumps(event, ensure_ascii=False)
+    if name != "post_booking":
+        return lambda: json.loads(raw)
+
+    def _next():
+        ev = json.loads(raw)
+        _seq[name] += 1
+        at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1767225600 + _seq[name] * 3600))
+        return _set_body(ev, dict(_body(ev), schedule=at))
+    return _next
+
+def workloads(handlers, events_dir=EVENTS_DIR):
+    """[(handler, label, next_event)]"""
+    base = local.default_events()
+    out = []
+    for name in handlers:
+        ev = base[name]
+        body = _body(ev)
+        args = (ev["requestContext"]["http"]["method"], ev["rawPath"], ev.get("pathParameters"),
+                ev.get("queryStringParameters"), body)
+        for version in (2, 1):
+            for b64 in ((False, True) if body is not None else (False,)):
+                label = f"v{version}" + ("-b64" if b64 else "")
+                out.append((name, label, _replay(name, local.http_event(*args, version=version, b64=b64))))
+    for path in sorted(glob.glob(os.path.join(events_dir, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            rec = json.load(f)
+        if rec["handler"] in handlers:
+            label = "rec:" + os.path.basename(path)[:-len(".json")]
+            out.append((rec["handler"], label, _replay(rec["handler"], rec["event"])))
+    return out
+
+# --------- 集計 ---------
+def summarize(lat, ddb, statuses, allocs, emf=None):
+    n = len(lat)
+    calls, rcu, wcu = Counter(), 0.0, 0.0
+    for d in ddb:
+        calls.update(d["calls"])
+        rcu += d["rcu"]
+        wcu += d["wcu"]
+    return {
+        "requests": n, "status": dict(Counter(str(s) for s in statuses)),
+        "p50_ms": round(local.percentile(lat, 50), 3), "p95_ms": round(local.percentile(lat, 95), 3),
+        "p99_ms": round(local.percentile(lat, 99), 3), "rps": round(n / (sum(lat) / 1000.0), 1) if n else 0,
+        "ddb_calls_per_req": round(sum(calls.values()) / n, 3) if n else 0,
+        "ddb_calls": {op: round(c / n, 3) for op, c in sorted(calls.items())},
+        "rcu_per_req": round(rcu / n, 3) if n else 0, "wcu_per_req": round(wcu / n, 3) if n else 0,
+        "alloc_peak_kb_p50": round(local.percentile(allocs, 50), 1),
+        "alloc_peak_kb_max": round(max(allocs), 1) if allocs else 0,
+        **(_emf_summary(emf) if emf else {}),
+    }
+
+def _emf_summary(records):
+    phases = {name: round(local.percentile([r[name] for r in records], 50), 3)
+              for name in ("ParseMs", "ValidateMs", "DynamoDBMs", "SerializeMs")}
+    return {"phase_p50_ms": phases,
+            "retries_per_req": round(sum(r["DynamoDBRetries"] for r in records) / len(records), 3)}
+
+# --------- inprocess ---------
+def _call(handler, event):
+    try:
+        resp = handler(event, None)
+        json.dumps(resp)
+        return resp.get("statusCode")
+    except Exception as e:
+        return type(e).__name__
+
+def run_inprocess(works, args):
+    from naraigoto import runtime as rt, metrics
+    client = rt.client()
+    meter = local.DdbMeter(client, capacity=not args.no_capacity)
+    sink = metrics.LocalSink()
+    metrics.set_sink(sink)
+    hook = local.inject_latency(client, args.latency_ms) if args.latency_ms else None
+    loaded, results = {}, {}
+    try:
+        for name, label, next_event in works:
+            if name not in loaded:
+                loaded[name] = local.load_handler(local.handler_path(name))
+            handler = loaded[name]
+            for _ in range(args.warmup):
+                _call(handler, next_event())
+            lat, ddb, statuses, allocs, emf = [], [], [], [], []
+            for _ in range(args.requests):
+                event = next_event()
+                meter.take()
+                sink.clear()
+                t0 = time.perf_counter()
+                statuses.append(_call(handler, event))
+                lat.append((time.perf_counter() - t0) * 1000)
+                ddb.append(meter.take())
+                records = sink.metrics()
+                assert len(records) == 1 and records[0]["DynamoDBCalls"] == sum(ddb[-1]["calls"].values()), \
+                    (name, label, records, ddb[-1])
+                emf.append(records[0])
+            tracemalloc.start()
+            for _ in range(args.alloc_requests):
+                event = next_event()
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                _call(handler, event)
+                allocs.append((tracemalloc.get_traced_memory()[1] - before) / 1024.0)
+            tracemalloc.stop()
+            results[f"{name}/{label}"] = summarize(lat, ddb, statuses, allocs, emf)
+    finally:
+        metrics.set_sink(None)
+        if hook:
+            client.meta.events.unregister("before-send.dynamodb", hook)
+    return results
+
+# --------- emulator ---------
+class Emulator:
+    def __init__(self, name, args):
+        cmd = [sys.executable, EMULATOR, "--function", name, "--memory", str(args.memory),
+               "--latency-ms", str(args.latency_ms)] + (["--no-capacity"] if args.no_capacity else [])
+        t0 = time.perf_counter()
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, text=True, env=os.environ)
+        self.init = json.loads(self.proc.stdout.readline())
+        self.init["spawn_ms"] = (time.perf_counter() - t0) * 1000
+
+    def invoke(self, event, alloc=False):
+        """(応答, 往復 ms)"""
+        t0 = time.perf_counter()
+        self.proc.stdin.write(json.dumps({"event": event, "alloc": alloc}, ensure_ascii=False) + "\n")
+        self.proc.stdin.flush()
+        r = json.loads(self.proc.stdout.readline())
+        return r, (time.perf_counter() - t0) * 1000
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+def _status(r):
+    return r["response"].get("statusCode") if "response" in r else r["error"]["errorType"]
+
+def run_emulator(works, args):
+    results, cold = {}, {}
+    by_name = {}
+    for w in works:
+        by_name.setdefault(w[0], []).append(w)
+    for name, ws in by_name.items():
+        emu = Emulator(name, args)
+        try:
+            first, _ = emu.invoke(ws[0][2]())
+            cold[name] = {"init_ms": round(emu.init["init_ms"], 3), "first_ms": round(first["duration_ms"], 3),
+                          "spawn_ms": round(emu.init["spawn_ms"], 3), "max_rss_mb": first["max_rss_mb"]}
+            for _, label, next_event in ws:
+                for _ in range(args.warmup):
+                    emu.invoke(next_event())
+                lat, rtts, ddb, statuses, allocs = [], [], [], [], []
+                for _ in range(args.requests):
+                    r, rtt = emu.invoke(next_event())
+                    lat.append(r["duration_ms"])
+                    rtts.append(rtt)
+                    ddb.append(r["ddb"])
+                    statuses.append(_status(r))
+                for _ in range(args.alloc_requests):
+                    allocs.append(emu.invoke(next_event(), alloc=True)[0]["alloc_kb"])
+                s = summarize(lat, ddb, statuses, allocs)
+                s["rtt_p50_ms"] = round(local.percentile(rtts, 50), 3)
+                s["rtt_p99_ms"] = round(local.percentile(rtts, 99), 3)
+                s["max_rss_mb"] = r["max_rss_mb"]
+                results[f"{name}/{label}"] = s
+        finally:
+            emu.close()
+    return results, cold
+
+# --------- 比較 ---------
+def _git(*cmd):
+    try:
+        return subprocess.check_output(["git", "-C", local.ROOT] + list(cmd), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(base, cur, threshold, floor_ms):
+    """悪化の一覧: [(mode, key, metric, before, after)]
+
+    レイテンシ・メモリ確保は threshold（比率）かつ floor_ms（絶対値）を超えたとき、
+    DynamoDB 呼び出し数・消費キャパシティ・ステータスは少しでも変わったときに悪化とみなす。
+    """
+    out = []
+    def _worse(b, c, abs_floor):
+        return c > b * (1 + threshold) and c - b > abs_floor
+    for mode in MODES:
+        for key, c in sorted(cur.get("results", {}).get(mode, {}).items()):
+            b = base.get("results", {}).get(mode, {}).get(key)
+            if not b:
+                continue
+            for m in ("p50_ms", "p99_ms"):
+                if _worse(b[m], c[m], floor_ms):
+                    out.append((mode, key, m, b[m], c[m]))
+            if _worse(b["alloc_peak_kb_p50"], c["alloc_peak_kb_p50"], 16):
+                out.append((mode, key, "alloc_peak_kb_p50", b["alloc_peak_kb_p50"], c["alloc_peak_kb_p50"]))
+            for m in ("ddb_calls_per_req", "rcu_per_req", "wcu_per_req"):
+                if c[m] > b[m] + 1e-6:
+                    out.append((mode, key, m, b[m], c[m]))
+            if c["status"] != b["status"]:
+                out.append((mode, key, "status", b["status"], c["status"]))
+    for name, c in sorted(cur.get("cold", {}).items()):
+        b = base.get("cold", {}).get(name)
+        if b and _worse(b["init_ms"], c["init_ms"], floor_ms):
+            out.append(("emulator", name, "init_ms", b["init_ms"], c["init_ms"]))
+    return out
+
+def _print(report):
+    print(f"{'mode':9s} {'handler/event':50s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'ddb/req':>8s} "
+          f"{'rcu':>7s} {'wcu':>7s} {'allocKB':>8s}  status")
+    for mode in MODES:
+        for key, r in sorted(report["results"].get(mode, {}).items()):
+            print(f"{mode:9s} {key:50s} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['p99_ms']:8.2f} "
+                  f"{r['ddb_calls_per_req']:8.2f} {r['rcu_per_req']:7.2f} {r['wcu_per_req']:7.2f} "
+                  f"{r['alloc_peak_kb_p50']:8.1f}  {r['status']}")
+    for name, c in sorted(report.get("cold", {}).items()):
+        print(f"cold      {name:50s} init={c['init_ms']:.1f}ms first={c['first_ms']:.1f}ms rss={c['max_rss_mb']:.0f}MB")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=MODES + ("both",), default="both")
+    ap.add_argument("--handlers", nargs="*", default=local.HANDLERS)
+    ap.add_argument("--events", default=EVENTS_DIR, help="記録イベントのディレクトリ")
+    ap.add_argument("--requests", type=int, default=100, help="イベントごとの計測回数")
+    ap.add_argument("--warmup", type=int, default=5)
+    ap.add_argument("--alloc-requests", type=int, default=20, help="メモリ確保の計測回数（別パス）")
+    ap.add_argument("--latency-ms", type=float, default=0, help="DynamoDB 呼び出しごとの人工遅延")
+    ap.add_argument("--memory", type=int, default=512, help="emulator の関数メモリ（MB）")
+    ap.add_argument("--no-capacity", action="store_true", help="ReturnConsumedCapacity を付けない")
+    ap.add_argument("--out", help="JSON レポートの出力先")
+    ap.add_argument("--compare", help="比較対象の JSON レポート")
+    ap.add_argument("--threshold", type=float, default=0.2, help="レイテンシ・メモリ確保の許容悪化率")
+    ap.add_argument("--floor-ms", type=float, default=2.0, help="これ未満のレイテンシ差は無視")
+    args = ap.parse_args()
+
+    endpoint = local.start_dynamodb(separate_process=True)
+    try:
+        local.create_tables()
+        local.seed()
+        works = workloads(args.handlers, args.events)
+        report = {"meta": {"commit": _git("rev-parse", "--short", "HEAD"), "dirty": bool(_git("status", "--porcelain", "lambda")),
+                           "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                           "python": platform.python_version(), "machine": platform.machine(),
+                           "endpoint": "moto" if local._proc else endpoint, "latency_ms": args.latency_ms,
+                           "requests": args.requests, "alloc_requests": args.alloc_requests},
+                  "results": {}}
+        if args.mode in ("inprocess", "both"):
+            report["results"]["inprocess"] = run_inprocess(works, args)
+        if args.mode in ("emulator", "both"):
+            report["results"]["emulator"], report["cold"] = run_emulator(works, args)
+    finally:
+        local.stop_dynamodb()
+
+    _print(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+        worse = compare(base, report, args.threshold, args.floor_ms)
+        print(f"\ncompared with {base['meta'].get('commit')}: {len(worse)} regression(s)")
+        for mode, key, metric, b, c in worse:
+            print(f"  {mode:9s} {key:50s} {metric:18s} {b} -> {c}")
+        if worse:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""月次チケット付与（naraigoto.grants）: 家庭ごとの INSERT ループとチャンク単位の1文の比較、並列度、中断からの再開
+
+    python lambda/bench/bench_grants.py --dsn postgresql://postgres@localhost/naraigoto --families 1000000
+
+ベンチ専用データベースに 03_reset.sql → 01_schema.sql を流し（既存データは消える）、--families 件の家庭と契約を COPY する:
+  - 約 --active の家庭に有効な契約（standard / premium / free）。一部は有効な契約が2件（多い方の枚数になる）
+  - 残りは解約・休止の契約か契約なし
+  - 付与する月の ticket_balances を一部の家庭に先に作っておく（Webhook で付与済み・消費済み・アップグレード前の枚数）
+次を計る:
+  dry-run  … grants.diff（付与せずに差分を数える）。期待値（Python で計算）と一致すること
+  loop     … 家庭ごとに SELECT + INSERT ... ON CONFLICT（--loop-sample 家庭だけ流し、全件の時間を見積もる）
+  resume   … --crash-after チャンク付与したところで止め、さらに1チャンクを途中でロールバック（クラッシュ相当）
+             させてから grants.run で続きを付与する。結果が期待値と一致し、やり直しても追加の付与が0件であること
+  parallel … --workers の各値で別の月を最初から付与する（チャンクは既定の statement_timeout の中で実行）
+"""
+import os, sys, time, uuid, random, argparse
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+PLANS = {"free": 0, "standard": 3, "premium": 6}
+
+def _uuid(kind, i):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"naraigoto-grants/{kind}/{i}"))
+
+def seed(dsn, families, active, month):
+    """家庭・契約・付与済みの残高を COPY し、(期待する付与先 {family: 枚数}, 既存の残高 {family: (balance, granted)})"""
+    import bench_pg
+    from naraigoto import pg
+    bench_pg.init(dsn)
+    rnd = random.Random(23)
+    target, existing = {}, {}
+    with pg.connect(dsn) as conn, conn.transaction(), conn.cursor() as cur:
+        with cur.copy("COPY users (id, type, email, name) FROM STDIN") as copy:
+            for i in range(families):
+                copy.write_row((_uuid("parent", i), "parent", f"g{i}@example.com", f"保護者{i}"))
+        with cur.copy("COPY families (id, parent_user_id) FROM STDIN") as copy:
+            for i in range(families):
+                copy.write_row((_uuid("family", i), _uuid("parent", i)))
+        with cur.copy("COPY subscriptions (family_id, plan, status) FROM STDIN") as copy:
+            for i in range(families):
+                fam, x = _uuid("family", i), rnd.random()
+                if x < active:
+                    plan = rnd.choices(("standard", "premium", "free"), (6, 3, 1))[0]
+                    copy.write_row((fam, plan, "active"))
+                    tickets = PLANS[plan]
+                    if rnd.random() < 0.02:
+                        copy.write_row((fam, "premium", "active"))
+                        tickets = PLANS["premium"]
+                    if tickets:
+                        target[fam] = tickets
+                elif x < active + 0.15:
+                    copy.write_row((fam, rnd.choice(("standard", "premium")), rnd.choice(("canceled", "paused"))))
+        with cur.copy("COPY ticket_balances (family_id, month, balance, granted) FROM STDIN") as copy:
+            for fam, tickets in target.items():
+                x = rnd.random()
+                if x < 0.10:      # Webhook（invoice.paid）で付与済み・一部消費
+                    existing[fam] = (rnd.randint(0, tickets), tickets)
+                elif x < 0.13:    # アップグレード前の枚数で付与済み
+                    existing[fam] = (rnd.randint(0, 3), min(3, tickets - 1))
+                elif x < 0.15:    # 付与なしで行だけある（予約の払い戻しなど）
+                    existing[fam] = (rnd.randint(0, 2), 0)
+                else:
+                    continue
+                copy.write_row((fam, month, *existing[fam]))
+            for i in range(0, families, 97):  # 有効な契約の無い家庭の行は触らない
+                fam = _uuid("family", i)
+                if fam not in target:
+                    existing[fam] = (1, 0)
+                    copy.write_row((fam, month, 1, 0))
+    return target, existing
+
+def expected(target, existing):
+    """{family: (balance, granted)}: granted との差分だけ足す"""
+    out = dict(existing)
+    for fam, tickets in target.items():
+        balance, granted = existing.get(fam, (0, 0))
+        if granted < tickets:
+            out[fam] = (balance + tickets - granted, tickets)
+    return out
+
+def check(month, want):
+    from naraigoto import pg
+    got = {str(r["family_id"]): (r["balance"], r["granted"]) for r in pg.fetch_all(
+        "SELECT family_id, balance, granted FROM ticket_balances WHERE month = %s", (month,))}
+    bad = sum(1 for fam in set(got) | set(want) if got.get(fam) != want.get(fam))
+    assert bad == 0, f"{bad} families differ from the expected balances"
+    return len(got)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=os.getenv("PG_DSN", "postgresql://postgres@localhost/naraigoto"))
+    ap.add_argument("--families", type=int, default=1000000)
+    ap.add_argument("--active", type=float, default=0.7, help="有効な契約のある家庭の割合")
+    ap.add_argument("--segments", type=int, default=16)
+    ap.add_argument("--chunk", type=int, default=2000)
+    ap.add_argument("--workers", default="1,4,8", help="並列度（カンマ区切り。それぞれ別の月で計る）")
+    ap.add_argument("--loop-sample", type=int, default=20000)
+    ap.add_argument("--crash-after", type=int, default=40, help="resume で止めるまでのチャンク数")
+    args = ap.parse_args()
+
+    from naraigoto import pg, grants, metrics
+    if pg.psycopg is None:
+        raise SystemExit("psycopg が必要です（pip install 'psycopg[binary]'）")
+    workers = [int(w) for w in args.workers.split(",")]
+    pg.DSN = args.dsn
+    pg.POOL_SIZE = max(workers) + 1
+    metrics.set_sink(lambda record: None)
+    month = "2026-11"
+    first = grants.month_start(month)
+
+    timeout, pg.STATEMENT_TIMEOUT_MS = pg.STATEMENT_TIMEOUT_MS, 0   # 投入と ANALYZE だけ時間制限なし
+    t0 = time.perf_counter()
+    target, existing = seed(args.dsn, args.families, args.active, first)
+    pg.execute("ANALYZE")
+    pg.reset()
+    pg.STATEMENT_TIMEOUT_MS = timeout
+    want = expected(target, existing)
+    grants_expected = sum(1 for fam, t in target.items() if existing.get(fam, (0, 0))[1] < t)
+    created_expected = sum(1 for fam in target if fam not in existing)
+    tickets_expected = sum(t - existing.get(fam, (0, 0))[1] for fam, t in target.items()
+                           if existing.get(fam, (0, 0))[1] < t)
+    print(f"seeded {args.families} families ({len(target)} with tickets, {len(existing)} existing balances) "
+          f"in {time.perf_counter() - t0:.1f}s")
+
+    # dry-run
+    t0 = time.perf_counter()
+    report = grants.diff(month, args.segments, max(workers), args.chunk, sample=3)
+    elapsed = time.perf_counter() - t0
+    print(f"dry-run  {elapsed:7.2f}s  families={report['families']} grants={report['grants']} "
+          f"created={report['created']} toppedUp={report['toppedUp']} tickets={report['tickets']}")
+    assert (report["families"], report["grants"], report["created"], report["tickets"]) == \
+        (args.families, grants_expected, created_expected, tickets_expected), report
+    assert pg.fetch_one("SELECT count(*) AS n FROM ticket_balances WHERE month = %s", (first,))["n"] == len(existing)
+
+    # loop: 家庭ごとの2文（別の月に付与して消す）
+    loop_month = date(2026, 10, 1)
+    sample = list(target)[:args.loop_sample]
+    t0 = time.perf_counter()
+    for fam in sample:
+        row = pg.fetch_one("SELECT max(p.tickets_per_month) AS tickets FROM subscriptions s "
+                           "JOIN plans p ON p.id = s.plan WHERE s.family_id = %s AND s.status = 'active'",
+                           (fam,), prepare=True)
+        pg.execute("INSERT INTO ticket_balances (family_id, month, balance, granted) VALUES (%s, %s, %s, %s) "
+                   "ON CONFLICT (family_id, month) DO UPDATE "
+                   "SET balance = ticket_balances.balance + (EXCLUDED.granted - ticket_balances.granted), "
+                   "granted = EXCLUDED.granted WHERE ticket_balances.granted < EXCLUDED.granted",
+                   (fam, loop_month, row["tickets"], row["tickets"]), prepare=True)
+    elapsed = time.perf_counter() - t0
+    rate = len(sample) / elapsed
+    print(f"loop     {elapsed:7.2f}s  {len(sample)} families, {rate:.0f} families/s "
+          f"→ ~{args.families / rate / 60:.1f} min for {args.families} families (1 worker, {2 * len(sample)} statements)")
+    pg.execute("DELETE FROM ticket_balances WHERE month = %s", (loop_month,))
+
+    # resume: 途中で止め、1チャンクをロールバックさせてから続き
+    grants.plan(month, args.segments)
+    for _ in range(args.crash_after):
+        grants.grant_chunk(month, args.chunk)
+    before = grants.status(month)
+
+    class Crash(Exception):
+        pass
+    try:
+        with pg.transaction() as conn:
+            seg = conn.execute(grants.CLAIM, (first,)).fetchone()
+            if seg is None:
+                raise SystemExit("--crash-after finished every segment; lower it or raise --families")
+            conn.execute(grants.APPLY, {"month": first, "after": seg["after_id"], "upper": seg["upper_id"],
+                                        "chunk": args.chunk})
+            raise Crash()
+    except Crash:
+        pass
+    assert grants.status(month) == before
+    r = grants.run(month, 3600, max(workers), args.segments, args.chunk)
+    rows = check(first, want)
+    state = grants.status(month)
+    print(f"resume   {r['seconds']:7.2f}s  stopped after {before['chunks']} chunks ({before['families']} families), "
+          f"finished {state['families']} families / {state['chunks']} chunks, remaining={state['remaining']}, "
+          f"rows={rows}")
+    assert state["remaining"] == 0 and state["families"] == args.families
+    assert state["grants"] == grants_expected and state["tickets"] == tickets_expected
+    grants.restart(month)
+    again = grants.run(month, 3600, max(workers), args.segments, args.chunk)
+    assert again["grants"] == 0 and again["tickets"] == 0, again
+    check(first, want)
+    print(f"ok: resumed run equals the expected balances; rerun granted {again['grants']} "
+          f"({again['seconds']:.2f}s)")
+
+    # parallel: 並列度ごとに別の月を最初から（既存の残高なし）
+    fresh = {fam: (t, t) for fam, t in target.items()}
+    for k, w in enumerate(workers):
+        m = date(2027, 1 + k, 1)
+        r = grants.run(m.strftime("%Y-%m"), 3600, w, args.segments, args.chunk)
+        check(m, fresh)
+        print(f"parallel {r['seconds']:7.2f}s  workers={w:2d} segments={args.segments} chunk={args.chunk} "
+              f"{r['familiesPerSec']:8.0f} families/s  grants={r['grants']} chunks={r['chunks']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""全ハンドラのコールドスタート / ウォーム呼び出しベンチ（before/after 比較）
+
+    python lambda/bench/bench_handlers.py --baseline dd2bc0e --runs 5 --warm 200
+
+コールドスタートはハンドラごとに新しいプロセスを起動して計測する
+（モジュール import + 初回呼び出し）。ウォームは同一プロセスでの連続呼び出し。
+"""
+import os, sys, json, time, argparse, subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+def _invoke(handler, event):
+    # ベースライン側には Decimal を含む応答で例外になるハンドラがあるため、例外も1件として数える
+    try:
+        return handler(dict(event), None)["statusCode"]
+    except Exception:
+        return "exception"
+
+def _child(source_dir, name, warm):
+    event = local.default_events()[name]
+    t0 = time.perf_counter()
+    handler = local.load_handler(local.handler_path(name, source_dir))
+    t1 = time.perf_counter()
+    status = _invoke(handler, event)
+    t2 = time.perf_counter()
+    lat = []
+    for _ in range(warm):
+        s = time.perf_counter()
+        _invoke(handler, event)
+        lat.append((time.perf_counter() - s) * 1000)
+    print(json.dumps({"import_ms": (t1 - t0) * 1000, "first_ms": (t2 - t1) * 1000,
+                      "status": status, "warm_ms": lat}))
+
+def _run_variant(source_dir, runs, warm):
+    results = {}
+    for name in local.HANDLERS:
+        if not os.path.exists(local.handler_path(name, source_dir)):
+            continue
+        cold, first, warm_lat, status = [], [], [], None
+        for i in range(runs):
+            out = subprocess.check_output([sys.executable, __file__, "--child", source_dir, name,
+                                           "--warm", str(warm if i == 0 else 0)], env=os.environ)
+            r = json.loads(out.decode().strip().splitlines()[-1])
+            cold.append(r["import_ms"] + r["first_ms"])
+            first.append(r["first_ms"])
+            warm_lat.extend(r["warm_ms"])
+            status = r["status"]
+        results[name] = {
+            "status": status,
+            "cold_p50_ms": local.percentile(cold, 50),
+            "first_invoke_p50_ms": local.percentile(first, 50),
+            "warm_p50_ms": local.percentile(warm_lat, 50),
+            "warm_p99_ms": local.percentile(warm_lat, 99),
+        }
+    return results
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--baseline", help="比較対象の git リビジョン（例: dd2bc0e）")
+    ap.add_argument("--runs", type=int, default=5, help="コールドスタート計測回数")
+    ap.add_argument("--warm", type=int, default=200, help="ウォーム呼び出し回数")
+    ap.add_argument("--child", nargs=2, metavar=("SOURCE_DIR", "HANDLER"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        _child(args.child[0], args.child[1], args.warm)
+        return
+
+    local.start_dynamodb()
+    try:
+        local.create_tables()
+        local.seed()
+        variants = {"after": local.LAMBDA_DIR}
+        if args.baseline:
+            variants = {"before": local.checkout_handlers(args.baseline), **variants}
+        report = {label: _run_variant(src, args.runs, args.warm) for label, src in variants.items()}
+    finally:
+        local.stop_dynamodb()
+
+    print(f"{'handler':24s} " + " ".join(f"{label + ' ' + col:>22s}" for label in report
+                                         for col in ("cold p50", "warm p50", "warm p99")))
+    for name in local.HANDLERS:
+        row = []
+        for label in report:
+            r = report[label].get(name)
+            row += [f"{r['cold_p50_ms']:22.2f}", f"{r['warm_p50_ms']:22.2f}", f"{r['warm_p99_ms']:22.2f}"] if r else [f"{'-':>22s}"] * 3
+        print(f"{name:24s} " + " ".join(row))
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Idempotency-Key の同時再送の計測
+
+    python lambda/bench/bench_idempotency.py --replays 100 --workers 32
+
+同じ Idempotency-Key の予約 POST を並列に大量送信した時間と応答の内訳、保存済み応答の再送レイテンシを出す。
+予約が1件・チケット消費が1回・別内容の再利用は 409 であることの検証は lambda/tests/test_idempotency.py。
+"""
+import os, sys, json, time, argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+USER = "U-IDEM"
+LESSON_ID = "L-IDEM"
+START_AT = "2025-10-11T10:00:00Z"
+BALANCE = 5
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--replays", type=int, default=100)
+    ap.add_argument("--workers", type=int, default=32)
+    args = ap.parse_args()
+
+    os.environ.setdefault("DDB_MAX_POOL_CONNECTIONS", str(args.workers))
+    local.start_dynamodb()
+    try:
+        local.create_tables()
+        from naraigoto import runtime as rt, booking
+        rt.table("TicketBalances").put_item(Item={"userId": USER, "month": booking.ticket_month(), "balance": BALANCE})
+        handler = local.load_handler(local.handler_path("post_booking"))
+        body = {"userId": USER, "lessonId": LESSON_ID, "schedule": START_AT}
+        key = {"Idempotency-Key": "3f1c1d1e-booking-retry"}
+
+        def post(_):
+            return handler(local.http_event("POST", "/bookings", body=body, headers=key), None)
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            responses = list(pool.map(post, range(args.replays)))
+        elapsed = time.perf_counter() - t0
+
+        codes = Counter((r["statusCode"], json.loads(r["body"]).get("error")) for r in responses)
+        print(f"{args.replays} concurrent replays in {elapsed:.2f}s:", dict(codes))
+
+        lat = []
+        for _ in range(args.replays):
+            s = time.perf_counter()
+            post(None)
+            lat.append((time.perf_counter() - s) * 1000)
+        print(f"sequential replay (stored response) p50={local.percentile(lat, 50):.1f}ms "
+              f"p99={local.percentile(lat, 99):.1f}ms")
+    finally:
+        local.stop_dynamodb()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""レスポンス JSON エンコードのマイクロベンチ
+
+    python lambda/bench/bench_json.py --number 2000
+
+旧実装（_decimal_to_native で全体コピー → json.dumps）と naraigoto.jsonenc を
+レビュー(親50+子50) / レッスン一覧 / レッスン詳細ペイロードで比較し、出力の一致も検証する。
+"""
+import os, sys, json, timeit, argparse, tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local  # noqa: F401  (Layer を sys.path に追加)
+from naraigoto import jsonenc
+
+def _decimal_to_native(obj):
+    # 旧ハンドラの実装そのまま（比較用）
+    if isinstance(obj, list):
+        return [_decimal_to_native(x) for x in obj]
+    if isinstance(obj, dict):
+        return {k: _decimal_to_native(v) for k, v in obj.items()}
+    if isinstance(obj, Decimal):
+        return int(obj) if obj % 1 == 0 else float(obj)
+    return obj
+
+def legacy(body):
+    return json.dumps(_decimal_to_native(body), ensure_ascii=False)
+
+def legacy_compact(body):
+    return json.dumps(_decimal_to_native(body), ensure_ascii=False, separators=(",", ":"))
+
+def _review(i, role):
+    return {"lessonsId": "L001", "createdAt": f"2025-09-{1 + i % 28:02d}T10:{i % 60:02d}:00.000Z",
+            "reviewId": f"7f0a8a7f-9a0c-4cb6-9932-{i:012d}", "userId": "11111111-1111-1111-1111-111111111111",
+            "rating": Decimal(1 + i % 5), "comment": "ダンスが楽しい！講師の方が親切でした。" * (1 + i % 4),
+            "role": role, "targetType": "school", "targetId": "bbbbbbbb-bbbb-bbbb-bbbb-bbbbbbbbbbb1",
+            "targetKey": "school#bbbbbbbb-bbbb-bbbb-bbbb-bbbbbbbbbbb1"}
+
+def payloads():
+    reviews = {"parents": [_review(i, "parent") for i in range(50)],
+               "children": [_review(i, "child") for i in range(50)]}
+    lessons = {"items": [{"lessonId": f"L{i:04d}", "schoolId": f"S{i:04d}", "title": f"はじめてのダンス {i}",
+                          "area": "杉並", "category": "dance", "ratingAvg": Decimal("4.37"),
+                          "ratingCount": Decimal(120 + i), "imageKey": f"schools/{i}.jpg",
+                          "updatedAt": "2025-09-18T13:02:11.102Z"} for i in range(100)],
+               "nextCursor": "eyJzIjogImNhdGFsb2dBbGwtcmF0aW5nfEFMTCJ9", "pagination": {"page": 1, "limit": 100}}
+    detail = {"lessonId": "L002", "title": "はじめてのダンス", "area": "杉並", "genre": "dance",
+              "price": Decimal("5500"), "ratingAvg": Decimal("4.5"), "ratingCount": Decimal("12"),
+              "courses": [{"title": f"コース{i}", "minutes": Decimal(45 + i), "fee": Decimal("3300.5")} for i in range(10)]}
+    return {"reviews_50+50": reviews, "lessons_list_100": lessons, "lesson_detail": detail}
+
+def _alloc(fn, body):
+    tracemalloc.start()
+    fn(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--number", type=int, default=2000)
+    args = ap.parse_args()
+
+    encoders = {"legacy": legacy, "jsonenc": jsonenc.dumps_std}
+    if jsonenc.dumps_orjson is not None:
+        encoders["jsonenc(orjson)"] = jsonenc.dumps_orjson
+
+    for name, body in payloads().items():
+        # 出力一致の検証（既定はバイト一致、orjson は区切り空白なしの旧出力と一致）
+        assert jsonenc.dumps_std(body).encode("utf-8") == legacy(body).encode("utf-8"), name
+        if jsonenc.dumps_orjson is not None:
+            assert jsonenc.dumps_orjson(body) == legacy_compact(body), name
+        print(f"{name} ({len(legacy(body).encode('utf-8'))} bytes)")
+        base = None
+        for label, fn in encoders.items():
+            sec = min(timeit.repeat(lambda: fn(body), number=args.number, repeat=5))
+            us = sec / args.number * 1e6
+            base = base or us
+            print(f"  {label:18s} {us:9.1f} us/op  x{base / us:5.2f}  peak alloc {_alloc(fn, body) / 1024:8.1f} KiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""一覧ページ（60 カード）のいいね状態取得: カードごとの呼び出し vs 一括呼び出し
+
+    python lambda/bench/bench_likes.py --cards 60 --latency-ms 10
+
+カードごと: likes_check を schoolId 1件ずつ（逐次 / ブラウザ相当の6並列）
+一括: likes_check を1回（BatchGetItem 1回）
+"""
+import os, sys, json, time, argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+USER = "U-LIKES"
+
+def _measure(label, fn, n):
+    lat = []
+    for _ in range(n):
+        s = time.perf_counter()
+        fn()
+        lat.append((time.perf_counter() - s) * 1000)
+    print(f"{label:34s} p50={local.percentile(lat, 50):8.2f}ms p95={local.percentile(lat, 95):8.2f}ms")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cards", type=int, default=60)
+    ap.add_argument("--latency-ms", type=float, default=10)
+    ap.add_argument("--pages", type=int, default=20)
+    args = ap.parse_args()
+
+    local.start_dynamodb()
+    try:
+        local.create_tables()
+        from naraigoto import runtime as rt
+        schools = [f"S{i:05d}" for i in range(args.cards)]
+        with rt.table("Likes").batch_writer() as w:
+            for s in schools[::3]:
+                w.put_item(Item={"userId": USER, "schoolId": s})
+        local.inject_latency(rt.client(), args.latency_ms)
+        check = local.load_handler(local.handler_path("likes_check"))
+
+        def call(ids):
+            r = check(local.http_event("GET", f"/users/{USER}/likes/check", {"userId": USER},
+                                       {"schoolIds": ",".join(ids)}), None)
+            assert r["statusCode"] == 200, r
+            return json.loads(r["body"])["liked"]
+
+        def per_card():
+            return [call([s]) for s in schools]
+
+        def per_card_parallel():
+            with ThreadPoolExecutor(max_workers=6) as pool:
+                return list(pool.map(lambda s: call([s]), schools))
+
+        def batch():
+            return call(schools)
+
+        liked = batch()
+        assert sum(liked.values()) == len(schools[::3]), liked
+        print(f"{args.cards} cards, injected latency {args.latency_ms}ms / DynamoDB call")
+        _measure("per-card (sequential)", per_card, args.pages)
+        _measure("per-card (6 parallel)", per_card_parallel, args.pages)
+        _measure("batch (1 call)", batch, args.pages)
+    finally:
+        local.stop_dynamodb()
+
+if __name__ == "__main__":
+    main()
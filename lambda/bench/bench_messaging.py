@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""受信箱（naraigoto.messaging）: 会話ごとの N+1・LATERAL JOIN・要約列の比較と、既読・ロングポーリング
+
+    python lambda/bench/bench_messaging.py --dsn postgresql://postgres@localhost/naraigoto --conversations 5000
+
+ベンチ専用データベースに 03_reset.sql → 01_schema.sql を流し（既存データは消える）、1教室に --conversations 件の
+会話（家庭ごとに1件）と会話あたり平均 --messages 件のメッセージを COPY する（要約列は messages のトリガが埋める）。
+教室の受信箱1ページ（--limit 件、新しい会話順）を次の方法で --requests 回ずつ読み、p50/p99 とクエリ数を出す:
+  n+1      … 会話を作成順に1ページ読み、会話ごとに最後のメッセージと未読数を別クエリで（ページあたり 1 + 2×limit）
+  lateral  … 1クエリ。LATERAL で会話ごとに最後のメッセージと未読数を求めて最新順に並べる（全会話を評価する）
+  summary  … messaging.inbox（conversations の要約列を索引順に読むだけ）
+先頭ページと --deep ページ目（カーソルでたどる）の両方を計る。lateral と summary の結果が一致すること、
+conversations_summary_rebuild() が何も直さないこと（トリガの要約が正しいこと）も確かめる。
+続けて既読（1件ずつの UPDATE と messaging.mark_read の1文）と、since のロングポーリングで新着が届くまでの遅延を計る。
+"""
+import os, sys, time, uuid, random, argparse, threading
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+BASE = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+def _id(kind, i):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"naraigoto-messaging/{kind}/{i}"))
+
+LATERAL = """
+SELECT c.id, c.activity_at, l.id AS last_message_id, l.body AS last_body, u.n AS unread
+  FROM conversations c
+  LEFT JOIN LATERAL (SELECT m.id, m.body, m.created_at FROM messages m
+                      WHERE m.conversation_id = c.id ORDER BY m.created_at DESC, m.id DESC LIMIT 1) l ON true
+  CROSS JOIN LATERAL (SELECT count(*) AS n FROM messages m JOIN users us ON us.id = m.sender_user_id
+                       WHERE m.conversation_id = c.id AND m.read_at IS NULL
+                         AND naraigoto_side(us.type) = 'family') u
+ WHERE c.school_id = %(school)s
+   AND (greatest(c.created_at, l.created_at), c.id) < (%(at)s::timestamptz, %(id)s::uuid)
+ ORDER BY greatest(c.created_at, l.created_at) DESC, c.id DESC
+ LIMIT %(limit)s"""
+
+PAGE = """
+SELECT id, created_at FROM conversations WHERE school_id = %s AND (created_at, id) < (%s::timestamptz, %s::uuid)
+ ORDER BY created_at DESC, id DESC LIMIT %s"""
+LAST = "SELECT id, body, created_at FROM messages WHERE conversation_id = %s ORDER BY created_at DESC, id DESC LIMIT 1"
+UNREAD = """
+SELECT count(*) AS n FROM messages m JOIN users u ON u.id = m.sender_user_id
+ WHERE m.conversation_id = %s AND m.read_at IS NULL AND naraigoto_side(u.type) = 'family'"""
+
+def seed(dsn, conversations, messages, unread):
+    import bench_pg
+    from naraigoto import pg
+    bench_pg.init(dsn)
+    rnd = random.Random(21)
+    school, owner = _id("school", 0), _id("owner", 0)
+    n = 0
+    with pg.connect(dsn) as conn, conn.transaction(), conn.cursor() as cur:
+        with cur.copy("COPY users (id, type, email, name) FROM STDIN") as copy:
+            copy.write_row((owner, "school_owner", "owner@example.com", "教室"))
+            for i in range(conversations):
+                copy.write_row((_id("parent", i), "parent", f"m{i}@example.com", f"保護者{i}"))
+        with cur.copy("COPY families (id, parent_user_id) FROM STDIN") as copy:
+            for i in range(conversations):
+                copy.write_row((_id("family", i), _id("parent", i)))
+        cur.execute("INSERT INTO schools (id, name, area, category) VALUES (%s, 'ベンチ教室', '杉並', 'dance')", (school,))
+        with cur.copy("COPY conversations (id, family_id, school_id, created_at, activity_at) FROM STDIN") as copy:
+            for i in range(conversations):
+                at = BASE + timedelta(minutes=i)
+                copy.write_row((_id("conversation", i), _id("family", i), school, at, at))
+        with cur.copy("COPY messages (id, conversation_id, sender_user_id, body, created_at, read_at) FROM STDIN") as copy:
+            for i in range(conversations):
+                at = BASE + timedelta(minutes=i)
+                k = max(1, int(rnd.expovariate(1.0 / messages)))
+                left = rnd.randint(0, k) if rnd.random() < unread else 0
+                for j in range(k):
+                    at += timedelta(seconds=rnd.randint(60, 86400 * 3))
+                    parent = j % 2 == 0
+                    read = None if j >= k - left else at + timedelta(minutes=10)
+                    copy.write_row((_id("message", n), _id("conversation", i), _id("parent", i) if parent else owner,
+                                    f"メッセージ {n}", at, read))
+                    n += 1
+    return school, owner, n
+
+def _timed(requests, fn):
+    lat_ms = []
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        fn()
+        lat_ms.append((time.perf_counter() - t0) * 1000)
+    return local.percentile(lat_ms, 50), local.percentile(lat_ms, 99)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=os.getenv("PG_DSN", "postgresql://postgres@localhost/naraigoto"))
+    ap.add_argument("--conversations", type=int, default=5000)
+    ap.add_argument("--messages", type=float, default=8, help="会話あたりの平均メッセージ数")
+    ap.add_argument("--unread", type=float, default=0.3, help="未読の残る会話の割合")
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--deep", type=int, default=50, help="計測する深いページ")
+    ap.add_argument("--requests", type=int, default=200)
+    args = ap.parse_args()
+
+    from naraigoto import pg, messaging
+    if pg.psycopg is None:
+        raise SystemExit("psycopg が必要です（pip install 'psycopg[binary]'）")
+    pg.DSN = args.dsn
+    messaging.POLL_INTERVAL = 0.2
+    t0 = time.perf_counter()
+    school, owner, n = seed(args.dsn, args.conversations, args.messages, args.unread)
+    print(f"seeded {args.conversations} conversations / {n} messages in {time.perf_counter() - t0:.1f}s")
+    pg.execute("ANALYZE")
+    fixed = pg.fetch_one("SELECT conversations_summary_rebuild() AS n")["n"]
+    assert fixed == 0, f"summary rebuild fixed {fixed} conversations"
+    print("ok: trigger-maintained summaries match a full recount")
+
+    # 深いページのカーソル（3通りとも同じ位置から）
+    pages, token = [], None
+    for _ in range(args.deep):
+        items, token = messaging.inbox("school", school, args.limit, token)
+        pages.append((items, token))
+    deep_token = pages[-2][1]
+    deep_at, deep_id = messaging._position(messaging.cursor.decode(deep_token, f"inbox|school|{school}|0"))
+    first = ("infinity", "ffffffff-ffff-ffff-ffff-ffffffffffff")
+
+    with pg.connect(args.dsn) as conn:
+        def lateral(at, after):
+            return conn.execute(LATERAL, {"school": school, "at": at, "id": after, "limit": args.limit},
+                                prepare=True).fetchall()
+
+        def n_plus_1(at, after):
+            rows = conn.execute(PAGE, (school, at, after, args.limit), prepare=True).fetchall()
+            return [(conn.execute(LAST, (r["id"],), prepare=True).fetchone(),
+                     conn.execute(UNREAD, (r["id"],), prepare=True).fetchone()) for r in rows]
+
+        def summary(at, after):
+            return conn.execute(messaging.INBOX["school"], {"owner": school, "at": at, "id": after,
+                                                           "limit": args.limit + 1, "min_unread": 0},
+                                prepare=True).fetchall()
+
+        for (at, after), items in ((first, pages[0][0]), ((deep_at, deep_id), pages[-1][0])):
+            want = [(str(r["id"]), str(r["last_message_id"]), r["unread"]) for r in lateral(at, after)]
+            got = [(it["id"], it["lastMessage"]["id"], it["unreadCount"]) for it in items]
+            assert want == got, (want[:3], got[:3])
+        print("ok: summary inbox matches the lateral-join inbox (first and deep page)")
+
+        for name, fn, queries in (("n+1", n_plus_1, 1 + 2 * args.limit), ("lateral", lateral, 1),
+                                  ("summary", summary, 1)):
+            p50, p99 = _timed(args.requests, lambda: fn(*first))
+            d50, d99 = _timed(args.requests, lambda: fn(deep_at, deep_id))
+            print(f"{name:8s} page1 p50={p50:7.2f}ms p99={p99:7.2f}ms  page{args.deep} p50={d50:7.2f}ms "
+                  f"p99={d99:7.2f}ms  queries/page={queries}")
+
+        plan = conn.execute("EXPLAIN " + messaging.INBOX["school"],
+                            {"owner": school, "at": first[0], "id": first[1], "limit": 21, "min_unread": 0}).fetchall()
+        print("summary plan:", " / ".join(r["QUERY PLAN"].strip() for r in plan[:4]))
+
+    # 既読: 未読の多い10会話を1件ずつ UPDATE した場合と、未読に戻してから mark_read の1文
+    convs = [r["id"] for r in pg.fetch_all(
+        "SELECT id FROM conversations WHERE school_id = %s ORDER BY school_unread DESC LIMIT 10", (school,))]
+    t0 = time.perf_counter()
+    ids = [r["id"] for r in pg.fetch_all(
+        "SELECT m.id FROM messages m JOIN users u ON u.id = m.sender_user_id "
+        "WHERE m.conversation_id = ANY(%s::uuid[]) AND m.read_at IS NULL AND u.type = 'parent'", (convs,))]
+    for mid in ids:
+        pg.execute("UPDATE messages SET read_at = now() WHERE id = %s", (mid,))
+    per_row = (time.perf_counter() - t0) * 1000
+    pg.execute("UPDATE messages SET read_at = NULL WHERE id = ANY(%s::uuid[])", (ids,))
+    t0 = time.perf_counter()
+    updated = messaging.mark_read(owner, convs)
+    batched = (time.perf_counter() - t0) * 1000
+    left = pg.fetch_one("SELECT sum(school_unread) AS n FROM conversations WHERE id = ANY(%s::uuid[])", (convs,))["n"]
+    assert updated == len(ids) and left == 0
+    print(f"mark read ({len(ids)} messages in {len(convs)} conversations): per-row {per_row:.2f}ms "
+          f"({len(ids) + 1} statements) / batched {batched:.2f}ms (1 statement), unread now {left}")
+
+    # ロングポーリング: 待っている間に教室が送ったメッセージが届くまで
+    cid = str(convs[0])
+    _, _, latest = messaging.messages(cid, 1)
+    delays = []
+    for k in range(10):
+        sent = {}
+
+        def _send():
+            time.sleep(random.uniform(0.1, 0.5))
+            sent["at"] = time.perf_counter()
+            messaging.send(cid, owner, f"お知らせ {k}")
+
+        t = threading.Thread(target=_send)
+        t.start()
+        items, latest = messaging.since(cid, latest, wait=5)
+        delays.append((time.perf_counter() - sent["at"]) * 1000)
+        t.join()
+        assert len(items) == 1 and items[0]["body"] == f"お知らせ {k}"
+    print(f"long-poll delivery (poll every {messaging.POLL_INTERVAL * 1000:.0f}ms): "
+          f"p50={local.percentile(delays, 50):.0f}ms max={max(delays):.0f}ms")
+
+if __name__ == "__main__":
+    main()
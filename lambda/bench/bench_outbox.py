@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""Outbox リレー（naraigoto.outbox）: 並列ワーカー・途中クラッシュ下のスループット
+
+    python lambda/bench/bench_outbox.py --dsn postgresql://postgres@localhost/naraigoto --classes 20000 --workers 4
+
+ベンチ専用データベースに 03_reset.sql → 01_schema.sql を流し（既存データは消える）、教室・クラスを COPY する
+（outbox はトリガが積む）。DynamoDB は moto（AWS_ENDPOINT_URL_DYNAMODB があればそちら）。
+  1. 一部のクラスに評価・いいね数だけのカタログアイテムを置く（別の投影が持つ項目。上書きされないことを確かめる）
+  2. --workers 個のリレーと、クラス名・教室のエリア変更 / クラスの追加・削除を続ける書き込みスレッドを
+     --seconds 秒並行に動かす。リレーは TransactWriteItems の前後で --crash-rate の確率で落ちる
+     （前: そのバッチの残りを書かずに終了、後: 書いた後 outbox を消す前に終了 → 同じ行を別のワーカーが取り直す）
+  3. 書き込みを止めて outbox を空にし、投影と RDS の不一致数を出す
+イベント数・スループット（events/s）・バッチごとの遅延 p50/p99・古い版として捨てた数・クラッシュ数を出す。
+投影が RDS と一致すること（版の巻き戻り・削除済みの復活・他の投影の項目の消失がないこと）の検証は
+lambda/tests/test_outbox.py（同じ load / relay / writer / verify を小さな規模で使う）。
+"""
+import os, sys, time, uuid, random, argparse, threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+from seedgen import AREAS, AREA_CENTERS, CATEGORIES
+
+class Crash(Exception):
+    """注入したクラッシュ"""
+
+def _id(kind, i):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"naraigoto-outbox/{kind}/{i}"))
+
+def load(dsn, schools, classes):
+    import bench_pg
+    from naraigoto import pg
+    bench_pg.init(dsn)
+    rnd = random.Random(13)
+    with pg.connect(dsn) as conn, conn.transaction(), conn.cursor() as cur:
+        with cur.copy("COPY schools (id, name, area, category, location) FROM STDIN") as copy:
+            for s in range(schools):
+                area = AREAS[s % len(AREAS)]
+                lat, lon = AREA_CENTERS[area]
+                copy.write_row((_id("school", s), f"{area}教室 {s}", area, CATEGORIES[rnd.randrange(len(CATEGORIES))],
+                                f"({lon + rnd.uniform(-0.02, 0.02):.6f},{lat + rnd.uniform(-0.02, 0.02):.6f})"))
+        with cur.copy("COPY classes (id, school_id, title, capacity, duration_min) FROM STDIN") as copy:
+            for c in range(classes):
+                copy.write_row((_id("class", c), _id("school", c % schools), f"クラス {c}", 10, 60))
+
+def crashing_client(rate, seed):
+    """TransactWriteItems の前後で rate の確率で Crash を投げる DynamoDB client（ワーカーごと）"""
+    import boto3
+    from naraigoto import runtime as rt
+    client = boto3.resource("dynamodb", config=rt.BOTO_CONFIG).meta.client
+    rnd, count = random.Random(seed), [0]
+
+    def _maybe(model, **_):
+        if model.name == "TransactWriteItems" and rnd.random() < rate / 2:
+            count[0] += 1
+            raise Crash(model.name)
+
+    client.meta.events.register("before-call.dynamodb", _maybe)
+    client.meta.events.register("after-call.dynamodb", _maybe)
+    return client, count
+
+def writer(stop, schools, classes, stats):
+    """RDS にだけ書く（アプリと同じ）。更新・追加・削除を混ぜる"""
+    from naraigoto import pg
+    rnd = random.Random(17)
+    next_class = classes
+    while not stop.is_set():
+        k = rnd.random()
+        if k < 0.5:
+            pg.execute("UPDATE classes SET title = %s WHERE id = %s",
+                       (f"クラス {rnd.randrange(10 ** 6)}", _id("class", rnd.randrange(next_class))))
+        elif k < 0.7:
+            pg.execute("UPDATE schools SET area = %s WHERE id = %s",
+                       (rnd.choice(AREAS), _id("school", rnd.randrange(schools))))
+        elif k < 0.9:
+            pg.execute("INSERT INTO classes (id, school_id, title, capacity, duration_min) VALUES (%s, %s, %s, 10, 60)",
+                       (_id("class", next_class), _id("school", rnd.randrange(schools)), f"新クラス {next_class}"))
+            next_class += 1
+        else:
+            pg.execute("DELETE FROM classes WHERE id = %s", (_id("class", rnd.randrange(next_class)),))
+        stats["writes"] += 1
+    stats["classes"] = next_class
+
+def relay(i, stop, rate, batch, stats, lock):
+    from naraigoto import outbox
+    client, crashes = crashing_client(rate, i)
+    mine = {"events": 0, "written": 0, "stale": 0, "lag": []}
+    idle_after_stop = 0
+    while True:
+        try:
+            r = outbox.relay_once(client, batch)
+        except Crash:
+            continue
+        if r["events"]:
+            for k in ("events", "written", "stale"):
+                mine[k] += r[k]
+            mine["lag"].append(r["lagMs"])
+            idle_after_stop = 0
+        elif stop.is_set():
+            idle_after_stop += 1
+            if idle_after_stop >= 3:
+                break
+        else:
+            time.sleep(0.05)
+    with lock:
+        for k in ("events", "written", "stale"):
+            stats[k] += mine[k]
+        stats["lag"].extend(mine["lag"])
+        stats["crashes"] += crashes[0]
+
+def verify(client, schools):
+    """投影と RDS の最新状態の比較: (クラス数, 墓標数, 他の投影の項目が残った数, 不一致数, outbox の残り)
+    削除済みは墓標、他の投影の項目は残るのが正しい"""
+    from naraigoto import pg, outbox, runtime as rt
+    pending = pg.fetch_one("SELECT count(*) AS n FROM outbox")["n"]
+    rows = {str(r["id"]): r for r in pg.fetch_all(outbox.CLASS_STATE, {"classes": [], "schools": [_id("school", s) for s in range(schools)]})}
+    table = rt.table(outbox.CATALOG_TABLE)
+    items, params = {}, {}
+    while True:
+        r = table.scan(**params)
+        items.update((it["lessonId"], it) for it in r.get("Items", []))
+        if not r.get("LastEvaluatedKey"):
+            break
+        params["ExclusiveStartKey"] = r["LastEvaluatedKey"]
+    bad = 0
+    for cid, row in rows.items():
+        it = items.get(cid) or {}
+        want = outbox.catalog_update(row)["Update"]
+        vals = want["ExpressionAttributeValues"]
+        names = want["ExpressionAttributeNames"]
+        expect = {names[k.replace(":", "#")]: v for k, v in vals.items() if k.startswith(":a")}
+        expect.update(classVersion=row["class_version"], schoolVersion=row["school_version"])
+        if any(it.get(k) != v for k, v in expect.items()) or it.get("deleted"):
+            bad += 1
+    deleted = [cid for cid in items if cid not in rows]
+    for cid in deleted:
+        it = items[cid]
+        if not it.get("deleted") or "catalogAll" in it or "schoolId" in it:
+            bad += 1
+    kept = sum(1 for it in items.values() if it.get("likesCount") == 5)
+    school_rows = pg.fetch_all(outbox.SCHOOL_STATE, ([_id("school", s) for s in range(schools)],))
+    stats_table = rt.table(outbox.SCHOOLS_STATS_TABLE)
+    for r in school_rows:
+        it = stats_table.get_item(Key={"id": str(r["id"])}).get("Item") or {}
+        if it.get("area") != r["area"] or int(it.get("schoolVersion") or 0) != r["school_version"]:
+            bad += 1
+    return len(rows), len(deleted), kept, bad, pending
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=os.getenv("PG_DSN", "postgresql://postgres@localhost/naraigoto"))
+    ap.add_argument("--schools", type=int, default=2000)
+    ap.add_argument("--classes", type=int, default=20000)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--batch", type=int, default=200)
+    ap.add_argument("--seconds", type=float, default=20)
+    ap.add_argument("--crash-rate", type=float, default=0.1, help="TransactWriteItems ごとのクラッシュ確率")
+    ap.add_argument("--rated", type=int, default=500, help="評価・いいね数を先に置くクラス数")
+    args = ap.parse_args()
+
+    from naraigoto import pg
+    if pg.psycopg is None:
+        raise SystemExit("psycopg が必要です（pip install 'psycopg[binary]'）")
+    pg.DSN = args.dsn
+    pg.POOL_SIZE = args.workers + 2
+    t0 = time.perf_counter()
+    load(args.dsn, args.schools, args.classes)
+    pg.reset()
+    print(f"copied {args.schools} schools / {args.classes} classes in {time.perf_counter() - t0:.1f}s "
+          f"(outbox {pg.fetch_one('SELECT count(*) AS n FROM outbox')['n']} rows)")
+
+    local.start_dynamodb(separate_process=True)
+    try:
+        local.create_tables()
+        from naraigoto import runtime as rt, catalog
+        with rt.table("LessonsCatalog").batch_writer() as w:
+            for c in range(args.rated):
+                w.put_item(Item=catalog.to_catalog_item({"lessonId": _id("class", c), "ratingAvg": 4, "ratingCount": 2,
+                                                         "likesCount": 5, "createdAt": "2025-01-01T00:00:00Z"}))
+
+        stats = {"events": 0, "written": 0, "stale": 0, "lag": [], "crashes": 0, "writes": 0}
+        lock, stop = threading.Lock(), threading.Event()
+        threads = [threading.Thread(target=relay, args=(i, stop, args.crash_rate, args.batch, stats, lock))
+                   for i in range(args.workers)]
+        w = threading.Thread(target=writer, args=(stop, args.schools, args.classes, stats))
+        t0 = time.perf_counter()
+        for t in threads + [w]:
+            t.start()
+        time.sleep(args.seconds)
+        stop.set()
+        w.join()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        lag = stats["lag"] or [0.0]
+        print(f"workers={args.workers} events={stats['events']} ({stats['events'] / elapsed:.0f}/s) "
+              f"writes={stats['writes']} written={stats['written']} stale={stats['stale']} crashes={stats['crashes']} "
+              f"lag p50={local.percentile(lag, 50):.0f}ms p99={local.percentile(lag, 99):.0f}ms")
+
+        classes, deleted, kept, bad, pending = verify(rt.client(), args.schools)
+        print(f"verify: classes={classes} tombstones={deleted} rating/likes kept={kept}/{args.rated} "
+              f"mismatches={bad} outbox left={pending}")
+    finally:
+        local.stop_dynamodb()
+
+if __name__ == "__main__":
+    main()
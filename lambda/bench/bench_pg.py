@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""PostgreSQL: 呼び出しごとの connect とコンテナ内プール（naraigoto.pg）のスループット比較
+
+    python lambda/bench/bench_pg.py --dsn postgresql://postgres@localhost/naraigoto --concurrency 20
+
+ローカルの PostgreSQL（例: docker run -e POSTGRES_HOST_AUTH_METHOD=trust -p 5432:5432 postgres:16）の
+ベンチ専用データベースに 03_reset.sql → 01_schema.sql を流し（既存データは消える）、
+家族・予約などを many()（パイプライン）で投入してから、
+--concurrency 個のスレッド（＝同時に動く Lambda コンテナ）で次を --seconds 秒ずつ回す:
+  connect     … リクエストごとに connect → 予約履歴 Query → close
+  pool        … コンテナごとに1接続を使い回す（prepare=True のサーバ側プリペアド）
+  pool-noprep … 同上、プリペアドなし（PG_POOL_MODE=transaction 相当）
+  summary-seq / summary-pipe … マイページ（残高・ポイント・直近予約の3クエリ）を逐次 / 1往復で
+スループット・p50/p99・サーバ側の最大接続数（pg_stat_activity）・接続回数を出す。
+投入時には1行ずつの INSERT と many() の速度も比べる。
+"""
+import os, sys, time, uuid, random, argparse, threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+from naraigoto import pg
+
+APP = "naraigoto-bench"
+SCHEMA = os.path.join(local.ROOT, "database", "postgres", "01_schema.sql")
+RESET = os.path.join(local.ROOT, "database", "postgres", "03_reset.sql")
+
+def _ids(kind, n):
+    return [str(uuid.uuid5(uuid.NAMESPACE_URL, f"naraigoto-bench/{kind}/{i}")) for i in range(n)]
+
+def init(dsn):
+    with pg.connect(dsn) as conn:
+        for path in (RESET, SCHEMA):
+            with open(path, encoding="utf-8") as f:
+                conn.execute(f.read())
+
+def seed(dsn, families, schedules, bookings_per_user):
+    """(users, families, month) を返す。bookings は1行ずつの INSERT と many() の速度を比べる"""
+    rnd = random.Random(5)
+    users, fams, children = _ids("parent", families), _ids("family", families), _ids("child", families)
+    school, owner, instructor, klass = _ids("school", 1)[0], _ids("owner", 1)[0], _ids("instructor", 1)[0], _ids("class", 1)[0]
+    scheds = _ids("schedule", schedules)
+    month = time.strftime("%Y-%m-01")
+    pg.many("INSERT INTO users (id, type, email, name) VALUES (%s, %s, %s, %s)",
+            [(owner, "school_owner", "owner@example.com", "owner")] +
+            [(u, "parent", f"p{i}@example.com", f"保護者{i}") for i, u in enumerate(users)] +
+            [(c, "child", f"c{i}@example.com", f"子ども{i}") for i, c in enumerate(children)])
+    pg.execute("INSERT INTO schools (id, name, area, category, location) VALUES (%s, 'ベンチ教室', '杉並', 'dance', point(139.63, 35.70))",
+               (school,))
+    pg.execute("INSERT INTO instructors (id, school_id, name) VALUES (%s, %s, '講師')", (instructor, school))
+    pg.execute("INSERT INTO classes (id, school_id, title, capacity, duration_min) VALUES (%s, %s, 'ダンス', 1000000, 60)",
+               (klass, school))
+    pg.many("INSERT INTO lesson_schedules (id, class_id, instructor_id, start_at, end_at) "
+            "VALUES (%s, %s, %s, now() + make_interval(hours => %s::int), now() + make_interval(hours => %s::int))",
+            [(s, klass, instructor, i, i + 1) for i, s in enumerate(scheds)])
+    pg.many("INSERT INTO families (id, parent_user_id) VALUES (%s, %s)", list(zip(fams, users)))
+    pg.many("INSERT INTO ticket_balances (family_id, month, balance) VALUES (%s, %s, 1000)", [(f, month) for f in fams])
+    pg.many("INSERT INTO points_transactions (family_id, type, amount) VALUES (%s, 'review', %s)",
+            [(f, rnd.randint(1, 50)) for f in fams for _ in range(3)])
+
+    rows = [(u, s) for u in users for s in rnd.sample(scheds, min(bookings_per_user, len(scheds)))]
+    half = len(rows) // 2
+    sql = "INSERT INTO bookings (user_id, schedule_id) VALUES (%s, %s)"
+    t0 = time.perf_counter()
+    for r in rows[:half]:
+        pg.execute(sql, r)
+    t1 = time.perf_counter()
+    pg.many(sql, rows[half:])
+    t2 = time.perf_counter()
+    print(f"insert bookings: row-by-row {half / (t1 - t0):8.0f} rows/s, many() {(len(rows) - half) / (t2 - t1):8.0f} rows/s")
+    return users, fams, month
+
+class Activity:
+    """pg_stat_activity の接続数を一定間隔で見て最大値を取る"""
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        with pg.connect(self.dsn) as conn:
+            while not self._stop.wait(0.05):
+                n = conn.execute("SELECT count(*) AS n FROM pg_stat_activity WHERE application_name = %s AND pid <> pg_backend_pid()",
+                                 (APP,)).fetchone()["n"]
+                self.peak = max(self.peak, n)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.peak
+
+def _bookings(conn, user, prepare):
+    return conn.execute(pg.USER_BOOKINGS, (user, None, 20), prepare=prepare).fetchall()
+
+def _summary_seq(conn, user, fam, month):
+    conn.execute(pg.TICKET_BALANCE, (fam, month), prepare=True).fetchall()
+    conn.execute(pg.POINTS_BALANCE, (fam,), prepare=True).fetchall()
+    return conn.execute(pg.USER_BOOKINGS, (user, None, 5), prepare=True).fetchall()
+
+def _summary_pipe(conn, user, fam, month):
+    with conn.pipeline():
+        curs = [conn.cursor() for _ in range(3)]
+        curs[0].execute(pg.TICKET_BALANCE, (fam, month), prepare=True)
+        curs[1].execute(pg.POINTS_BALANCE, (fam,), prepare=True)
+        curs[2].execute(pg.USER_BOOKINGS, (user, None, 5), prepare=True)
+    return [c.fetchall() for c in curs]
+
+SCENARIOS = {
+    "connect": (False, lambda conn, u, f, m: _bookings(conn, u, False)),
+    "pool": (True, lambda conn, u, f, m: _bookings(conn, u, True)),
+    "pool-noprep": (True, lambda conn, u, f, m: _bookings(conn, u, False)),
+    "summary-seq": (True, _summary_seq),
+    "summary-pipe": (True, _summary_pipe),
+}
+
+def run(dsn, name, users, fams, month, concurrency, seconds, latency_ms):
+    pooled, fn = SCENARIOS[name]
+    lat, errors, connects = [], [0], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def _container(i):
+        rnd = random.Random(i)
+        pool = pg.Pool(dsn, size=1, mode="session") if pooled else None
+        mine = []
+        while time.perf_counter() < deadline:
+            k = rnd.randrange(len(users))
+            t0 = time.perf_counter()
+            try:
+                if pooled:
+                    with pool.connection() as conn:
+                        fn(conn, users[k], fams[k], month)
+                else:
+                    with pg.connect(dsn) as conn:
+                        fn(conn, users[k], fams[k], month)
+                    with lock:
+                        connects[0] += 1
+            except Exception as e:
+                with lock:
+                    errors[0] += 1
+                print(f"[{name}] {e.__class__.__name__}: {e}")
+                time.sleep(0.05)
+                continue
+            mine.append((time.perf_counter() - t0) * 1000)
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)  # ハンドラ側の他の処理
+        if pool:
+            with lock:
+                connects[0] += pool.connects
+            pool.close()
+        with lock:
+            lat.extend(mine)
+
+    activity = Activity(dsn)
+    threads = [threading.Thread(target=_container, args=(i,)) for i in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    peak = activity.stop()
+    print(f"{name:13s} rps={len(lat) / elapsed:8.0f} p50={local.percentile(lat, 50):7.2f}ms "
+          f"p99={local.percentile(lat, 99):7.2f}ms connects={connects[0]:6d} peak_conns={peak:4d} errors={errors[0]}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=os.getenv("PG_DSN", "postgresql://postgres@localhost/naraigoto"))
+    ap.add_argument("--families", type=int, default=2000)
+    ap.add_argument("--schedules", type=int, default=500)
+    ap.add_argument("--bookings", type=int, default=10, help="保護者1人あたりの予約数")
+    ap.add_argument("--concurrency", type=int, default=20)
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--latency-ms", type=float, default=0, help="リクエスト間の待ち（ハンドラの他の処理）")
+    ap.add_argument("--scenarios", nargs="*", default=list(SCENARIOS))
+    args = ap.parse_args()
+
+    if pg.psycopg is None:
+        raise SystemExit("psycopg が必要です（pip install 'psycopg[binary]'）")
+    os.environ["AWS_LAMBDA_FUNCTION_NAME"] = APP  # application_name（pg_stat_activity で数える）
+    pg.DSN = args.dsn
+    init(args.dsn)
+    users, fams, month = seed(args.dsn, args.families, args.schedules, args.bookings)
+    pg.reset()
+    for name in args.scenarios:
+        run(args.dsn, name, users, fams, month, args.concurrency, args.seconds, args.latency_ms)
+
+if __name__ == "__main__":
+    main()
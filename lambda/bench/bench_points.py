@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""ポイント台帳（naraigoto.points）: 履歴の長い家庭の残高の読み取り、口コミ報酬のバッチ、同時引き換え
+
+    python lambda/bench/bench_points.py --dsn postgresql://postgres@localhost/naraigoto --transactions 1000000
+
+ベンチ専用データベースに 03_reset.sql → 01_schema.sql を流し（既存データは消える）、1家庭に --transactions 行、
+ほかの --families 家庭に数十行ずつの履歴を COPY する。次を計る:
+  balance  … 全件 SUM（従来の POINTS_BALANCE）と、スナップショット + 差分（圧縮前・圧縮直後・圧縮後に --recent 行
+             追記した状態）の p50/p99。圧縮（points.compact）の所要時間
+  reviews  … 口コミ報酬を1レコードずつ INSERT した場合と、ストリームのバッチ（--batch 件）を1文で付与した場合
+  redeem   … --threads 本で同じ家庭から --redeem ポイントずつ同時に引き換えたスループットと結果の内訳。
+             続けて付与と圧縮を並行させながら引き換えたときの残高と台帳の合計
+一致・再処理で0件・残高が負にならないことの検証は lambda/tests/test_points.py（seed を小さな規模で使う）。
+"""
+import os, sys, time, uuid, random, argparse, threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+BASE = datetime(2020, 1, 1, tzinfo=timezone.utc)
+FULL_SUM = "SELECT coalesce(sum(amount), 0) AS points FROM points_transactions WHERE family_id = %s"
+
+def _id(kind, i):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"naraigoto-points/{kind}/{i}"))
+
+def seed(dsn, transactions, families):
+    import bench_pg
+    from naraigoto import pg
+    bench_pg.init(dsn)
+    rnd = random.Random(24)
+    with pg.connect(dsn) as conn, conn.transaction(), conn.cursor() as cur:
+        with cur.copy("COPY users (id, type, email, name) FROM STDIN") as copy:
+            for i in range(families + 2):
+                copy.write_row((_id("parent", i), "parent", f"pt{i}@example.com", f"保護者{i}"))
+                copy.write_row((_id("child", i), "child", f"ch{i}@example.com", f"子ども{i}"))
+        with cur.copy("COPY families (id, parent_user_id) FROM STDIN") as copy:
+            for i in range(families + 2):
+                copy.write_row((_id("family", i), _id("parent", i)))
+        with cur.copy("COPY family_members (family_id, child_user_id) FROM STDIN") as copy:
+            for i in range(families + 2):
+                copy.write_row((_id("family", i), _id("child", i)))
+        with cur.copy("COPY points_transactions (family_id, type, amount, created_at) FROM STDIN") as copy:
+            heavy = _id("family", 0)
+            step = timedelta(seconds=6 * 365 * 86400 / max(transactions, 1))
+            for i in range(transactions):
+                if rnd.random() < 0.8:
+                    copy.write_row((heavy, rnd.choice(("review", "referral")), rnd.randint(10, 100), BASE + step * i))
+                else:
+                    copy.write_row((heavy, "redeem", -rnd.randint(1, 30), BASE + step * i))
+            for f in range(2, families + 2):
+                for k in range(rnd.randint(5, 60)):
+                    copy.write_row((_id("family", f), "review", 50, BASE + timedelta(hours=k)))
+    return _id("family", 0), _id("family", 1)
+
+def _timed(requests, fn):
+    lat_ms = []
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        fn()
+        lat_ms.append((time.perf_counter() - t0) * 1000)
+    return local.percentile(lat_ms, 50), local.percentile(lat_ms, 99)
+
+def _record(review_id, user_id, seq):
+    return {"eventID": f"ev-{review_id}", "eventName": "INSERT", "dynamodb": {
+        "SequenceNumber": str(seq), "NewImage": {"reviewId": {"S": review_id}, "userId": {"S": user_id},
+                                                 "lessonsId": {"S": "lesson-1"}, "rating": {"N": "5"}}}}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=os.getenv("PG_DSN", "postgresql://postgres@localhost/naraigoto"))
+    ap.add_argument("--transactions", type=int, default=1000000, help="履歴の長い家庭の行数")
+    ap.add_argument("--families", type=int, default=2000)
+    ap.add_argument("--recent", type=int, default=1000, help="圧縮後に追記する行数")
+    ap.add_argument("--requests", type=int, default=50)
+    ap.add_argument("--reviews", type=int, default=5000)
+    ap.add_argument("--batch", type=int, default=100)
+    ap.add_argument("--threads", type=int, default=32)
+    ap.add_argument("--redeem", type=int, default=30)
+    args = ap.parse_args()
+
+    from naraigoto import pg, points, metrics
+    if pg.psycopg is None:
+        raise SystemExit("psycopg が必要です（pip install 'psycopg[binary]'）")
+    pg.DSN = args.dsn
+    pg.POOL_SIZE = args.threads + 4
+    metrics.set_sink(lambda record: None)
+
+    timeout, pg.STATEMENT_TIMEOUT_MS = pg.STATEMENT_TIMEOUT_MS, 0   # 投入と ANALYZE だけ時間制限なし
+    t0 = time.perf_counter()
+    heavy, racer = seed(args.dsn, args.transactions, args.families)
+    pg.execute("ANALYZE")
+    pg.reset()
+    pg.STATEMENT_TIMEOUT_MS = timeout
+    print(f"seeded {args.transactions} transactions for one family + {args.families} families "
+          f"in {time.perf_counter() - t0:.1f}s")
+
+    def full():
+        return pg.fetch_one(FULL_SUM, (heavy,), prepare=True)["points"]
+
+    def report(label):
+        want = full()
+        p50, p99 = _timed(args.requests, lambda: points.balance(heavy))
+        print(f"balance  {label:28s} p50={p50:8.2f}ms p99={p99:8.2f}ms  (= {want})")
+
+    p50, p99 = _timed(args.requests, full)
+    print(f"balance  {'full SUM':28s} p50={p50:8.2f}ms p99={p99:8.2f}ms")
+    report("snapshot+delta, no snapshot")
+    r = points.compact(3600)
+    print(f"compact  {r['seconds']:7.2f}s  families={r['families']} folded={r['folded']} chunks={r['chunks']} "
+          f"pending={r['pending']} complete={r['complete']}")
+    report("after compaction")
+    pg.many("INSERT INTO points_transactions (family_id, type, amount) VALUES (%s, 'referral', %s)",
+            [(heavy, 10) for _ in range(args.recent)])
+    report(f"+{args.recent} rows since compaction")
+    p50, p99 = _timed(args.requests, lambda: points.history(heavy, 20))
+    print(f"history  {'first page (+balance)':28s} p50={p50:8.2f}ms p99={p99:8.2f}ms")
+
+    # 口コミ報酬: 1レコードずつ と バッチ1文（親・子どもの投稿を混ぜる）
+    users = [_id(("parent", "child")[i % 2], 2 + i % args.families) for i in range(args.reviews)]
+    half = args.reviews // 2
+    single = [_record(f"rv-{i}", users[i], i) for i in range(half)]
+    batched = [_record(f"rv-{i}", users[i], i) for i in range(half, args.reviews)]
+    t0 = time.perf_counter()
+    n1 = sum(points.award_reviews([rec])["awarded"] for rec in single)
+    t1 = time.perf_counter()
+    n2 = sum(points.award_reviews(batched[i:i + args.batch])["awarded"] for i in range(0, len(batched), args.batch))
+    t2 = time.perf_counter()
+    again = sum(points.award_reviews(batched[i:i + args.batch])["awarded"] for i in range(0, len(batched), args.batch))
+    print(f"reviews  per-record {len(single) / (t1 - t0):8.0f} awards/s ({len(single)} statements) / "
+          f"batched {len(batched) / (t2 - t1):8.0f} awards/s ({-(-len(batched) // args.batch)} statements), "
+          f"awarded {n1}+{n2}, replayed batches awarded {again}")
+
+    # 同時引き換え: 残高ちょうどの分だけ通る
+    points.award(racer, "referral", 1000)
+    outcome = {"ok": 0, "insufficient": 0}
+    lock = threading.Lock()
+
+    def _redeem(_):
+        try:
+            points.redeem(racer, args.redeem)
+            key = "ok"
+        except points.PointsError as e:
+            key = "insufficient" if e.code == "insufficient_points" else e.code
+        with lock:
+            outcome[key] = outcome.get(key, 0) + 1
+
+    attempts = args.threads * 4
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as ex:
+        list(ex.map(_redeem, range(attempts)))
+    elapsed = time.perf_counter() - t0
+    left = points.balance(racer)
+    print(f"redeem   {args.threads} threads x {attempts // args.threads}: ok={outcome['ok']} "
+          f"insufficient={outcome['insufficient']} balance={left} ({attempts / elapsed:.0f} redeems/s)")
+
+    # 付与・圧縮と並行して引き換え
+    stop, awarded = threading.Event(), [0]
+
+    def _awarder():
+        while not stop.is_set():
+            points.award(racer, "referral", 7)
+            awarded[0] += 7
+
+    def _compactor():
+        while not stop.is_set():
+            points.compact(5)
+
+    helpers = [threading.Thread(target=_awarder), threading.Thread(target=_compactor)]
+    for t in helpers:
+        t.start()
+    outcome.update(ok=0, insufficient=0)
+    with ThreadPoolExecutor(args.threads) as ex:
+        list(ex.map(_redeem, range(attempts * 4)))
+    stop.set()
+    for t in helpers:
+        t.join()
+    points.compact(60)
+    left = points.balance(racer)
+    ledger = pg.fetch_one(FULL_SUM, (racer,))["points"]
+    print(f"redeem   with awards + compaction: ok={outcome['ok']} insufficient={outcome['insufficient']} "
+          f"awarded={awarded[0]} balance={left} ledger={ledger}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""人気ランキング（naraigoto.ranking）: 10万教室での再計算の所要時間と、事前計算済みランキングの読み取り
+
+    python lambda/bench/bench_ranking.py --schools 100000 --events 300000
+
+DynamoDB のスタンドイン（local.start_dynamodb）にテーブルを作り、--schools 件の教室（SchoolsStats の
+name / area / category / 評価）と、直近 --days 日の予約・口コミ・いいね --events 件（教室の人気は Zipf 分布）を作る:
+  stream    … --stream 件をストリームのレコード（予約・キャンセル・口コミ・いいね・解除）にして ranking_stream
+              ハンドラへ --batch 件ずつ流す。同じバッチをもう一度流してもカウンタが変わらず、
+              イベントを直接数えた値と一致すること
+  backfill  … 履歴の --events 件（とストリームで流した分）をバケットに数えて RankingCounters を置き換え
+              （ranking.replace_counters）、数えた値と一致すること
+  recompute … ranking.recompute の所要時間（Scan / ヒープ / 書き込み）と DynamoDB の呼び出し数。
+              範囲ごとの上位が、全教室のスコアを並べ替えた上位と一致すること
+  read      … get_rankings の p50/p99（キャッシュなしの GetItem 1回 / コンテナ内キャッシュ）と、
+              リクエストごとにカウンタを読んで計算した場合（on-request）の所要時間
+moto はトランザクションごとにテーブルを複製し、Scan のフィルタも Python で評価するので、ストリームと Scan の時間は
+実際の DynamoDB より大きく出る（AWS_ENDPOINT_URL_DYNAMODB で DynamoDB Local などに向けられる）。
+"""
+import os, sys, json, time, random, argparse
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+AREAS = ["杉並", "中野", "練馬", "世田谷", "渋谷", "新宿", "目黒", "品川", "大田", "豊島", "文京", "台東",
+         "江東", "墨田", "北", "板橋", "足立", "葛飾", "江戸川", "荒川", "港", "中央", "千代田"]
+CATEGORIES = ["dance", "piano", "swimming", "english", "programming", "soccer", "art", "calligraphy",
+              "abacus", "karate", "ballet", "science"]
+ARN = "arn:aws:dynamodb:ap-northeast-1:000000000000:table/{}/stream/2026-10-01T00:00:00.000"
+
+def _school(i):
+    return f"S{i:06d}"
+
+def _lesson(i):
+    return f"RL{i:06d}"
+
+class Events:
+    """教室の人気を Zipf 分布にした予約・口コミ・いいね（時刻は直近 days 日に一様）"""
+    def __init__(self, rnd, schools, now, days):
+        self.rnd, self.now, self.days = rnd, now, days
+        weights = [1.0 / (k + 1) ** 1.1 for k in range(schools)]
+        order = list(range(schools))
+        rnd.shuffle(order)
+        self.population, self.weights = order, weights
+
+    def draw(self, n):
+        """[(教室番号, 種類, 時刻)]"""
+        kinds = self.rnd.choices(("bookings", "reviews", "likes"), (5, 2, 3), k=n)
+        picks = self.rnd.choices(self.population, self.weights, k=n)
+        span = self.days * 86400
+        return [(p, kinds[i], self.now - self.rnd.randrange(span)) for i, p in enumerate(picks)]
+
+def seed_schools(schools, lessons):
+    from naraigoto import runtime as rt, review_stats, ranking
+    rnd = random.Random(25)
+    profiles = {}
+    with rt.table(review_stats.SCHOOLS_STATS_TABLE).batch_writer() as w:
+        for i in range(schools):
+            area, category = rnd.choice(AREAS), rnd.choice(CATEGORIES)
+            count = rnd.randint(0, 40)
+            profiles[_school(i)] = (area, category)
+            w.put_item(Item={"id": _school(i), "name": f"{area}{category}教室{i}", "area": area, "category": category,
+                             "ratingSum": Decimal(count * rnd.randint(3, 5)), "ratingCount": count})
+    with rt.table(ranking.CATALOG_TABLE).batch_writer() as w:
+        for i in range(lessons):
+            w.put_item(Item={"lessonId": _lesson(i), "schoolId": _school(i), "title": f"体験レッスン {i}"})
+    return profiles
+
+def records(events, rnd, now, lessons):
+    """(教室番号, 種類, 時刻) → ストリームのレコードと、同じ内容の signal（教室, 種類, ±1, 時刻）"""
+    out, signals = [], []
+    for n, (i, kind, at) in enumerate(events):
+        seq = {"SequenceNumber": f"{n:021d}", "ApproximateCreationDateTime": at}
+        school = _school(i)
+        if kind == "likes":
+            keys = {"userId": {"S": f"U{n}"}, "schoolId": {"S": school}}
+            image = {**keys, "createdAt": {"N": str(at)}}
+            if rnd.random() < 0.1:   # 解除: 後から届き、いいねした時刻のバケットから引く
+                seq["ApproximateCreationDateTime"] = min(now, at + rnd.randrange(3 * 86400))
+                out.append({"eventID": f"rk-{n}", "eventName": "REMOVE", "eventSourceARN": ARN.format("Likes"),
+                            "dynamodb": {**seq, "Keys": keys, "OldImage": image}})
+                sign = -1
+            else:
+                out.append({"eventID": f"rk-{n}", "eventName": "INSERT", "eventSourceARN": ARN.format("Likes"),
+                            "dynamodb": {**seq, "Keys": keys, "NewImage": image}})
+                sign = 1
+        elif kind == "bookings":
+            if i >= lessons:   # 教室の分からない予約は LessonsCatalog に無いレッスン → 数えない
+                i, school = i % lessons, _school(i % lessons)
+            image = {"bookingId": {"S": f"B{n}"}, "lessonId": {"S": _lesson(i)}, "status": {"S": "reserved"},
+                     "createdAt": {"N": str(at)}}
+            if rnd.random() < 0.1:   # キャンセル: 予約した時刻のバケットから引く
+                out.append({"eventID": f"rk-{n}", "eventName": "MODIFY", "eventSourceARN": ARN.format("Bookings"),
+                            "dynamodb": {**seq, "OldImage": image,
+                                         "NewImage": dict(image, status={"S": "canceled"})}})
+                sign = -1
+            else:
+                out.append({"eventID": f"rk-{n}", "eventName": "INSERT", "eventSourceARN": ARN.format("Bookings"),
+                            "dynamodb": {**seq, "NewImage": image}})
+                sign = 1
+        else:
+            created = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(at))
+            image = {"reviewId": {"S": f"R{n}"}, "createdAt": {"S": created}, "rating": {"N": "5"}}
+            if i < lessons and rnd.random() < 0.5:   # レッスンの口コミ（教室は LessonsCatalog で引く）
+                image["lessonsId"] = {"S": _lesson(i)}
+            else:
+                image["targetKey"] = {"S": f"school#{school}"}
+            out.append({"eventID": f"rk-{n}", "eventName": "INSERT", "eventSourceARN": ARN.format("Reviews"),
+                        "dynamodb": {**seq, "NewImage": image}})
+            sign = 1
+        signals.append((school, kind, sign, at))
+    return out, signals
+
+def read_counters(client):
+    from naraigoto import ranking
+    out = {}
+
+    def _keep(items):
+        for it in items:
+            d = {k: int(it[k]) for k in ranking.KINDS if int(it.get(k) or 0)}
+            if d:
+                out[(it["schoolId"], it["bucket"])] = d
+
+    ranking.parallel_scan(client, {"TableName": ranking.COUNTERS_TABLE}, 8, _keep)
+    return out
+
+def merge(*parts):
+    out = {}
+    for part in parts:
+        for key, d in part.items():
+            t = out.setdefault(key, {})
+            for k, n in d.items():
+                t[k] = t.get(k, 0) + n
+    return {k: {a: n for a, n in d.items() if n} for k, d in out.items() if any(d.values())}
+
+def _timed(n, fn):
+    lat = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        lat.append((time.perf_counter() - t0) * 1000)
+    return local.percentile(lat, 50), local.percentile(lat, 99)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--schools", type=int, default=100000)
+    ap.add_argument("--events", type=int, default=300000, help="バックフィルで数えるイベント数")
+    ap.add_argument("--stream", type=int, default=5000, help="ストリームで流すイベント数")
+    ap.add_argument("--batch", type=int, default=100)
+    ap.add_argument("--days", type=int, default=9, help="イベントを置く期間（窓より長くして期限切れも混ぜる）")
+    ap.add_argument("--lessons", type=int, default=5000, help="LessonsCatalog に置くレッスン数")
+    ap.add_argument("--k", type=int, default=50)
+    ap.add_argument("--requests", type=int, default=300)
+    ap.add_argument("--segments", type=int, default=8)
+    args = ap.parse_args()
+
+    os.environ.setdefault("DDB_READ_TIMEOUT", "120")   # moto の大きな Scan / トランザクション
+    local.start_dynamodb(separate_process=True)
+    try:
+        local.create_tables()
+        from naraigoto import runtime as rt, ranking, metrics
+        metrics.set_sink(lambda record: None)
+        client = rt.client()
+        now = int(time.time())
+        rnd = random.Random(2025)
+
+        t0 = time.perf_counter()
+        profiles = seed_schools(args.schools, min(args.lessons, args.schools))
+        print(f"seeded {args.schools} schools, {min(args.lessons, args.schools)} catalog lessons "
+              f"in {time.perf_counter() - t0:.1f}s")
+
+        # stream: ハンドラにバッチで流し、同じバッチの再処理は無視されること
+        gen = Events(rnd, args.schools, now, args.days)
+        handler = local.load_handler(local.handler_path("ranking_stream"))
+        recs, signals = records(gen.draw(args.stream), rnd, now, min(args.lessons, args.schools))
+        t0 = time.perf_counter()
+        for i in range(0, len(recs), args.batch):
+            r = handler({"Records": recs[i:i + args.batch]}, None)
+            assert r == {"batchItemFailures": []}, r
+        elapsed = time.perf_counter() - t0
+        before = read_counters(client)
+        for i in range(0, len(recs), args.batch * 10):
+            handler({"Records": recs[i:i + args.batch]}, None)
+        after = read_counters(client)
+        want = ranking.deltas(signals, now)
+        bad = sum(1 for key in set(want) | set(after) if want.get(key) != after.get(key))
+        print(f"stream    {elapsed:7.2f}s  {len(recs)} records, {len(recs) / elapsed:.0f} records/s "
+              f"(batch {args.batch}); replayed batches changed {sum(1 for k in after if after[k] != before.get(k))} "
+              f"buckets, mismatches={bad}")
+        assert before == after and bad == 0
+
+        # backfill: 履歴（ストリームで流した分も含む）をバケットに数えて置き換え
+        history = [(_school(i), kind, 1, at) for i, kind, at in gen.draw(args.events)] + signals
+        t0 = time.perf_counter()
+        counters = ranking.deltas(history, now)
+        written, deleted = ranking.replace_counters(client, counters, now, args.segments)
+        elapsed = time.perf_counter() - t0
+        got = read_counters(client)
+        bad = sum(1 for key in set(counters) | set(got) if counters.get(key) != got.get(key))
+        print(f"backfill  {elapsed:7.2f}s  {len(history)} events → {written} buckets "
+              f"({len({k[0] for k in counters})} schools), deleted {deleted}, mismatches={bad}")
+        assert bad == 0
+
+        # recompute
+        meter = local.DdbMeter(client)
+        r = ranking.recompute(client, now, args.k, args.segments)
+        usage = meter.take()
+        print(f"recompute {r['seconds']:7.2f}s  scan={r['scanSeconds']:.2f}s heap={r['heapSeconds']:.3f}s "
+              f"write={r['writeSeconds']:.2f}s  schools={r['schools']}/{r['profiles']} scopes={r['scopes']} "
+              f"calls={usage['calls']}")
+
+        # 検証: 全教室を並べ替えた上位と一致（ヒープの上位 K）
+        scores = ranking.scan_counters(client, now, args.segments)
+        ranked = sorted(((s["score"], school) for school, s in scores.items() if s["score"] > 0), reverse=True)
+        area, category = profiles[ranked[0][1]]
+        checks = {"all": ranked}
+        for sc, keep in ((ranking.scope(area), lambda p: p[0] == area),
+                         (ranking.scope(category=category), lambda p: p[1] == category),
+                         (ranking.scope(area, category), lambda p: p == (area, category))):
+            checks[sc] = [e for e in ranked if keep(profiles[e[1]])]
+        for sc, full in checks.items():
+            got = [it["schoolId"] for it in ranking.read(client, *_split(sc), limit=args.k)["items"]]
+            assert got == [school for _, school in full[:args.k]], sc
+        assert r["scopes"] == len(ranking.top_k(scores, {s: {"area": a, "category": c} for s, (a, c) in profiles.items()},
+                                                args.k))
+
+        # read: 事前計算済みの1アイテム（キャッシュなし / あり）と、リクエストごとの計算
+        get = local.load_handler(local.handler_path("get_rankings"))
+        pool = [{}] + [{"area": a} for a in AREAS[:5]] + [{"category": c} for c in CATEGORIES[:5]] + \
+               [{"area": a, "category": c} for a in AREAS[:5] for c in CATEGORIES[:5]]
+
+        def _get(q):
+            resp = get(local.http_event("GET", "/rankings", query=dict(q, limit="20")), None)
+            assert resp["statusCode"] == 200, resp
+            return json.loads(resp["body"])
+
+        assert _get({})["items"][0]["schoolId"] == ranked[0][1]
+        p50, p99 = _timed(args.requests, lambda: ranking.read(client, **rnd.choice(pool), limit=20))
+        print(f"read      {'GetItem (no cache)':24s} p50={p50:7.2f}ms p99={p99:7.2f}ms")
+        for q in pool:   # キャッシュを温める
+            _get(q)
+        p50, p99 = _timed(args.requests, lambda: _get(rnd.choice(pool)))
+        print(f"read      {'get_rankings (cached)':24s} p50={p50:7.2f}ms p99={p99:7.2f}ms")
+        meter.take()
+        t0 = time.perf_counter()
+        scores = ranking.scan_counters(client, now, args.segments)
+        ranking.top_k(scores, {s: {"area": a, "category": c} for s, (a, c) in profiles.items() if a == area}, 20)
+        usage = meter.take()
+        print(f"read      {'on-request (scan+score)':24s} {(time.perf_counter() - t0) * 1000:9.1f}ms "
+              f"calls={usage['calls']}")
+        print("ok: heap top-K equals the full sort for every checked scope; replayed stream batches are ignored")
+    finally:
+        local.stop_dynamodb()
+
+def _split(sc):
+    """scope → (area, category)"""
+    kind, _, rest = sc.partition("#")
+    if kind == "area":
+        return rest, None
+    if kind == "category":
+        return None, rest
+    if kind == "areaCategory":
+        return tuple(rest.split("#", 1))
+    return None, None
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""口コミの単一テーブル化: 移行と 1ページあたりの Query 数・レイテンシの before/after
+
+    python lambda/bench/bench_review_layout.py --reviews 1000000 --lessons 2000 --latency-ms 10
+
+旧 ParentReviews / ChildReviews に --reviews 件を投入し、
+  before: REVIEWS_LAYOUT=split（親/子を並列 Query してマージ）
+  移行:   reviews_migration/migrate.py（--throttle の確率でスロットリングを注入し、途中で一度中断→再開）
+  after:  dual（移行中）/ single（Reviews のみ）
+の順に、lessonsId 別・対象別の1ページ目と3ページ目までの Query 数と p50/p99 を計測する。
+single と split で全ページの結果（順序含む）が一致することも確認する。
+1M 件は moto ではメモリが足りないことがあるため DynamoDB Local（AWS_ENDPOINT_URL_DYNAMODB）推奨。
+"""
+import os, sys, time, random, argparse, threading, tempfile, importlib.util
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+def _load_migrate():
+    path = os.path.join(local.LAMBDA_DIR, "reviews_migration", "migrate.py")
+    spec = importlib.util.spec_from_file_location("reviews_migrate", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def seed(client, n_reviews, n_lessons, n_schools, workers=4):
+    """lessonsId はおおむね Zipf 分布（人気レッスンに口コミが集中）"""
+    rnd = random.Random(11)
+    weights = [1.0 / (i + 1) for i in range(n_lessons)]
+    lessons = rnd.choices(range(n_lessons), weights, k=n_reviews)
+    base = 1700000000
+
+    def _chunk(start):
+        batch = {"ParentReviews": [], "ChildReviews": []}
+        for i in range(start, min(start + 1000, n_reviews)):
+            role = "parent" if i % 3 else "child"
+            lesson = lessons[i]
+            school = f"S{lesson % n_schools:04d}"
+            created = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(base + i * 7)) + f".{i % 1000:03d}Z"
+            batch["ParentReviews" if role == "parent" else "ChildReviews"].append({"PutRequest": {"Item": {
+                "lessonsId": f"L{lesson:05d}", "createdAt": created, "reviewId": f"R{i:08d}",
+                "userId": f"U{i % 5000:05d}", "rating": Decimal(1 + i % 5), "comment": "丁寧に教えてもらえました。",
+                "role": role, "targetType": "school", "targetId": school, "targetKey": f"school#{school}"}}})
+        for table, reqs in batch.items():
+            for j in range(0, len(reqs), 25):
+                request = {table: reqs[j:j + 25]}
+                while request:
+                    request = client.batch_write_item(RequestItems=request).get("UnprocessedItems") or {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(_chunk, range(0, n_reviews, 1000)))
+    return sorted(set(lessons), key=lambda l: -weights[l])
+
+class QueryCounter:
+    def __init__(self, client):
+        self.n = 0
+        self._lock = threading.Lock()
+        client.meta.events.register("before-call.dynamodb.Query", self._inc)
+
+    def _inc(self, **_):
+        with self._lock:
+            self.n += 1
+
+def _walk(reviews, key_name, key_value, index, layout, pages, limit=20, role="all"):
+    token, out = None, []
+    for _ in range(pages):
+        items, token = reviews.query_merged(key_name, key_value, role=role, limit=limit, cursor_token=token,
+                                            index=index, layout=layout)
+        out.extend(items)
+        if not token:
+            break
+    return out
+
+def measure(label, reviews, counter, layout, keys, pages, n):
+    lat, queries = [], 0
+    rnd = random.Random(7)
+    for _ in range(n):
+        key_name, key_value, index = rnd.choice(keys)
+        q0 = counter.n
+        s = time.perf_counter()
+        _walk(reviews, key_name, key_value, index, layout, pages)
+        lat.append((time.perf_counter() - s) * 1000)
+        queries += counter.n - q0
+    print(f"{label:34s} queries/page={queries / (n * pages):5.2f} p50={local.percentile(lat, 50):8.2f}ms "
+          f"p99={local.percentile(lat, 99):8.2f}ms")
+
+def inject_throttle(client, rate, rnd=random.Random(3)):
+    """BatchWriteItem / Scan の一部を ProvisionedThroughputExceededException にする"""
+    class _Http:
+        status_code = 400
+    def _maybe(**_):
+        if rnd.random() < rate:
+            return _Http(), {"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "injected"},
+                             "ResponseMetadata": {"HTTPStatusCode": 400}}
+    client.meta.events.register("before-call.dynamodb.BatchWriteItem", _maybe)
+    client.meta.events.register("before-call.dynamodb.Scan", _maybe)
+    return _maybe
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--reviews", type=int, default=1000000)
+    ap.add_argument("--lessons", type=int, default=2000)
+    ap.add_argument("--schools", type=int, default=200)
+    ap.add_argument("--segments", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--latency-ms", type=float, default=10)
+    ap.add_argument("--throttle", type=float, default=0.05, help="移行中に注入するスロットリングの確率")
+    args = ap.parse_args()
+
+    local.start_dynamodb()
+    try:
+        local.create_tables()
+        from naraigoto import runtime as rt, reviews
+        client = rt.client()
+        t0 = time.perf_counter()
+        lessons = seed(client, args.reviews, args.lessons, args.schools)
+        print(f"seeded {args.reviews} reviews over {len(lessons)} lessons in {time.perf_counter() - t0:.1f}s")
+
+        # 人気上位とロングテールを半々に
+        hot = [f"L{l:05d}" for l in lessons[:20]]
+        tail = [f"L{l:05d}" for l in lessons[20:]] or hot
+        keys = [("lessonsId", l, None) for l in hot + random.Random(1).sample(tail, min(20, len(tail)))]
+        target_keys = [("targetKey", f"school#S{i:04d}", "byTarget") for i in range(min(args.schools, 20))]
+
+        migrate = _load_migrate()
+        ckpt_path = os.path.join(tempfile.mkdtemp(), "reviews-migration.json")
+        throttle_hook = inject_throttle(client, args.throttle)
+        # 中断→再開: BatchWriteItem が一定回数に達したら落とす
+        crash = {"left": max(1, args.reviews // 25 // 3)}
+        def _crash(**_):
+            crash["left"] -= 1
+            if crash["left"] <= 0:
+                raise RuntimeError("simulated crash")
+        client.meta.events.register("before-call.dynamodb.BatchWriteItem", _crash)
+        try:
+            migrate.migrate(client, args.segments, checkpoint=ckpt_path)
+        except RuntimeError as e:
+            print(f"migration interrupted: {e}")
+        client.meta.events.unregister("before-call.dynamodb.BatchWriteItem", _crash)
+        ckpt = migrate.Checkpoint(ckpt_path, args.segments)
+        resumed = sum(1 for p in ckpt.data["progress"].values() if p["start"] or p["done"])
+        print(f"checkpoint: {resumed} of {args.segments * 2} segments had progress")
+        result = migrate.migrate(client, args.segments, checkpoint=ckpt_path)
+        client.meta.events.unregister("before-call.dynamodb.BatchWriteItem", throttle_hook)
+        client.meta.events.unregister("before-call.dynamodb.Scan", throttle_hook)
+        print(f"migration (resumed): {result}")
+        report = migrate.verify(client, args.segments)
+        print(f"verify: {report}")
+        assert report["ok"], report
+
+        # single と split で同じ結果（順序・件数）
+        for key_name, key_value, index in keys[:3] + target_keys[:2]:
+            for role in ("all", "parent", "child"):
+                a = _walk(reviews, key_name, key_value, index, "split", 10 ** 6, limit=50, role=role)
+                b = _walk(reviews, key_name, key_value, index, "single", 10 ** 6, limit=50, role=role)
+                c = _walk(reviews, key_name, key_value, index, "dual", 10 ** 6, limit=50, role=role)
+                ids = [x["reviewId"] for x in a]
+                assert ids == [x["reviewId"] for x in b] == [x["reviewId"] for x in c], (key_value, role)
+                assert len(ids) == len(set(ids))
+        print("ok: split / dual / single return identical pages")
+
+        counter = QueryCounter(client)
+        local.inject_latency(client, args.latency_ms)
+        print(f"injected latency: {args.latency_ms}ms / call")
+        for ks, kind in ((keys, "lesson"), (target_keys, "target")):
+            for pages in (1, 3):
+                for layout in ("split", "dual", "single"):
+                    measure(f"{layout:6s} {kind} pages={pages}", reviews, counter, layout, ks, pages, args.requests)
+    finally:
+        local.stop_dynamodb()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""口コミ取得（親/子テーブル）の逐次 vs 並列 Query ベンチ
+
+    python lambda/bench/bench_reviews.py --latency-ms 15 --requests 100
+
+ローカルの DynamoDB スタンドインに --latency-ms の人工遅延を入れ、
+REVIEWS_LAYOUT=split での reviews.query_merged の parallel=False（旧実装相当の2往復）と parallel=True を比較する。
+単一 Reviews テーブルとの比較は bench_review_layout.py。
+"""
+import os, sys, time, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+def _measure(label, fn, n):
+    lat = []
+    for _ in range(n):
+        s = time.perf_counter()
+        fn()
+        lat.append((time.perf_counter() - s) * 1000)
+    print(f"{label:36s} p50={local.percentile(lat, 50):8.2f}ms p95={local.percentile(lat, 95):8.2f}ms "
+          f"p99={local.percentile(lat, 99):8.2f}ms")
+    return local.percentile(lat, 50)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency-ms", type=float, default=15)
+    ap.add_argument("--requests", type=int, default=100)
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--reviews", type=int, default=200)
+    args = ap.parse_args()
+
+    local.start_dynamodb()
+    try:
+        local.create_tables()
+        local.seed(n_lessons=1, n_reviews=args.reviews)
+        from naraigoto import runtime as rt, reviews
+        local.inject_latency(rt.client(), args.latency_ms)
+
+        def run(parallel, role="all", pages=1):
+            def fn():
+                token = None
+                for _ in range(pages):
+                    _, token = reviews.query_merged("lessonsId", "L001", role=role, limit=args.limit,
+                                                    cursor_token=token, parallel=parallel, layout="split")
+            return fn
+
+        print(f"injected latency: {args.latency_ms}ms / call")
+        seq = _measure("sequential role=all", run(False), args.requests)
+        par = _measure("parallel   role=all", run(True), args.requests)
+        _measure("parallel   role=parent", run(True, role="parent"), args.requests)
+        _measure("parallel   role=all (3 pages)", run(True, pages=3), args.requests)
+        print(f"p50 speedup (all): {seq / par:.2f}x")
+    finally:
+        local.stop_dynamodb()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""キーワード検索: 素朴な ILIKE '%語%'（全件走査）と 2-gram GIN 索引（naraigoto.search）の比較
+
+    python lambda/bench/bench_search.py --dsn postgresql://postgres@localhost/naraigoto --docs 100000
+
+ベンチ専用データベースに 03_reset.sql → 01_schema.sql を流し（既存データは消える）、教室・講師・クラスを
+COPY する（検索ドキュメントはトリガが作る。教室:クラス = 1:4 で合計 --docs 件）。次を --requests 回ずつ計測:
+  ilike       … 教室・講師・クラスを JOIN して ILIKE（索引なし）
+  search      … search.search（よくある語 / 珍しい語 / 2語 AND / type 指定）
+  suggest     … search.suggest（1文字・2文字・4文字の前方一致）
+  update      … 教室名の UPDATE（トリガで差分反映）→ 直後の検索で見つかるまで
+p50/p99、COPY の時間（トリガ込み）、索引サイズを出し、ILIKE と件数が一致することも確かめる。
+"""
+import os, sys, time, uuid, random, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+from seedgen import AREAS
+from naraigoto import pg, search
+
+CATEGORIES = {"dance": "ダンス", "piano": "ピアノ", "swimming": "スイミング", "english": "英会話",
+              "programming": "プログラミング", "soccer": "サッカー", "art": "絵画", "calligraphy": "書道"}
+ADJECTIVES = ("はじめての", "キッズ", "親子で楽しむ", "本格", "少人数", "初心者向け", "上級", "のびのび")
+PHRASES = ("経験豊富な講師が丁寧に指導します。", "体験レッスン随時受付中。", "駅から徒歩5分。",
+           "発表会を年2回開催しています。", "振替制度あり。", "幼児から大人まで通えます。",
+           "少人数制で一人ひとりに合わせます。", "コンクール入賞者多数。")
+SURNAMES = ("佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "山本", "中村", "小林", "加藤")
+GIVEN = ("美咲", "翔太", "陽菜", "大翔", "結衣", "蓮", "さくら", "悠真")
+PROFILES = ("元劇団員。", "音大卒。", "全国大会出場経験あり。", "保育士資格あり。", "海外在住経験10年。",
+            "プロチームのコーチ経験あり。")
+
+def _id(kind, i):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"naraigoto-search/{kind}/{i}"))
+
+def load(dsn, docs):
+    """(COPY 秒, 教室数)"""
+    import bench_pg
+    bench_pg.init(dsn)
+    rnd = random.Random(9)
+    n_schools = max(1, docs // 5)
+    t0 = time.perf_counter()
+    with pg.connect(dsn) as conn, conn.transaction(), conn.cursor() as cur:
+        with cur.copy("COPY schools (id, name, area, category, description) FROM STDIN") as copy:
+            for s in range(n_schools):
+                area, cat = AREAS[s % len(AREAS)], list(CATEGORIES)[rnd.randrange(len(CATEGORIES))]
+                copy.write_row((_id("school", s), f"{area}{CATEGORIES[cat]}教室 {s}", area, cat,
+                                "".join(rnd.sample(PHRASES, 3))))
+        with cur.copy("COPY instructors (id, school_id, name, profile) FROM STDIN") as copy:
+            for s in range(n_schools):
+                for k in range(2):
+                    copy.write_row((_id("instructor", s * 2 + k), _id("school", s),
+                                    f"{rnd.choice(SURNAMES)} {rnd.choice(GIVEN)}", rnd.choice(PROFILES)))
+        with cur.copy("COPY classes (id, school_id, title, capacity, duration_min) FROM STDIN") as copy:
+            for c in range(docs - n_schools):
+                s = c % n_schools
+                cat = list(CATEGORIES)[rnd.randrange(len(CATEGORIES))]
+                copy.write_row((_id("class", c), _id("school", s), f"{rnd.choice(ADJECTIVES)}{CATEGORIES[cat]} {c}", 10, 60))
+    elapsed = time.perf_counter() - t0
+    with pg.connect(dsn) as conn:
+        conn.execute("ANALYZE search_documents")
+    return elapsed, n_schools
+
+ILIKE = """
+SELECT count(*) AS n FROM (
+  SELECT s.id FROM schools s
+   WHERE concat_ws(' ', s.name, s.area, s.category, s.description,
+                   (SELECT string_agg(concat_ws(' ', i.name, i.profile), ' ') FROM instructors i WHERE i.school_id = s.id))
+         ILIKE '%%' || %(q)s || '%%'
+  UNION ALL
+  SELECT c.id FROM classes c JOIN schools s ON s.id = c.school_id
+   WHERE concat_ws(' ', c.title, s.name, s.area, s.category) ILIKE '%%' || %(q)s || '%%'
+) x"""
+
+def _count(q):
+    n, token = 0, None
+    while True:
+        items, token = search.search(q, limit=search.MAX_LIMIT, cursor_token=token)
+        n += len(items)
+        if not token:
+            return n
+
+def measure(name, fn, args, requests):
+    lat = []
+    for i in range(requests):
+        t0 = time.perf_counter()
+        fn(args[i % len(args)])
+        lat.append((time.perf_counter() - t0) * 1000)
+    print(f"{name:22s} p50={local.percentile(lat, 50):8.2f}ms p99={local.percentile(lat, 99):8.2f}ms")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=os.getenv("PG_DSN", "postgresql://postgres@localhost/naraigoto"))
+    ap.add_argument("--docs", type=int, default=100000)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--ilike-requests", type=int, default=20)
+    args = ap.parse_args()
+
+    if pg.psycopg is None:
+        raise SystemExit("psycopg が必要です（pip install 'psycopg[binary]'）")
+    pg.DSN = args.dsn
+    elapsed, n_schools = load(args.dsn, args.docs)
+    pg.reset()
+    sizes = pg.fetch_one("""
+        SELECT count(*) AS docs, pg_size_pretty(pg_relation_size('idx_search_bigrams')) AS gin,
+               pg_size_pretty(pg_relation_size('idx_search_title_prefix')) AS prefix,
+               pg_size_pretty(pg_relation_size('search_documents')) AS heap FROM search_documents""")
+    print(f"loaded {args.docs} docs ({n_schools} schools) with triggers in {elapsed:.1f}s: {sizes}")
+
+    common = ["ピアノ", "ダンス", "英会話", "体験レッスン"]
+    rare = ["コンクール入賞", "海外在住", "書道 杉並", "スイミング 初心者"]
+    for q in common[:2] + rare[:2]:
+        want = pg.fetch_one(ILIKE, {"q": q})["n"]
+        got = _count(q)
+        assert got == want, (q, got, want)
+    print("ok: search counts match ILIKE")
+
+    with pg.connect(args.dsn) as conn:
+        measure("ilike", lambda q: conn.execute(ILIKE, {"q": q}).fetchone(), common + rare, args.ilike_requests)
+    measure("search common", lambda q: search.search(q), common, args.requests)
+    measure("search rare/AND", lambda q: search.search(q), rare, args.requests)
+    measure("search type=school", lambda q: search.search(q, "school"), common, args.requests)
+    measure("search page 3", lambda q: _pages(q, 3), common, args.requests)
+    measure("suggest 1 char", lambda q: search.suggest(q), ["杉", "は", "キ", "練"], args.requests)
+    measure("suggest 2 chars", lambda q: search.suggest(q), ["杉並", "はじ", "キッ", "ピア"], args.requests)
+    measure("suggest 4 chars", lambda q: search.suggest(q), ["杉並ピア", "はじめて", "キッズダ", "本格ダン"], args.requests)
+
+    # 差分反映: 教室名を変えて、直後の検索で見つかるか
+    lat = []
+    for i in range(min(args.requests, 50)):
+        name = f"改名テスト教室{i}"
+        t0 = time.perf_counter()
+        pg.execute("UPDATE schools SET name = %s WHERE id = %s", (name, _id("school", i)))
+        items, _ = search.search(name, "school")
+        lat.append((time.perf_counter() - t0) * 1000)
+        assert items and items[0]["id"] == _id("school", i), name
+    print(f"{'update+search':22s} p50={local.percentile(lat, 50):8.2f}ms p99={local.percentile(lat, 99):8.2f}ms")
+
+def _pages(q, n):
+    token = None
+    for _ in range(n):
+        _, token = search.search(q, cursor_token=token)
+        if not token:
+            break
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Stripe Webhook（naraigoto.billing）: 更新が集中したときの受信の応答時間と、ワーカーの反映の正しさ・スループット
+
+    python lambda/bench/bench_webhooks.py --dsn postgresql://postgres@localhost/naraigoto --events 50000
+
+ベンチ専用データベースに 03_reset.sql → 01_schema.sql を流し（既存データは消える）、家庭ごとの
+Stripe イベント列（契約開始・毎月の請求と決済・プラン変更・決済失敗と再試行・解約）を合計 --events 件ほど作って、
+Stripe の代わりに署名付きで stripe_webhook ハンドラへ --concurrency 本で一斉に送る:
+  - 配信順は作成日時に最大 --jitter 秒のずれを足して並べ替える（同じ顧客のイベントも順不同で届く）
+  - --dup-rate の割合のイベントはもう一度送る（再送。ずれた位置に入る）
+  - 半分の家庭は stripe_customer_id を持たず、イベントの metadata.family_id で紐付く
+受信と並行して --workers 本のワーカー（billing.process_once）を回し、受信の p50/p99・受信スループットと、
+未処理が無くなるまでの反映スループットを出す。最後に、作成日時の順にイベントを1回ずつ適用した場合の状態
+（契約のプラン・状態、決済の状態、月ごとのチケット残高）と RDS が一致すること、重複が1件に畳まれたこと、失敗・保留が無いことを確かめる。
+"""
+import os, sys, json, time, uuid, random, argparse, threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+SECRET = "whsec_bench"
+MONTH = 30 * 86400
+BASE = 1767225600  # 2026-01-01T00:00:00Z
+PLANS = {"standard": 3, "premium": 6}
+
+def _uuid(kind, i):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"naraigoto-webhooks/{kind}/{i}"))
+
+class Timeline:
+    """家庭ごとの Stripe イベント列（created は顧客内で単調増加）"""
+    def __init__(self, rnd):
+        self.rnd, self.events, self.n = rnd, [], 0
+
+    def add(self, type_, created, obj):
+        self.n += 1
+        self.events.append({"id": f"evt_{self.n:08d}", "object": "event", "type": type_, "created": created,
+                            "data": {"object": obj}})
+
+    def family(self, f, months):
+        rnd = self.rnd
+        cus, sub, fam = f"cus_{f:06d}", f"sub_{f:06d}", _uuid("family", f)
+        plan = rnd.choice(list(PLANS))
+        t = BASE + rnd.randint(0, 86400 * 20)
+        meta = {"family_id": fam}
+
+        def subscription(type_, at, status, start):
+            price = {"id": f"price_{plan}", "lookup_key": plan}
+            self.add(type_, at, {"id": sub, "object": "subscription", "customer": cus, "status": status,
+                                 "metadata": meta, "current_period_start": start, "current_period_end": start + MONTH,
+                                 "items": {"data": [{"price": price}]}})
+
+        def pay(at, k, fail):
+            pi = f"pi_{f:06d}_{k:02d}"
+            amount = 2980 if plan == "standard" else 4980
+            obj = {"id": pi, "object": "payment_intent", "customer": cus, "amount": amount, "currency": "jpy",
+                   "metadata": meta, "invoice": f"in_{f:06d}_{k:02d}"}
+            self.add("payment_intent.created", at, dict(obj, status="requires_payment_method"))
+            if fail:
+                self.add("payment_intent.payment_failed", at + 1, dict(obj, status="requires_payment_method"))
+                at += 3600
+            self.add("payment_intent.succeeded", at + 2, dict(obj, status="succeeded", amount_received=amount))
+            self.add("invoice.paid", at + 3, {
+                "id": f"in_{f:06d}_{k:02d}", "object": "invoice", "customer": cus, "subscription": sub,
+                "metadata": meta, "lines": {"data": [{"price": {"lookup_key": plan}, "period": {"start": at}}]}})
+            return at + 4
+
+        if f % 2 == 0:
+            self.add("checkout.session.completed", t, {"id": f"cs_{f:06d}", "object": "checkout.session",
+                                                       "customer": cus, "client_reference_id": fam})
+        subscription("customer.subscription.created", t + 1, "active", t)
+        t = pay(t + 2, 0, False)
+        for k in range(1, months):
+            t = BASE + k * MONTH + rnd.randint(0, 86400 * 20)
+            if rnd.random() < 0.2:
+                plan = "premium" if plan == "standard" else "standard"
+            subscription("customer.subscription.updated", t, "active", t)
+            t = pay(t + 1, k, rnd.random() < 0.1)
+        if rnd.random() < 0.15:
+            subscription("customer.subscription.deleted", t + 10, "canceled", t)
+
+def expected(events):
+    """作成日時順に1回ずつ適用した結果"""
+    subs, pays, tickets = {}, {}, {}
+    for e in sorted(events, key=lambda e: e["created"]):
+        o = e["data"]["object"]
+        if e["type"].startswith("customer.subscription."):
+            status = "canceled" if e["type"].endswith("deleted") else "active"
+            subs[o["id"]] = (o["items"]["data"][0]["price"]["lookup_key"], status)
+        elif e["type"].startswith("payment_intent."):
+            pays[o["id"]] = {"payment_intent.succeeded": "succeeded",
+                             "payment_intent.payment_failed": "failed"}.get(e["type"], "pending")
+        elif e["type"] == "invoice.paid":
+            line = o["lines"]["data"][0]
+            key = (o["metadata"]["family_id"], time.strftime("%Y-%m-01", time.gmtime(line["period"]["start"])))
+            tickets[key] = max(tickets.get(key, 0), PLANS[line["price"]["lookup_key"]])
+    return subs, pays, tickets
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=os.getenv("PG_DSN", "postgresql://postgres@localhost/naraigoto"))
+    ap.add_argument("--events", type=int, default=50000)
+    ap.add_argument("--months", type=int, default=6)
+    ap.add_argument("--dup-rate", type=float, default=0.1)
+    ap.add_argument("--jitter", type=int, default=3 * 86400, help="配信順のずれ（秒）")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--workers", type=int, default=4)
+    args = ap.parse_args()
+
+    os.environ["STRIPE_WEBHOOK_SECRET"] = SECRET
+    from naraigoto import pg, billing, metrics
+    if pg.psycopg is None:
+        raise SystemExit("psycopg が必要です（pip install 'psycopg[binary]'）")
+    import bench_pg
+    pg.DSN = args.dsn
+    pg.POOL_SIZE = max(args.concurrency, args.workers) + 1
+    bench_pg.init(args.dsn)
+    pg.reset()
+    metrics.set_sink(lambda record: None)
+
+    rnd = random.Random(31)
+    tl, families = Timeline(rnd), 0
+    while tl.n < args.events:
+        tl.family(families, args.months)
+        families += 1
+    pg.many("INSERT INTO users (id, type, email, name) VALUES (%s, 'parent', %s, %s)",
+            [(_uuid("parent", f), f"wh{f}@example.com", f"保護者{f}") for f in range(families)])
+    # 奇数の家庭だけ先に顧客 ID を持つ（偶数は checkout.session.completed / metadata で紐付く）
+    pg.many("INSERT INTO families (id, parent_user_id, stripe_customer_id) VALUES (%s, %s, %s)",
+            [(_uuid("family", f), _uuid("parent", f), f"cus_{f:06d}" if f % 2 else None) for f in range(families)])
+
+    deliveries = [(e["created"] + rnd.uniform(0, args.jitter), e) for e in tl.events]
+    deliveries += [(e["created"] + rnd.uniform(0, args.jitter * 2), e) for e in tl.events if rnd.random() < args.dup_rate]
+    deliveries.sort(key=lambda d: d[0])
+    late = sum(1 for i in range(1, len(deliveries)) if deliveries[i][1]["created"] < deliveries[i - 1][1]["created"])
+    print(f"{families} families, {tl.n} events, {len(deliveries)} deliveries "
+          f"({len(deliveries) - tl.n} duplicates, {late} delivered after a newer event)")
+
+    handler = local.load_handler(local.handler_path("stripe_webhook"))
+    bodies = [json.dumps(e, ensure_ascii=False) for _, e in deliveries]
+
+    def _deliver(body):
+        ev = local.http_event("POST", "/webhooks/stripe", body=body,
+                              headers={"Stripe-Signature": billing.sign(body, SECRET)})
+        t0 = time.perf_counter()
+        r = handler(ev, None)
+        return (time.perf_counter() - t0) * 1000, r["statusCode"], json.loads(r["body"]).get("duplicate")
+
+    # ワーカーは受信と並行して回す（古いイベントが新しいイベントの反映後に届く状況を作る）
+    stats = {"events": 0, "failed": 0, "batches": 0}
+    lock, ingested = threading.Lock(), threading.Event()
+
+    def _worker():
+        idle = 0
+        while not ingested.is_set() or idle < 3:
+            r = billing.process_once()
+            with lock:
+                stats["events"] += r["events"]
+                stats["failed"] += r["failed"]
+                stats["batches"] += 1 if r["customers"] else 0
+            idle = 0 if r["customers"] else idle + 1
+            if not r["customers"]:
+                time.sleep(0.05)
+
+    threads = [threading.Thread(target=_worker) for _ in range(args.workers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    with ThreadPoolExecutor(args.concurrency) as ex:
+        results = list(ex.map(_deliver, bodies))
+    ingest_s = time.perf_counter() - t0
+    ingested.set()
+    lat = [r[0] for r in results]
+    assert all(r[1] == 200 for r in results), {r[1] for r in results}
+    dups = sum(1 for r in results if r[2])
+    stored = pg.fetch_one("SELECT count(*) AS n FROM webhook_events")["n"]
+    print(f"ingest: {args.concurrency} senders, {len(results) / ingest_s:.0f} req/s, "
+          f"ack p50={local.percentile(lat, 50):.2f}ms p99={local.percentile(lat, 99):.2f}ms, "
+          f"stored={stored} duplicates acknowledged={dups}")
+    assert stored == tl.n and dups == len(deliveries) - tl.n
+
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    pending = pg.fetch_one(billing.PENDING, {"max_attempts": billing.MAX_ATTEMPTS})
+    print(f"worker: {args.workers} workers, {stats['events']} events in {elapsed:.1f}s "
+          f"({stats['events'] / elapsed:.0f} events/s, {stats['batches']} batches), failed={stats['failed']} "
+          f"pending={pending['n']} parked={pending['parked']}")
+    assert stats["events"] == tl.n and pending["n"] == 0 and pending["parked"] == 0
+
+    subs, pays, tickets = expected(tl.events)
+    bad = 0
+    for r in pg.fetch_all("SELECT stripe_subscription_id, plan, status::text AS status FROM subscriptions"):
+        bad += subs.pop(r["stripe_subscription_id"], None) != (r["plan"], r["status"])
+    for r in pg.fetch_all("SELECT stripe_payment_intent_id, status::text AS status FROM payments"):
+        bad += pays.pop(r["stripe_payment_intent_id"], None) != r["status"]
+    for r in pg.fetch_all("SELECT family_id, month, balance, granted FROM ticket_balances"):
+        key = (str(r["family_id"]), r["month"].strftime("%Y-%m-%d"))
+        want = tickets.pop(key, None)
+        bad += want != r["balance"] or want != r["granted"]
+    bad += len(subs) + len(pays) + len(tickets)
+    linked = pg.fetch_one("SELECT count(*) AS n FROM families WHERE stripe_customer_id IS NULL")["n"]
+    print(f"verify: mismatches={bad}, families without customer id={linked}")
+    assert bad == 0 and linked == 0
+    print("ok: state equals applying each event once in created order")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""ローカル Lambda ランタイムエミュレータ（bench_e2e.py から起動する1関数分のプロセス）
+
+    python lambda/bench/lambda_emulator.py --function post_reviews --memory 512 --latency-ms 10
+
+Lambda の Python ランタイムと同じ手順で動かす:
+  - LAMBDA_TASK_ROOT（関数ディレクトリ）とレイヤー（/opt/python 相当）を sys.path に載せ、
+    _HANDLER=lambda_function.lambda_handler を import する（この時間を init として報告）
+  - 呼び出しごとに LambdaContext を作り、戻り値を json.dumps する（失敗は Runtime.MarshalError）
+  - 例外は errorType / errorMessage で返す
+標準入力の1行1呼び出し（{"id", "event"}）に、標準出力の1行（duration・DynamoDB 呼び出し・
+消費キャパシティ・メモリ確保量と応答）で答える。最初の1行は init の報告。
+"""
+import os, sys, json, time, uuid, argparse, resource, tracemalloc, importlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+class LambdaContext:
+    def __init__(self, function, memory, timeout):
+        self.function_name = function
+        self.function_version = "$LATEST"
+        self.memory_limit_in_mb = str(memory)
+        self.invoked_function_arn = f"arn:aws:lambda:ap-northeast-1:000000000000:function:{function}"
+        self.aws_request_id = str(uuid.uuid4())
+        self.log_group_name = f"/aws/lambda/{function}"
+        self.log_stream_name = time.strftime("%Y/%m/%d/[$LATEST]") + uuid.uuid4().hex
+        self._deadline = time.time() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.time()) * 1000))
+
+def _max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def _init(args):
+    task_root = os.path.join(args.source_dir, args.function)
+    os.environ.update({
+        "AWS_LAMBDA_FUNCTION_NAME": args.function, "AWS_LAMBDA_FUNCTION_VERSION": "$LATEST",
+        "AWS_LAMBDA_FUNCTION_MEMORY_SIZE": str(args.memory), "AWS_EXECUTION_ENV": "AWS_Lambda_python3.12",
+        "LAMBDA_TASK_ROOT": task_root, "_HANDLER": "lambda_function.lambda_handler",
+    })
+    sys.path[:0] = [task_root, local.LAYER_DIR]
+    module_name, handler_name = os.environ["_HANDLER"].rsplit(".", 1)
+    t0 = time.perf_counter()
+    handler = getattr(importlib.import_module(module_name), handler_name)
+    init_ms = (time.perf_counter() - t0) * 1000
+
+    # import 時に作られた client にフックを付ける（init の計測には含めない）
+    from naraigoto import runtime as rt
+    client = rt.client()
+    meter = local.DdbMeter(client, capacity=not args.no_capacity)
+    if args.latency_ms:
+        local.inject_latency(client, args.latency_ms)
+    return handler, init_ms, meter
+
+def _invoke(handler, event, args):
+    context = LambdaContext(args.function, args.memory, args.timeout)
+    try:
+        return {"response": json.loads(json.dumps(handler(event, context)))}
+    except (TypeError, ValueError) as e:
+        return {"error": {"errorType": "Runtime.MarshalError", "errorMessage": str(e)}}
+    except Exception as e:
+        return {"error": {"errorType": type(e).__name__, "errorMessage": str(e)}}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--function", required=True)
+    ap.add_argument("--source-dir", default=local.LAMBDA_DIR)
+    ap.add_argument("--memory", type=int, default=512)
+    ap.add_argument("--timeout", type=float, default=10)
+    ap.add_argument("--latency-ms", type=float, default=0)
+    ap.add_argument("--no-capacity", action="store_true", help="ReturnConsumedCapacity を付けない")
+    args = ap.parse_args()
+
+    out = sys.stdout
+    # ハンドラの print は CloudWatch Logs 相当として標準エラーへ
+    sys.stdout = sys.stderr
+    handler, init_ms, meter = _init(args)
+    out.write(json.dumps({"init_ms": init_ms, "max_rss_mb": _max_rss_mb()}) + "\n")
+    out.flush()
+
+    for line in sys.stdin:
+        req = json.loads(line)
+        trace = req.get("alloc")
+        if trace:
+            tracemalloc.start()
+        meter.take()
+        t0 = time.perf_counter()
+        r = _invoke(handler, req["event"], args)
+        r["duration_ms"] = (time.perf_counter() - t0) * 1000
+        if trace:
+            r["alloc_kb"] = tracemalloc.get_traced_memory()[1] / 1024.0
+            tracemalloc.stop()
+        r.update(id=req.get("id"), ddb=meter.take(), max_rss_mb=_max_rss_mb())
+        out.write(json.dumps(r, ensure_ascii=False) + "\n")
+        out.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""ベンチ用ローカル環境: DynamoDB スタンドイン起動 / テーブル作成 / シード / イベント生成
+
+DynamoDB Local を使う場合は AWS_ENDPOINT_URL_DYNAMODB を設定して起動する。
+未設定なら moto サーバ（pip install "moto[server,dynamodb]"）をスレッドで立ち上げる。
+"""
+import os, sys, json, glob, time, base64, socket, logging, threading, subprocess, importlib.util, tempfile
+from collections import Counter
+from decimal import Decimal
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+LAMBDA_DIR = os.path.join(ROOT, "lambda")
+LAYER_DIR = os.path.join(LAMBDA_DIR, "layer", "python")
+TABLES_DIR = os.path.join(ROOT, "database", "dynamodb", "tables")
+
+# カーソルの署名鍵（本番は関数の環境変数で必ず設定する）
+os.environ.setdefault("CURSOR_SECRET", "naraigoto-local")
+# ベンチでは消費 RCU/WCU も EMF に出す（本番の既定は付けない）
+os.environ.setdefault("METRICS_CAPACITY", "1")
+
+HANDLERS = [
+    "list_lessons", "get_lesson_by_id", "get_reviews", "get_reviews_by_target",
+    "post_reviews", "likes_post", "likes_delete", "likes_list_by_user",
+    "post_booking", "get_my_bookings", "cancel_booking", "get_school_by_id",
+    "likes_check", "likes_bulk", "search_nearby", "get_availability",
+]
+
+HANDLER_ENV = {
+    "AWS_DEFAULT_REGION": "ap-northeast-1",
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "REVIEWS_TABLE": "Reviews",
+    "PARENT_REVIEWS_TABLE": "ParentReviews",
+    "CHILD_REVIEWS_TABLE": "ChildReviews",
+    "LESSONS_TABLE": "Lessons",
+    "CATALOG_TABLE": "LessonsCatalog",
+    "BOOKINGS_TABLE": "Bookings",
+    "LIKES_TABLE": "Likes",
+    "SCHEDULE_SEATS_TABLE": "ScheduleSeats",
+    "TICKET_BALANCES_TABLE": "TicketBalances",
+    "IDEMPOTENCY_TABLE": "IdempotencyKeys",
+    # ベンチ出力に EMF を混ぜない（検査は naraigoto.metrics.LocalSink で）
+    "METRICS_SAMPLE_RATE": "0",
+}
+
+if LAYER_DIR not in sys.path:
+    sys.path.insert(0, LAYER_DIR)
+
+USER_ID = "11111111-1111-1111-1111-111111111111"
+SCHOOL_ID = "bbbbbbbb-bbbb-bbbb-bbbb-bbbbbbbbbbb1"
+
+_server = None
+_proc = None
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _serialize_moto():
+    """moto はリクエストをスレッドで並列処理し、条件付き書き込み/トランザクションが原子的にならない。
+    DynamoDB と同じ結果になるよう API 呼び出しを1本ずつ処理させる（並行性はクライアント側で再現される）"""
+    import threading
+    from moto.dynamodb.responses import DynamoHandler
+    if getattr(DynamoHandler, "_naraigoto_serialized", False):
+        return
+    lock = threading.Lock()
+    call_action = DynamoHandler.call_action
+
+    def serialized(self):
+        with lock:
+            return call_action(self)
+    DynamoHandler.call_action = serialized
+    DynamoHandler._naraigoto_serialized = True
+
+def start_dynamodb(separate_process=False):
+    """DynamoDB エンドポイントを用意し、環境変数に設定して URL を返す
+
+    separate_process=True なら moto を別プロセスで起動する（計測対象のプロセスに
+    サーバ側の CPU 時間・メモリ確保を混ぜないため）
+    """
+    global _server, _proc
+    for k, v in HANDLER_ENV.items():
+        os.environ.setdefault(k, v)
+    endpoint = os.environ.get("AWS_ENDPOINT_URL_DYNAMODB")
+    if endpoint:
+        return endpoint
+    if separate_process:
+        port = _free_port()
+        _proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port)],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        endpoint = f"http://127.0.0.1:{port}"
+        for _ in range(200):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        os.environ["AWS_ENDPOINT_URL_DYNAMODB"] = endpoint
+        return endpoint
+    from moto.server import ThreadedMotoServer
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    _serialize_moto()
+    port = _free_port()
+    _server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    _server.start()
+    endpoint = f"http://127.0.0.1:{port}"
+    os.environ["AWS_ENDPOINT_URL_DYNAMODB"] = endpoint
+    return endpoint
+
+def stop_dynamodb():
+    global _server, _proc
+    if _server is not None:
+        _server.stop()
+        _server = None
+    if _proc is not None:
+        _proc.terminate()
+        _proc.wait()
+        _proc = None
+        os.environ.pop("AWS_ENDPOINT_URL_DYNAMODB", None)
+
+def _serve(port):
+    from moto.server import ThreadedMotoServer
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    _serialize_moto()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    threading.Event().wait()
+
+def inject_latency(client, ms):
+    """client の各 API 呼び出しの送信前に ms ミリ秒待つ（実リージョン相当の RTT を再現）"""
+    import time
+    def _sleep(**_):
+        time.sleep(ms / 1000.0)
+    client.meta.events.register("before-send.dynamodb", _sleep)
+    return _sleep
+
+READ_OPS = ("GetItem", "Query", "Scan", "BatchGetItem", "TransactGetItems")
+CAPACITY_OPS = READ_OPS + ("PutItem", "UpdateItem", "DeleteItem", "BatchWriteItem", "TransactWriteItems")
+
+class DdbMeter:
+    """client の DynamoDB 呼び出し回数（オペレーション別）と消費キャパシティを数える
+
+    capacity=True なら ReturnConsumedCapacity=TOTAL を自動で付ける（指定済みの呼び出しはそのまま）
+    """
+    def __init__(self, client, capacity=True):
+        self._lock = threading.Lock()
+        self.capacity = capacity
+        self.reset()
+        events = client.meta.events
+        events.register("provide-client-params.dynamodb", self._params)
+        events.register("before-call.dynamodb", self._before)
+        events.register("after-call.dynamodb", self._after)
+
+    def reset(self):
+        with self._lock:
+            self.calls, self.rcu, self.wcu = Counter(), 0.0, 0.0
+
+    def take(self):
+        """前回の take 以降の {"calls": {op: n}, "rcu", "wcu"} を返してリセット"""
+        with self._lock:
+            out = {"calls": dict(self.calls), "rcu": self.rcu, "wcu": self.wcu}
+            self.calls, self.rcu, self.wcu = Counter(), 0.0, 0.0
+        return out
+
+    def _params(self, params, model, **_):
+        if self.capacity and model.name in CAPACITY_OPS:
+            params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+    def _before(self, model, **_):
+        with self._lock:
+            self.calls[model.name] += 1
+
+    def _after(self, parsed, model, **_):
+        cc = parsed.get("ConsumedCapacity") if isinstance(parsed, dict) else None
+        if not cc:
+            return
+        units = sum(float(c.get("CapacityUnits") or 0) for c in (cc if isinstance(cc, list) else [cc]))
+        with self._lock:
+            if model.name in READ_OPS:
+                self.rcu += units
+            else:
+                self.wcu += units
+
+def ddb_client():
+    import boto3
+    return boto3.client("dynamodb")
+
+def create_tables(client=None):
+    client = client or ddb_client()
+    existing = set(client.list_tables().get("TableNames", []))
+    for path in sorted(glob.glob(os.path.join(TABLES_DIR, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            spec = json.load(f)
+        if spec["TableName"] not in existing:
+            client.create_table(**spec)
+
+def seed(n_lessons=20, n_reviews=50):
+    """各ハンドラが実データを返せる程度の小さなデータセット"""
+    import boto3
+    from naraigoto import catalog
+    ddb = boto3.resource("dynamodb")
+    with ddb.Table("Lessons").batch_writer() as w, ddb.Table("LessonsCatalog").batch_writer() as cw:
+        for i in range(n_lessons):
+            lesson = {"lessonId": f"L{i:03d}", "title": f"はじめてのダンス {i}",
+                      "area": "杉並", "genre": "dance", "ratingAvg": Decimal("4.5"),
+                      "ratingCount": 12, "createdAt": f"2025-09-{1 + i % 28:02d}T00:00:00Z",
+                      "lat": Decimal("35.699") + Decimal(i) / 1000, "lon": Decimal("139.636")}
+            w.put_item(Item=lesson)
+            cw.put_item(Item=catalog.to_catalog_item(lesson))
+    for name, role in (("ParentReviews", "parent"), ("ChildReviews", "child")):
+        with ddb.Table(name).batch_writer() as w:
+            for i in range(n_reviews):
+                w.put_item(Item={"lessonsId": "L001", "createdAt": f"2025-09-{1 + i % 28:02d}T10:{i % 60:02d}:00.000Z",
+                                 "reviewId": f"{role}-{i}", "userId": USER_ID, "rating": Decimal(1 + i % 5),
+                                 "comment": "講師の方が親切でした。" * 3, "role": role,
+                                 "targetType": "school", "targetId": SCHOOL_ID,
+                                 "targetKey": f"school#{SCHOOL_ID}"})
+    ddb.Table("Likes").put_item(Item={"userId": USER_ID, "schoolId": SCHOOL_ID})
+    from naraigoto import booking
+    ddb.Table("TicketBalances").put_item(Item={"userId": USER_ID, "month": booking.ticket_month(), "balance": 10 ** 6})
+    # L001 の週1回 x 8週の座席カウンタ（get_availability の期間検索用）
+    with ddb.Table("ScheduleSeats").batch_writer() as w:
+        for k in range(8):
+            start_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1756832400 + k * 7 * 86400))
+            w.put_item(Item={"scheduleId": booking.schedule_id("L001", start_at), "sk": booking.SEATS_SK,
+                             "lessonId": "L001", "startAt": start_at, "capacity": 10, "reserved": k % 11})
+    with ddb.Table("Bookings").batch_writer() as w:
+        for i in range(20):
+            w.put_item(Item={"bookingId": f"B{i:03d}", "userId": USER_ID, "lessonId": "L001",
+                             "schedule": "2025-09-30T17:00:00Z", "status": "reserved",
+                             "consumedTickets": 1, "createdAt": 1758000000 + i})
+
+# --------- API Gateway イベント ---------
+def http_event(method, path, path_params=None, query=None, body=None, version=2, headers=None, b64=False):
+    """API Gateway HTTP API(v2) / REST(v1) 形式のイベント（b64=True でボディを base64 に）"""
+    payload = json.dumps(body, ensure_ascii=False) if isinstance(body, (dict, list)) else body
+    if b64 and payload is not None:
+        payload = base64.b64encode(payload.encode("utf-8")).decode("ascii")
+    if version == 1:
+        return {"httpMethod": method, "path": path, "pathParameters": path_params,
+                "queryStringParameters": query, "body": payload, "isBase64Encoded": b64,
+                "headers": dict(headers or {}), "requestContext": {"httpMethod": method}}
+    return {"version": "2.0", "rawPath": path, "pathParameters": path_params,
+            "queryStringParameters": query, "body": payload, "isBase64Encoded": b64,
+            "headers": {k.lower(): v for k, v in (headers or {}).items()},
+            "requestContext": {"http": {"method": method, "path": path}}}
+
+def default_events():
+    return {
+        "list_lessons": http_event("GET", "/lessons"),
+        "get_lesson_by_id": http_event("GET", "/lessons/L001", {"lessonId": "L001"}),
+        "get_reviews": http_event("GET", "/reviews", query={"lessonsId": "L001"}),
+        "get_reviews_by_target": http_event("GET", "/reviews/by-target",
+                                            query={"targetType": "school", "targetId": SCHOOL_ID}),
+        "post_reviews": http_event("POST", "/reviews", body={"lessonsId": "L001", "userId": USER_ID,
+                                                             "rating": 5, "comment": "とても良い", "role": "parent"}),
+        "likes_post": http_event("POST", "/likes", body={"userId": USER_ID, "schoolId": SCHOOL_ID}),
+        "likes_delete": http_event("DELETE", f"/likes/{USER_ID}/{SCHOOL_ID}",
+                                   {"userId": USER_ID, "schoolId": SCHOOL_ID}),
+        "likes_list_by_user": http_event("GET", f"/users/{USER_ID}/likes", {"userId": USER_ID}),
+        "post_booking": http_event("POST", "/bookings", body={"userId": USER_ID, "lessonId": "L001"}),
+        "get_my_bookings": http_event("GET", "/me/bookings", query={"userId": USER_ID}),
+        "cancel_booking": http_event("POST", "/bookings/B000/cancel", {"id": "B000"}),
+        "get_school_by_id": http_event("GET", f"/schools/{SCHOOL_ID}", {"id": SCHOOL_ID}),
+        "likes_check": http_event("GET", f"/users/{USER_ID}/likes/check", {"userId": USER_ID},
+                                  {"schoolIds": ",".join([SCHOOL_ID] + [f"S{i:03d}" for i in range(59)])}),
+        "likes_bulk": http_event("POST", "/likes/bulk", body={"userId": USER_ID,
+                                                              "like": [f"S{i:03d}" for i in range(0, 20, 2)]}),
+        "search_nearby": http_event("GET", "/lessons/nearby", query={"lat": "35.7", "lon": "139.64", "limit": "10"}),
+        "get_availability": http_event("GET", "/lessons/L001/availability", {"lessonId": "L001"},
+                                       {"from": "2025-09-01T00:00:00Z", "to": "2025-10-29T00:00:00Z"}),
+    }
+
+# --------- ハンドラ読み込み ---------
+def handler_path(name, source_dir=LAMBDA_DIR):
+    return os.path.join(source_dir, name, "lambda_function.py")
+
+def load_handler(path, alias=None):
+    """lambda_function.py をモジュールとして読み込み lambda_handler を返す"""
+    alias = alias or "bench_" + os.path.basename(os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(alias, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod.lambda_handler
+
+def checkout_handlers(rev):
+    """git の任意リビジョンのハンドラを一時ディレクトリへ展開する（before/after 比較用）"""
+    out = tempfile.mkdtemp(prefix=f"naraigoto-{rev}-")
+    for name in HANDLERS:
+        rel = f"lambda/{name}/lambda_function.py"
+        try:
+            src = subprocess.check_output(["git", "-C", ROOT, "show", f"{rev}:{rel}"], stderr=subprocess.DEVNULL)
+        except subprocess.CalledProcessError:
+            continue
+        os.makedirs(os.path.join(out, name))
+        with open(os.path.join(out, name, "lambda_function.py"), "wb") as f:
+            f.write(src)
+    return out
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    k = min(len(xs) - 1, max(0, int(round(p / 100.0 * (len(xs) - 1)))))
+    return xs[k]
+
+if __name__ == "__main__" and len(sys.argv) == 3 and sys.argv[1] == "--serve":
+    _serve(int(sys.argv[2]))
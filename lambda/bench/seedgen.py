@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+"""大量シードデータ生成（DynamoDB / PostgreSQL / CSV）
+
+    # 約 1,000 万行（scale=1 で約 24 万行）を DynamoDB と PostgreSQL に投入
+    python lambda/bench/seedgen.py --scale 50 --target dynamodb postgres --dsn postgresql://localhost/naraigoto
+    # ローカルの moto に投入 / 生成速度とメモリだけ測る
+    python lambda/bench/seedgen.py --scale 1 --target dynamodb --local
+    python lambda/bench/seedgen.py --scale 50 --target null
+
+教室 → 講師・クラス → 週次スケジュール → 家族（保護者・子ども・サブスク・チケット）→ 予約
+→ 出欠・口コミ・会話/メッセージ・いいね の順に1件ずつ生成し、そのまま各シンクへ流す。
+- ID は (種別, 連番) から決まる UUID なので、参照先を保持しなくても外部キーが一致する
+- 人気は Zipf（--zipf）: 予約はクラス、いいねは教室に偏る。定員を超える回は別の週へ回す
+- 保持するのは回ごとの予約数（スケジュール数ぶんの配列）のみ。行数に対してメモリは一定
+- DynamoDB: 25 件ずつのバッチを上限付きキューに積み、複数スレッドで BatchWriteItem（未処理は再送）
+- PostgreSQL: テーブルごとに一時 CSV へ書き出し、外部キー順に COPY FROM STDIN（psycopg 3 が必要）
+"""
+import os, sys, csv, time, uuid, queue, random, argparse, resource, tempfile, threading
+from array import array
+from bisect import bisect
+from decimal import Decimal
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local
+
+try:
+    import psycopg
+except ImportError:  # PostgreSQL への投入時のみ必要
+    psycopg = None
+
+AREAS = ("杉並", "世田谷", "練馬", "中野", "渋谷", "目黒", "品川", "大田", "港", "新宿", "文京", "豊島")
+# 区ごとのおおよその中心（緯度, 経度）
+AREA_CENTERS = {
+    "杉並": (35.699, 139.636), "世田谷": (35.646, 139.653), "練馬": (35.736, 139.652), "中野": (35.708, 139.664),
+    "渋谷": (35.664, 139.698), "目黒": (35.641, 139.698), "品川": (35.609, 139.730), "大田": (35.561, 139.716),
+    "港": (35.658, 139.752), "新宿": (35.694, 139.703), "文京": (35.708, 139.752), "豊島": (35.726, 139.716),
+}
+CATEGORIES = ("dance", "piano", "swimming", "english", "programming", "soccer", "art", "calligraphy")
+COMMENTS = ("先生がとても丁寧でした。", "子どもが楽しそうに通っています。", "教室が清潔で安心です。",
+            "振替がしやすくて助かります。", "少し難しかったようです。", "体験から入会を決めました。")
+MESSAGES = ("来週の振替は可能でしょうか。", "承知しました。お待ちしております。", "持ち物を教えてください。",
+            "本日はありがとうございました。", "少し遅れて到着します。")
+
+# 種別ごとの UUID 上位ビット（連番と組み合わせて決定的な ID にする）
+KINDS = {k: i + 1 for i, k in enumerate((
+    "school", "owner", "instructor", "class", "schedule", "family", "parent", "child", "subscription",
+    "ticket", "booking", "attendance", "review", "conversation", "message"))}
+
+# PostgreSQL の列（database/postgres/01_schema.sql）。この順に COPY する（外部キー順）
+PG_COLUMNS = {
+    "users": ("id", "type", "email", "name", "created_at"),
+    "schools": ("id", "name", "area", "category", "description", "image_key", "location", "created_at"),
+    "instructors": ("id", "school_id", "name", "profile", "image_key", "created_at"),
+    "classes": ("id", "school_id", "title", "capacity", "duration_min", "created_at"),
+    "lesson_schedules": ("id", "class_id", "instructor_id", "start_at", "end_at", "created_at"),
+    "families": ("id", "parent_user_id", "stripe_customer_id", "created_at"),
+    "family_members": ("family_id", "child_user_id"),
+    "subscriptions": ("id", "family_id", "plan", "status", "current_period_start", "current_period_end",
+                      "stripe_subscription_id", "created_at"),
+    "ticket_balances": ("id", "family_id", "month", "balance", "created_at"),
+    "bookings": ("id", "user_id", "schedule_id", "status", "consumed_tickets", "created_at"),
+    "attendances": ("id", "booking_id", "status", "created_at"),
+    "conversations": ("id", "booking_id", "family_id", "school_id", "created_at"),
+    "messages": ("id", "conversation_id", "sender_user_id", "body", "created_at", "read_at"),
+}
+
+DDB_TABLES = {
+    "lessons": os.getenv("LESSONS_TABLE", "Lessons"),
+    "catalog": os.getenv("CATALOG_TABLE", "LessonsCatalog"),
+    "seats": os.getenv("SCHEDULE_SEATS_TABLE", "ScheduleSeats"),
+    "bookings": os.getenv("BOOKINGS_TABLE", "Bookings"),
+    "tickets": os.getenv("TICKET_BALANCES_TABLE", "TicketBalances"),
+    "reviews": os.getenv("REVIEWS_TABLE", "Reviews"),
+    "likes": os.getenv("LIKES_TABLE", "Likes"),
+}
+
+class Config:
+    """scale=1 あたりの件数（各比率は引数で上書き可）"""
+    def __init__(self, args):
+        self.schools = max(1, int(200 * args.scale))
+        self.families = max(1, int(5000 * args.scale))
+        self.instructors_per_school = 3
+        self.classes_per_school = 5
+        self.weeks = args.weeks
+        self.bookings_per_child = args.bookings_per_child
+        self.likes_per_family = args.likes_per_family
+        self.review_rate = args.review_rate
+        self.message_rate = args.message_rate
+        self.zipf = args.zipf
+        self.seed = args.seed
+        self.start = args.start
+        self.classes = self.schools * self.classes_per_school
+        self.schedules = self.classes * self.weeks
+
+_MIX = 0x9E3779B97F4A7C15F39CC0605CEDC835  # 奇数との乗算は 2^128 を法とした全単射
+_MASK = (1 << 128) - 1
+
+def uid(kind, n, seed):
+    """(種別, 連番) → UUID。連番のままだとインデックスへの挿入が実運用（ランダム UUID）より有利になるので混ぜる"""
+    return str(uuid.UUID(int=(((seed & 0xFFFFFFFF) << 96 | KINDS[kind] << 80 | n) * _MIX) & _MASK))
+
+def ts(epoch):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+
+def zipf_cum(n, s):
+    return list(accumulate(1.0 / (i + 1) ** s for i in range(n)))
+
+class Generator:
+    """(sink, table, row) を順に生成する。row は dict（DynamoDB 用と PostgreSQL 用は別 table 名）"""
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.rnd = random.Random(cfg.seed)
+        c = cfg
+        self.capacity = array("H", (self.rnd.randint(6, 20) for _ in range(c.classes)))
+        self.quality = array("f", (self.rnd.uniform(3.0, 5.0) for _ in range(c.classes)))
+        self.reserved = array("H", bytes(2 * c.schedules))
+        # 人気の順位はクラス番号と無関係にする（番号の小さい教室ばかり人気にならないよう）
+        self.class_rank = list(range(c.classes))
+        self.rnd.shuffle(self.class_rank)
+        self.school_rank = list(range(c.schools))
+        self.rnd.shuffle(self.school_rank)
+        self.class_cum = zipf_cum(c.classes, c.zipf)
+        self.school_cum = zipf_cum(c.schools, c.zipf)
+        self.booking_n = self.review_n = self.message_n = self.conv_n = 0
+        self.now = int(time.time())
+
+    def _id(self, kind, n):
+        return uid(kind, n, self.cfg.seed)
+
+    def _pick(self, cum, ranks):
+        return ranks[bisect(cum, self.rnd.random() * cum[-1])]
+
+    def school(self, s):
+        area = AREAS[s % len(AREAS)]
+        return area, CATEGORIES[(s // len(AREAS)) % len(CATEGORIES)]
+
+    def schedule_start(self, sched):
+        cls, week = divmod(sched, self.cfg.weeks)
+        # クラスごとに曜日・時刻を固定（平日 16〜19 時 / 土日 9〜16 時）
+        day = cls % 7
+        hour = 9 + cls % 8 if day >= 5 else 16 + cls % 4
+        return self.cfg.start + week * 7 * 86400 + day * 86400 + hour * 3600
+
+    def catalog(self):
+        c, rnd = self.cfg, self.rnd
+        created = c.start - 365 * 86400
+        for s in range(c.schools):
+            sid, area, category = self._id("school", s), *self.school(s)
+            lat, lon = AREA_CENTERS[area]
+            lat, lon = lat + rnd.uniform(-0.02, 0.02), lon + rnd.uniform(-0.02, 0.02)
+            owner = self._id("owner", s)
+            yield "pg", "users", (owner, "school_owner", f"owner{s}@example.com", f"オーナー{s}", ts(created))
+            yield "pg", "schools", (sid, f"{area}{category}教室{s}", area, category, "", f"schools/{s}.jpg",
+                                    f"({lon:.6f},{lat:.6f})", ts(created))
+            for k in range(c.instructors_per_school):
+                i = s * c.instructors_per_school + k
+                yield "pg", "instructors", (self._id("instructor", i), sid, f"講師{i}", "", "", ts(created))
+            for k in range(c.classes_per_school):
+                cls = s * c.classes_per_school + k
+                lesson_id = self._id("class", cls)
+                title = f"{area}の{category}クラス {cls}"
+                yield "pg", "classes", (lesson_id, sid, title, self.capacity[cls], 60, ts(created))
+                lesson = {"lessonId": lesson_id, "schoolId": sid, "title": title, "area": area,
+                          "category": category, "genre": category, "capacity": self.capacity[cls],
+                          "ratingAvg": Decimal(str(round(self.quality[cls], 1))), "createdAt": ts(created + cls),
+                          "lat": Decimal(f"{lat:.6f}"), "lon": Decimal(f"{lon:.6f}")}
+                yield "ddb", "lessons", lesson
+                yield "ddb", "catalog", lesson
+                instructor = self._id("instructor", s * c.instructors_per_school + k % c.instructors_per_school)
+                for w in range(c.weeks):
+                    sched = cls * c.weeks + w
+                    start = self.schedule_start(sched)
+                    yield "pg", "lesson_schedules", (self._id("schedule", sched), lesson_id, instructor,
+                                                     ts(start), ts(start + 3600), ts(created))
+
+    def _book(self, exclude):
+        """Zipf でクラスを選び、空きのある週の回を返す（満席なら他の週 → 他のクラス）"""
+        c = self.cfg
+        for _ in range(4):
+            cls = self._pick(self.class_cum, self.class_rank)
+            w0 = self.rnd.randrange(c.weeks)
+            for d in range(c.weeks):
+                sched = cls * c.weeks + (w0 + d) % c.weeks
+                if sched not in exclude and self.reserved[sched] < self.capacity[cls]:
+                    return cls, sched
+        return None, None
+
+    def families(self):
+        c, rnd = self.cfg, self.rnd
+        now = self.now
+        month = ts(now)[:7]
+        for f in range(c.families):
+            fid, parent = self._id("family", f), self._id("parent", f)
+            joined = c.start - rnd.randint(30, 700) * 86400
+            yield "pg", "users", (parent, "parent", f"parent{f}@example.com", f"保護者{f}", ts(joined))
+            yield "pg", "families", (fid, parent, f"cus_{f:010d}", ts(joined))
+            yield "pg", "subscriptions", (self._id("subscription", f), fid, "standard",
+                                          "active" if f % 10 else "canceled", ts(now - 86400 * 10),
+                                          ts(now + 86400 * 20), f"sub_{f:010d}", ts(joined))
+            yield "pg", "ticket_balances", (self._id("ticket", f), fid, month + "-01", 8, ts(joined))
+            children = [self._id("child", f * 2 + k) for k in range(1 + f % 2)]
+            for k, child in enumerate(children):
+                yield "pg", "users", (child, "child", f"child{f * 2 + k}@example.com", f"子ども{f * 2 + k}", ts(joined))
+                yield "pg", "family_members", (fid, child)
+                yield "ddb", "tickets", {"userId": child, "month": month, "balance": 8}
+                yield from self._bookings(f, fid, parent, child, joined)
+            yield from self._likes(parent)
+
+    def _bookings(self, f, fid, parent, child, joined):
+        c, rnd = self.cfg, self.rnd
+        n = min(c.weeks * 3, int(rnd.expovariate(1.0 / c.bookings_per_child)) + 1)
+        seen = set()
+        for _ in range(n):
+            cls, sched = self._book(seen)
+            if sched is None:
+                continue
+            seen.add(sched)
+            b = self.booking_n
+            self.booking_n += 1
+            bid, lesson_id, start = self._id("booking", b), self._id("class", cls), self.schedule_start(sched)
+            created = min(self.now, max(joined, start - rnd.randint(1, 21) * 86400))
+            canceled = rnd.random() < 0.1
+            if not canceled:
+                self.reserved[sched] += 1
+            start_at = ts(start)
+            yield "pg", "bookings", (bid, child, self._id("schedule", sched), "canceled" if canceled else "confirmed",
+                                     1, ts(created))
+            yield "ddb", "bookings", {"bookingId": bid, "userId": child, "lessonId": lesson_id, "schedule": start_at,
+                                      "scheduleId": f"{lesson_id}#{start_at}",
+                                      "status": "canceled" if canceled else "reserved",
+                                      "consumedTickets": 1, "createdAt": created, "ticketMonth": ts(created)[:7]}
+            if canceled:
+                continue
+            yield "ddb", "seats", {"scheduleId": f"{lesson_id}#{start_at}", "sk": f"USER#{child}", "bookingId": bid}
+            if start > self.now:
+                continue
+            attended = rnd.random() < 0.92
+            yield "pg", "attendances", (self._id("attendance", b), bid, "attended" if attended else "absent",
+                                        ts(start + 3600))
+            if attended and rnd.random() < c.review_rate:
+                yield "ddb", "reviews", self._review(cls, bid, fid, parent, child, start)
+            if rnd.random() < c.message_rate:
+                yield from self._conversation(cls, bid, fid, parent, start)
+
+    def _review(self, cls, bid, fid, parent, child, start):
+        rnd = self.rnd
+        role = "parent" if rnd.random() < 0.6 else "child"
+        rating = min(5, max(1, round(rnd.gauss(self.quality[cls], 0.8))))
+        school = cls // self.cfg.classes_per_school
+        sid = self._id("school", school)
+        created = ts(start + rnd.randint(2, 72) * 3600)
+        r = self.review_n
+        self.review_n += 1
+        return {"lessonsId": self._id("class", cls), "sk": f"{role}#{created}", "createdAt": created,
+                "reviewId": self._id("review", r), "bookingId": bid, "familyId": fid,
+                "userId": parent if role == "parent" else child, "role": role, "rating": Decimal(rating),
+                "comment": COMMENTS[r % len(COMMENTS)], "targetType": "school", "targetId": sid,
+                "targetKey": f"school#{sid}"}
+
+    def _conversation(self, cls, bid, fid, parent, start):
+        rnd = self.rnd
+        school = cls // self.cfg.classes_per_school
+        conv = self._id("conversation", self.conv_n)
+        self.conv_n += 1
+        at = start - rnd.randint(1, 48) * 3600
+        yield "pg", "conversations", (conv, bid, fid, self._id("school", school), ts(at))
+        for k in range(rnd.randint(1, 6)):
+            sender = parent if k % 2 == 0 else self._id("owner", school)
+            at += rnd.randint(60, 7200)
+            yield "pg", "messages", (self._id("message", self.message_n), conv, sender,
+                                     MESSAGES[(self.message_n + k) % len(MESSAGES)], ts(at), ts(at + 600))
+            self.message_n += 1
+
+    def _likes(self, parent):
+        n = min(self.cfg.schools, int(self.rnd.expovariate(1.0 / self.cfg.likes_per_family)))
+        seen = set()
+        for _ in range(n):
+            s = self._pick(self.school_cum, self.school_rank)
+            if s not in seen:
+                seen.add(s)
+                yield "ddb", "likes", {"userId": parent, "schoolId": self._id("school", s)}
+
+    def seats(self):
+        """予約の生成後に回ごとの座席カウンタ（予約中の件数）を出す"""
+        c = self.cfg
+        for sched in range(c.schedules):
+            cls = sched // c.weeks
+            lesson_id, start_at = self._id("class", cls), ts(self.schedule_start(sched))
+            yield "ddb", "seats", {"scheduleId": f"{lesson_id}#{start_at}", "sk": "SEATS", "lessonId": lesson_id,
+                                   "startAt": start_at, "capacity": self.capacity[cls],
+                                   "reserved": self.reserved[sched]}
+
+    def rows(self):
+        yield from self.catalog()
+        yield from self.families()
+        yield from self.seats()
+
+# --------- シンク ---------
+class Stats:
+    def __init__(self, every=5.0):
+        self.rows = {}
+        self.t0 = self.last = time.perf_counter()
+        self.every = every
+
+    def add(self, table):
+        self.rows[table] = self.rows.get(table, 0) + 1
+        now = time.perf_counter()
+        if now - self.last >= self.every:
+            self.last = now
+            self.report("progress")
+
+    def total(self):
+        return sum(self.rows.values())
+
+    def report(self, label):
+        elapsed = time.perf_counter() - self.t0
+        n = self.total()
+        # ru_maxrss は Linux では KB
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"[{label}] rows={n} elapsed={elapsed:.1f}s rows/s={n / elapsed if elapsed else 0:,.0f} "
+              f"maxrss={rss:.0f}MB", flush=True)
+
+class DynamoSink:
+    """テーブルごとに 25 件溜めてキューへ。workers 本のスレッドが BatchWriteItem する"""
+    def __init__(self, client, workers=8, depth=64):
+        from naraigoto import catalog
+        self.catalog = catalog
+        self.client = client
+        self.buffers = {}
+        self.queue = queue.Queue(maxsize=depth)
+        self.retries = 0
+        self.error = None
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for t in self.threads:
+            t.start()
+
+    def put(self, table, item):
+        if table == "catalog":
+            item = self.catalog.to_catalog_item(item)
+        buf = self.buffers.setdefault(table, [])
+        buf.append({"PutRequest": {"Item": item}})
+        if len(buf) == 25:
+            self._submit(table, buf)
+            self.buffers[table] = []
+
+    def _submit(self, table, buf):
+        if self.error:
+            raise self.error
+        self.queue.put((DDB_TABLES[table], buf))
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            table, buf = job
+            try:
+                self._write(table, buf)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _write(self, table, buf):
+        request = {table: buf}
+        for attempt in range(12):
+            try:
+                r = self.client.batch_write_item(RequestItems=request)
+            except self.client.exceptions.ProvisionedThroughputExceededException:
+                r = {"UnprocessedItems": request}
+            request = r.get("UnprocessedItems") or {}
+            if not request:
+                return
+            self.retries += 1
+            time.sleep(random.uniform(0, 0.05 * (2 ** min(attempt, 6))))
+        raise RuntimeError(f"BatchWriteItem: unprocessed items remain for {table}")
+
+    def close(self):
+        for table, buf in self.buffers.items():
+            if buf:
+                self._submit(table, buf)
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        if self.error:
+            raise self.error
+
+class CsvSink:
+    """テーブルごとの CSV（COPY の FORMAT csv と同じ形式）"""
+    def __init__(self, out_dir=None):
+        self.dir = out_dir or tempfile.mkdtemp(prefix="naraigoto-seed-")
+        os.makedirs(self.dir, exist_ok=True)
+        self.files, self.writers = {}, {}
+
+    def path(self, table):
+        return os.path.join(self.dir, f"{table}.csv")
+
+    def put(self, table, row):
+        w = self.writers.get(table)
+        if w is None:
+            f = self.files[table] = open(self.path(table), "w", newline="", encoding="utf-8")
+            w = self.writers[table] = csv.writer(f)
+        w.writerow(row)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        print(f"CSV: {self.dir}")
+
+class PostgresSink(CsvSink):
+    """一時 CSV に書き出し、close 時に外部キー順で COPY FROM STDIN"""
+    def __init__(self, dsn, out_dir=None):
+        if psycopg is None:
+            raise SystemExit("PostgreSQL への投入には psycopg（pip install 'psycopg[binary]'）が必要")
+        super().__init__(out_dir)
+        self.dsn = dsn
+
+    def close(self):
+        super().close()
+        t0 = time.perf_counter()
+        n = 0
+        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
+            for table, cols in PG_COLUMNS.items():
+                if table not in self.files:
+                    continue
+                with open(self.path(table), encoding="utf-8") as f, \
+                        cur.copy(f"COPY {table} ({', '.join(cols)}) FROM STDIN WITH (FORMAT csv)") as copy:
+                    while True:
+                        chunk = f.read(1 << 20)
+                        if not chunk:
+                            break
+                        copy.write(chunk)
+                n += cur.rowcount if cur.rowcount and cur.rowcount > 0 else 0
+                print(f"COPY {table}: {cur.rowcount} rows", flush=True)
+        elapsed = time.perf_counter() - t0
+        print(f"[postgres] COPY {n} rows in {elapsed:.1f}s ({n / elapsed if elapsed else 0:,.0f} rows/s)")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", type=float, default=1.0, help="1 あたり教室 200・家族 5,000（約 24 万行）")
+    ap.add_argument("--target", nargs="+", default=["dynamodb"], choices=("dynamodb", "postgres", "csv", "null"))
+    ap.add_argument("--dsn", default=os.getenv("DATABASE_URL", ""))
+    ap.add_argument("--out", help="csv の出力先（postgres は一時ディレクトリ）")
+    ap.add_argument("--local", action="store_true", help="moto（または AWS_ENDPOINT_URL_DYNAMODB）に投入")
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--weeks", type=int, default=12)
+    ap.add_argument("--bookings-per-child", type=float, default=6)
+    ap.add_argument("--likes-per-family", type=float, default=3)
+    ap.add_argument("--review-rate", type=float, default=0.3)
+    ap.add_argument("--message-rate", type=float, default=0.1)
+    ap.add_argument("--zipf", type=float, default=1.1)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--start", type=int, default=None, help="最初の週（epoch 秒）。既定は 8 週間前")
+    args = ap.parse_args()
+    if args.start is None:
+        args.start = (int(time.time()) // 86400 - 56) * 86400
+
+    cfg = Config(args)
+    sinks = {}
+    if args.local:
+        local.start_dynamodb()
+        local.create_tables()
+    try:
+        if "dynamodb" in args.target:
+            from naraigoto import runtime as rt
+            os.environ.setdefault("DDB_MAX_POOL_CONNECTIONS", str(args.workers * 2))
+            sinks["ddb"] = DynamoSink(rt.client(), args.workers)
+        if "postgres" in args.target:
+            if not args.dsn:
+                ap.error("--dsn（または DATABASE_URL）が必要")
+            sinks["pg"] = PostgresSink(args.dsn, args.out)
+        elif "csv" in args.target:
+            sinks["pg"] = CsvSink(args.out)
+
+        stats = Stats()
+        for sink, table, row in Generator(cfg).rows():
+            s = sinks.get(sink)
+            if s is not None:
+                s.put(table, row)
+            stats.add(f"{sink}.{table}")
+        stats.report("generated")
+        for s in sinks.values():
+            s.close()
+        stats.report("done")
+        for table, n in sorted(stats.rows.items()):
+            print(f"  {table:24s} {n:>12,}")
+        if "ddb" in sinks:
+            print(f"  BatchWriteItem retries: {sinks['ddb'].retries}")
+    finally:
+        if args.local:
+            local.stop_dynamodb()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import os
+from naraigoto import runtime as rt, messaging, metrics
+from naraigoto.cursor import CursorError
+
+# メッセージ: GET /conversations/{conversationId}/messages?limit=&cursor=（新しい順。latestCursor を since に渡す）
+#             GET /conversations/{conversationId}/messages?since=<cursor>&wait=20（新着を古い順に。無ければ wait 秒まで待つ）
+#             POST /conversations/{conversationId}/messages { userId, body }
+# since は WebSocket に繋がらないときのロングポーリング。PG_DSN が必要
+DEFAULT_LIMIT = 50
+# Lambda のタイムアウト前に返す余裕（ミリ秒）
+MARGIN_MS = int(os.getenv("MESSAGES_MARGIN_MS", "2000"))
+
+HEADERS = rt.cors_headers("GET,POST,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+def _wait(q, context):
+    try:
+        wait = float(q.get("wait") or 0)
+    except ValueError:
+        raise ValueError("wait must be a number")
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        wait = min(wait, max(0.0, (context.get_remaining_time_in_millis() - MARGIN_MS) / 1000.0))
+    return wait
+
+@rt.http_handler(HEADERS)
+def lambda_handler(event, context):
+    pp = event.get("pathParameters") or {}
+    q = event.get("queryStringParameters") or {}
+    if not isinstance(pp, dict):
+        pp = {}
+    if not isinstance(q, dict):
+        q = {}
+    conversation_id = pp.get("conversationId") or q.get("conversationId")
+    if not conversation_id:
+        return _resp(400, {"ok": False, "error": "conversationId required"})
+
+    try:
+        if rt.http_method(event) == "POST":
+            b = rt.json_body(event)
+            if not isinstance(b, dict):
+                return _resp(400, {"ok": False, "error": "invalid_json"})
+            if not b.get("userId"):
+                return _resp(400, {"ok": False, "error": "Missing field: userId"})
+            item, latest = messaging.send(conversation_id, b["userId"], b.get("body"))
+            return _resp(201, {"ok": True, "message": item, "latestCursor": latest})
+
+        try:
+            limit = int(q.get("limit") or DEFAULT_LIMIT)
+        except ValueError:
+            limit = DEFAULT_LIMIT
+        if "since" in q:
+            items, latest = messaging.since(conversation_id, q.get("since"), limit, _wait(q, context))
+            return _resp(200, {"ok": True, "items": items, "latestCursor": latest})
+        items, next_cursor, latest = messaging.messages(conversation_id, limit, q.get("cursor"))
+        return _resp(200, {"ok": True, "items": items, "nextCursor": next_cursor, "latestCursor": latest})
+    except (ValueError, CursorError) as e:
+        return _resp(400, {"ok": False, "error": str(e)})
+    except messaging.MessagingError as e:
+        return _resp(e.status, {"ok": False, "error": e.code})
+    except Exception as e:
+        metrics.error("conversation_messages failed", e)
+        return _resp(500, {"ok": False, "error": "internal_error"})
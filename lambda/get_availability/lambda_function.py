@@ -0,0 +1,38 @@
+# get_availability: 回ごとの残り席数（ScheduleSeats の座席カウンタを読む。Bookings は数えない）
+# GET /availability?scheduleIds=a,b,c  または POST { scheduleIds: [...] }（最大100件、BatchGetItem 1回）
+# GET /lessons/{lessonId}/availability?from=&to=&open=1（期間内の回を開始日時順に。既定は今から4週間）
+from naraigoto import runtime as rt, availability, metrics
+
+HEADERS = rt.cors_headers("GET,POST,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+@rt.http_handler(HEADERS)
+def lambda_handler(event, _):
+    pp = event.get("pathParameters") or {}
+    q = event.get("queryStringParameters") or {}
+    b = rt.json_body(event)
+    if not isinstance(b, dict):
+        return _resp(400, {"ok": False, "error": "invalid_json"})
+    if not isinstance(pp, dict):
+        pp = {}
+    if not isinstance(q, dict):
+        q = {}
+
+    try:
+        lesson_id = pp.get("lessonId") or q.get("lessonId")
+        if lesson_id:
+            items = availability.slots(rt.client(), lesson_id, q.get("from"), q.get("to"),
+                                       (q.get("open") or "").lower() in ("1", "true"))
+            return _resp(200, {"ok": True, "lessonId": lesson_id, "items": items})
+
+        ids = availability.parse_ids(b.get("scheduleIds") if "scheduleIds" in b else q.get("scheduleIds"))
+        if not ids:
+            return _resp(400, {"ok": False, "error": "scheduleIds or lessonId required"})
+        found = availability.seats(rt.client(), ids)
+        return _resp(200, {"ok": True, "items": [found[s] for s in ids if s in found],
+                           "missing": [s for s in ids if s not in found]})
+    except ValueError as e:
+        return _resp(400, {"ok": False, "error": str(e)})
+    except Exception as e:
+        metrics.error("get_availability failed", e)
+        return _resp(500, {"ok": False, "error": "internal_error"})
@@ -1,32 +1,14 @@
-import os, json
-import boto3
-from decimal import Decimal
-
-dynamodb = boto3.resource("dynamodb")
-LESSONS = dynamodb.Table(os.getenv("LESSONS_TABLE", "Lessons"))
-
-HEADERS = {
-    "Content-Type": "application/json; charset=utf-8",
-    "Access-Control-Allow-Origin": "*",
-    "Access-Control-Allow-Headers": "content-type,authorization,x-api-key",
-    "Access-Control-Allow-Methods": "GET,OPTIONS"
-}
-
-def _decimal_to_native(obj):
-    if isinstance(obj, list):
-        return [_decimal_to_native(x) for x in obj]
-    if isinstance(obj, dict):
-        return {k: _decimal_to_native(v) for k, v in obj.items()}
-    if isinstance(obj, Decimal):
-        return int(obj) if obj % 1 == 0 else float(obj)
-    return obj
-
-def _resp(code, body):
-    return {
-        "statusCode": code,
-        "headers": HEADERS,
-        "body": json.dumps(_decimal_to_native(body), ensure_ascii=False)
-    }
+import os, time, random
+from naraigoto import runtime as rt, review_stats, cache, metrics
+
+LESSONS_TABLE = os.getenv("LESSONS_TABLE", "Lessons")
+STATS_TABLE = review_stats.LESSONS_STATS_TABLE
+LESSONS = rt.table(LESSONS_TABLE)
+MAX_AGE = int(os.getenv("HTTP_MAX_AGE", "60"))  # CloudFront / ブラウザの Cache-Control
+MAX_RETRIES = 5
+
+HEADERS = rt.cors_headers("GET,OPTIONS")
+_resp = rt.responder(HEADERS)
 
 def _pick_lesson_id(event):
     pp = event.get("pathParameters") or {}
@@ -40,21 +22,49 @@ def _pick_lesson_id(event):
         return raw_path.split("/")[-1]
     return None
 
-def lambda_handler(event, _):
-    method = (event.get("requestContext") or {}).get("http", {}).get("method", "GET").upper()
-    if method == "OPTIONS":
-        return {"statusCode": 204, "headers": HEADERS, "body": ""}
+def _backoff(attempt):
+    time.sleep(random.uniform(0, 0.05 * (2 ** min(attempt, 5))))
 
-    lesson_id = _pick_lesson_id(event)
-    if not lesson_id:
-        return _resp(400, {"error": "lessonId required"})
+def _get_lesson_and_stats(lesson_id):
+    # レッスン本体と評価集計を1回の BatchGetItem で取得（未処理キーが残れば例外 → 5xx。404 にはしない）
+    request = {
+        LESSONS_TABLE: {"Keys": [{"lessonId": lesson_id}]},
+        STATS_TABLE: {"Keys": [{"id": lesson_id}]},
+    }
+    found = {}
+    for attempt in range(MAX_RETRIES + 1):
+        r = rt.dynamodb().batch_get_item(RequestItems=request)
+        for table, items in (r.get("Responses") or {}).items():
+            if items:
+                found[table] = items[0]
+        request = r.get("UnprocessedKeys") or {}
+        if not request:
+            return found.get(LESSONS_TABLE), found.get(STATS_TABLE)
+        _backoff(attempt)
+    raise RuntimeError("BatchGetItem: unprocessed keys remain after retries")
 
-    r = LESSONS.get_item(Key={"lessonId": lesson_id})
-    item = r.get("Item")
+def _load(lesson_id):
+    item, stats = _get_lesson_and_stats(lesson_id)
     if not item:
-        return _resp(404, {"error": "Not Found"})
+        return None
     if "lessonsId" in item and "lessonId" not in item:
         item["lessonId"] = item["lessonsId"]
         del item["lessonsId"]
-    return _resp(200, item)
+    item["stats"] = review_stats.view(stats)
+    return item
 
+@rt.http_handler(HEADERS)
+def lambda_handler(event, _):
+    lesson_id = _pick_lesson_id(event)
+    if not lesson_id:
+        return _resp(400, {"error": "lessonId required"})
+
+    # 人気レッスンに偏るため、シリアライズ済みレスポンスをキャッシュ（ETag で 304 も返す）
+    try:
+        entry, status = cache.LESSONS.get_or_load(lesson_id, "detail", lambda: _load(lesson_id))
+    except Exception as e:
+        metrics.error("get_lesson_by_id failed", e)
+        return _resp(500, {"error": "internal_error"})
+    if entry is None:
+        return _resp(404, {"error": "Not Found"})
+    return cache.http_response(event, entry, HEADERS, MAX_AGE, status)
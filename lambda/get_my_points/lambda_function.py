@@ -0,0 +1,31 @@
+from naraigoto import runtime as rt, points, metrics
+from naraigoto.cursor import CursorError
+
+# ポイント: GET /me/points?familyId=...&limit=&cursor=（残高と新しい順の履歴）
+# 残高はスナップショット（points_balances）+ 以後の行の合計で、履歴の長さに比例しない。PG_DSN が必要
+DEFAULT_LIMIT = 20
+
+HEADERS = rt.cors_headers("GET,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+@rt.http_handler(HEADERS)
+def lambda_handler(event, _):
+    q = event.get("queryStringParameters") or {}
+    if not isinstance(q, dict):
+        q = {}
+    if not q.get("familyId"):
+        # 将来的には認証トークン(JWT)から抽出
+        return _resp(400, {"ok": False, "error": "familyId required (query)"})
+    try:
+        limit = int(q.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    try:
+        total, items, next_cursor = points.history(q["familyId"], limit, q.get("cursor"))
+    except (ValueError, CursorError) as e:
+        return _resp(400, {"ok": False, "error": str(e)})
+    except Exception as e:
+        metrics.error("get_my_points failed", e)
+        return _resp(500, {"ok": False, "error": "internal_error"})
+
+    return _resp(200, {"ok": True, "points": total, "items": items, "nextCursor": next_cursor})
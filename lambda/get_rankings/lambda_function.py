@@ -0,0 +1,32 @@
+# get_rankings: 人気ランキング（今週の人気）
+# GET /rankings?area=&category=&limit= → 事前計算済みの Rankings の1アイテム（GetItem 1回）
+import os
+from naraigoto import runtime as rt, ranking, cache, metrics
+
+MAX_AGE = int(os.getenv("HTTP_MAX_AGE", "60"))  # CloudFront / ブラウザの Cache-Control
+# 再計算は10分ごとなので、コンテナ内で短時間キャッシュする
+RANKINGS = cache.ResponseCache("rankings", int(os.getenv("CACHE_RANKING_SIZE", "256")),
+                               float(os.getenv("CACHE_RANKING_TTL", "60")), int(os.getenv("CACHE_SHARED_TTL", "300")))
+
+HEADERS = rt.cors_headers("GET,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+@rt.http_handler(HEADERS)
+def lambda_handler(event, _):
+    q = event.get("queryStringParameters") or {}
+    area, category = (q.get("area") or "").strip() or None, (q.get("category") or "").strip() or None
+    try:
+        limit = int(q.get("limit") or 20)
+    except ValueError:
+        return _resp(400, {"error": "limit must be an integer"})
+    if not 1 <= limit <= ranking.TOP_K:
+        return _resp(400, {"error": f"limit must be between 1 and {ranking.TOP_K}"})
+
+    sc = ranking.scope(area, category)
+    try:
+        entry, status = RANKINGS.get_or_load(sc, str(limit),
+                                             lambda: ranking.read(rt.client(), area, category, limit))
+    except Exception as e:
+        metrics.error("get_rankings failed", e)
+        return _resp(500, {"error": "internal_error"})
+    return cache.http_response(event, entry, HEADERS, MAX_AGE, status)
@@ -1,44 +1,17 @@
 # get_reviews.py
 # -*- coding: utf-8 -*-
-import json, os, boto3
-from boto3.dynamodb.conditions import Key
-from decimal import Decimal
-
-dynamodb = boto3.resource('dynamodb')
-PARENT_TBL = os.environ['PARENT_REVIEWS_TABLE']
-CHILD_TBL  = os.environ['CHILD_REVIEWS_TABLE']
-parent_table = dynamodb.Table(PARENT_TBL)
-child_table  = dynamodb.Table(CHILD_TBL)
+import os, json
+from naraigoto import runtime as rt, reviews, cache, metrics
+from naraigoto.cursor import CursorError
 
+# テーブル名・読み取り元は naraigoto.reviews が REVIEWS_TABLE / REVIEWS_LAYOUT などから読む
 PARAM_NAME   = 'lessonsId'
 DDB_KEY_NAME = 'lessonsId'
+DEFAULT_LIMIT = 20
+MAX_AGE = int(os.getenv("HTTP_MAX_AGE", "15"))  # CloudFront / ブラウザの Cache-Control
 
-HEADERS = {
-    "Content-Type": "application/json; charset=utf-8",
-    "Access-Control-Allow-Origin": "*",
-    "Access-Control-Allow-Headers": "content-type,authorization,x-api-key",
-    "Access-Control-Allow-Methods": "GET,OPTIONS"
-}
-
-def _decimal_to_native(obj):
-    """dict/listを再帰的に走査し、Decimalをint/floatへ変換"""
-    if isinstance(obj, list):
-        return [_decimal_to_native(x) for x in obj]
-    if isinstance(obj, dict):
-        return {k: _decimal_to_native(v) for k, v in obj.items()}
-    if isinstance(obj, Decimal):
-        # 整数ならintに、そうでなければfloatに
-        return int(obj) if obj % 1 == 0 else float(obj)
-        # ※すべてfloatにしたいなら: return float(obj)
-    return obj
-
-def _res(code, body):
-    safe_body = _decimal_to_native(body)
-    return {
-        "statusCode": code,
-        "headers": HEADERS,
-        "body": json.dumps(safe_body, ensure_ascii=False)
-    }
+HEADERS = rt.cors_headers("GET,OPTIONS")
+_res = rt.responder(HEADERS)
 
 def _get_param(event):
     # pathParameters 優先（/lessons/{lessonId}/reviews など）
@@ -61,31 +34,34 @@ def _get_param(event):
             pass
     return None
 
-def _query_latest(table, lessons_id, limit=20):
-    resp = table.query(
-        KeyConditionExpression=Key(DDB_KEY_NAME).eq(lessons_id),
-        ScanIndexForward=False,
-        Limit=limit
-    )
-    return resp.get('Items', [])
+def _query_params(event):
+    qs = event.get("queryStringParameters") or {}
+    if not isinstance(qs, dict):
+        qs = {}
+    try:
+        limit = int(qs.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    return qs.get("role") or "all", limit, qs.get("cursor")
 
+@rt.http_handler(HEADERS)
 def lambda_handler(event, _ctx):
-    method = (event.get("requestContext") or {}).get("http", {}).get("method", "GET").upper()
-    if method == "OPTIONS":
-        return {"statusCode": 204, "headers": HEADERS, "body": ""}
-
     lessons_id = _get_param(event)
     if not lessons_id:
         return _res(400, {"error": f"{PARAM_NAME} required"})
+    role, limit, token = _query_params(event)
 
     try:
-        parents  = _query_latest(parent_table, lessons_id, limit=20)
-        children = _query_latest(child_table, lessons_id, limit=20)
-        return _res(200, {"parents": parents, "children": children})
+        # Reviews（移行中は旧 親/子テーブルも並列に）を Query → createdAt 降順でマージ
+        def load():
+            items, next_cursor = reviews.query_merged(DDB_KEY_NAME, lessons_id, role=role,
+                                                      limit=limit, cursor_token=token)
+            return {"items": items, "nextCursor": next_cursor}
+        # 同じ lessonsId のキャッシュは post_reviews がまとめて無効化する
+        entry, status = cache.REVIEWS.get_or_load(lessons_id, f"{role}|{limit}|{token or ''}", load)
+        return cache.http_response(event, entry, HEADERS, MAX_AGE, status)
+    except (ValueError, CursorError) as e:
+        return _res(400, {"error": str(e)})
     except Exception as e:
-        print(f"[get_reviews] error: {e}")
-        return _res(500, {"error": "internal_error", "message": str(e)})
-
-
-
-
+        metrics.error("get_reviews failed", e)
+        return _res(500, {"error": "internal_error"})
@@ -0,0 +1,26 @@
+from naraigoto import runtime as rt, review_stats, like_stats, metrics
+
+# 教室詳細の集計値（評価・件数・いいね数など）は SchoolsStats の1回の GetItem で返す
+SCHOOLS_STATS = rt.table(review_stats.SCHOOLS_STATS_TABLE)
+
+HEADERS = rt.cors_headers("GET,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+@rt.http_handler(HEADERS)
+def lambda_handler(event, _):
+    pp = event.get("pathParameters") or {}
+    school_id = None
+    if isinstance(pp, dict):
+        school_id = pp.get("id") or pp.get("schoolId")
+    if not school_id:
+        return _resp(400, {"error": "schoolId required"})
+
+    try:
+        item = SCHOOLS_STATS.get_item(Key={"id": school_id}).get("Item")
+    except Exception as e:
+        metrics.error("get_school_by_id failed", e)
+        return _resp(500, {"error": "internal_error"})
+
+    stats = review_stats.view(item)
+    stats["likesCount"] = like_stats.count(item)
+    return _resp(200, {"schoolId": school_id, "stats": stats})
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""naraigoto 共通ランタイム（Lambda Layer: /opt/python/naraigoto）
+
+各 lambda_function.py から import して使う。コンテナ単位で初期化されるもの
+（DynamoDB クライアント等）はモジュールレベルでキャッシュする。
+"""
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""残り席数の読み取りモデル（ScheduleSeats の sk=SEATS カウンタ）
+
+座席カウンタ（capacity, reserved）は予約・キャンセルのトランザクション内で更新される
+（naraigoto.booking）ため、残り席数は Bookings を数えずにカウンタを読むだけで出せる。
+
+- 一括: 回（scheduleId = "<lessonId>#<startAt>"）を最大 MAX_BATCH 件まで BatchGetItem 1回で読む。
+  まだ予約がなくカウンタの無い回は Lessons の capacity（未設定なら DEFAULT_CAPACITY）で空席扱い
+- 期間: レッスンの回を開始日時順に（sparse GSI lessonId-startAt。lessonId を持つのは SEATS だけ）。
+  カウンタは公開時（booking.init_seats）か初回予約時に作られ、期間検索はカウンタのある回だけを返す
+"""
+import os, time, random, calendar
+
+from boto3.dynamodb.conditions import Key
+
+from naraigoto import booking
+
+SEATS_TABLE = booking.SEATS_TABLE
+LESSONS_TABLE = booking.LESSONS_TABLE
+INDEX = os.getenv("SCHEDULE_SEATS_LESSON_INDEX", "lessonId-startAt")
+MAX_BATCH = 100       # 1リクエストで扱う回の上限（BatchGetItem の上限と同じ）
+DEFAULT_DAYS = 28
+MAX_DAYS = int(os.getenv("AVAILABILITY_MAX_DAYS", "62"))
+MAX_RETRIES = int(os.getenv("AVAILABILITY_BATCH_RETRIES", "8"))
+
+FIELDS = ("scheduleId", "lessonId", "startAt", "capacity", "reserved")
+
+def _backoff(attempt):
+    time.sleep(random.uniform(0, 0.05 * (2 ** min(attempt, 5))))
+
+def parse_ids(value):
+    """"a,b,c" または配列 → 重複を除いた scheduleId の配列"""
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)):
+        return []
+    seen, out = set(), []
+    for v in value:
+        v = str(v).strip() if v is not None else ""
+        if v and v not in seen:
+            seen.add(v)
+            out.append(v)
+    return out
+
+def view(item):
+    """カウンタ → API の形（left = 残り席数）"""
+    capacity, reserved = int(item.get("capacity") or 0), int(item.get("reserved") or 0)
+    return {"scheduleId": item["scheduleId"], "lessonId": item.get("lessonId"), "startAt": item.get("startAt"),
+            "capacity": capacity, "reserved": reserved, "left": max(0, capacity - reserved)}
+
+def _batch_get(client, table, keys, projection, names):
+    out = []
+    request = {table: {"Keys": keys, "ProjectionExpression": projection, "ExpressionAttributeNames": names}}
+    for attempt in range(MAX_RETRIES + 1):
+        r = client.batch_get_item(RequestItems=request)
+        out.extend(r.get("Responses", {}).get(table, []))
+        request = r.get("UnprocessedKeys") or {}
+        if not request:
+            return out
+        _backoff(attempt)
+    raise RuntimeError("BatchGetItem: unprocessed keys remain after retries")
+
+def seats(client, schedule_ids):
+    """{scheduleId: view}（BatchGetItem 1回。カウンタの無い回はレッスンの定員で空席、レッスンも無ければ含めない）"""
+    schedule_ids = parse_ids(schedule_ids)
+    if len(schedule_ids) > MAX_BATCH:
+        raise ValueError(f"scheduleIds must be <= {MAX_BATCH}")
+    if not schedule_ids:
+        return {}
+    names = {f"#f{i}": f for i, f in enumerate(FIELDS)}
+    items = _batch_get(client, SEATS_TABLE, [{"scheduleId": s, "sk": booking.SEATS_SK} for s in schedule_ids],
+                       ",".join(names), names)
+    found = {it["scheduleId"]: view(it) for it in items}
+
+    missing = [s for s in schedule_ids if s not in found and "#" in s]
+    lesson_ids = parse_ids([s.partition("#")[0] for s in missing])
+    if lesson_ids:
+        lessons = _batch_get(client, LESSONS_TABLE, [{"lessonId": l} for l in lesson_ids],
+                             "lessonId, #cap", {"#cap": "capacity"})
+        capacity = {it["lessonId"]: it.get("capacity") or booking.DEFAULT_CAPACITY for it in lessons}
+        for s in missing:
+            lesson_id, _, start_at = s.partition("#")
+            if lesson_id in capacity:
+                found[s] = view({"scheduleId": s, "lessonId": lesson_id, "startAt": start_at,
+                                 "capacity": capacity[lesson_id], "reserved": 0})
+    return found
+
+def _iso(epoch):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+
+def _epoch(s):
+    """ISO8601 UTC（秒まで）→ epoch。形式が違えば ValueError"""
+    try:
+        return calendar.timegm(time.strptime(s[:19], "%Y-%m-%dT%H:%M:%S"))
+    except ValueError:
+        raise ValueError("from/to must be ISO8601 UTC (YYYY-MM-DDTHH:MM:SSZ)") from None
+
+def slots(client, lesson_id, start=None, end=None, available_only=False):
+    """レッスンの回を開始日時順に: [view]。期間は [start, end)（ISO8601 UTC。既定は今から4週間）"""
+    t0 = _epoch(start) if start else int(time.time())
+    t1 = _epoch(end) if end else t0 + DEFAULT_DAYS * 86400
+    if t1 <= t0:
+        raise ValueError("to must be after from")
+    if t1 - t0 > MAX_DAYS * 86400:
+        raise ValueError(f"range must be <= {MAX_DAYS} days")
+    start, end = _iso(t0), _iso(t1)
+    names = {f"#f{i}": f for i, f in enumerate(FIELDS)}
+    params = {"TableName": SEATS_TABLE, "IndexName": INDEX,
+              "KeyConditionExpression": Key("lessonId").eq(lesson_id) & Key("startAt").between(start, end),
+              "ProjectionExpression": ",".join(names), "ExpressionAttributeNames": names}
+    if available_only:
+        params["FilterExpression"] = "#f4 < #f3"
+    out = []
+    while True:
+        r = client.query(**params)
+        # BETWEEN は上端を含むため end ちょうどの回は落とす
+        out.extend(view(it) for it in r.get("Items", []) if it["startAt"] < end)
+        if not r.get("LastEvaluatedKey"):
+            return out
+        params["ExclusiveStartKey"] = r["LastEvaluatedKey"]
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""Stripe Webhook: 受信（署名検証・重複排除）と、ワーカーによる subscriptions / payments / チケット付与への反映
+
+受信（lambda/stripe_webhook）は署名を確かめて webhook_events に INSERT ... ON CONFLICT (stripe_event_id) DO NOTHING
+するだけで 200 を返す（更新の集中時も HTTP の中で反映処理をしない。Stripe の再送は ON CONFLICT で1件になる）。
+ワーカー（lambda/stripe_webhook_worker）は次を1トランザクションで行う:
+
+  1. 未処理のイベントがある顧客を pg_try_advisory_xact_lock で取る（同じ顧客は1つのワーカーだけが順に処理する）
+  2. その顧客たちのイベントを (event_created, id) 順に読み、1件ずつセーブポイントの中で反映する。
+     失敗したら attempts / last_error を記録し、その顧客の後続は次回に回す（順序を守る）
+  3. 反映できたイベントの processed_at をまとめて UPDATE
+
+反映は何度行っても1回と同じになる:
+  - subscriptions / payments は Stripe の ID で UPSERT し、stripe_event_at（反映済みのイベント日時）より古い
+    イベントでは更新しない（遅れて届いた古いイベントで状態を巻き戻さない）
+  - チケット付与（invoice.paid）は ticket_balances.granted との差分だけ balance に足す（同じ月の再付与は0枚、
+    月の途中のアップグレードは差分だけ）。月は請求期間の開始月（UTC。booking.ticket_month と同じ）
+家庭との紐付けは families.stripe_customer_id、無ければイベントの metadata.family_id
+（Checkout Session の client_reference_id / subscription_data.metadata に入れておく）。
+"""
+import os, time, hmac, json, hashlib
+
+from naraigoto import pg, metrics
+
+WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
+TOLERANCE = int(os.getenv("STRIPE_WEBHOOK_TOLERANCE_SEC", "300"))
+BATCH_CUSTOMERS = int(os.getenv("WEBHOOK_BATCH_CUSTOMERS", "50"))
+BATCH_EVENTS = int(os.getenv("WEBHOOK_BATCH_EVENTS", "500"))
+MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+
+# Stripe の状態 → subscription_status / payment_status
+SUBSCRIPTION_STATUS = {"active": "active", "trialing": "active", "past_due": "paused", "paused": "paused",
+                       "unpaid": "paused", "incomplete": "paused", "canceled": "canceled",
+                       "incomplete_expired": "canceled"}
+PAYMENT_STATUS = {"payment_intent.succeeded": "succeeded", "payment_intent.payment_failed": "failed"}
+
+INGEST = """
+INSERT INTO webhook_events (stripe_event_id, type, payload, customer_id, event_created)
+VALUES (%s, %s, %s::jsonb, %s, to_timestamp(%s))
+ON CONFLICT (stripe_event_id) DO NOTHING"""
+
+# 未処理のイベントがある顧客（ロックを取れたものだけ。ロックはトランザクションの終わりで外れる）
+CLAIM = """
+SELECT customer_id
+  FROM (SELECT DISTINCT customer_id FROM webhook_events
+         WHERE processed_at IS NULL AND attempts < %(max_attempts)s AND customer_id <> ALL(%(skip)s::text[])
+         LIMIT %(scan)s) c
+ WHERE pg_try_advisory_xact_lock(hashtextextended('stripe:' || customer_id, 0))
+ LIMIT %(customers)s"""
+
+EVENTS = """
+SELECT id, stripe_event_id, type, payload, customer_id, event_created,
+       extract(epoch FROM clock_timestamp() - received_at) * 1000 AS lag_ms
+  FROM webhook_events
+ WHERE customer_id = ANY(%s) AND processed_at IS NULL AND attempts < %s
+ ORDER BY customer_id, event_created, id
+ LIMIT %s"""
+
+DONE = "UPDATE webhook_events SET processed_at = now(), last_error = NULL WHERE id = ANY(%s::uuid[])"
+FAILED = "UPDATE webhook_events SET attempts = attempts + 1, last_error = %s WHERE id = %s"
+
+PENDING = """
+SELECT count(*) FILTER (WHERE attempts < %(max_attempts)s) AS n,
+       count(*) FILTER (WHERE attempts >= %(max_attempts)s) AS parked,
+       coalesce(extract(epoch FROM clock_timestamp() - min(received_at)) * 1000, 0) AS oldest_ms
+  FROM webhook_events
+ WHERE processed_at IS NULL"""
+
+FAMILY = """
+SELECT id FROM families WHERE stripe_customer_id = %s
+UNION ALL
+SELECT id FROM families WHERE id::text = %s
+LIMIT 1"""
+
+LINK = """
+UPDATE families SET stripe_customer_id = %s
+ WHERE id = %s AND stripe_customer_id IS DISTINCT FROM %s"""
+
+UPSERT_SUBSCRIPTION = """
+INSERT INTO subscriptions (family_id, plan, status, current_period_start, current_period_end,
+                           stripe_subscription_id, stripe_event_at)
+VALUES (%(family)s, %(plan)s, %(status)s::subscription_status, to_timestamp(%(start)s), to_timestamp(%(end)s),
+        %(sub)s, %(at)s)
+ON CONFLICT (stripe_subscription_id) DO UPDATE
+   SET plan = EXCLUDED.plan, status = EXCLUDED.status, current_period_start = EXCLUDED.current_period_start,
+       current_period_end = EXCLUDED.current_period_end, stripe_event_at = EXCLUDED.stripe_event_at
+ WHERE subscriptions.stripe_event_at IS NULL OR subscriptions.stripe_event_at <= EXCLUDED.stripe_event_at"""
+
+UPSERT_PAYMENT = """
+INSERT INTO payments (family_id, stripe_payment_intent_id, amount, currency, status, meta, stripe_event_at)
+VALUES (%(family)s, %(pi)s, %(amount)s, %(currency)s, %(status)s::payment_status, %(meta)s::jsonb, %(at)s)
+ON CONFLICT (stripe_payment_intent_id) DO UPDATE
+   SET amount = EXCLUDED.amount, currency = EXCLUDED.currency, status = EXCLUDED.status, meta = EXCLUDED.meta,
+       stripe_event_at = EXCLUDED.stripe_event_at
+ WHERE payments.stripe_event_at IS NULL OR payments.stripe_event_at <= EXCLUDED.stripe_event_at"""
+
+SUBSCRIPTION_PLAN = "SELECT plan FROM subscriptions WHERE stripe_subscription_id = %s"
+
+# プランの月間枚数まで付与する（granted との差分だけ足す）
+GRANT = """
+INSERT INTO ticket_balances (family_id, month, balance, granted)
+SELECT %(family)s, date_trunc('month', to_timestamp(%(start)s) AT TIME ZONE 'UTC')::date,
+       p.tickets_per_month, p.tickets_per_month
+  FROM plans p
+ WHERE p.id = %(plan)s
+ON CONFLICT (family_id, month) DO UPDATE
+   SET balance = ticket_balances.balance + (EXCLUDED.granted - ticket_balances.granted),
+       granted = EXCLUDED.granted
+ WHERE ticket_balances.granted < EXCLUDED.granted"""
+
+class SignatureError(ValueError):
+    """Stripe-Signature が無い・一致しない・古い"""
+
+class UnknownCustomer(Exception):
+    """家庭に紐付かない顧客（後から紐付くこともあるので再試行する）"""
+
+def sign(payload, secret, ts=None):
+    """Stripe-Signature ヘッダの値（ローカルの再生・ベンチ用）"""
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    ts = str(int(ts if ts is not None else time.time()))
+    sig = hmac.new(secret.encode("utf-8"), ts.encode("ascii") + b"." + payload, hashlib.sha256).hexdigest()
+    return f"t={ts},v1={sig}"
+
+def verify(payload, header, secret=None, tolerance=None, now=None):
+    """Stripe-Signature（t=...,v1=...）を確かめてイベント（dict）を返す"""
+    secret = secret or WEBHOOK_SECRET
+    if not secret:
+        raise RuntimeError("STRIPE_WEBHOOK_SECRET is not set")
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    ts, sigs = None, []
+    for part in (header or "").split(","):
+        k, _, v = part.strip().partition("=")
+        if k == "t":
+            ts = v
+        elif k == "v1":
+            sigs.append(v)
+    if not ts or not ts.isdigit() or not sigs:
+        raise SignatureError("invalid Stripe-Signature header")
+    if abs((now if now is not None else time.time()) - int(ts)) > (TOLERANCE if tolerance is None else tolerance):
+        raise SignatureError("timestamp outside the tolerance")
+    expected = sign(payload, secret, ts).split("v1=")[1]
+    if not any(hmac.compare_digest(expected, s) for s in sigs):
+        raise SignatureError("signature mismatch")
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        raise ValueError("invalid_json")
+    if not isinstance(event, dict) or not event.get("id") or not event.get("type"):
+        raise ValueError("not a Stripe event")
+    return event
+
+def _obj(event):
+    return ((event.get("data") or {}).get("object")) or {}
+
+def _id(v):
+    """展開済みのオブジェクトでも ID 文字列に"""
+    return v.get("id") if isinstance(v, dict) else v
+
+def customer_of(event):
+    obj = _obj(event)
+    return _id(obj.get("id") if obj.get("object") == "customer" else obj.get("customer")) or ""
+
+def ingest(event, payload):
+    """検証済みのイベントを保存する。新規なら True（再送は False）"""
+    if isinstance(payload, bytes):
+        payload = payload.decode("utf-8")
+    return pg.execute(INGEST, (event["id"], event["type"], payload, customer_of(event),
+                               event.get("created") or time.time()), prepare=True) == 1
+
+def _family(conn, customer, obj):
+    meta = obj.get("metadata") or {}
+    ref = obj.get("client_reference_id") or meta.get("family_id") or ""
+    row = conn.execute(FAMILY, (customer, ref)).fetchone()
+    if row is None:
+        raise UnknownCustomer(customer)
+    if customer and ref:
+        conn.execute(LINK, (customer, row["id"], customer))
+    return row["id"]
+
+def _price(obj):
+    items = ((obj.get("items") or {}).get("data")) or ((obj.get("lines") or {}).get("data")) or [{}]
+    return items[0].get("price") or items[0].get("plan") or {}, items[0]
+
+def _plan(obj):
+    price, _ = _price(obj)
+    return (obj.get("metadata") or {}).get("plan") or price.get("lookup_key") or \
+        (price.get("metadata") or {}).get("plan")
+
+def _subscription(conn, ev, obj):
+    _, item = _price(obj)
+    status = "canceled" if ev["type"] == "customer.subscription.deleted" else \
+        SUBSCRIPTION_STATUS.get(obj.get("status"), "paused")
+    conn.execute(UPSERT_SUBSCRIPTION, {
+        "family": _family(conn, ev["customer_id"], obj), "plan": _plan(obj) or "standard", "status": status,
+        "start": obj.get("current_period_start") or item.get("current_period_start"),
+        "end": obj.get("current_period_end") or item.get("current_period_end"),
+        "sub": obj["id"], "at": ev["event_created"]})
+
+def _payment(conn, ev, obj):
+    conn.execute(UPSERT_PAYMENT, {
+        "family": _family(conn, ev["customer_id"], obj), "pi": obj["id"],
+        "amount": obj.get("amount_received") or obj.get("amount") or 0, "currency": obj.get("currency") or "jpy",
+        "status": PAYMENT_STATUS.get(ev["type"], "pending"),
+        "meta": json.dumps({"invoice": _id(obj.get("invoice")), "event": ev["stripe_event_id"]}),
+        "at": ev["event_created"]})
+
+def _invoice_paid(conn, ev, obj):
+    family = _family(conn, ev["customer_id"], obj)
+    sub = _id(obj.get("subscription")) or \
+        _id(((obj.get("parent") or {}).get("subscription_details") or {}).get("subscription"))
+    _, line = _price(obj)
+    start = ((line.get("period") or {}).get("start")) or obj.get("period_start")
+    plan = _plan(obj)
+    if not plan and sub:
+        row = conn.execute(SUBSCRIPTION_PLAN, (sub,)).fetchone()
+        plan = row["plan"] if row else None
+    if not plan or start is None:
+        raise ValueError("invoice without plan or period")
+    conn.execute(GRANT, {"family": family, "start": start, "plan": plan})
+
+def _checkout(conn, ev, obj):
+    _family(conn, ev["customer_id"], obj)
+
+HANDLERS = {
+    "checkout.session.completed": _checkout,
+    "customer.subscription.created": _subscription,
+    "customer.subscription.updated": _subscription,
+    "customer.subscription.deleted": _subscription,
+    "invoice.paid": _invoice_paid,
+    "invoice.payment_succeeded": _invoice_paid,
+    "payment_intent.created": _payment,
+    "payment_intent.processing": _payment,
+    "payment_intent.succeeded": _payment,
+    "payment_intent.payment_failed": _payment,
+}
+
+def apply(conn, ev):
+    """1イベントを反映する（未対応の種別は何もしない）"""
+    fn = HANDLERS.get(ev["type"])
+    if fn is not None:
+        fn(conn, ev, _obj(ev["payload"]))
+
+def process_once(customers=None, events=None, skip=()):
+    """顧客を取って1バッチ反映する: {"events", "failed", "customers", "blocked", "lagMs"}（無ければ customers=0）
+    skip の顧客は取らない（同じ実行の中で失敗した顧客をすぐに再試行しない）"""
+    with pg.transaction() as conn:
+        claimed = [r["customer_id"] for r in conn.execute(CLAIM, {
+            "max_attempts": MAX_ATTEMPTS, "scan": (customers or BATCH_CUSTOMERS) * 4,
+            "customers": customers or BATCH_CUSTOMERS, "skip": list(skip)}).fetchall()]
+        if not claimed:
+            return {"events": 0, "failed": 0, "customers": 0, "blocked": [], "lagMs": 0.0}
+        rows = conn.execute(EVENTS, (claimed, MAX_ATTEMPTS, events or BATCH_EVENTS)).fetchall()
+        done, failed, blocked = [], 0, set()
+        for ev in rows:
+            if ev["customer_id"] in blocked:
+                continue
+            try:
+                with conn.transaction():
+                    apply(conn, ev)
+                done.append(ev["id"])
+            except Exception as e:
+                # この顧客の後続は次回（順序を守る）。MAX_ATTEMPTS 回で止めて last_error を残す
+                failed += 1
+                blocked.add(ev["customer_id"])
+                conn.execute(FAILED, (f"{type(e).__name__}: {e}"[:500], ev["id"]))
+        if done:
+            conn.execute(DONE, (done,))
+    return {"events": len(done), "failed": failed, "customers": len(claimed), "blocked": sorted(blocked),
+            "lagMs": float(max(r["lag_ms"] for r in rows)) if rows else 0.0}
+
+def run(max_seconds=50.0, function="stripe_webhook_worker"):
+    """未処理が無くなるか max_seconds を過ぎるまでバッチを回し、遅延・残数を EMF で出す"""
+    t0 = time.perf_counter()
+    total = {"events": 0, "failed": 0, "batches": 0, "lagMs": 0.0}
+    blocked = set()
+    while time.perf_counter() - t0 < max_seconds:
+        r = process_once(skip=blocked)
+        if not r["customers"]:
+            break
+        blocked.update(r["blocked"])
+        total["batches"] += 1
+        total["events"] += r["events"]
+        total["failed"] += r["failed"]
+        total["lagMs"] = max(total["lagMs"], r["lagMs"])
+    elapsed = time.perf_counter() - t0
+    pending = pg.fetch_one(PENDING, {"max_attempts": MAX_ATTEMPTS})
+    total.update(pending=pending["n"], parked=pending["parked"], oldestMs=float(pending["oldest_ms"]),
+                 eventsPerSec=total["events"] / elapsed if elapsed > 0 else 0.0)
+    metrics.emit(function, {
+        "WebhookEvents": total["events"], "WebhookFailed": total["failed"], "WebhookBatches": total["batches"],
+        "WebhookLagMs": total["lagMs"], "WebhookPending": total["pending"], "WebhookParked": total["parked"],
+        "WebhookOldestMs": total["oldestMs"], "WebhookEventsPerSec": round(total["eventsPerSec"], 1)},
+        {"WebhookLagMs": "Milliseconds", "WebhookOldestMs": "Milliseconds", "WebhookEventsPerSec": "Count/Second"})
+    return total
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""予約エンジン（座席確保・重複防止・チケット消費を1トランザクションで）
+
+ScheduleSeats（PK scheduleId / SK sk）:
+  sk="SEATS"        … 座席カウンタ（capacity, reserved）。reserved < capacity を条件に ADD
+  sk="USER#<userId>" … 同一ユーザーの二重予約防止（RDS の booking_unique_user_schedule 相当）
+TicketBalances（PK userId / SK month=YYYY-MM）: balance >= 消費枚数 を条件に減算
+
+予約は上記と Bookings への Put を TransactWriteItems でまとめて書き、
+キャンセルは状態更新・座席返却・ホールド削除・チケット返却を同様に1トランザクションで行う。
+
+予約履歴（history）は Bookings の userId-index（createdAt 順）/ userId-schedule（受講日時順）を Query する。
+"""
+import os, time, uuid, random
+
+from boto3.dynamodb.conditions import Key, Attr
+
+from naraigoto import cursor
+
+SEATS_TABLE = os.getenv("SCHEDULE_SEATS_TABLE", "ScheduleSeats")
+TICKETS_TABLE = os.getenv("TICKET_BALANCES_TABLE", "TicketBalances")
+BOOKINGS_TABLE = os.getenv("BOOKINGS_TABLE", "Bookings")
+LESSONS_TABLE = os.getenv("LESSONS_TABLE", "Lessons")
+DEFAULT_CAPACITY = int(os.getenv("DEFAULT_CAPACITY", "10"))
+# デモ環境など TicketBalances を用意しない場合は TICKET_DEBIT=off
+TICKET_DEBIT = os.getenv("TICKET_DEBIT", "on").lower() not in ("off", "0", "false")
+MAX_TX_ATTEMPTS = int(os.getenv("BOOKING_TX_ATTEMPTS", "8"))
+
+SEATS_SK = "SEATS"
+
+class BookingError(Exception):
+    """予約/キャンセルを受け付けられない（status は HTTP ステータス）"""
+    def __init__(self, code, status=409):
+        super().__init__(code)
+        self.code = code
+        self.status = status
+
+def schedule_id(lesson_id, start_at):
+    return f"{lesson_id}#{start_at}"
+
+def ticket_month(epoch=None):
+    return time.strftime("%Y-%m", time.gmtime(epoch if epoch is not None else time.time()))
+
+def _hold_key(sched_id, user_id):
+    return {"scheduleId": sched_id, "sk": f"USER#{user_id}"}
+
+def _backoff(attempt):
+    # 同一カウンタへの競合（TransactionConflict）はジッタ付きで再試行
+    time.sleep(random.uniform(0, 0.01 * (2 ** min(attempt, 5))))
+
+def init_seats(client, sched_id, lesson_id, start_at, capacity=None):
+    """座席カウンタを作成する（既存なら何もしない）"""
+    if capacity is None:
+        lesson = client.get_item(TableName=LESSONS_TABLE, Key={"lessonId": lesson_id},
+                                 ProjectionExpression="#cap",
+                                 ExpressionAttributeNames={"#cap": "capacity"}).get("Item") or {}
+        capacity = int(lesson.get("capacity") or DEFAULT_CAPACITY)
+    try:
+        client.put_item(
+            TableName=SEATS_TABLE,
+            Item={"scheduleId": sched_id, "sk": SEATS_SK, "lessonId": lesson_id,
+                  "startAt": start_at, "capacity": capacity, "reserved": 0},
+            ConditionExpression="attribute_not_exists(scheduleId)",
+        )
+    except client.exceptions.ConditionalCheckFailedException:
+        pass
+
+def _attr(v):
+    # CancellationReasons の Item は DynamoDB JSON のまま返る
+    return v.get("S") if isinstance(v, dict) else v
+
+def _reasons(e):
+    return [r.get("Code") for r in e.response.get("CancellationReasons") or []]
+
+def book(client, user_id, lesson_id, start_at, tickets=1):
+    """予約を作成して Bookings のアイテムを返す。満席/重複/チケット不足は BookingError"""
+    sched_id = schedule_id(lesson_id, start_at)
+    now = int(time.time())
+    month = ticket_month(now)
+    item = {
+        "bookingId": str(uuid.uuid4()),
+        "userId": user_id,
+        "lessonId": lesson_id,
+        "schedule": start_at,
+        "scheduleId": sched_id,
+        "status": "reserved",
+        "consumedTickets": tickets,
+        "createdAt": now,
+    }
+    if TICKET_DEBIT and tickets > 0:
+        item["ticketMonth"] = month
+
+    items = [
+        {"Update": {
+            "TableName": SEATS_TABLE, "Key": {"scheduleId": sched_id, "sk": SEATS_SK},
+            "UpdateExpression": "ADD reserved :one",
+            "ConditionExpression": "attribute_exists(#cap) AND reserved < #cap",
+            "ExpressionAttributeNames": {"#cap": "capacity"},
+            "ExpressionAttributeValues": {":one": 1},
+            "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+        }},
+        {"Put": {
+            "TableName": SEATS_TABLE,
+            "Item": {**_hold_key(sched_id, user_id), "bookingId": item["bookingId"]},
+            "ConditionExpression": "attribute_not_exists(sk)",
+            "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+        }},
+        {"Put": {
+            "TableName": BOOKINGS_TABLE, "Item": item,
+            "ConditionExpression": "attribute_not_exists(bookingId)",
+        }},
+    ]
+    if "ticketMonth" in item:
+        items.append({"Update": {
+            "TableName": TICKETS_TABLE, "Key": {"userId": user_id, "month": month},
+            "UpdateExpression": "SET balance = balance - :n",
+            "ConditionExpression": "balance >= :n",
+            "ExpressionAttributeValues": {":n": tickets},
+        }})
+
+    initialized = False
+    for attempt in range(MAX_TX_ATTEMPTS):
+        try:
+            # 同じトークンの再送（SDK のタイムアウト再試行など）は DynamoDB 側で1回分として扱われる
+            client.transact_write_items(TransactItems=items, ClientRequestToken=item["bookingId"])
+            return item
+        except client.exceptions.TransactionCanceledException as e:
+            codes = _reasons(e)
+            if len(codes) > 1 and codes[1] == "ConditionalCheckFailed":
+                held = e.response["CancellationReasons"][1].get("Item") or {}
+                if _attr(held.get("bookingId")) == item["bookingId"]:
+                    # 自分の書き込みが先に成立していた（応答だけ失われた）
+                    return item
+                raise BookingError("already_booked")
+            if codes and codes[0] == "ConditionalCheckFailed":
+                reason = e.response["CancellationReasons"][0]
+                if not reason.get("Item") and not initialized:
+                    # 初回予約: カウンタを作ってから再実行
+                    init_seats(client, sched_id, lesson_id, start_at)
+                    initialized = True
+                    continue
+                raise BookingError("sold_out")
+            if len(codes) > 3 and codes[3] == "ConditionalCheckFailed":
+                raise BookingError("insufficient_tickets")
+            if "TransactionConflict" in codes or "ThrottlingError" in codes:
+                _backoff(attempt)
+                continue
+            raise
+        except client.exceptions.TransactionInProgressException:
+            _backoff(attempt)
+    raise BookingError("busy", 503)
+
+def cancel(client, booking_id):
+    """予約をキャンセルし、座席とチケットを返却する。更新後の Bookings アイテムを返す"""
+    booking = client.get_item(TableName=BOOKINGS_TABLE, Key={"bookingId": booking_id},
+                              ConsistentRead=True).get("Item")
+    if not booking:
+        raise BookingError("not_found", 404)
+    if booking.get("status") != "reserved":
+        raise BookingError("not_reserved")
+
+    items = [{"Update": {
+        "TableName": BOOKINGS_TABLE, "Key": {"bookingId": booking_id},
+        "UpdateExpression": "SET #s = :c, canceledAt = :t",
+        "ConditionExpression": "#s = :r",
+        "ExpressionAttributeNames": {"#s": "status"},
+        "ExpressionAttributeValues": {":c": "canceled", ":r": "reserved", ":t": int(time.time())},
+    }}]
+    sched_id = booking.get("scheduleId")
+    if sched_id:
+        items.append({"Update": {
+            "TableName": SEATS_TABLE, "Key": {"scheduleId": sched_id, "sk": SEATS_SK},
+            "UpdateExpression": "ADD reserved :m",
+            "ConditionExpression": "reserved > :z",
+            "ExpressionAttributeValues": {":m": -1, ":z": 0},
+        }})
+        items.append({"Delete": {
+            "TableName": SEATS_TABLE, "Key": _hold_key(sched_id, booking["userId"]),
+        }})
+    tickets = int(booking.get("consumedTickets") or 0)
+    if booking.get("ticketMonth") and tickets > 0:
+        items.append({"Update": {
+            "TableName": TICKETS_TABLE, "Key": {"userId": booking["userId"], "month": booking["ticketMonth"]},
+            "UpdateExpression": "ADD balance :n",
+            "ExpressionAttributeValues": {":n": tickets},
+        }})
+
+    token = str(uuid.uuid5(uuid.NAMESPACE_URL, f"cancel:{booking_id}"))
+    for attempt in range(MAX_TX_ATTEMPTS):
+        try:
+            client.transact_write_items(TransactItems=items, ClientRequestToken=token)
+            break
+        except client.exceptions.TransactionCanceledException as e:
+            codes = _reasons(e)
+            if codes and codes[0] == "ConditionalCheckFailed":
+                # 並行するキャンセルが先に成功した
+                raise BookingError("not_reserved")
+            if "TransactionConflict" in codes or "ThrottlingError" in codes:
+                _backoff(attempt)
+                continue
+            raise
+        except client.exceptions.TransactionInProgressException:
+            _backoff(attempt)
+    else:
+        raise BookingError("busy", 503)
+    booking["status"] = "canceled"
+    booking["canceledAt"] = items[0]["Update"]["ExpressionAttributeValues"][":t"]
+    return booking
+
+# --------- 予約履歴（/me/bookings） ---------
+USER_INDEX = os.getenv("BOOKINGS_USER_INDEX", "userId-index")              # userId + createdAt
+SCHEDULE_INDEX = os.getenv("BOOKINGS_SCHEDULE_INDEX", "userId-schedule")   # userId + schedule
+HISTORY_STATUSES = ("reserved", "canceled", "upcoming", "past")
+# /me/bookings が表示する項目のみ
+HISTORY_FIELDS = ("bookingId", "lessonId", "schedule", "status", "consumedTickets", "createdAt")
+HISTORY_MAX_LIMIT = 100
+
+def _now_iso():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+def history(table, user_id, status=None, limit=20, cursor_token=None, now=None):
+    """ユーザーの予約を1ページ: (items, next_cursor)
+
+    status なし/reserved/canceled: 予約日時(createdAt)の新しい順
+    upcoming: 受講日時(schedule)が now 以降の予約中を近い順、past: now より前の受講を新しい順
+    インデックスが無い等の失敗は例外のまま返す（Scan にフォールバックしない）
+    """
+    if status and status not in HISTORY_STATUSES:
+        raise ValueError(f"status must be one of {', '.join(HISTORY_STATUSES)}")
+    limit = max(1, min(int(limit), HISTORY_MAX_LIMIT))
+    now = now or _now_iso()
+    key = Key("userId").eq(user_id)
+    if status == "upcoming":
+        index, sk, forward = SCHEDULE_INDEX, "schedule", True
+        key &= Key("schedule").gte(now)
+        filt = Attr("status").eq("reserved")
+    elif status == "past":
+        index, sk, forward = SCHEDULE_INDEX, "schedule", False
+        key &= Key("schedule").lt(now)
+        filt = Attr("status").ne("canceled")
+    else:
+        index, sk, forward = USER_INDEX, "createdAt", False
+        filt = Attr("status").eq(status) if status else None
+
+    fields = HISTORY_FIELDS + ("userId",)
+    names = {f"#f{i}": f for i, f in enumerate(fields)}
+    params = {"IndexName": index, "KeyConditionExpression": key, "ScanIndexForward": forward,
+              "ProjectionExpression": ",".join(names), "ExpressionAttributeNames": names}
+    if filt is not None:
+        params["FilterExpression"] = filt
+    scope = f"{index}|{user_id}|{status or ''}"
+    start = cursor.decode(cursor_token, scope)
+
+    items = []
+    while True:
+        # フィルタありは読み飛ばし分を見込んで多めに読む
+        params["Limit"] = limit - len(items) if filt is None else max(limit * 2, 20)
+        if start:
+            params["ExclusiveStartKey"] = start
+        r = table.query(**params)
+        items.extend(r.get("Items", []))
+        start = r.get("LastEvaluatedKey")
+        if len(items) >= limit or not start:
+            break
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        start = {"bookingId": last["bookingId"], "userId": user_id, sk: last[sk]}
+    for it in items:
+        it.pop("userId", None)
+    return items, cursor.encode(start, scope)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""読み取りキャッシュ（コンテナ内 LRU/TTL + 任意の Redis 互換2段目）
+
+人気レッスンの詳細・口コミはアクセスが偏り、更新は少ない。シリアライズ済みの
+レスポンスボディと ETag をキャッシュし、ヒット時は DynamoDB にもエンコードにも触れない。
+
+- 1段目: コンテナ内 LRU（件数上限 + TTL）。他関数からの無効化は届かないため TTL は短め
+- 2段目: CACHE_REDIS_URL を設定し redis-py を Layer に同梱した場合のみ。post_reviews から無効化できる
+- 304: If-None-Match が ETag と一致すれば本文なしで返す（CloudFront / ブラウザの再検証）
+"""
+import os, json, time, hashlib, threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # redis はオプション
+    redis = None
+
+from naraigoto import runtime as rt, metrics
+from naraigoto.jsonenc import dumps
+
+REDIS_URL = os.getenv("CACHE_REDIS_URL", "")
+REDIS_PREFIX = os.getenv("CACHE_REDIS_PREFIX", "naraigoto:")
+STATS_EVERY = int(os.getenv("CACHE_STATS_EVERY", "100"))  # ヒット率の集計ログ間隔（0 で無効）
+
+class LRUCache:
+    """件数上限つき LRU + エントリごとの有効期限（スレッドセーフ）"""
+    def __init__(self, maxsize=256, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expired = 0
+
+    def get(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value = entry
+            if expires <= now:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._data[key] = (now + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for k in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[k]
+
+    def __len__(self):
+        return len(self._data)
+
+_redis = None
+
+def _redis_client():
+    global _redis
+    if _redis is None and REDIS_URL and redis is not None:
+        _redis = redis.Redis.from_url(REDIS_URL, socket_timeout=0.2, socket_connect_timeout=0.2)
+    return _redis
+
+class ResponseCache:
+    """名前空間つきのレスポンスキャッシュ。entity（lessonsId など）単位で無効化できる"""
+    def __init__(self, namespace, maxsize=256, ttl=30.0, shared_ttl=300):
+        self.namespace = namespace
+        self.local = LRUCache(maxsize, ttl)
+        self.shared_ttl = shared_ttl
+        self.shared_hits = 0
+        self.load_ms = 0.0
+        self.hit_ms = 0.0
+        self.requests = 0
+
+    def _key(self, entity, variant):
+        return f"{self.namespace}:{entity}:{variant}"
+
+    def get_or_load(self, entity, variant, loader):
+        """(entry, status)。entry = {"body", "etag"}（loader が None を返せば None）、status = HIT|SHARED|MISS"""
+        t0 = time.perf_counter()
+        self.requests += 1
+        key = self._key(entity, variant)
+        entry = self.local.get(key)
+        status = "HIT"
+        if entry is None:
+            entry = self._shared_get(key)
+            status = "SHARED" if entry is not None else "MISS"
+            if entry is None:
+                value = loader()
+                if value is None:
+                    self._record(status, t0)
+                    return None, status
+                with metrics.phase("serialize"):
+                    body = dumps(value)
+                entry = {"body": body, "etag": etag(body)}
+                self._shared_set(entity, key, entry)
+            else:
+                self.shared_hits += 1
+            self.local.set(key, entry)
+        self._record(status, t0)
+        return entry, status
+
+    def invalidate(self, entity):
+        """entity のエントリを全て破棄（このコンテナの1段目 + 共有の2段目）"""
+        self.local.delete_prefix(f"{self.namespace}:{entity}:")
+        r = _redis_client()
+        if r is None:
+            return
+        members = f"{REDIS_PREFIX}{self.namespace}:{entity}"
+        try:
+            keys = list(r.smembers(members))
+            p = r.pipeline()
+            if keys:
+                p.delete(*keys)
+            p.delete(members)
+            p.execute()
+        except Exception as e:
+            metrics.log("warn", "cache invalidate failed", cache=self.namespace, error=str(e))
+
+    def _shared_get(self, key):
+        r = _redis_client()
+        if r is None:
+            return None
+        try:
+            raw = r.get(REDIS_PREFIX + key)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            metrics.log("warn", "cache shared get failed", cache=self.namespace, error=str(e))
+            return None
+
+    def _shared_set(self, entity, key, entry):
+        r = _redis_client()
+        if r is None:
+            return
+        try:
+            # entity ごとのキー集合も持ち、無効化時にまとめて消す
+            p = r.pipeline()
+            p.set(REDIS_PREFIX + key, json.dumps(entry, ensure_ascii=False), ex=self.shared_ttl)
+            p.sadd(f"{REDIS_PREFIX}{self.namespace}:{entity}", REDIS_PREFIX + key)
+            p.expire(f"{REDIS_PREFIX}{self.namespace}:{entity}", self.shared_ttl)
+            p.execute()
+        except Exception as e:
+            metrics.log("warn", "cache shared set failed", cache=self.namespace, error=str(e))
+
+    def _record(self, status, t0):
+        ms = (time.perf_counter() - t0) * 1000
+        metrics.cache(status)
+        if status == "MISS":
+            self.load_ms += ms
+        else:
+            self.hit_ms += ms
+        if STATS_EVERY and self.requests % STATS_EVERY == 0:
+            metrics.log("info", "cache stats", cache=self.namespace, **self.stats())
+
+    def stats(self):
+        hits = self.local.hits
+        served = hits + self.shared_hits
+        misses = self.requests - served
+        return {
+            "requests": self.requests, "hits": hits, "sharedHits": self.shared_hits, "misses": misses,
+            "hitRatio": round(served / self.requests, 4) if self.requests else 0.0,
+            "evictions": self.local.evictions, "expired": self.local.expired, "size": len(self.local),
+            "avgHitMs": round(self.hit_ms / served, 3) if served else 0.0,
+            "avgMissMs": round(self.load_ms / misses, 3) if misses else 0.0,
+        }
+
+# ハンドラ間で共有する名前空間（post_reviews が同じ名前で無効化する）
+LESSONS = ResponseCache("lesson", int(os.getenv("CACHE_LESSON_SIZE", "512")),
+                        float(os.getenv("CACHE_LESSON_TTL", "60")), int(os.getenv("CACHE_SHARED_TTL", "300")))
+REVIEWS = ResponseCache("reviews", int(os.getenv("CACHE_REVIEWS_SIZE", "1024")),
+                        float(os.getenv("CACHE_REVIEWS_TTL", "15")), int(os.getenv("CACHE_SHARED_TTL", "300")))
+
+# --------- HTTP キャッシュ ---------
+def etag(body):
+    return '"' + hashlib.sha1(body.encode("utf-8")).hexdigest()[:20] + '"'
+
+def not_modified(event, tag):
+    """If-None-Match が tag と一致するか（W/ 付き・カンマ区切り・* に対応）"""
+    inm = rt.header(event, "If-None-Match")
+    if not inm:
+        return False
+    tags = [t.strip() for t in inm.split(",")]
+    return "*" in tags or tag in tags or f"W/{tag}" in tags
+
+def http_response(event, entry, headers, max_age, status=None):
+    """キャッシュ済みエントリから 200 / 304 を作る"""
+    h = {**headers, "ETag": entry["etag"],
+         "Cache-Control": f"public, max-age={max_age}, stale-while-revalidate={max_age}"}
+    if status:
+        h["X-Cache"] = status
+    if not_modified(event, entry["etag"]):
+        return {"statusCode": 304, "headers": h, "body": ""}
+    return {"statusCode": 200, "headers": h, "body": entry["body"]}
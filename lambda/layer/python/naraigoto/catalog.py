@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""LessonsCatalog（一覧用 Read Model）のクエリエンジン
+
+フィルタ（area / category / 両方 / なし）× 並び順（rating / new）ごとに GSI を持ち、
+一覧は必ず Query で取得する（Scan しない）。並び順キーは投影時に事前計算する。
+
+    GSI 名                            PK             SK
+    catalogAll-rating / -new          catalogAll     rankRating / rankNew
+    area-rating / area-new            area           rankRating / rankNew
+    category-rating / -new            category       rankRating / rankNew
+    areaCategory-rating / -new        areaCategory   rankRating / rankNew
+
+GSI は一覧項目（LIST_FIELDS）のみ INCLUDE 投影する
+（database/dynamodb/tables/lessons_catalog.json）。
+教室の位置（lat / lon）があるアイテムには近くの教室検索用の geohash キーも付ける（naraigoto.geo）。
+"""
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Key, Attr
+
+from naraigoto import cursor, geo
+
+CATALOG_ALL = "ALL"
+SORT_KEYS = {"rating": "rankRating", "new": "rankNew"}
+DEFAULT_SORT = "rating"
+MAX_LIMIT = 100
+
+# 一覧カードで使う項目のみ（ProjectionExpression / GSI の INCLUDE と揃える）
+LIST_FIELDS = ("lessonId", "schoolId", "classId", "title", "area", "category",
+               "instructorId", "ratingAvg", "ratingCount", "likesCount", "imageKey", "updatedAt")
+# GSI キー属性（カーソル生成用に取得し、レスポンスからは除く）
+_INDEX_ATTRS = ("catalogAll", "areaCategory", "rankRating", "rankNew")
+
+def rank_rating(avg, count):
+    """評価順の SK: 平均(小数2桁, 3桁固定) + 件数(10桁固定)。降順 Query で高評価・多件数順"""
+    avg = Decimal(str(avg or 0))
+    return f"{int((avg * 100).to_integral_value()):03d}#{int(count or 0):010d}"
+
+def to_catalog_item(lesson):
+    """Lessons/RDS 由来の属性から LessonsCatalog アイテム（GSI キー付き）を作る"""
+    item = dict(lesson)
+    if "lessonsId" in item and "lessonId" not in item:
+        item["lessonId"] = item.pop("lessonsId")
+    if not item.get("category") and item.get("genre"):
+        item["category"] = item["genre"]
+    item["catalogAll"] = CATALOG_ALL
+    if item.get("area") and item.get("category"):
+        item["areaCategory"] = f"{item['area']}#{item['category']}"
+    item["rankRating"] = rank_rating(item.get("ratingAvg"), item.get("ratingCount"))
+    item["rankNew"] = str(item.get("createdAt") or item.get("updatedAt") or "")
+    if item.get("lat") is not None and item.get("lon") is not None:
+        geo.to_geo_item(item, item["lat"], item["lon"])
+    return item
+
+def _scope(area, category):
+    if area and category:
+        return "areaCategory", f"{area}#{category}"
+    if area:
+        return "area", area
+    if category:
+        return "category", category
+    return "catalogAll", CATALOG_ALL
+
+def _cursor_key(item, pk_attr, sk_attr):
+    return {"lessonId": item["lessonId"], pk_attr: item[pk_attr], sk_attr: item[sk_attr]}
+
+def query_page(table, area=None, category=None, sort=DEFAULT_SORT, limit=20,
+               cursor_token=None, keyword=None, return_capacity=False):
+    """1ページ分のカタログを返す: (items, next_cursor, consumed_rcu)
+
+    keyword 指定時は GSI Query に FilterExpression を付けるため、ページが埋まるまで
+    追加 Query する。カーソルはページ末尾アイテムのキーから作る。
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    pk_attr, pk_value = _scope(area, category)
+    sk_attr = SORT_KEYS[sort]
+    index = f"{pk_attr}-{sort}"
+    scope = f"{index}|{pk_value}"
+
+    fields = LIST_FIELDS + tuple(a for a in (pk_attr, sk_attr) if a not in LIST_FIELDS)
+    names = {f"#f{i}": f for i, f in enumerate(fields)}
+    params = {
+        "IndexName": index,
+        "KeyConditionExpression": Key(pk_attr).eq(pk_value),
+        "ScanIndexForward": False,
+        "ProjectionExpression": ",".join(names),
+        "ExpressionAttributeNames": names,
+    }
+    if keyword:
+        params["FilterExpression"] = Attr("title").contains(keyword)
+    if return_capacity:
+        params["ReturnConsumedCapacity"] = "TOTAL"
+
+    start = cursor.decode(cursor_token, scope)
+    items, rcu = [], 0.0
+    while True:
+        params["Limit"] = limit - len(items) if not keyword else max(limit * 2, 20)
+        if start:
+            params["ExclusiveStartKey"] = start
+        r = table.query(**params)
+        rcu += float((r.get("ConsumedCapacity") or {}).get("CapacityUnits") or 0)
+        items.extend(r.get("Items", []))
+        start = r.get("LastEvaluatedKey")
+        if len(items) >= limit or not start:
+            break
+
+    if len(items) > limit:
+        items = items[:limit]
+        start = _cursor_key(items[-1], pk_attr, sk_attr)
+
+    for it in items:
+        for a in _INDEX_ATTRS:
+            it.pop(a, None)
+    return items, cursor.encode(start, scope), rcu
+
+def skip_pages(table, page, limit, **kw):
+    """page 番号指定（フロントの page/limit）をカーソルへ変換する。
+
+    先頭から (page-1) ページ分を Query で辿る（Scan はしない）。
+    深いページはカーソル指定を推奨。
+    """
+    token = None
+    for _ in range(max(0, page - 1)):
+        _, token, _ = query_page(table, limit=limit, cursor_token=token, **kw)
+        if not token:
+            return None, True
+    return token, False
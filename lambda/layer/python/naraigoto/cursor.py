@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""継続カーソル: LastEvaluatedKey を URL セーフな不透明文字列に変換する
+
+本体 {s, k} に CURSOR_SECRET の HMAC-SHA256 を付けて署名し、decode で検証する。
+鍵を変えると発行済みのカーソルは無効（400）になる。CURSOR_SECRET が無ければ既定値で署名せず RuntimeError
+（ローカル・ベンチは lambda/bench/local.py が設定する）。
+"""
+import os, json, base64, hmac, hashlib
+from decimal import Decimal
+
+from naraigoto.runtime import dumps
+
+SIG_BYTES = 16
+_secret = None
+
+def _key():
+    # 全関数で同じ値を設定する。import の順に依らないよう初回に読む
+    global _secret
+    if _secret is None:
+        value = os.getenv("CURSOR_SECRET")
+        if not value:
+            raise RuntimeError("CURSOR_SECRET is not set")
+        _secret = value.encode("utf-8")
+    return _secret
+
+class CursorError(ValueError):
+    """不正・署名不一致・別クエリ用のカーソル"""
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+def _unb64(s):
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+def _sign(raw):
+    return hmac.new(_key(), raw, hashlib.sha256).digest()[:SIG_BYTES]
+
+def encode(key, scope=""):
+    """key(dict) と scope(クエリ形状) を埋め込んだ署名つきカーソル。key が空なら None"""
+    if not key:
+        return None
+    raw = dumps({"s": scope, "k": key}).encode("utf-8")
+    return _b64(raw) + "." + _b64(_sign(raw))
+
+def decode(cursor, scope=""):
+    """カーソルから key を復元する。署名か scope が一致しなければ CursorError"""
+    if not cursor:
+        return None
+    _key()  # 鍵の未設定は不正なカーソル（400）ではなく設定ミス
+    try:
+        body, sig = cursor.split(".")
+        raw = _unb64(body)
+        ok = hmac.compare_digest(_unb64(sig), _sign(raw))
+    except Exception:
+        raise CursorError("invalid cursor")
+    if not ok:
+        raise CursorError("invalid cursor")
+    try:
+        # 数値キーは boto3 にそのまま渡せるよう Decimal で復元
+        data = json.loads(raw, parse_float=Decimal, parse_int=Decimal)
+    except Exception:
+        raise CursorError("invalid cursor")
+    if not isinstance(data, dict) or not isinstance(data.get("k"), dict) or data.get("s") != scope:
+        raise CursorError("invalid cursor")
+    return data["k"]
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""近くの教室検索（LessonsCatalog の geohash GSI）
+
+カタログアイテムは教室の位置（lat / lon）と geohash を持ち、5桁セル（約 4.9km × 4.9km、
+東京付近で東西約 4km）をパーティションキー、9桁 geohash をソートキーにした GSI で引く:
+
+    GSI 名         PK                                  SK
+    geo            geoCell（5桁）                      geohash（9桁）
+    geoCategory    geoCellCategory（5桁#category）     geohash
+
+検索円を囲む矩形を 5〜7桁のセルで覆い（Query 数が GEO_MAX_CELLS 以下になる最も細かい桁）、
+同じ5桁セル内で geohash 順に連続するセルは1つの BETWEEN にまとめて並列に Query する。
+取得後に大圏距離で円の外を落とし、(距離, lessonId) 順に並べる。
+
+- radius 指定: 円内を距離順にページング
+- radius なし（k 近傍）: 500m から半径を倍にしながら limit 件見つかるまで広げる（GEO_MAX_RADIUS_M まで）
+カーソルはページ末尾の (距離, lessonId) で、検索地点・半径・カテゴリに束縛される。
+"""
+import os, math
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Key
+
+from naraigoto import runtime as rt, cursor
+
+CATALOG_TABLE = os.getenv("CATALOG_TABLE", "LessonsCatalog")
+MAX_RADIUS_M = float(os.getenv("GEO_MAX_RADIUS_M", "10000"))
+MAX_CELLS = int(os.getenv("GEO_MAX_CELLS", "24"))
+START_RADIUS_M = 500.0
+MAX_LIMIT = 100
+
+CELL_PRECISION = 5
+HASH_PRECISION = 9
+INDEX = "geo"
+CATEGORY_INDEX = "geoCategory"
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"  # ASCII 順（文字列比較 = geohash 順）
+EARTH_RADIUS_M = 6371008.8
+
+# 検索結果として返す項目。geo GSI は ALL 投影（INCLUDE の属性数はテーブル全体で 100 までのため）
+FIELDS = ("lessonId", "schoolId", "classId", "title", "area", "category", "instructorId",
+          "ratingAvg", "ratingCount", "likesCount", "imageKey", "updatedAt", "lat", "lon")
+
+_pool = None
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="geo")
+    return _pool
+
+# --------- geohash ---------
+def _bits(precision):
+    """(経度のビット数, 緯度のビット数)。経度から交互に割り当てる"""
+    n = precision * 5
+    return (n + 1) // 2, n // 2
+
+def cell_size(precision):
+    """セルの大きさ（緯度方向の度, 経度方向の度）"""
+    lon_bits, lat_bits = _bits(precision)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+def _index(lat, lon, precision):
+    lon_bits, lat_bits = _bits(precision)
+    i = min(int((lat + 90.0) / 180.0 * (1 << lat_bits)), (1 << lat_bits) - 1)
+    j = min(int((lon + 180.0) / 360.0 * (1 << lon_bits)), (1 << lon_bits) - 1)
+    return i, j
+
+def _hash(i, j, precision):
+    lon_bits, lat_bits = _bits(precision)
+    out, v = [], 0
+    for k in range(precision * 5):
+        # 偶数ビットが経度、奇数ビットが緯度（上位から）
+        if k % 2 == 0:
+            lon_bits -= 1
+            bit = (j >> lon_bits) & 1
+        else:
+            lat_bits -= 1
+            bit = (i >> lat_bits) & 1
+        v = (v << 1) | bit
+        if k % 5 == 4:
+            out.append(BASE32[v])
+            v = 0
+    return "".join(out)
+
+def encode(lat, lon, precision=HASH_PRECISION):
+    return _hash(*_index(float(lat), float(lon), precision), precision)
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """大圏距離（haversine, m）"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+def bbox(lat, lon, radius_m):
+    """半径 radius_m の円を囲む矩形 (lat0, lon0, lat1, lon1)"""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlon = math.degrees(radius_m / (EARTH_RADIUS_M * max(math.cos(math.radians(lat)), 1e-6)))
+    return max(-90.0, lat - dlat), max(-180.0, lon - dlon), min(90.0, lat + dlat), min(180.0, lon + dlon)
+
+def covering(lat, lon, radius_m, max_cells=None):
+    """円を覆うセル: (precision, [geohash])。max_cells 以下になる最も細かい桁（最低 5桁）"""
+    lat0, lon0, lat1, lon1 = bbox(lat, lon, radius_m)
+    max_cells = max_cells or MAX_CELLS
+    for precision in range(7, CELL_PRECISION - 1, -1):
+        i0, j0 = _index(lat0, lon0, precision)
+        i1, j1 = _index(lat1, lon1, precision)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) <= max_cells or precision == CELL_PRECISION:
+            cells = [_hash(i, j, precision) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+            return precision, sorted(cells)
+
+def _next(h):
+    """geohash 順で次のセル（同じ桁）。最後なら None"""
+    for k in range(len(h) - 1, -1, -1):
+        c = BASE32.index(h[k])
+        if c < len(BASE32) - 1:
+            return h[:k] + BASE32[c + 1] + BASE32[0] * (len(h) - k - 1)
+    return None
+
+def ranges(cells):
+    """セル → Query 単位 [(5桁セル, 先頭 geohash, 末尾 geohash)]。5桁セルそのものは (cell, None, None)"""
+    out = []
+    for h in sorted(cells):
+        parent = h[:CELL_PRECISION]
+        if len(h) == CELL_PRECISION:
+            out.append((parent, None, None))
+            continue
+        if out and out[-1][0] == parent and out[-1][2] is not None and _next(out[-1][2]) == h:
+            out[-1] = (parent, out[-1][1], h)
+        else:
+            out.append((parent, h, h))
+    return out
+
+def to_geo_item(item, lat, lon):
+    """カタログアイテムに位置と GSI キーを付ける（catalog.to_catalog_item から呼ぶ）"""
+    h = encode(lat, lon)
+    item["geohash"] = h
+    item["geoCell"] = h[:CELL_PRECISION]
+    if item.get("category"):
+        item["geoCellCategory"] = f"{item['geoCell']}#{item['category']}"
+    return item
+
+# --------- 検索 ---------
+def _query(client, table, cell, lo, hi, category):
+    """1つの範囲を末尾まで Query する"""
+    if category:
+        index, key = CATEGORY_INDEX, Key("geoCellCategory").eq(f"{cell}#{category}")
+    else:
+        index, key = INDEX, Key("geoCell").eq(cell)
+    if lo is not None:
+        key &= Key("geohash").between(lo, hi + BASE32[-1] * (HASH_PRECISION - len(hi)))
+    names = {f"#f{i}": f for i, f in enumerate(FIELDS)}
+    params = {"TableName": table, "IndexName": index, "KeyConditionExpression": key,
+              "ProjectionExpression": ",".join(names), "ExpressionAttributeNames": names}
+    items = []
+    while True:
+        r = client.query(**params)
+        items.extend(r.get("Items", []))
+        if not r.get("LastEvaluatedKey"):
+            return items
+        params["ExclusiveStartKey"] = r["LastEvaluatedKey"]
+
+def _fetch(lat, lon, radius_m, category, table, parallel, done=None):
+    """円を覆うセルを Query し、セル内の全アイテムを距離つきで返す: [(distance_m, item)]
+
+    done（set）を渡すと Query 済みのセルを記録し、次の呼び出しでは同じセルを読まない（k 近傍の拡大用）。
+    """
+    _, cells = covering(lat, lon, radius_m)
+    if done is not None:
+        cells = [c for c in cells if c not in done]
+        done.update(cells)
+    client = rt.client()
+    args = [(client, table or CATALOG_TABLE, cell, lo, hi, category) for cell, lo, hi in ranges(cells)]
+    if parallel and len(args) > 1:
+        results = list(_executor().map(lambda a: _query(*a), args))
+    else:
+        results = [_query(*a) for a in args]
+    return [(distance_m(lat, lon, float(it["lat"]), float(it["lon"])), it)
+            for items in results for it in items if it.get("lat") is not None and it.get("lon") is not None]
+
+def within(lat, lon, radius_m, category=None, table=None, parallel=True):
+    """半径 radius_m 以内のアイテムを距離つきで: [(distance_m, item)]（順不同）"""
+    return [h for h in _fetch(lat, lon, radius_m, category, table, parallel) if h[0] <= radius_m]
+
+def _after(hits, start):
+    hits = sorted(hits, key=lambda h: (h[0], h[1]["lessonId"]))
+    if start:
+        d, lesson_id = float(start["d"]), start["id"]
+        hits = [h for h in hits if (h[0], h[1]["lessonId"]) > (d, lesson_id)]
+    return hits
+
+def nearby(lat, lon, radius_m=None, category=None, limit=20, cursor_token=None, table=None, parallel=True):
+    """近い順に1ページ返す: (items, next_cursor)。各 item に distanceM（m, 整数）を付ける"""
+    lat, lon = float(lat), float(lon)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("lat/lon out of range")
+    if radius_m is not None:
+        radius_m = float(radius_m)
+        if not 0 < radius_m <= MAX_RADIUS_M:
+            raise ValueError(f"radius must be in (0, {int(MAX_RADIUS_M)}]")
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    scope = f"geo|{lat:.6f}|{lon:.6f}|{radius_m or ''}|{category or ''}"
+    start = cursor.decode(cursor_token, scope)
+    if start and ("d" not in start or "id" not in start):
+        raise cursor.CursorError("invalid cursor")
+
+    if radius_m is not None:
+        hits = _after(within(lat, lon, radius_m, category, table, parallel), start)
+        done = len(hits) <= limit
+    else:
+        # k 近傍: 前ページ末尾の距離から始め、limit 件を超えるまで半径を倍にする
+        r = max(START_RADIUS_M, float(start["d"]) * 1.5 if start else 0.0)
+        found, seen = {}, set()
+        while True:
+            r = min(r, MAX_RADIUS_M)
+            # 読んだセルの円の外側のアイテムも残し、半径で絞り直す（同じ桁のセルは読み直さない）
+            for d, it in _fetch(lat, lon, r, category, table, parallel, seen):
+                found[it["lessonId"]] = (d, it)
+            hits = _after([h for h in found.values() if h[0] <= r], start)
+            if len(hits) > limit or r >= MAX_RADIUS_M:
+                break
+            r *= 2
+        done = len(hits) <= limit
+
+    page = hits[:limit]
+    items = []
+    for d, it in page:
+        it["distanceM"] = int(round(d))
+        items.append(it)
+    if done or not page:
+        return items, None
+    d, last = page[-1]
+    return items, cursor.encode({"d": repr(d), "id": last["lessonId"]}, scope)
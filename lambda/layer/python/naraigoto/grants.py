@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""月次チケット付与: 有効な契約（subscriptions.status = 'active'）のプラン枚数（plans.tickets_per_month）を
+ticket_balances(family_id, month) に付与する
+
+家庭ごとに Python で INSERT せず、チャンク単位の1文（INSERT ... SELECT ... ON CONFLICT (family_id, month) DO UPDATE）で
+まとめて付与する:
+
+  - families の UUID 空間を segments 個の範囲 (lower_id, upper_id] に分け、ticket_grant_progress に1行ずつ持つ
+  - ワーカーは未完了の segment を FOR UPDATE SKIP LOCKED で1つ取り、after_id の続きから id 順に CHUNK 家庭を
+    1文で付与して after_id を進め、コミットする（並列のワーカーは別の segment を取る）
+  - 付与と進捗が同じトランザクションなので、途中で落ちても続きから。付与は ticket_balances.granted との差分だけ
+    balance に足す（naraigoto.billing の invoice.paid と同じ。どちらが先でも、何度実行しても1回分）
+
+diff() は同じチャンクを読むだけで、付与する家庭数・新規行・追加枚数とサンプルを返す（ドライラン）。
+月は UTC の "YYYY-MM"（booking.ticket_month と同じ）。
+"""
+import os, time, uuid, threading
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+
+from naraigoto import pg, booking, metrics
+
+SEGMENTS = int(os.getenv("GRANT_SEGMENTS", "16"))
+CHUNK = int(os.getenv("GRANT_CHUNK", "2000"))
+WORKERS = int(os.getenv("GRANT_WORKERS", "4"))     # PG_POOL_SIZE 以下に
+SAMPLE = 20
+
+# チャンクの家庭 → 有効な契約の月間枚数（複数あれば多い方）→ まだ足りない分
+_DIFF = """
+WITH chunk AS (
+  SELECT id FROM families
+   WHERE id > %(after)s AND id <= %(upper)s
+   ORDER BY id
+   LIMIT %(chunk)s),
+target AS (
+  SELECT s.family_id, max(p.tickets_per_month) AS tickets
+    FROM chunk c
+    JOIN subscriptions s ON s.family_id = c.id AND s.status = 'active'
+    JOIN plans p ON p.id = s.plan
+   GROUP BY s.family_id),
+diff AS (
+  SELECT t.family_id, t.tickets, tb.granted, tb.balance
+    FROM target t
+    LEFT JOIN ticket_balances tb ON tb.family_id = t.family_id AND tb.month = %(month)s
+   WHERE coalesce(tb.granted, 0) < t.tickets)"""
+
+_CHUNK = """
+SELECT (SELECT id FROM chunk ORDER BY id DESC LIMIT 1) AS last_id, (SELECT count(*) FROM chunk) AS families"""
+
+DIFF = _DIFF + _CHUNK + """,
+       (SELECT count(*) FROM target) AS active,
+       (SELECT count(*) FROM diff) AS grants,
+       (SELECT count(*) FROM diff WHERE granted IS NULL) AS created,
+       (SELECT coalesce(sum(tickets - coalesce(granted, 0)), 0) FROM diff) AS tickets,
+       (SELECT jsonb_agg(d) FROM (SELECT family_id, granted, balance, tickets FROM diff
+                                   ORDER BY family_id LIMIT %(sample)s) d) AS sample"""
+
+APPLY = _DIFF + """,
+applied AS (
+  INSERT INTO ticket_balances (family_id, month, balance, granted)
+  SELECT family_id, %(month)s, tickets, tickets FROM diff
+  ON CONFLICT (family_id, month) DO UPDATE
+     SET balance = ticket_balances.balance + (EXCLUDED.granted - ticket_balances.granted),
+         granted = EXCLUDED.granted
+   WHERE ticket_balances.granted < EXCLUDED.granted
+  RETURNING family_id)""" + _CHUNK + """,
+       (SELECT count(*) FROM applied) AS grants,
+       (SELECT coalesce(sum(d.tickets - coalesce(d.granted, 0)), 0)
+          FROM applied a JOIN diff d USING (family_id)) AS tickets"""
+
+PLAN = """
+INSERT INTO ticket_grant_progress (month, segment, segments, lower_id, upper_id, after_id)
+VALUES (%s, %s, %s, %s, %s, %s)
+ON CONFLICT (month, segment) DO NOTHING"""
+
+CLAIM = """
+SELECT segment, after_id, upper_id FROM ticket_grant_progress
+ WHERE month = %s AND done_at IS NULL
+ ORDER BY segment
+ LIMIT 1
+   FOR UPDATE SKIP LOCKED"""
+
+ADVANCE = """
+UPDATE ticket_grant_progress
+   SET after_id = coalesce(%(last)s, after_id), families = families + %(families)s,
+       granted = granted + %(grants)s, tickets = tickets + %(tickets)s, chunks = chunks + 1,
+       updated_at = now(), done_at = CASE WHEN %(done)s THEN now() END
+ WHERE month = %(month)s AND segment = %(segment)s"""
+
+STATUS = """
+SELECT count(*) AS segments, count(*) FILTER (WHERE done_at IS NULL) AS remaining, max(segments) AS planned,
+       coalesce(sum(families), 0) AS families, coalesce(sum(granted), 0) AS granted,
+       coalesce(sum(tickets), 0) AS tickets, coalesce(sum(chunks), 0) AS chunks
+  FROM ticket_grant_progress
+ WHERE month = %s"""
+
+RESTART = "DELETE FROM ticket_grant_progress WHERE month = %s"
+
+def month_start(month=None):
+    """"YYYY-MM"（既定は今月。UTC）→ その月の1日"""
+    month = month or booking.ticket_month()
+    try:
+        y, m = (int(v) for v in str(month).split("-"))
+        return date(y, m, 1)
+    except ValueError:
+        raise ValueError("month must be YYYY-MM")
+
+def bounds(segments):
+    """UUID 空間を segments 個の (lower, upper] に等分する（最初の lower は nil UUID）"""
+    if not 1 <= segments <= 4096:
+        raise ValueError("segments must be between 1 and 4096")
+    edges = [uuid.UUID(int=(2 ** 128 - 1) * i // segments) for i in range(segments + 1)]
+    return list(zip(edges, edges[1:]))
+
+def status(month=None):
+    r = pg.fetch_one(STATUS, (month_start(month),))
+    return {"segments": r["segments"], "remaining": r["remaining"], "families": r["families"],
+            "granted": r["granted"], "tickets": int(r["tickets"]), "chunks": r["chunks"]}
+
+def plan(month=None, segments=None):
+    """その月の segment を作る（作成済みならそのまま。segments が違えば ValueError）"""
+    first, segments = month_start(month), segments or SEGMENTS
+    planned = pg.fetch_one(STATUS, (first,))["planned"]
+    if planned is not None and planned != segments:
+        raise ValueError(f"{first:%Y-%m} was planned with {planned} segments")
+    pg.many(PLAN, [(first, i, segments, lo, hi, lo) for i, (lo, hi) in enumerate(bounds(segments))])
+    return status(first.strftime("%Y-%m"))
+
+def grant_chunk(month=None, chunk=None):
+    """未完了の segment を1つ取り、1チャンク付与して進める: {"segment", "families", "grants", "tickets", "done"}
+    取れる segment が無ければ None（全部終わったか、ほかのワーカーが処理中）"""
+    first, chunk = month_start(month), chunk or CHUNK
+    with pg.transaction() as conn:
+        seg = conn.execute(CLAIM, (first,)).fetchone()
+        if seg is None:
+            return None
+        r = conn.execute(APPLY, {"month": first, "after": seg["after_id"], "upper": seg["upper_id"],
+                                 "chunk": chunk}).fetchone()
+        done = r["families"] < chunk
+        conn.execute(ADVANCE, {"month": first, "segment": seg["segment"], "last": r["last_id"],
+                               "families": r["families"], "grants": r["grants"], "tickets": r["tickets"],
+                               "done": done})
+    return {"segment": seg["segment"], "families": r["families"], "grants": r["grants"],
+            "tickets": int(r["tickets"]), "done": done}
+
+def run(month=None, max_seconds=600.0, workers=None, segments=None, chunk=None, function="ticket_grant"):
+    """segment を作り、workers 本で全 segment が終わるか max_seconds を過ぎるまで付与する。
+    途中で止まっても同じ月で呼び直せば続きから"""
+    month = month_start(month).strftime("%Y-%m")
+    plan(month, segments)
+    t0 = time.perf_counter()
+    total = {"families": 0, "grants": 0, "tickets": 0, "chunks": 0}
+    lock = threading.Lock()
+
+    def _worker():
+        while time.perf_counter() - t0 < max_seconds:
+            r = grant_chunk(month, chunk)
+            if r is None:
+                return
+            with lock:
+                total["chunks"] += 1
+                for k in ("families", "grants", "tickets"):
+                    total[k] += r[k]
+
+    workers = workers or WORKERS
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for f in [pool.submit(_worker) for _ in range(workers)]:
+            f.result()
+    elapsed = time.perf_counter() - t0
+    state = status(month)
+    total.update(month=month, seconds=round(elapsed, 2), remaining=state["remaining"],
+                 familiesPerSec=total["families"] / elapsed if elapsed > 0 else 0.0)
+    metrics.emit(function, {
+        "GrantFamilies": total["families"], "GrantGrants": total["grants"], "GrantTickets": total["tickets"],
+        "GrantChunks": total["chunks"], "GrantRemainingSegments": state["remaining"],
+        "GrantFamiliesPerSec": round(total["familiesPerSec"], 1)},
+        {"GrantFamiliesPerSec": "Count/Second"})
+    return total
+
+def diff(month=None, segments=None, workers=None, chunk=None, sample=SAMPLE):
+    """ドライラン: 付与せずに、付与される家庭数・新規行・追加枚数と先頭 sample 件を返す（進捗も作らない）"""
+    first, chunk = month_start(month), chunk or CHUNK
+
+    def _segment(bound):
+        after, upper = bound
+        out = {"families": 0, "active": 0, "grants": 0, "created": 0, "tickets": 0, "sample": []}
+        while True:
+            r = pg.fetch_one(DIFF, {"month": first, "after": after, "upper": upper, "chunk": chunk,
+                                    "sample": sample})
+            for k in ("families", "active", "grants", "created", "tickets"):
+                out[k] += int(r[k])
+            out["sample"] += (r["sample"] or [])[:max(0, sample - len(out["sample"]))]
+            if r["families"] < chunk:
+                return out
+            after = r["last_id"]
+
+    report = {"month": first.strftime("%Y-%m"), "families": 0, "active": 0, "grants": 0, "created": 0,
+              "toppedUp": 0, "tickets": 0, "sample": []}
+    with ThreadPoolExecutor(max_workers=workers or WORKERS) as pool:
+        for part in pool.map(_segment, bounds(segments or SEGMENTS)):
+            for k in ("families", "active", "grants", "created", "tickets"):
+                report[k] += part[k]
+            report["sample"] += part["sample"][:max(0, sample - len(report["sample"]))]
+    report["toppedUp"] = report["grants"] - report["created"]
+    return report
+
+def restart(month=None):
+    """その月の進捗を消す（付与済みの枚数は granted で分かるので、やり直しても二重には付与しない）"""
+    return pg.execute(RESTART, (month_start(month),))
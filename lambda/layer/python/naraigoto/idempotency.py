@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Idempotency-Key による書き込み API の再送対策
+
+IdempotencyKeys（PK key、TTL: expiresAt）に「リクエストの指紋」と「返したレスポンス」を保存し、
+同じキーの再送は本体テーブルに触れずに保存済みレスポンスを返す。
+
+- 同じキーで内容が異なる → 409 idempotency_key_reused
+- 先行リクエストが処理中 → 409 request_in_progress（Retry-After 付き）
+- 5xx / 例外 → 記録を消して再試行できるようにする
+"""
+import os, json, time, hashlib, functools
+
+from boto3.dynamodb.types import TypeDeserializer
+
+from naraigoto import runtime as rt, metrics
+
+IDEMPOTENCY_TABLE = os.getenv("IDEMPOTENCY_TABLE", "IdempotencyKeys")
+TTL_SEC = int(os.getenv("IDEMPOTENCY_TTL_SEC", str(24 * 3600)))
+# 処理中ロックの有効期間（Lambda のタイムアウトより長く）
+LOCK_SEC = int(os.getenv("IDEMPOTENCY_LOCK_SEC", "60"))
+HEADER = "Idempotency-Key"
+MAX_KEY_LEN = 255
+
+_deser = TypeDeserializer()
+
+def fingerprint(event):
+    """ボディ（JSON は正規化）とパスのハッシュ"""
+    body = rt.json_body(event)
+    if body is None:
+        body = event.get("body")
+    path = event.get("rawPath") or event.get("path") or ""
+    raw = json.dumps([path, body], sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _claim(client, key, fp, now):
+    """処理中として登録する。既存の記録があればそれを返す（登録できたら None）"""
+    try:
+        client.put_item(
+            TableName=IDEMPOTENCY_TABLE,
+            Item={"key": key, "fingerprint": fp, "status": "IN_PROGRESS",
+                  "lockedUntil": now + LOCK_SEC, "expiresAt": now + TTL_SEC},
+            # 期限切れ（TTL 削除待ち）/ 処理中のまま落ちた記録は引き継ぐ
+            ConditionExpression="attribute_not_exists(#k) OR expiresAt < :now "
+                                "OR (#s = :p AND lockedUntil < :now)",
+            ExpressionAttributeNames={"#k": "key", "#s": "status"},
+            ExpressionAttributeValues={":now": now, ":p": "IN_PROGRESS"},
+            ReturnValuesOnConditionCheckFailure="ALL_OLD",
+        )
+        return None
+    except client.exceptions.ConditionalCheckFailedException as e:
+        item = e.response.get("Item")
+        if item is not None:
+            # 例外レスポンスの Item は DynamoDB JSON のまま
+            return {k: _deser.deserialize(v) for k, v in item.items()}
+        return client.get_item(TableName=IDEMPOTENCY_TABLE, Key={"key": key},
+                               ConsistentRead=True).get("Item") or {}
+
+def _save(client, key, resp):
+    client.update_item(
+        TableName=IDEMPOTENCY_TABLE, Key={"key": key},
+        UpdateExpression="SET #s = :c, statusCode = :sc, responseHeaders = :h, responseBody = :b REMOVE lockedUntil",
+        ExpressionAttributeNames={"#s": "status"},
+        ExpressionAttributeValues={":c": "COMPLETED", ":sc": resp.get("statusCode", 200),
+                                   ":h": json.dumps(resp.get("headers") or {}), ":b": resp.get("body") or ""},
+    )
+
+def _release(client, key):
+    try:
+        client.delete_item(TableName=IDEMPOTENCY_TABLE, Key={"key": key})
+    except Exception as e:
+        metrics.error("idempotency release failed", e, key=key)
+
+def idempotent(scope, headers):
+    """Idempotency-Key ヘッダ付きの POST を1回だけ実行するデコレータ（ヘッダなしはそのまま実行）
+
+    scope はハンドラ名など。キーはハンドラごとに独立する。rt.http_handler の内側に付ける。
+    """
+    def _err(code, body, extra=None):
+        return rt.respond(code, body, {**headers, **extra} if extra else headers)
+
+    def wrap(fn):
+        @functools.wraps(fn)
+        def handler(event, context):
+            user_key = rt.header(event, HEADER)
+            if not user_key:
+                return fn(event, context)
+            if len(user_key) > MAX_KEY_LEN:
+                return _err(400, {"ok": False, "error": f"{HEADER} too long (<={MAX_KEY_LEN})"})
+
+            client = rt.client()
+            key = f"{scope}#{user_key}"
+            fp = fingerprint(event)
+            prev = _claim(client, key, fp, int(time.time()))
+            if prev is not None:
+                if prev.get("fingerprint") != fp:
+                    return _err(409, {"ok": False, "error": "idempotency_key_reused"})
+                if prev.get("status") != "COMPLETED":
+                    return _err(409, {"ok": False, "error": "request_in_progress"}, {"Retry-After": "1"})
+                replay_headers = json.loads(prev.get("responseHeaders") or "{}")
+                replay_headers["Idempotent-Replayed"] = "true"
+                return {"statusCode": int(prev.get("statusCode") or 200), "headers": replay_headers,
+                        "body": prev.get("responseBody") or ""}
+
+            try:
+                resp = fn(event, context)
+            except Exception:
+                _release(client, key)
+                raise
+            if int(resp.get("statusCode") or 500) >= 500:
+                # サーバ側の失敗は保存しない（同じキーで再試行可能）
+                _release(client, key)
+            else:
+                _save(client, key, resp)
+            return resp
+        return handler
+    return wrap
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""レスポンス用 JSON エンコーダ（1パス）
+
+DynamoDB 由来の Decimal / set / Binary をシリアライズ中にその場で変換する
+（旧 _decimal_to_native のような全体コピーを作らない）。
+
+- 既定: 標準 json の C エンコーダ。出力は
+  json.dumps(_decimal_to_native(body), ensure_ascii=False) とバイト単位で同一
+- JSON_ENCODER=orjson かつ orjson が導入済みなら orjson を使う（区切りの空白なしの
+  コンパクト出力になる）。orjson が扱えない値（64bit 超の整数など）は標準 json にフォールバック
+"""
+import os, json, base64
+from decimal import Decimal
+
+from boto3.dynamodb.types import Binary
+
+try:
+    import orjson
+except ImportError:  # orjson はオプション（Layer に同梱した場合のみ有効）
+    orjson = None
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        # 整数なら int、そうでなければ float（旧 _decimal_to_native と同じ規則）
+        i = int(obj)
+        return i if i == obj else float(obj)
+    if isinstance(obj, (set, frozenset)):
+        # DynamoDB の SS/NS。順序を安定させるためソートして配列に
+        return sorted(obj, key=_set_sort_key)
+    if isinstance(obj, Binary):
+        obj = obj.value
+    if isinstance(obj, (bytes, bytearray)):
+        return base64.b64encode(obj).decode("ascii")
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+def _set_sort_key(v):
+    return (0, v, "") if isinstance(v, (int, float, Decimal)) else (1, 0, str(v))
+
+# json.dumps(..., default=...) は呼び出し毎にエンコーダを生成するため、1つを使い回す
+_ENCODER = json.JSONEncoder(ensure_ascii=False, default=_default)
+_COMPACT_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+
+def dumps_std(obj, compact=False):
+    return (_COMPACT_ENCODER if compact else _ENCODER).encode(obj)
+
+if orjson is not None:
+    def dumps_orjson(obj):
+        try:
+            return orjson.dumps(obj, default=_default).decode("utf-8")
+        except (TypeError, orjson.JSONEncodeError):
+            return _COMPACT_ENCODER.encode(obj)
+else:
+    dumps_orjson = None
+
+def _select():
+    if os.getenv("JSON_ENCODER", "").lower() == "orjson" and dumps_orjson is not None:
+        return dumps_orjson
+    return _ENCODER.encode
+
+dumps = _select()
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""教室ごとのいいね数（SchoolsStats.likesCount）
+
+Likes の DynamoDB Streams の INSERT / REMOVE（Keys の schoolId のみ使う） を schoolId ごとに ±1 して ADD する。
+likes_post / likes_delete は Likes への1回の書き込みのまま（O(1)）。
+
+冪等性: review_stats と同じく eventID を ReviewStatsEvents（処理済みイベント表）に条件付き Put し、
+ADD と同じトランザクションで書く。バッチ内は schoolId ごとに差分をまとめ、
+重複が混ざっていた場合だけ1件ずつの処理にフォールバックする。
+
+一覧（LessonsCatalog）にも likesCount を非正規化して持たせ、一覧/詳細とも追加クエリなしで返す。
+カタログへの反映は SchoolsStats の likesVersion（更新ごとに +1）を条件にした SET で、
+複数シャードから順不同に届いても古い値で上書きしない。
+"""
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Key
+
+from naraigoto import review_stats
+
+SCHOOLS_STATS_TABLE = review_stats.SCHOOLS_STATS_TABLE
+EVENTS_TABLE = review_stats.EVENTS_TABLE
+CATALOG_TABLE = os.getenv("CATALOG_TABLE", "LessonsCatalog")
+CATALOG_SCHOOL_INDEX = os.getenv("CATALOG_SCHOOL_INDEX", "schoolId-index")
+LIKES_SCHOOL_INDEX = os.getenv("LIKES_SCHOOL_INDEX", "bySchool")
+# 1トランザクション 100 アクションまで（eventId の Put + 教室ごとの ADD）
+MAX_TX_ITEMS = 100
+
+def _delta(record):
+    """ストリームレコード → (schoolId, ±1)。対象外は None"""
+    sign = {"INSERT": 1, "REMOVE": -1}.get(record.get("eventName"))
+    keys = (record.get("dynamodb") or {}).get("Keys") or {}
+    school = (keys.get("schoolId") or {}).get("S")
+    if not sign or not school:
+        return None
+    return school, sign
+
+def _event_put(record, expires_at):
+    return {"Put": {
+        "TableName": EVENTS_TABLE,
+        "Item": {"eventId": record["eventID"], "expiresAt": expires_at},
+        "ConditionExpression": "attribute_not_exists(eventId)",
+    }}
+
+def _add(school_id, n):
+    return {"Update": {
+        "TableName": SCHOOLS_STATS_TABLE, "Key": {"id": school_id},
+        "UpdateExpression": "ADD likesCount :n, likesVersion :one",
+        "ExpressionAttributeValues": {":n": n, ":one": 1},
+    }}
+
+def _transact(client, records, expires_at):
+    """records をまとめて1トランザクションで適用。重複を含めば False"""
+    acc = defaultdict(int)
+    for r in records:
+        school, sign = _delta(r)
+        acc[school] += sign
+    items = [_event_put(r, expires_at) for r in records]
+    items += [_add(s, n) for s, n in sorted(acc.items()) if n]
+    try:
+        client.transact_write_items(TransactItems=items)
+        return True
+    except client.exceptions.TransactionCanceledException as e:
+        reasons = e.response.get("CancellationReasons") or []
+        if any(r.get("Code") == "ConditionalCheckFailed" for r in reasons[:len(records)]):
+            return False
+        raise
+
+def apply_records(client, records, now):
+    """ストリームのバッチを適用し、変化した schoolId の set を返す"""
+    expires_at = now + review_stats.EVENT_TTL_SEC
+    records = [r for r in records if _delta(r)]
+    touched = set()
+    # 1グループ = レコード数 + 教室数 <= MAX_TX_ITEMS
+    group, schools = [], set()
+    groups = []
+    for r in records:
+        school = _delta(r)[0]
+        if group and len(group) + 1 + len(schools | {school}) > MAX_TX_ITEMS:
+            groups.append(group)
+            group, schools = [], set()
+        group.append(r)
+        schools.add(school)
+    if group:
+        groups.append(group)
+
+    for g in groups:
+        if not _transact(client, g, expires_at):
+            # 再処理で一部が適用済み: 1件ずつ（適用済みはスキップされる）
+            for r in g:
+                _transact(client, [r], expires_at)
+        touched.update(_delta(r)[0] for r in g)
+    return touched
+
+# --------- カタログへの反映 ---------
+def sync_catalog(client, school_ids, workers=8):
+    """SchoolsStats の likesCount を LessonsCatalog の同じ教室のレッスンへコピーする"""
+    def _sync(school_id):
+        stats = client.get_item(TableName=SCHOOLS_STATS_TABLE, Key={"id": school_id}, ConsistentRead=True,
+                                ProjectionExpression="likesCount, likesVersion").get("Item") or {}
+        n, version = count(stats), int(stats.get("likesVersion") or 0)
+        updated = 0
+        for lesson_id in _catalog_lessons(client, school_id):
+            try:
+                client.update_item(
+                    TableName=CATALOG_TABLE, Key={"lessonId": lesson_id},
+                    UpdateExpression="SET likesCount = :c, likesVersion = :v",
+                    ConditionExpression="attribute_exists(lessonId) AND "
+                                        "(attribute_not_exists(likesVersion) OR likesVersion < :v)",
+                    ExpressionAttributeValues={":c": n, ":v": version},
+                )
+                updated += 1
+            except client.exceptions.ConditionalCheckFailedException:
+                pass  # より新しい値が反映済み
+        return updated
+
+    school_ids = list(school_ids)
+    if not school_ids:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(workers, len(school_ids))) as pool:
+        return sum(pool.map(_sync, school_ids))
+
+def _catalog_lessons(client, school_id):
+    params = {"TableName": CATALOG_TABLE, "IndexName": CATALOG_SCHOOL_INDEX,
+              "KeyConditionExpression": Key("schoolId").eq(school_id),
+              "ProjectionExpression": "lessonId"}
+    while True:
+        r = client.query(**params)
+        for it in r.get("Items", []):
+            yield it["lessonId"]
+        if not r.get("LastEvaluatedKey"):
+            return
+        params["ExclusiveStartKey"] = r["LastEvaluatedKey"]
+
+# --------- 再集計（ドリフト修正） ---------
+def recount(client, likes_table, segments=8):
+    """Likes の bySchool GSI を Segment 並列で Scan し、schoolId ごとの件数を返す"""
+    def _segment(seg):
+        counts = defaultdict(int)
+        params = {"TableName": likes_table, "IndexName": LIKES_SCHOOL_INDEX,
+                  "Segment": seg, "TotalSegments": segments, "ProjectionExpression": "schoolId"}
+        while True:
+            r = client.scan(**params)
+            for it in r.get("Items", []):
+                counts[it["schoolId"]] += 1
+            if not r.get("LastEvaluatedKey"):
+                return counts
+            params["ExclusiveStartKey"] = r["LastEvaluatedKey"]
+
+    total = defaultdict(int)
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        for counts in pool.map(_segment, range(segments)):
+            for s, n in counts.items():
+                total[s] += n
+    return dict(total)
+
+def current_counts(client, segments=8):
+    """SchoolsStats を Segment 並列で Scan: {schoolId: (likesCount, likesVersion)}"""
+    def _segment(seg):
+        out = {}
+        params = {"TableName": SCHOOLS_STATS_TABLE, "Segment": seg, "TotalSegments": segments,
+                  "ProjectionExpression": "id, likesCount, likesVersion"}
+        while True:
+            r = client.scan(**params)
+            for it in r.get("Items", []):
+                out[it["id"]] = (count(it), int(it.get("likesVersion") or 0))
+            if not r.get("LastEvaluatedKey"):
+                return out
+            params["ExclusiveStartKey"] = r["LastEvaluatedKey"]
+
+    total = {}
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        for part in pool.map(_segment, range(segments)):
+            total.update(part)
+    return total
+
+def repair(client, expected, current, workers=8):
+    """ずれている教室だけ絶対値で上書きする（like_stats_stream を止めてから呼ぶ）。
+
+    current の読み取り後に likesVersion が進んだ教室は条件で弾いてスキップする（次回の再集計で直す）。
+    戻り値: (修正した schoolId の配列, スキップ数)
+    """
+    def _fix(entry):
+        school_id, want = entry
+        version = current.get(school_id, (0, 0))[1]
+        cond = "attribute_not_exists(likesVersion)" if version == 0 else "likesVersion = :old"
+        values = {":c": want, ":v": version + 1}
+        if version:
+            values[":old"] = version
+        try:
+            client.update_item(
+                TableName=SCHOOLS_STATS_TABLE, Key={"id": school_id},
+                UpdateExpression="SET likesCount = :c, likesVersion = :v",
+                ConditionExpression=cond, ExpressionAttributeValues=values,
+            )
+            return school_id
+        except client.exceptions.ConditionalCheckFailedException:
+            return None
+
+    drift = [(s, n) for s, n in expected.items() if current.get(s, (0, 0))[0] != n]
+    drift += [(s, 0) for s, (n, _) in current.items() if n and s not in expected]
+    if not drift:
+        return [], 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_fix, drift))
+    fixed = [s for s in results if s]
+    return fixed, len(results) - len(fixed)
+
+def count(item):
+    """SchoolsStats / LessonsCatalog のアイテムからいいね数"""
+    return int((item or {}).get("likesCount") or 0)
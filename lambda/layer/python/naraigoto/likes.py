@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""いいね（Likes: PK userId / SK schoolId）の一括参照・一括更新・ページング"""
+import os, time, random
+
+from boto3.dynamodb.conditions import Key
+
+from naraigoto import cursor
+
+LIKES_TABLE = os.getenv("LIKES_TABLE", "Likes")
+MAX_BATCH = 100       # 1リクエストで扱う schoolId の上限
+GET_CHUNK = 100       # BatchGetItem の上限
+WRITE_CHUNK = 25      # BatchWriteItem の上限
+MAX_RETRIES = int(os.getenv("LIKES_BATCH_RETRIES", "8"))
+MAX_LIMIT = 100
+
+def _backoff(attempt):
+    time.sleep(random.uniform(0, 0.05 * (2 ** min(attempt, 5))))
+
+def _chunks(xs, n):
+    for i in range(0, len(xs), n):
+        yield xs[i:i + n]
+
+def _unique(ids):
+    seen, out = set(), []
+    for x in ids:
+        if x and x not in seen:
+            seen.add(x)
+            out.append(x)
+    return out
+
+def parse_ids(value):
+    """"a,b,c" または配列 → 重複を除いた schoolId の配列"""
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)):
+        return []
+    return _unique(str(v).strip() for v in value if v is not None and str(v).strip())
+
+def liked(client, user_id, school_ids):
+    """school_ids のうち user_id がいいね済みのものの set（BatchGetItem、未処理キーは再試行）"""
+    found = set()
+    for chunk in _chunks(_unique(school_ids), GET_CHUNK):
+        request = {LIKES_TABLE: {
+            "Keys": [{"userId": user_id, "schoolId": s} for s in chunk],
+            "ProjectionExpression": "schoolId",
+        }}
+        for attempt in range(MAX_RETRIES + 1):
+            r = client.batch_get_item(RequestItems=request)
+            found.update(it["schoolId"] for it in r.get("Responses", {}).get(LIKES_TABLE, []))
+            request = r.get("UnprocessedKeys") or {}
+            if not request:
+                break
+            _backoff(attempt)
+        else:
+            raise RuntimeError("BatchGetItem: unprocessed keys remain after retries")
+    return found
+
+def write(client, user_id, like_ids=(), unlike_ids=()):
+    """一括いいね/解除（BatchWriteItem を 25 件ずつ、未処理は再試行）: (新たにいいねした数, 解除数)"""
+    like_ids, unlike_ids = _unique(like_ids), _unique(unlike_ids)
+    if set(like_ids) & set(unlike_ids):
+        raise ValueError("the same schoolId cannot be in both like and unlike")
+    # いいね済みは書かない: createdAt を保つ（ランキングは解除時にいいねした時刻のバケットから引く）
+    if like_ids:
+        done = liked(client, user_id, like_ids)
+        like_ids = [s for s in like_ids if s not in done]
+    now = int(time.time())
+    ops = [{"PutRequest": {"Item": {"userId": user_id, "schoolId": s, "createdAt": now}}} for s in like_ids]
+    ops += [{"DeleteRequest": {"Key": {"userId": user_id, "schoolId": s}}} for s in unlike_ids]
+    for chunk in _chunks(ops, WRITE_CHUNK):
+        request = {LIKES_TABLE: chunk}
+        for attempt in range(MAX_RETRIES + 1):
+            r = client.batch_write_item(RequestItems=request)
+            request = r.get("UnprocessedItems") or {}
+            if not request:
+                break
+            _backoff(attempt)
+        else:
+            raise RuntimeError("BatchWriteItem: unprocessed items remain after retries")
+    return len(like_ids), len(unlike_ids)
+
+def list_page(table, user_id, limit=50, cursor_token=None):
+    """ユーザーのいいね一覧を1ページ: (items, next_cursor)"""
+    scope = f"likes|{user_id}"
+    params = {"KeyConditionExpression": Key("userId").eq(user_id),
+              "Limit": max(1, min(int(limit), MAX_LIMIT))}
+    start = cursor.decode(cursor_token, scope)
+    if start:
+        params["ExclusiveStartKey"] = start
+    r = table.query(**params)
+    return r.get("Items", []), cursor.encode(r.get("LastEvaluatedKey"), scope)
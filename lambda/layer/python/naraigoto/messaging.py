@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""メッセージ（家庭と教室の会話）: PostgreSQL の conversations / messages
+
+- 受信箱: conversations の要約列（最後のメッセージ・側ごとの未読数）を読む1クエリ。
+  要約は messages の文単位トリガが送信・既読と同じトランザクションで更新する（database/postgres/01_schema.sql）。
+  並びは (activity_at, id) の新しい順で、教室 / 家庭ごとの索引をキーセットでたどる
+- メッセージ: (conversation_id, created_at, id) の索引をキーセットでたどる。
+  before … 古い方へのページ（新しい順）、since … カーソルより後（古い順。WebSocket が使えないときのロングポーリング）
+- 既読: 相手側の未読を1回の UPDATE でまとめて read_at にする（会話をまたいでも1文）
+- 送信は会話の行ロックの中で clock_timestamp() を created_at にするので、同じ会話ではコミット順と
+  created_at 順が一致し、since のカーソルを後からコミットされたメッセージが追い越さない
+"""
+import os, time, uuid
+from datetime import datetime, timezone
+
+from naraigoto import pg, cursor
+
+SIDES = ("family", "school")
+MAX_LIMIT = 100
+MAX_BODY = 2000
+MAX_READ_IDS = 100
+MAX_WAIT = float(os.getenv("MESSAGES_MAX_WAIT_SEC", "20"))         # ロングポーリングの上限（API Gateway は 29 秒）
+POLL_INTERVAL = float(os.getenv("MESSAGES_POLL_INTERVAL_SEC", "1"))
+
+_FIRST = ("infinity", "ffffffff-ffff-ffff-ffff-ffffffffffff")
+_ZERO = "00000000-0000-0000-0000-000000000000"
+
+_INBOX = """
+SELECT c.id, c.booking_id, c.family_id, c.school_id, c.created_at, c.activity_at,
+       c.last_message_id, c.last_message_at, c.last_sender_user_id, c.last_body, c.{side}_unread AS unread,
+       s.name AS school_name, cl.title AS lesson_title, ls.start_at AS lesson_at
+  FROM conversations c
+  LEFT JOIN schools s ON s.id = c.school_id
+  LEFT JOIN bookings b ON b.id = c.booking_id
+  LEFT JOIN lesson_schedules ls ON ls.id = b.schedule_id
+  LEFT JOIN classes cl ON cl.id = ls.class_id
+ WHERE c.{side}_id = %(owner)s
+   AND (c.activity_at, c.id) < (%(at)s::timestamptz, %(id)s::uuid)
+   AND c.{side}_unread >= %(min_unread)s
+ ORDER BY c.activity_at DESC, c.id DESC
+ LIMIT %(limit)s"""
+INBOX = {side: _INBOX.format(side=side) for side in SIDES}
+
+_COLUMNS = "id, conversation_id, sender_user_id, body, created_at, read_at"
+
+MESSAGES_BEFORE = f"""
+SELECT {_COLUMNS}
+  FROM messages
+ WHERE conversation_id = %(conversation_id)s AND (created_at, id) < (%(at)s::timestamptz, %(id)s::uuid)
+ ORDER BY created_at DESC, id DESC
+ LIMIT %(limit)s"""
+
+MESSAGES_SINCE = f"""
+SELECT {_COLUMNS}
+  FROM messages
+ WHERE conversation_id = %(conversation_id)s AND (created_at, id) > (%(at)s::timestamptz, %(id)s::uuid)
+ ORDER BY created_at, id
+ LIMIT %(limit)s"""
+
+# 送り手の側と、家庭側なら会話の家庭に属するか（教室側は教室と利用者の紐付けがスキーマに無いので側だけ見る）
+SENDER = """
+SELECT naraigoto_side(u.type) AS side,
+       (f.parent_user_id = u.id OR EXISTS (SELECT 1 FROM family_members m
+                                            WHERE m.family_id = c.family_id AND m.child_user_id = u.id)) AS member
+  FROM conversations c
+  JOIN users u ON u.id = %(user)s
+  LEFT JOIN families f ON f.id = c.family_id
+ WHERE c.id = %(conversation_id)s
+   FOR UPDATE OF c"""
+
+SEND = f"""
+INSERT INTO messages (conversation_id, sender_user_id, body, created_at)
+VALUES (%(conversation_id)s, %(user)s, %(body)s, clock_timestamp())
+RETURNING {_COLUMNS}"""
+
+# 読み手と反対側の未読を up_to まで既読にする（部分索引 idx_messages_unread）
+MARK_READ = """
+UPDATE messages m SET read_at = now()
+  FROM users u
+ WHERE m.conversation_id = ANY(%(ids)s::uuid[]) AND m.read_at IS NULL
+   AND (m.created_at, m.id) <= (%(at)s::timestamptz, %(id)s::uuid)
+   AND u.id = m.sender_user_id
+   AND naraigoto_side(u.type) <> (SELECT naraigoto_side(type) FROM users WHERE id = %(user)s)"""
+
+class MessagingError(Exception):
+    """送信を受け付けられない（status は HTTP ステータス）"""
+    def __init__(self, code, status=409):
+        super().__init__(code)
+        self.code = code
+        self.status = status
+
+def _iso(ts):
+    return ts.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ") if ts else None
+
+def _uuid(v, name):
+    try:
+        return str(uuid.UUID(str(v)))
+    except ValueError:
+        raise ValueError(f"{name} must be a UUID")
+
+def _limit(limit):
+    return max(1, min(int(limit), MAX_LIMIT))
+
+def _position(start):
+    """カーソル → (created_at, id)。created_at はマイクロ秒まで持つ"""
+    if not all(k in start for k in ("t", "id")):
+        raise cursor.CursorError("invalid cursor")
+    try:
+        return datetime.fromisoformat(start["t"]), _uuid(start["id"], "cursor")
+    except (TypeError, ValueError):
+        raise cursor.CursorError("invalid cursor")
+
+def _token(ts, row_id, scope):
+    return cursor.encode({"t": ts.isoformat(), "id": str(row_id)}, scope)
+
+def message(r):
+    return {"id": str(r["id"]), "conversationId": str(r["conversation_id"]),
+            "senderUserId": str(r["sender_user_id"]), "body": r["body"],
+            "createdAt": _iso(r["created_at"]), "readAt": _iso(r["read_at"])}
+
+def _conversation(r):
+    last = None
+    if r["last_message_id"]:
+        last = {"id": str(r["last_message_id"]), "senderUserId": str(r["last_sender_user_id"]),
+                "body": r["last_body"], "createdAt": _iso(r["last_message_at"])}
+    return {"id": str(r["id"]), "bookingId": str(r["booking_id"]) if r["booking_id"] else None,
+            "familyId": str(r["family_id"]) if r["family_id"] else None,
+            "schoolId": str(r["school_id"]) if r["school_id"] else None, "schoolName": r["school_name"],
+            "lessonTitle": r["lesson_title"], "lessonDate": _iso(r["lesson_at"]),
+            "createdAt": _iso(r["created_at"]), "lastMessage": last, "unreadCount": r["unread"]}
+
+def inbox(side, owner_id, limit=20, cursor_token=None, unread_only=False):
+    """教室（side="school"）/ 家庭の会話を新しい順に1ページ: (items, next_cursor)。未読数は owner 側"""
+    if side not in SIDES:
+        raise ValueError(f"side must be one of {', '.join(SIDES)}")
+    owner_id, limit = _uuid(owner_id, f"{side}Id"), _limit(limit)
+    scope = f"inbox|{side}|{owner_id}|{int(bool(unread_only))}"
+    start = cursor.decode(cursor_token, scope)
+    at, after = _position(start) if start else _FIRST
+    rows = pg.fetch_all(INBOX[side], {"owner": owner_id, "at": at, "id": after, "limit": limit + 1,
+                                      "min_unread": 1 if unread_only else 0}, prepare=True)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = _token(rows[-1]["activity_at"], rows[-1]["id"], scope) if more else None
+    return [_conversation(r) for r in rows], next_cursor
+
+def messages(conversation_id, limit=50, cursor_token=None):
+    """新しい順に1ページ（cursor_token は前ページの nextCursor）: (items, next_cursor, latest_cursor)
+    latest_cursor は最新のメッセージの位置で、since() に渡して続きを待つ"""
+    conversation_id, limit = _uuid(conversation_id, "conversationId"), _limit(limit)
+    scope = f"messages|{conversation_id}"
+    start = cursor.decode(cursor_token, scope)
+    at, after = _position(start) if start else _FIRST
+    rows = pg.fetch_all(MESSAGES_BEFORE, {"conversation_id": conversation_id, "at": at, "id": after,
+                                          "limit": limit + 1}, prepare=True)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = _token(rows[-1]["created_at"], rows[-1]["id"], scope) if more else None
+    latest = _token(rows[0]["created_at"], rows[0]["id"], scope) if rows and not start else None
+    return [message(r) for r in rows], next_cursor, latest
+
+def since(conversation_id, cursor_token=None, limit=50, wait=0.0):
+    """cursor_token より後のメッセージを古い順に: (items, cursor)。無ければ wait 秒まで POLL_INTERVAL ごとに
+    読み直す（ロングポーリング）。返す cursor は次の呼び出しに渡す（新着が無ければ渡したものと同じ位置）"""
+    conversation_id, limit = _uuid(conversation_id, "conversationId"), _limit(limit)
+    scope = f"messages|{conversation_id}"
+    start = cursor.decode(cursor_token, scope)
+    at, after = _position(start) if start else (datetime.min.replace(tzinfo=timezone.utc), _ZERO)
+    params = {"conversation_id": conversation_id, "at": at, "id": after, "limit": limit}
+    deadline = time.monotonic() + max(0.0, min(float(wait), MAX_WAIT))
+    while True:
+        rows = pg.fetch_all(MESSAGES_SINCE, params, prepare=True)
+        if rows or time.monotonic() + POLL_INTERVAL > deadline:
+            break
+        time.sleep(POLL_INTERVAL)
+    if not rows:
+        return [], cursor_token or _token(at, after, scope)
+    return [message(r) for r in rows], _token(rows[-1]["created_at"], rows[-1]["id"], scope)
+
+def send(conversation_id, user_id, body):
+    """メッセージを送る（要約・相手側の未読数はトリガが同じトランザクションで更新）: (item, cursor)"""
+    body = (body or "").strip()
+    if not body:
+        raise ValueError("body required")
+    if len(body) > MAX_BODY:
+        raise ValueError(f"body must be <= {MAX_BODY} characters")
+    conversation_id = _uuid(conversation_id, "conversationId")
+    params = {"conversation_id": conversation_id, "user": _uuid(user_id, "userId"), "body": body}
+    with pg.transaction() as conn:
+        sender = conn.execute(SENDER, params).fetchone()
+        if sender is None:
+            raise MessagingError("not_found", 404)
+        if sender["side"] == "family" and not sender["member"]:
+            raise MessagingError("forbidden", 403)
+        row = conn.execute(SEND, params).fetchone()
+    return message(row), _token(row["created_at"], row["id"], f"messages|{conversation_id}")
+
+def mark_read(user_id, conversation_ids, cursor_token=None):
+    """user と反対側の未読を既読にする（1文）。cursor_token（会話が1つのとき）までに限れる。更新件数を返す"""
+    ids = list(dict.fromkeys(_uuid(c, "conversationIds") for c in conversation_ids or []))
+    if not ids:
+        raise ValueError("conversationIds required")
+    if len(ids) > MAX_READ_IDS:
+        raise ValueError(f"conversationIds must be <= {MAX_READ_IDS}")
+    at, after = _FIRST
+    if cursor_token:
+        if len(ids) != 1:
+            raise ValueError("cursor applies to a single conversation")
+        at, after = _position(cursor.decode(cursor_token, f"messages|{ids[0]}"))
+    return pg.execute(MARK_READ, {"ids": ids, "at": at, "id": after, "user": _uuid(user_id, "userId")}, prepare=True)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""リクエスト単位の計測（フェーズ別時間・DynamoDB 呼び出し・CloudWatch EMF）
+
+rt.http_handler が各 lambda_handler をこのスコープで包む。1リクエストにつき1行の
+Embedded Metric Format（EMF）を出し、CloudWatch Logs 側でメトリクスに変換される。
+
+- フェーズ: parse（rt.json_body）/ validate（ハンドラが phase("validate") で囲む）/
+  ddb（botocore のフックで各呼び出しを計測。並列呼び出しは合計）/ pg（naraigoto.pg）/ serialize（rt.respond）
+- DynamoDB: オペレーション別の呼び出し数・リトライ数（送信回数 - 呼び出し数）・ConsumedCapacity
+  （METRICS_CAPACITY=1 のときだけ ReturnConsumedCapacity=TOTAL を付ける。既定は付けない）
+- ColdStart: コンテナの最初のリクエストで 1
+- サンプリング: METRICS_SAMPLE_RATE の割合だけ出力。コールドスタート・5xx・
+  METRICS_SLOW_MS 以上のリクエストは常に出す（SampleRate プロパティで補正できる）
+- 出力先: 既定は標準出力（CloudWatch Logs）。set_sink(LocalSink()) でベンチから検査できる
+
+Lambda のコンテナは同時に1リクエストしか処理しないため、現在のリクエストはモジュール変数で持つ
+（naraigoto.reviews のようにプール上のスレッドから呼ばれる DynamoDB 呼び出しも同じリクエストに数える）。
+"""
+import os, sys, json, time, random, threading, contextlib, traceback
+
+NAMESPACE = os.getenv("METRICS_NAMESPACE", "Naraigoto")
+SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "0.1"))
+SLOW_MS = float(os.getenv("METRICS_SLOW_MS", "1000"))
+CAPACITY = os.getenv("METRICS_CAPACITY", "0") == "1"
+
+READ_OPS = ("GetItem", "Query", "Scan", "BatchGetItem", "TransactGetItems")
+CAPACITY_OPS = READ_OPS + ("PutItem", "UpdateItem", "DeleteItem", "BatchWriteItem", "TransactWriteItems")
+PHASES = ("parse", "validate", "ddb", "pg", "serialize")
+
+# EMF の Metrics 定義（名前, 単位）。同じ名前のキーをレコードの最上位に置く
+_METRICS = [("Duration", "Milliseconds"), ("ParseMs", "Milliseconds"), ("ValidateMs", "Milliseconds"),
+            ("DynamoDBMs", "Milliseconds"), ("PostgresMs", "Milliseconds"), ("SerializeMs", "Milliseconds"),
+            ("DynamoDBCalls", "Count"), ("DynamoDBRetries", "Count"), ("ConsumedRCU", "Count"),
+            ("ConsumedWCU", "Count"), ("PostgresQueries", "Count"), ("PostgresConnects", "Count"),
+            ("ColdStart", "Count"), ("CacheHits", "Count"), ("CacheMisses", "Count")]
+_PHASE_METRIC = {"parse": "ParseMs", "validate": "ValidateMs", "ddb": "DynamoDBMs", "pg": "PostgresMs",
+                 "serialize": "SerializeMs"}
+# incr() で数えるカウンタ（未使用のリクエストでは 0）
+_COUNTERS = ("PostgresQueries", "PostgresConnects")
+
+class Request:
+    """1リクエスト分の計測値"""
+    def __init__(self, function, request_id=None, cold=False):
+        self.function = function
+        self.request_id = request_id
+        self.cold = cold
+        self.status = None
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.calls = {}
+        self.sends = 0
+        self.rcu = self.wcu = 0.0
+        self.cache_hits = self.cache_misses = 0
+        self.counts = {}
+        self.props = {}
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self._lock = threading.Lock()
+
+    def add(self, phase, ms):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + ms
+
+    @property
+    def ddb_calls(self):
+        return sum(self.calls.values())
+
+    @property
+    def retries(self):
+        return max(0, self.sends - self.ddb_calls)
+
+    def record(self, sample_rate):
+        """EMF のレコード（dict）"""
+        r = {
+            "_aws": {"Timestamp": int(time.time() * 1000), "CloudWatchMetrics": [{
+                "Namespace": NAMESPACE, "Dimensions": [["Function"]],
+                "Metrics": [{"Name": n, "Unit": u} for n, u in _METRICS]}]},
+            "Function": self.function, "requestId": self.request_id, "statusCode": self.status,
+            "Duration": round(self.duration_ms, 3), "DynamoDBCalls": self.ddb_calls,
+            "DynamoDBRetries": self.retries, "ConsumedRCU": self.rcu, "ConsumedWCU": self.wcu,
+            "ColdStart": 1 if self.cold else 0, "CacheHits": self.cache_hits, "CacheMisses": self.cache_misses,
+            "ddbOps": dict(self.calls), "SampleRate": sample_rate,
+        }
+        for phase, name in _PHASE_METRIC.items():
+            r[name] = round(self.phases[phase], 3)
+        for name in _COUNTERS:
+            r[name] = self.counts.get(name, 0)
+        r.update(self.props)
+        return r
+
+# --------- 出力先 ---------
+def _stdout(record):
+    sys.stdout.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+class LocalSink:
+    """出力したレコードを保持する（ベンチ・テスト用。サンプリングせず全件）"""
+    sample_rate = 1.0
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def metrics(self, function=None):
+        """EMF レコードのみ（ログ行を除く）"""
+        return [r for r in self.records if "_aws" in r and (function is None or r["Function"] == function)]
+
+    def logs(self, level=None):
+        return [r for r in self.records if "_aws" not in r and (level is None or r.get("level") == level)]
+
+    def clear(self):
+        self.records = []
+
+_sink = _stdout
+_sample_rate = SAMPLE_RATE
+_current = None
+_cold = True
+_tl = threading.local()
+
+def set_sink(sink=None):
+    """出力先を差し替える（None で標準出力に戻す）。sink に sample_rate があればそれを使う"""
+    global _sink, _sample_rate
+    _sink = sink or _stdout
+    _sample_rate = getattr(sink, "sample_rate", SAMPLE_RATE) if sink else SAMPLE_RATE
+
+def current():
+    return _current
+
+def _sampled(req):
+    return (req.cold or (req.status or 0) >= 500 or req.duration_ms >= SLOW_MS
+            or random.random() < _sample_rate)
+
+@contextlib.contextmanager
+def request(function, context=None):
+    """1リクエストの計測スコープ。終了時にサンプリングして EMF を出す"""
+    global _current, _cold
+    req = Request(function, getattr(context, "aws_request_id", None), _cold)
+    _cold = False
+    prev, _current = _current, req
+    try:
+        yield req
+    except BaseException:
+        req.status = req.status or 500
+        raise
+    finally:
+        _current = prev
+        req.duration_ms = (time.perf_counter() - req.started) * 1000
+        if _sampled(req):
+            _sink(req.record(_sample_rate))
+
+@contextlib.contextmanager
+def phase(name):
+    """現在のリクエストの name フェーズの時間に加算する（リクエスト外では何もしない）"""
+    req = _current
+    if req is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        req.add(name, (time.perf_counter() - t0) * 1000)
+
+def put(**props):
+    """EMF レコードに任意のプロパティを足す（メトリクスにはならない）"""
+    if _current is not None:
+        _current.props.update(props)
+
+def incr(name, n=1):
+    req = _current
+    if req is not None:
+        with req._lock:
+            req.counts[name] = req.counts.get(name, 0) + n
+
+def cache(status):
+    """naraigoto.cache のヒット/ミス（HIT|SHARED はヒット）"""
+    req = _current
+    if req is None:
+        return
+    with req._lock:
+        if status == "MISS":
+            req.cache_misses += 1
+        else:
+            req.cache_hits += 1
+
+def log(level, message, **fields):
+    """構造化ログ（1行 JSON）。error は traceback を付けられる"""
+    r = {"level": level, "message": message, "Function": _current.function if _current else None,
+         "requestId": _current.request_id if _current else None}
+    r.update(fields)
+    _sink(r)
+
+def error(message, exc=None, **fields):
+    if exc is not None:
+        fields["error"] = f"{exc.__class__.__name__}: {exc}"
+        fields["trace"] = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))[-4000:]
+    log("error", message, **fields)
+
+def emit(function, values, units=None, **props):
+    """リクエスト単位でない集計値（バッチ処理の遅延・件数など）を EMF で1行出す（サンプリングしない）
+
+    values: {メトリクス名: 値}。units で単位を指定（既定 Count）
+    """
+    units = units or {}
+    r = {"_aws": {"Timestamp": int(time.time() * 1000), "CloudWatchMetrics": [{
+            "Namespace": NAMESPACE, "Dimensions": [["Function"]],
+            "Metrics": [{"Name": n, "Unit": units.get(n, "Count")} for n in values]}]},
+         "Function": function}
+    r.update(values)
+    r.update(props)
+    _sink(r)
+
+# --------- botocore フック ---------
+def instrument(client):
+    """DynamoDB client に計測フックを付ける（runtime.dynamodb() が1回だけ呼ぶ）"""
+    events = client.meta.events
+    events.register("provide-client-params.dynamodb", _params)
+    events.register("before-call.dynamodb", _before_call)
+    events.register("before-send.dynamodb", _before_send)
+    events.register("after-call.dynamodb", _after_call)
+    events.register("after-call-error.dynamodb", _after_error)
+    return client
+
+def _params(params, model, **_):
+    if CAPACITY and _current is not None and model.name in CAPACITY_OPS:
+        params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+def _before_call(model, **_):
+    req = _current
+    if req is None:
+        return
+    _tl.t0 = time.perf_counter()
+    with req._lock:
+        req.calls[model.name] = req.calls.get(model.name, 0) + 1
+
+def _before_send(**_):
+    req = _current
+    if req is not None:
+        with req._lock:
+            req.sends += 1
+
+def _elapsed(req):
+    t0 = getattr(_tl, "t0", None)
+    if t0 is not None:
+        _tl.t0 = None
+        req.add("ddb", (time.perf_counter() - t0) * 1000)
+
+def _after_call(parsed, model, **_):
+    req = _current
+    if req is None:
+        return
+    _elapsed(req)
+    cc = parsed.get("ConsumedCapacity") if isinstance(parsed, dict) else None
+    if not cc:
+        return
+    units = sum(float(c.get("CapacityUnits") or 0) for c in (cc if isinstance(cc, list) else [cc]))
+    with req._lock:
+        if model.name in READ_OPS:
+            req.rcu += units
+        else:
+            req.wcu += units
+
+def _after_error(**_):
+    req = _current
+    if req is not None:
+        _elapsed(req)
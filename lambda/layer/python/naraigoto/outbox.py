@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Outbox リレー: RDS（主系）の schools / classes の変更を DynamoDB の読み取りモデルへ投影する
+
+アプリは RDS にだけ書く（二重書き込みしない）。schools / classes の文単位トリガが同じトランザクションで
+outbox に (aggregate_type, aggregate_id) を積み（database/postgres/01_schema.sql）、リレーが次を1トランザクションで行う:
+
+  1. outbox を id 順に BATCH 行 SELECT ... FOR UPDATE SKIP LOCKED（並列のワーカーは別の行を取る）
+  2. 対象のクラス・教室の「いまの状態」を RDS から2クエリで読む（イベントの中身ではなく最新の行を投影する）
+  3. LessonsCatalog（クラス = lessonId）/ SchoolsStats（教室のプロフィール）へ UpdateItem を
+     100件ずつ TransactWriteItems でまとめて書く
+  4. outbox の行を DELETE してコミット
+
+途中で落ちた場合は行ロックが外れて次のワーカーが同じ行を取り直す（少なくとも1回）。
+投影は版つきの SET なので、同じ状態を何度書いても結果は1回と同じになる:
+  - 版 = 行の updated_at（µs）。クラスのアイテムは classVersion / schoolVersion の両方を持ち、
+    どちらかでも保存済みより古い状態の書き込みは条件で落とす（別ワーカーが先に新しい状態を書いた）
+  - 削除は版を DELETED にして投影項目と GSI キーを消す（墓標。GSI に載らず、古い upsert でも復活しない）
+  - 評価・いいね数（ratingAvg / rankRating / likesCount など）は別の投影が持つので触らない
+"""
+import os, time, random
+from datetime import timezone
+from decimal import Decimal
+
+from naraigoto import pg, catalog, metrics, review_stats
+
+CATALOG_TABLE = os.getenv("CATALOG_TABLE", "LessonsCatalog")
+SCHOOLS_STATS_TABLE = review_stats.SCHOOLS_STATS_TABLE
+BATCH = int(os.getenv("OUTBOX_BATCH", "200"))
+MAX_TX_ITEMS = 100          # TransactWriteItems の上限
+MAX_TX_ATTEMPTS = int(os.getenv("OUTBOX_TX_ATTEMPTS", "5"))
+DELETED = 2 ** 62           # 削除の版（以後のどの状態よりも新しい）
+
+# LessonsCatalog のうちこの投影が持つ項目（None なら REMOVE）
+CATALOG_FIELDS = ("schoolId", "classId", "title", "area", "category", "imageKey", "lat", "lon", "capacity",
+                  "durationMin", "createdAt", "updatedAt", "catalogAll", "areaCategory", "rankNew",
+                  "geohash", "geoCell", "geoCellCategory")
+SCHOOL_FIELDS = ("name", "area", "category", "imageKey", "lat", "lon", "updatedAt")
+
+CLAIM = """
+SELECT id, aggregate_type, aggregate_id, event_type,
+       extract(epoch FROM clock_timestamp() - created_at) * 1000 AS lag_ms
+  FROM outbox
+ ORDER BY id
+ LIMIT %s
+   FOR UPDATE SKIP LOCKED"""
+
+_US = "(extract(epoch FROM {}) * 1000000)::bigint"
+
+# 変更されたクラスと、変更された教室のすべてのクラス
+CLASS_STATE = f"""
+SELECT c.id, c.school_id, c.title, c.capacity, c.duration_min, c.created_at,
+       greatest(c.updated_at, s.updated_at) AS updated_at,
+       {_US.format("c.updated_at")} AS class_version, {_US.format("s.updated_at")} AS school_version,
+       s.area, s.category, s.image_key, s.location[1] AS lat, s.location[0] AS lon
+  FROM classes c
+  JOIN schools s ON s.id = c.school_id
+ WHERE c.id = ANY(%(classes)s::uuid[]) OR c.school_id = ANY(%(schools)s::uuid[])"""
+
+SCHOOL_STATE = f"""
+SELECT id, name, area, category, image_key, location[1] AS lat, location[0] AS lon, updated_at,
+       {_US.format("updated_at")} AS school_version
+  FROM schools
+ WHERE id = ANY(%s::uuid[])"""
+
+DONE = "DELETE FROM outbox WHERE id = ANY(%s::bigint[])"
+
+PENDING = """
+SELECT count(*) AS n, coalesce(extract(epoch FROM clock_timestamp() - min(created_at)) * 1000, 0) AS oldest_ms
+  FROM outbox"""
+
+def _iso(ts):
+    return ts.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ") if ts else None
+
+def _coord(v):
+    return Decimal(f"{v:.6f}") if v is not None else None
+
+def _update(table, key, values, versions, extra_set=()):
+    """UpdateItem（版の条件つき）。values の None は REMOVE、versions は {属性: 版}"""
+    sets, removes, names, vals = list(extra_set), [], {}, {}
+    for i, (k, v) in enumerate(values.items()):
+        names[f"#a{i}"] = k
+        if v is None:
+            removes.append(f"#a{i}")
+        else:
+            sets.append(f"#a{i} = :a{i}")
+            vals[f":a{i}"] = v
+    cond = []
+    for j, (k, v) in enumerate(versions.items()):
+        names[f"#v{j}"] = k
+        vals[f":v{j}"] = v
+        sets.append(f"#v{j} = :v{j}")
+        cond.append(f"(attribute_not_exists(#v{j}) OR #v{j} <= :v{j})")
+    expr = "SET " + ", ".join(sets) + (" REMOVE " + ", ".join(removes) if removes else "")
+    return {"Update": {"TableName": table, "Key": key, "UpdateExpression": expr,
+                       "ConditionExpression": " AND ".join(cond),
+                       "ExpressionAttributeNames": names, "ExpressionAttributeValues": vals}}
+
+def catalog_update(row):
+    """classes + schools の行 → LessonsCatalog の UpdateItem"""
+    item = catalog.to_catalog_item({
+        "lessonId": str(row["id"]), "classId": str(row["id"]), "schoolId": str(row["school_id"]),
+        "title": row["title"], "area": row["area"], "category": row["category"], "imageKey": row["image_key"],
+        "lat": _coord(row["lat"]), "lon": _coord(row["lon"]), "capacity": row["capacity"],
+        "durationMin": row["duration_min"], "createdAt": _iso(row["created_at"]), "updatedAt": _iso(row["updated_at"])})
+    values = {k: item.get(k) for k in CATALOG_FIELDS}
+    values["deleted"] = None
+    u = _update(CATALOG_TABLE, {"lessonId": item["lessonId"]}, values,
+                {"classVersion": row["class_version"], "schoolVersion": row["school_version"]},
+                ["rankRating = if_not_exists(rankRating, :rr)"])
+    # 評価の投影がまだ無いクラスも一覧の GSI に載るよう、評価順のキーだけは無ければ作る
+    u["Update"]["ExpressionAttributeValues"][":rr"] = item["rankRating"]
+    return u
+
+def catalog_tombstone(class_id):
+    values = dict.fromkeys(CATALOG_FIELDS)
+    values["deleted"] = True
+    return _update(CATALOG_TABLE, {"lessonId": class_id}, values, {"classVersion": DELETED})
+
+def school_update(row):
+    """schools の行 → SchoolsStats のプロフィール項目（評価・いいねの集計は別の投影が ADD する）"""
+    values = {"name": row["name"], "area": row["area"], "category": row["category"], "imageKey": row["image_key"],
+              "lat": _coord(row["lat"]), "lon": _coord(row["lon"]), "updatedAt": _iso(row["updated_at"]),
+              "deleted": None}
+    return _update(SCHOOLS_STATS_TABLE, {"id": str(row["id"])}, values, {"schoolVersion": row["school_version"]})
+
+def school_tombstone(school_id):
+    values = dict.fromkeys(SCHOOL_FIELDS)
+    values["deleted"] = True
+    return _update(SCHOOLS_STATS_TABLE, {"id": school_id}, values, {"schoolVersion": DELETED})
+
+def projections(class_ids, school_ids, class_rows, school_rows):
+    """イベントの対象 → UpdateItem の配列（アイテムごとに1つ。見つからない行は削除済み）"""
+    actions = {}
+    for r in class_rows:
+        actions[("class", str(r["id"]))] = catalog_update(r)
+    for c in class_ids:
+        actions.setdefault(("class", c), catalog_tombstone(c))
+    for r in school_rows:
+        actions[("school", str(r["id"]))] = school_update(r)
+    for s in school_ids:
+        actions.setdefault(("school", s), school_tombstone(s))
+    return [actions[k] for k in sorted(actions)]
+
+def _backoff(attempt):
+    time.sleep(random.uniform(0, 0.02 * (2 ** min(attempt, 5))))
+
+def write(client, actions):
+    """MAX_TX_ITEMS 件ずつ TransactWriteItems。古い版で落ちた更新は除いて再実行: (書いた数, 捨てた数)"""
+    written = stale = 0
+    for i in range(0, len(actions), MAX_TX_ITEMS):
+        group, attempt = actions[i:i + MAX_TX_ITEMS], 0
+        while group:
+            try:
+                client.transact_write_items(TransactItems=group)
+                written += len(group)
+                break
+            except client.exceptions.TransactionCanceledException as e:
+                codes = [r.get("Code") for r in e.response.get("CancellationReasons") or []]
+                failed = {k for k, c in enumerate(codes) if c == "ConditionalCheckFailed"}
+                if failed:
+                    # 別のワーカーが新しい状態を書き済み
+                    stale += len(failed)
+                    group = [a for k, a in enumerate(group) if k not in failed]
+                    continue
+                if "TransactionConflict" not in codes and "ThrottlingError" not in codes:
+                    raise
+                attempt += 1
+                if attempt >= MAX_TX_ATTEMPTS:
+                    raise
+                _backoff(attempt)
+    return written, stale
+
+def relay_once(client, batch=None):
+    """1バッチを投影する: {"events", "written", "stale", "lagMs"}（outbox が空なら events=0）"""
+    with pg.transaction() as conn:
+        rows = conn.execute(CLAIM, (batch or BATCH,)).fetchall()
+        if not rows:
+            return {"events": 0, "written": 0, "stale": 0, "lagMs": 0.0}
+        class_ids = sorted({str(r["aggregate_id"]) for r in rows if r["aggregate_type"] == "class"})
+        school_ids = sorted({str(r["aggregate_id"]) for r in rows if r["aggregate_type"] == "school"})
+        class_rows = conn.execute(CLASS_STATE, {"classes": class_ids, "schools": school_ids}).fetchall()
+        school_rows = conn.execute(SCHOOL_STATE, (school_ids,)).fetchall() if school_ids else []
+        written, stale = write(client, projections(class_ids, school_ids, class_rows, school_rows))
+        conn.execute(DONE, ([r["id"] for r in rows],))
+    return {"events": len(rows), "written": written, "stale": stale,
+            "lagMs": float(max(r["lag_ms"] for r in rows))}
+
+def run(client, max_seconds=50.0, batch=None, function="outbox_relay"):
+    """outbox が空になるか max_seconds を過ぎるまでバッチを回し、遅延・スループットを EMF で出す"""
+    t0 = time.perf_counter()
+    total = {"events": 0, "written": 0, "stale": 0, "batches": 0, "lagMs": 0.0}
+    while time.perf_counter() - t0 < max_seconds:
+        r = relay_once(client, batch)
+        if not r["events"]:
+            break
+        total["batches"] += 1
+        for k in ("events", "written", "stale"):
+            total[k] += r[k]
+        total["lagMs"] = max(total["lagMs"], r["lagMs"])
+    elapsed = time.perf_counter() - t0
+    pending = pg.fetch_one(PENDING)
+    total["pending"], total["oldestMs"] = pending["n"], float(pending["oldest_ms"])
+    total["eventsPerSec"] = total["events"] / elapsed if elapsed > 0 else 0.0
+    metrics.emit(function, {
+        "OutboxEvents": total["events"], "OutboxWritten": total["written"], "OutboxStale": total["stale"],
+        "OutboxBatches": total["batches"], "OutboxLagMs": total["lagMs"], "OutboxPending": total["pending"],
+        "OutboxOldestMs": total["oldestMs"], "OutboxEventsPerSec": round(total["eventsPerSec"], 1)},
+        {"OutboxLagMs": "Milliseconds", "OutboxOldestMs": "Milliseconds", "OutboxEventsPerSec": "Count/Second"})
+    return total
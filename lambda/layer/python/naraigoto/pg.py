@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""PostgreSQL（主系。database/postgres/01_schema.sql）への接続と主要クエリ
+
+Lambda では呼び出しごとに connect せず、ウォームコンテナ内で接続を使い回す。
+- プール: コンテナ内で PG_POOL_SIZE 本まで（既定 1。スレッドで並列に使う関数だけ増やす）。
+  貸し出し時に PG_IDLE_CHECK 秒以上使っていない接続は SELECT 1 で確かめ、切れていれば張り直す
+  （プロキシ / NAT のアイドル切断対策）。PG_MAX_LIFETIME 秒を過ぎた接続も作り直す
+- 読み取りは接続切れ（broken）なら1回だけ張り直して再実行する。書き込み・タイムアウトは再実行しない
+- プリペアドステートメント: 主要クエリは prepare=True でサーバ側に準備する（接続ごとに初回だけ）
+- まとめて送る: many() は executemany（psycopg 3 はパイプラインで1往復）、pipelined() は
+  種類の違う複数クエリを1往復で送る
+- PG_POOL_MODE=transaction: RDS Proxy / PgBouncer のトランザクションプーリング向け。
+  サーバ側プリペアドステートメントを使わず（prepare_threshold=None）、セッション状態
+  （SET / 一時テーブル / advisory lock）を持たない。複数文は transaction() の中だけで実行し、
+  statement_timeout も SET LOCAL で掛ける
+- 接続先は PG_DSN（libpq の接続文字列。PGHOST などの環境変数でも可）。PG_IAM=1 なら
+  RDS（Proxy）の IAM 認証トークンをパスワードに使う
+psycopg（3.x）はオプション。PostgreSQL を使う関数の Layer にだけ同梱する。
+"""
+import os, time, threading, contextlib
+
+try:
+    import psycopg
+    from psycopg.rows import dict_row
+except ImportError:  # psycopg はオプション
+    psycopg = None
+
+from naraigoto import metrics
+
+DSN = os.getenv("PG_DSN", "")
+POOL_SIZE = int(os.getenv("PG_POOL_SIZE", "1"))
+POOL_MODE = os.getenv("PG_POOL_MODE", "session").lower()  # session | transaction
+CONNECT_TIMEOUT = int(os.getenv("PG_CONNECT_TIMEOUT", "3"))
+STATEMENT_TIMEOUT_MS = int(os.getenv("PG_STATEMENT_TIMEOUT_MS", "5000"))
+IDLE_CHECK = float(os.getenv("PG_IDLE_CHECK", "30"))
+MAX_LIFETIME = float(os.getenv("PG_MAX_LIFETIME", "1800"))
+IAM = os.getenv("PG_IAM") == "1"
+MODES = ("session", "transaction")
+
+def _password(dsn):
+    """RDS IAM 認証トークン（15分有効。接続時にだけ使う）"""
+    import boto3
+    from psycopg.conninfo import conninfo_to_dict
+    info = conninfo_to_dict(dsn)
+    host = info.get("host") or os.getenv("PGHOST")
+    port = int(info.get("port") or os.getenv("PGPORT") or 5432)
+    user = info.get("user") or os.getenv("PGUSER")
+    return boto3.client("rds").generate_db_auth_token(DBHostname=host, Port=port, DBUsername=user)
+
+def connect(dsn=None, mode=None):
+    """接続を1本張る（autocommit。複数文は transaction() で）"""
+    if psycopg is None:
+        raise RuntimeError("psycopg is not installed (pip install 'psycopg[binary]')")
+    dsn = DSN if dsn is None else dsn
+    mode = mode or POOL_MODE
+    if mode not in MODES:
+        raise RuntimeError(f"PG_POOL_MODE must be one of {', '.join(MODES)}")
+    kwargs = {"autocommit": True, "row_factory": dict_row, "connect_timeout": CONNECT_TIMEOUT,
+              "application_name": os.getenv("AWS_LAMBDA_FUNCTION_NAME", "naraigoto")}
+    if mode == "transaction":
+        kwargs["prepare_threshold"] = None
+    elif STATEMENT_TIMEOUT_MS:
+        kwargs["options"] = f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"
+    if IAM:
+        kwargs.update(password=_password(dsn), sslmode="require")
+    metrics.incr("PostgresConnects")
+    with metrics.phase("pg"):
+        return psycopg.connect(dsn, **kwargs)
+
+def _usable(conn):
+    return not conn.closed and not conn.broken and \
+        conn.info.transaction_status == psycopg.pq.TransactionStatus.IDLE
+
+class Pool:
+    """コンテナ内の接続プール（size 本まで。空きがなければ返却を待つ）"""
+    def __init__(self, dsn=None, size=None, mode=None):
+        self.dsn = dsn
+        self.size = size or POOL_SIZE
+        self.mode = mode or POOL_MODE
+        self.connects = self.reconnects = 0
+        self._idle = []  # [conn, created, last_used]
+        self._opened = 0
+        self._cond = threading.Condition()
+
+    def _new(self):
+        conn = connect(self.dsn, self.mode)
+        self.connects += 1
+        now = time.monotonic()
+        return [conn, now, now]
+
+    def _healthy(self, entry):
+        conn, created, last = entry
+        now = time.monotonic()
+        if not _usable(conn) or now - created > MAX_LIFETIME:
+            return False
+        if now - last > IDLE_CHECK:
+            try:
+                conn.execute("SELECT 1", prepare=False)
+            except psycopg.Error:
+                return False
+        return True
+
+    def _checkout(self):
+        with self._cond:
+            while not self._idle and self._opened >= self.size:
+                self._cond.wait()
+            entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                self._opened += 1
+        try:
+            if entry is None:
+                return self._new()
+            if not self._healthy(entry):
+                entry[0].close()
+                self.reconnects += 1
+                return self._new()
+            return entry
+        except BaseException:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+
+    def _checkin(self, entry):
+        conn = entry[0]
+        ok = _usable(conn)
+        if not ok:
+            conn.close()
+        with self._cond:
+            if ok:
+                entry[2] = time.monotonic()
+                self._idle.append(entry)
+            else:
+                self._opened -= 1
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """接続を借りる。終了時にトランザクションが残っている / 切れている接続は捨てる"""
+        entry = self._checkout()
+        try:
+            yield entry[0]
+        finally:
+            self._checkin(entry)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+        for conn, _, _ in idle:
+            conn.close()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def pool():
+    """コンテナで共有するプール（初回に作る。接続は最初の貸し出しまで張らない）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = Pool()
+    return _pool
+
+def reset():
+    """プールを破棄する（ベンチでのコールドスタート再現用）"""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+    _pool = None
+
+def _prepare(prepare):
+    return False if POOL_MODE == "transaction" else prepare
+
+def run(fn, retry=False):
+    """fn(conn) を実行する。retry=True なら接続切れのときだけ張り直して1回再実行（読み取り用）"""
+    for attempt in (0, 1):
+        with pool().connection() as conn:
+            try:
+                metrics.incr("PostgresQueries")
+                with metrics.phase("pg"):
+                    return fn(conn)
+            except psycopg.OperationalError:
+                if not retry or attempt or not (conn.broken or conn.closed):
+                    raise
+
+def fetch_all(sql, params=None, prepare=None):
+    return run(lambda conn: conn.execute(sql, params, prepare=_prepare(prepare)).fetchall(), retry=True)
+
+def fetch_one(sql, params=None, prepare=None):
+    return run(lambda conn: conn.execute(sql, params, prepare=_prepare(prepare)).fetchone(), retry=True)
+
+def execute(sql, params=None, prepare=None):
+    """1文を実行して rowcount を返す（autocommit）"""
+    return run(lambda conn: conn.execute(sql, params, prepare=_prepare(prepare)).rowcount)
+
+def many(sql, rows):
+    """同じ文を rows 件分、1トランザクション・パイプラインで実行する"""
+    def _many(conn):
+        with conn.transaction(), conn.cursor() as cur:
+            _timeout(conn)
+            cur.executemany(sql, rows)
+            return cur.rowcount
+    return run(_many)
+
+def pipelined(statements, prepare=None):
+    """[(sql, params)] を1往復で送り、それぞれの全行を返す（読み取り用）"""
+    def _pipelined(conn):
+        with conn.pipeline():
+            cursors = [conn.cursor() for _ in statements]
+            for cur, (sql, params) in zip(cursors, statements):
+                cur.execute(sql, params, prepare=_prepare(prepare))
+        return [cur.fetchall() for cur in cursors]
+    return run(_pipelined, retry=True)
+
+def _timeout(conn):
+    if POOL_MODE == "transaction" and STATEMENT_TIMEOUT_MS:
+        conn.execute(f"SET LOCAL statement_timeout = {STATEMENT_TIMEOUT_MS}")
+
+@contextlib.contextmanager
+def transaction():
+    """複数文を1トランザクションで（トランザクションプーリングでも同じ接続に載る単位）"""
+    with pool().connection() as conn:
+        metrics.incr("PostgresQueries")
+        with metrics.phase("pg"), conn.transaction():
+            _timeout(conn)
+            yield conn
+
+# --------- 主要クエリ（prepare=True でサーバ側に準備） ---------
+USER_BOOKINGS = """
+SELECT b.id, b.status, b.consumed_tickets, b.created_at, s.id AS schedule_id, s.start_at, s.end_at,
+       c.id AS class_id, c.title, c.school_id
+  FROM bookings b
+  JOIN lesson_schedules s ON s.id = b.schedule_id
+  JOIN classes c ON c.id = s.class_id
+ WHERE b.user_id = %s AND b.created_at < coalesce(%s::timestamptz, 'infinity')
+ ORDER BY b.created_at DESC
+ LIMIT %s"""
+
+# 残り席数は lesson_schedules.reserved（bookings の文単位トリガで予約・キャンセルと同じトランザクションに更新）。
+# bookings は数えない
+AVAILABILITY = """
+SELECT s.id AS schedule_id, s.class_id, s.start_at, c.capacity, s.reserved AS booked
+  FROM lesson_schedules s
+  JOIN classes c ON c.id = s.class_id
+ WHERE s.id = ANY(%s::uuid[])"""
+
+# クラスの期間内の回を開始日時順に（UNIQUE (class_id, start_at) の索引）。open_only なら空きのある回だけ
+CLASS_SLOTS = """
+SELECT s.id AS schedule_id, s.class_id, s.start_at, c.capacity, s.reserved AS booked
+  FROM lesson_schedules s
+  JOIN classes c ON c.id = s.class_id
+ WHERE s.class_id = %(class_id)s AND s.start_at >= %(start)s AND s.start_at < %(end)s
+   AND (NOT %(open_only)s OR s.reserved < c.capacity)
+ ORDER BY s.start_at"""
+
+TICKET_BALANCE = "SELECT balance FROM ticket_balances WHERE family_id = %s AND month = %s"
+
+# スナップショット（points_balances）+ 以後の行（idx_points_family_xid の範囲だけ。naraigoto.points）
+POINTS_BALANCE = """
+SELECT coalesce(b.balance, 0) + coalesce((SELECT sum(t.amount) FROM points_transactions t
+                                           WHERE t.family_id = f.id
+                                             AND t.xid >= coalesce(b.through_xid, '0'::xid8)), 0) AS points
+  FROM (SELECT %s::uuid AS id) f
+  LEFT JOIN points_balances b ON b.family_id = f.id"""
+
+# 近くの教室（location は point(経度, 緯度)）。earth_box で GiST を引き、earth_distance で円に絞って
+# <->（索引の k 近傍順）で並べる。前ページ末尾の (距離, id) より後ろだけ返す
+_NEARBY = """
+SELECT id, name, area, category, image_key, location[1] AS lat, location[0] AS lon,
+       earth_distance(ll_to_earth(location[1], location[0]), ll_to_earth(%(lat)s, %(lon)s)) AS distance_m
+  FROM schools
+ WHERE earth_box(ll_to_earth(%(lat)s, %(lon)s), %(radius)s) @> ll_to_earth(location[1], location[0])
+   AND earth_distance(ll_to_earth(location[1], location[0]), ll_to_earth(%(lat)s, %(lon)s)) <= %(radius)s
+   AND (earth_distance(ll_to_earth(location[1], location[0]), ll_to_earth(%(lat)s, %(lon)s)), id)
+       > (%(after_d)s, %(after_id)s::uuid){category}
+ ORDER BY ll_to_earth(location[1], location[0]) <-> ll_to_earth(%(lat)s, %(lon)s), id
+ LIMIT %(limit)s"""
+NEARBY_SCHOOLS = _NEARBY.format(category="")
+NEARBY_SCHOOLS_CATEGORY = _NEARBY.format(category="\n   AND category = %(category)s")
+
+def _seats(r):
+    return {"scheduleId": str(r["schedule_id"]), "classId": str(r["class_id"]), "startAt": r["start_at"],
+            "capacity": r["capacity"], "booked": r["booked"], "left": max(0, r["capacity"] - r["booked"])}
+
+def availability(schedule_ids):
+    """{schedule_id: {"scheduleId", "classId", "startAt", "capacity", "booked", "left"}}（1クエリ）"""
+    rows = fetch_all(AVAILABILITY, (list(schedule_ids),), prepare=True)
+    return {str(r["schedule_id"]): _seats(r) for r in rows}
+
+def class_slots(class_id, start, end, open_only=False):
+    """クラスの [start, end) の回を開始日時順に（1クエリ）"""
+    rows = fetch_all(CLASS_SLOTS, {"class_id": class_id, "start": start, "end": end, "open_only": open_only},
+                     prepare=True)
+    return [_seats(r) for r in rows]
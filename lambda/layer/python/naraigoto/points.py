@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""ポイント台帳: PostgreSQL の points_transactions（追記のみ）と points_balances（家庭ごとのスナップショット）
+
+- 残高 = スナップショット + through_xid 以後の行の合計（pg.POINTS_BALANCE。idx_points_family_xid の範囲だけ読む）。
+  履歴の長い家庭でも全件を SUM しない
+- 圧縮（compact）: 実行中のどのトランザクションよりも古い行（xid < pg_snapshot_xmin）だけを家庭ごとに balance へ畳み、
+  through_xid を進める。コミット前の行は必ずその xmin 以上なので、後からコミットされても次の圧縮・残高の差分に入る。
+  前回の horizon 以後に行がある家庭だけを family_id 順のチャンクで見る
+- 引き換え（redeem）: points_balances の行を FOR UPDATE で取ってから残高を読み直し、足りれば負の行を書く
+  （同じ家庭の引き換え・圧縮は行ロックで直列になる。付与は行ロックを取らない。増えるだけなので引き換えを通し過ぎない）
+- 口コミ報酬（award_reviews）: Reviews のストリームのバッチをまとめて1文で INSERT する。
+  reviewId の一意索引（idx_points_review）で再処理は ON CONFLICT DO NOTHING
+"""
+import os, time, uuid, json
+from datetime import datetime, timezone
+
+from boto3.dynamodb.types import TypeDeserializer
+
+from naraigoto import pg, cursor, metrics, review_stats
+
+REVIEW_POINTS = int(os.getenv("REVIEW_POINTS", "50"))
+COMPACT_CHUNK = int(os.getenv("POINTS_COMPACT_CHUNK", "500"))
+MAX_LIMIT = 100
+MAX_REDEEM = 100000
+
+_FIRST = ("infinity", "ffffffff-ffff-ffff-ffff-ffffffffffff")
+_ZERO = "00000000-0000-0000-0000-000000000000"
+
+HISTORY = """
+SELECT id, type::text AS type, amount, created_at, meta
+  FROM points_transactions
+ WHERE family_id = %(family)s AND (created_at, id) < (%(at)s::timestamptz, %(id)s::uuid)
+ ORDER BY created_at DESC, id DESC
+ LIMIT %(limit)s"""
+
+# 家庭が無ければ0行（FK 違反にしない）。あれば FOR UPDATE で引き換え・圧縮を直列にする
+ENSURE = """
+INSERT INTO points_balances (family_id)
+SELECT id FROM families WHERE id = %s
+ON CONFLICT (family_id) DO NOTHING"""
+LOCK = "SELECT family_id FROM points_balances WHERE family_id = %s FOR UPDATE"
+
+INSERT = """
+INSERT INTO points_transactions (family_id, type, amount, meta)
+VALUES (%s, %s::points_transaction_type, %s, %s::jsonb)
+RETURNING id, type::text AS type, amount, created_at, meta"""
+
+AWARD_REVIEWS = """
+INSERT INTO points_transactions (family_id, type, amount, meta)
+SELECT fm.family_id, 'review', %(amount)s,
+       jsonb_build_object('reviewId', r.review_id, 'userId', r.user_id, 'lessonsId', r.lessons_id)
+  FROM unnest(%(reviews)s::text[], %(users)s::uuid[], %(lessons)s::text[]) AS r(review_id, user_id, lessons_id)
+  CROSS JOIN LATERAL (SELECT id AS family_id FROM families WHERE parent_user_id = r.user_id
+                      UNION ALL
+                      SELECT family_id FROM family_members WHERE child_user_id = r.user_id
+                      LIMIT 1) fm
+ON CONFLICT ((meta->>'reviewId')) WHERE type = 'review' DO NOTHING"""
+
+HORIZON = """
+SELECT c.horizon AS last, pg_snapshot_xmin(pg_current_snapshot()) AS horizon
+  FROM points_compaction c"""
+
+CANDIDATES = """
+SELECT DISTINCT family_id FROM points_transactions
+ WHERE xid >= %(last)s AND xid < %(horizon)s AND family_id > %(after)s
+ ORDER BY family_id
+ LIMIT %(chunk)s"""
+
+ENSURE_MANY = """
+INSERT INTO points_balances (family_id)
+SELECT unnest(%s::uuid[])
+ON CONFLICT (family_id) DO NOTHING"""
+
+# through_xid が読んだときのままの行だけ進める（並列の圧縮で同じ行を二重に畳まない）
+FOLD = """
+WITH d AS (
+  SELECT b.family_id, b.through_xid, coalesce(sum(t.amount), 0) AS amount, count(t.id) AS n
+    FROM points_balances b
+    LEFT JOIN points_transactions t
+      ON t.family_id = b.family_id AND t.xid >= b.through_xid AND t.xid < %(horizon)s
+   WHERE b.family_id = ANY(%(families)s::uuid[]) AND b.through_xid < %(horizon)s
+   GROUP BY b.family_id, b.through_xid)
+UPDATE points_balances b
+   SET balance = b.balance + d.amount, through_xid = %(horizon)s, updated_at = now()
+  FROM d
+ WHERE b.family_id = d.family_id AND b.through_xid = d.through_xid
+RETURNING d.n"""
+
+ADVANCE = "UPDATE points_compaction SET horizon = %s, updated_at = now() WHERE horizon < %s"
+
+PENDING = """
+SELECT count(*) AS n FROM points_transactions
+ WHERE xid >= (SELECT horizon FROM points_compaction)"""
+
+_deser = TypeDeserializer()
+
+class PointsError(Exception):
+    """引き換えできない（status は HTTP ステータス）"""
+    def __init__(self, code, status=409):
+        super().__init__(code)
+        self.code = code
+        self.status = status
+
+def _iso(ts):
+    return ts.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ") if ts else None
+
+def _uuid(v, name):
+    try:
+        return str(uuid.UUID(str(v)))
+    except ValueError:
+        raise ValueError(f"{name} must be a UUID")
+
+def _position(start):
+    if not all(k in start for k in ("t", "id")):
+        raise cursor.CursorError("invalid cursor")
+    try:
+        return datetime.fromisoformat(start["t"]), _uuid(start["id"], "cursor")
+    except (TypeError, ValueError):
+        raise cursor.CursorError("invalid cursor")
+
+def transaction(r):
+    return {"id": str(r["id"]), "type": r["type"], "amount": r["amount"], "createdAt": _iso(r["created_at"]),
+            "meta": r["meta"]}
+
+def balance(family_id):
+    return pg.fetch_one(pg.POINTS_BALANCE, (_uuid(family_id, "familyId"),), prepare=True)["points"]
+
+def history(family_id, limit=20, cursor_token=None):
+    """残高と、新しい順の履歴1ページ: (points, items, next_cursor)。1往復"""
+    family_id = _uuid(family_id, "familyId")
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    scope = f"points|{family_id}"
+    start = cursor.decode(cursor_token, scope)
+    at, after = _position(start) if start else _FIRST
+    points, rows = pg.pipelined([(pg.POINTS_BALANCE, (family_id,)),
+                                 (HISTORY, {"family": family_id, "at": at, "id": after, "limit": limit + 1})],
+                                prepare=True)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = cursor.encode({"t": rows[-1]["created_at"].isoformat(), "id": str(rows[-1]["id"])},
+                                scope) if more else None
+    return points[0]["points"], [transaction(r) for r in rows], next_cursor
+
+def award(family_id, type_, amount, meta=None):
+    """付与（紹介など）。行ロックは取らない"""
+    if int(amount) <= 0:
+        raise ValueError("amount must be positive")
+    row = pg.fetch_one(INSERT, (_uuid(family_id, "familyId"), type_, int(amount), json.dumps(meta or {})))
+    return transaction(row)
+
+def redeem(family_id, amount, meta=None):
+    """残高を確かめて引き換える: (transaction, points)。足りなければ PointsError("insufficient_points")"""
+    family_id = _uuid(family_id, "familyId")
+    try:
+        amount = int(amount)
+    except (TypeError, ValueError):
+        raise ValueError("amount must be an integer")
+    if not 0 < amount <= MAX_REDEEM:
+        raise ValueError(f"amount must be between 1 and {MAX_REDEEM}")
+    with pg.transaction() as conn:
+        conn.execute(ENSURE, (family_id,))
+        if conn.execute(LOCK, (family_id,)).fetchone() is None:
+            raise PointsError("not_found", 404)
+        # ロックを取った後の文なので、先にコミットされた引き換えを含めて読む
+        points = conn.execute(pg.POINTS_BALANCE, (family_id,)).fetchone()["points"]
+        if points < amount:
+            raise PointsError("insufficient_points")
+        row = conn.execute(INSERT, (family_id, "redeem", -amount, json.dumps(meta or {}))).fetchone()
+    return transaction(row), points - amount
+
+def review_awards(records):
+    """ストリームのレコード → 報酬の対象（新規の口コミ。移行のコピーと UUID でない userId は除く）"""
+    out = {}
+    for record in records or []:
+        if record.get("eventName") != "INSERT":
+            continue
+        image = {k: _deser.deserialize(v) for k, v in ((record.get("dynamodb") or {}).get("NewImage") or {}).items()}
+        if review_stats.migrated(image) or not image.get("reviewId"):
+            continue
+        try:
+            user = str(uuid.UUID(str(image.get("userId"))))
+        except ValueError:
+            continue
+        out[str(image["reviewId"])] = (user, str(image.get("lessonsId") or ""))
+    return out
+
+def award_reviews(records, amount=None):
+    """口コミ報酬をバッチ1文で付与する: {"reviews", "awarded"}（家庭に紐付かない利用者・再処理分は付与しない）"""
+    awards = review_awards(records)
+    if not awards:
+        return {"reviews": 0, "awarded": 0}
+    ids = list(awards)
+    n = pg.execute(AWARD_REVIEWS, {"amount": amount or REVIEW_POINTS, "reviews": ids,
+                                   "users": [awards[i][0] for i in ids], "lessons": [awards[i][1] for i in ids]},
+                   prepare=True)
+    return {"reviews": len(ids), "awarded": n}
+
+def compact_chunk(last, horizon, after=_ZERO, chunk=None):
+    """after より後の家庭を chunk 件畳む: (最後の family_id, 家庭数, 畳んだ行数)。家庭が無ければ (None, 0, 0)"""
+    with pg.transaction() as conn:
+        families = [r["family_id"] for r in conn.execute(CANDIDATES, {
+            "last": last, "horizon": horizon, "after": after, "chunk": chunk or COMPACT_CHUNK}).fetchall()]
+        if not families:
+            return None, 0, 0
+        conn.execute(ENSURE_MANY, (families,))
+        folded = sum(r["n"] for r in conn.execute(FOLD, {"families": families, "horizon": horizon}).fetchall())
+    return families[-1], len(families), folded
+
+def compact(max_seconds=50.0, chunk=None, function="points_compaction"):
+    """前回の horizon 以後に行がある家庭を畳む。最後まで進んだら horizon を進める（途中で止まれば次回やり直す）"""
+    t0 = time.perf_counter()
+    h = pg.fetch_one(HORIZON)
+    after, total = _ZERO, {"families": 0, "folded": 0, "chunks": 0, "complete": False}
+    while time.perf_counter() - t0 < max_seconds:
+        after, families, folded = compact_chunk(h["last"], h["horizon"], after, chunk)
+        if after is None:
+            pg.execute(ADVANCE, (h["horizon"], h["horizon"]))
+            total["complete"] = True
+            break
+        total["chunks"] += 1
+        total["families"] += families
+        total["folded"] += folded
+    elapsed = time.perf_counter() - t0
+    pending = pg.fetch_one(PENDING)["n"]
+    total.update(seconds=round(elapsed, 2), pending=pending)
+    metrics.emit(function, {
+        "PointsCompactedFamilies": total["families"], "PointsFoldedRows": total["folded"],
+        "PointsCompactChunks": total["chunks"], "PointsPendingRows": pending,
+        "PointsCompactMs": round(elapsed * 1000, 1)},
+        {"PointsCompactMs": "Milliseconds"})
+    return total
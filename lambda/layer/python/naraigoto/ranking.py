@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+"""人気ランキング（今週の人気）: 教室ごとの時間・日バケットのカウンタと、範囲ごとの上位 K 件の事前計算
+
+RankingCounters（PK schoolId / SK bucket）:
+  bucket="H#YYYYMMDDHH" … 1時間ごとの bookings / reviews / likes（直近 HOURLY_DAYS 日分。TTL expiresAt）
+  bucket="D#YYYYMMDD"   … 1日ごと（WINDOW_DAYS 日分）
+Bookings / Reviews / Likes のストリームのバッチを (教室, バケット) ごとの差分にまとめて ADD する。
+冪等性は like_stats と同じく eventId を ReviewStatsEvents に条件付き Put し、ADD と同じトランザクションで書く
+（同じストリームをほかの集計も読むので eventId は "ranking#" + eventID）。
+
+スコア = Σ 重み(種類) × 件数 × 0.5 ** (バケットの中央からの経過時間 / HALF_LIFE_HOURS)。
+UTC の日付で今日から HOURLY_DAYS 日は時間バケット、それより前の日は日バケットを使う（重ならない）。
+
+recompute() は窓内のカウンタと SchoolsStats（name / area / category / 評価）を Segment 並列で Scan し、
+範囲（全体・area・category・area#category）ごとに大きさ K のヒープで上位を残して、
+範囲ごとに1アイテムとして Rankings（PK scope）に書く。読み出し（read）は GetItem 1回。
+"""
+import os, time, heapq, random, calendar, functools, threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeDeserializer
+
+from naraigoto import review_stats, metrics
+
+COUNTERS_TABLE = os.getenv("RANKING_COUNTERS_TABLE", "RankingCounters")
+RANKINGS_TABLE = os.getenv("RANKINGS_TABLE", "Rankings")
+SCHOOLS_STATS_TABLE = review_stats.SCHOOLS_STATS_TABLE
+EVENTS_TABLE = review_stats.EVENTS_TABLE
+CATALOG_TABLE = os.getenv("CATALOG_TABLE", "LessonsCatalog")
+BOOKINGS_TABLE = os.getenv("BOOKINGS_TABLE", "Bookings")
+LIKES_TABLE = os.getenv("LIKES_TABLE", "Likes")
+WINDOW_DAYS = int(os.getenv("RANKING_WINDOW_DAYS", "7"))
+HOURLY_DAYS = int(os.getenv("RANKING_HOURLY_DAYS", "2"))
+HALF_LIFE_HOURS = float(os.getenv("RANKING_HALF_LIFE_HOURS", "72"))
+TOP_K = int(os.getenv("RANKING_TOP_K", "50"))
+SEGMENTS = int(os.getenv("RANKING_SEGMENTS", "8"))
+KINDS = ("bookings", "reviews", "likes")
+# 1トランザクション 100 アクションまで（eventId の Put + (教室, バケット) ごとの ADD）
+MAX_TX_ITEMS = 100
+GET_CHUNK = 100
+WRITE_CHUNK = 25
+MAX_RETRIES = 8
+
+HOUR, DAY = 3600, 86400
+
+def _weights(spec):
+    """"bookings=3,reviews=2,likes=1" → {種類: 重み}"""
+    out = {"bookings": 3.0, "reviews": 2.0, "likes": 1.0}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        kind, _, w = part.partition("=")
+        if kind.strip() not in out:
+            raise ValueError(f"unknown ranking weight: {kind}")
+        out[kind.strip()] = float(w)
+    return out
+
+WEIGHTS = _weights(os.getenv("RANKING_WEIGHTS", ""))
+
+_deser = TypeDeserializer()
+# レッスンの教室は変わらないので、コンテナ内で覚えておく
+_lesson_schools = {}
+
+def _backoff(attempt):
+    time.sleep(random.uniform(0, 0.05 * (2 ** min(attempt, 5))))
+
+# --------- バケット ---------
+def buckets(at):
+    """時刻（epoch 秒）→ (時間バケット, 日バケット)"""
+    t = time.gmtime(at)
+    return time.strftime("H#%Y%m%d%H", t), time.strftime("D#%Y%m%d", t)
+
+@functools.lru_cache(maxsize=4096)
+def bucket_start(bucket):
+    b = bucket[2:]
+    return calendar.timegm((int(b[0:4]), int(b[4:6]), int(b[6:8]), int(b[8:10] or 0), 0, 0))
+
+def expires_at(bucket):
+    keep = HOURLY_DAYS if bucket[0] == "H" else WINDOW_DAYS
+    return bucket_start(bucket) + (keep + 1) * DAY
+
+def window(now):
+    """スコアに使うバケット: (時間バケットの下限, 日バケットの下限, 日バケットの上限)。いずれも含む"""
+    today = int(now) // DAY * DAY
+    cut = today - (HOURLY_DAYS - 1) * DAY
+    first = today - (WINDOW_DAYS - 1) * DAY
+    return (time.strftime("H#%Y%m%d%H", time.gmtime(cut)), time.strftime("D#%Y%m%d", time.gmtime(first)),
+            time.strftime("D#%Y%m%d", time.gmtime(cut - DAY)))
+
+def decay(bucket, now):
+    span = HOUR if bucket[0] == "H" else DAY
+    age = max(0.0, now - bucket_start(bucket) - span / 2)
+    return 0.5 ** (age / 3600.0 / HALF_LIFE_HOURS)
+
+def deltas(signals, now):
+    """[(schoolId, 種類, ±n, 時刻)] → {(schoolId, バケット): {種類: n}}（保持期間を過ぎたバケットは除く）"""
+    acc = defaultdict(lambda: defaultdict(int))
+    for school, kind, sign, at in signals:
+        for b in buckets(at):
+            if expires_at(b) > now:
+                acc[(school, b)][kind] += sign
+    return {k: {a: n for a, n in d.items() if n} for k, d in acc.items() if any(d.values())}
+
+# --------- ストリーム ---------
+def _source(record):
+    arn = record.get("eventSourceARN") or ""
+    return arn.split(":table/", 1)[1].split("/", 1)[0] if ":table/" in arn else ""
+
+def _image(record, name):
+    return {k: _deser.deserialize(v) for k, v in ((record.get("dynamodb") or {}).get(name) or {}).items()}
+
+def epoch(value):
+    """createdAt（epoch 秒 / ISO 8601）→ epoch 秒。読めなければ None"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return None
+
+def review_school(review):
+    """口コミの対象が教室なら schoolId"""
+    key = review.get("targetKey")
+    if not key and review.get("targetType") and review.get("targetId"):
+        key = f"{review['targetType']}#{review['targetId']}"
+    ttype, _, tid = str(key or "").partition("#")
+    return tid if ttype == "school" and tid else None
+
+def signal(record):
+    """ストリームレコード → (schoolId, lessonId, 種類, ±1, 時刻)。対象外は None。
+    教室の分からない予約・口コミは schoolId が None（lessonId から LessonsCatalog で引く）"""
+    source, name = _source(record), record.get("eventName")
+    old, new = _image(record, "OldImage"), _image(record, "NewImage")
+    if source == LIKES_TABLE:
+        # いいねで +1。解除はいいねした時刻（OldImage の createdAt）のバケットから -1
+        sign = {"INSERT": 1, "REMOVE": -1}.get(name)
+        image = new if sign == 1 else old
+        at = epoch(image.get("createdAt"))
+        if not sign or not image.get("schoolId") or at is None:
+            return None
+        return image["schoolId"], None, "likes", sign, at
+    if source == BOOKINGS_TABLE:
+        # 予約で +1。キャンセル（reserved → canceled / 削除）は予約した時刻のバケットから -1
+        was, now = old.get("status") == "reserved", new.get("status") == "reserved"
+        if was == now:
+            return None
+        image = new if now else old
+        at = epoch(image.get("createdAt"))
+        if not image.get("lessonId") or at is None:
+            return None
+        return image.get("schoolId"), image["lessonId"], "bookings", 1 if now else -1, at
+    # Reviews: 投稿で +1 / 削除で -1（移行のコピーは数えない）
+    sign = {"INSERT": 1, "REMOVE": -1}.get(name)
+    image = new if sign == 1 else old
+    if not sign or review_stats.migrated(image):
+        return None
+    at = epoch(image.get("createdAt"))
+    school, lesson = review_school(image), image.get("lessonsId")
+    if at is None or not (school or lesson):
+        return None
+    return school, lesson, "reviews", sign, at
+
+def lesson_schools(client, lesson_ids):
+    """lessonId → schoolId（LessonsCatalog を BatchGetItem。カタログに無いレッスンは None）"""
+    missing = sorted({l for l in lesson_ids if l and l not in _lesson_schools})
+    for i in range(0, len(missing), GET_CHUNK):
+        request = {CATALOG_TABLE: {"Keys": [{"lessonId": l} for l in missing[i:i + GET_CHUNK]],
+                                   "ProjectionExpression": "lessonId, schoolId"}}
+        for attempt in range(MAX_RETRIES + 1):
+            r = client.batch_get_item(RequestItems=request)
+            for it in r.get("Responses", {}).get(CATALOG_TABLE, []):
+                if it.get("schoolId"):
+                    _lesson_schools[it["lessonId"]] = it["schoolId"]
+            request = r.get("UnprocessedKeys") or {}
+            if not request:
+                break
+            _backoff(attempt)
+        else:
+            raise RuntimeError("BatchGetItem: unprocessed keys remain after retries")
+    return {l: _lesson_schools.get(l) for l in lesson_ids}
+
+def _event_put(record, expires):
+    return {"Put": {
+        "TableName": EVENTS_TABLE,
+        "Item": {"eventId": "ranking#" + record["eventID"], "expiresAt": expires},
+        "ConditionExpression": "attribute_not_exists(eventId)",
+    }}
+
+def _add(key, delta):
+    school, bucket = key
+    kinds = sorted(delta)
+    values = {f":v{i}": delta[k] for i, k in enumerate(kinds)}
+    values[":exp"] = expires_at(bucket)
+    return {"Update": {
+        "TableName": COUNTERS_TABLE, "Key": {"schoolId": school, "bucket": bucket},
+        "UpdateExpression": "ADD " + ", ".join(f"#a{i} :v{i}" for i in range(len(kinds))) + " SET expiresAt = :exp",
+        "ExpressionAttributeNames": {f"#a{i}": k for i, k in enumerate(kinds)},
+        "ExpressionAttributeValues": values,
+    }}
+
+def _transact(client, group, now):
+    """[(record, signal)] をまとめて1トランザクションで適用。重複を含めば False"""
+    expires = now + review_stats.EVENT_TTL_SEC
+    items = [_event_put(r, expires) for r, _ in group]
+    items += [_add(k, d) for k, d in sorted(deltas([s for _, s in group], now).items())]
+    try:
+        client.transact_write_items(TransactItems=items)
+        return True
+    except client.exceptions.TransactionCanceledException as e:
+        reasons = e.response.get("CancellationReasons") or []
+        if any(r.get("Code") == "ConditionalCheckFailed" for r in reasons[:len(group)]):
+            return False
+        raise
+
+def apply_records(client, records, now):
+    """ストリームのバッチを適用する: {"records", "signals", "schools"}"""
+    parsed = [(r, s) for r, s in ((r, signal(r)) for r in records or []) if s]
+    found = lesson_schools(client, [s[1] for _, s in parsed if not s[0]])
+    signals = []
+    for r, (school, lesson, kind, sign, at) in parsed:
+        school = school or found.get(lesson)
+        if school:
+            signals.append((r, (school, kind, sign, at)))
+
+    # 1グループ = レコード数 + (教室, バケット) 数 <= MAX_TX_ITEMS
+    groups, group, keys = [], [], set()
+    for r, s in signals:
+        mine = {(s[0], b) for b in buckets(s[3])}
+        if group and len(group) + 1 + len(keys | mine) > MAX_TX_ITEMS:
+            groups.append(group)
+            group, keys = [], set()
+        group.append((r, s))
+        keys |= mine
+    if group:
+        groups.append(group)
+
+    for g in groups:
+        if not _transact(client, g, now):
+            # 再処理で一部が適用済み: 1件ずつ（適用済みはスキップされる）
+            for item in g:
+                _transact(client, [item], now)
+    return {"records": len(records or []), "signals": len(signals), "schools": len({s[0] for _, s in signals})}
+
+# --------- 再計算 ---------
+def scope(area=None, category=None):
+    if area and category:
+        return f"areaCategory#{area}#{category}"
+    if area:
+        return f"area#{area}"
+    if category:
+        return f"category#{category}"
+    return "all"
+
+def scopes(profile):
+    """教室が載る範囲（全体・area・category・area#category のうち値のあるもの）"""
+    area, category = profile.get("area"), profile.get("category")
+    out = ["all"]
+    if area:
+        out.append(scope(area))
+    if category:
+        out.append(scope(category=category))
+    if area and category:
+        out.append(scope(area, category))
+    return out
+
+def parallel_scan(client, params, segments, fn):
+    """Segment 並列の Scan。セグメントごとに fn(items) を呼ぶ"""
+    def _segment(seg):
+        p = dict(params, Segment=seg, TotalSegments=segments)
+        while True:
+            r = client.scan(**p)
+            fn(r.get("Items", []))
+            if not r.get("LastEvaluatedKey"):
+                return
+            p["ExclusiveStartKey"] = r["LastEvaluatedKey"]
+
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        list(pool.map(_segment, range(segments)))
+
+def scan_counters(client, now, segments=None):
+    """窓内のカウンタを読んでスコアにする: {schoolId: {"score", "bookings", "reviews", "likes"}}"""
+    hour_from, day_from, day_to = window(now)
+    cond, values = "#b >= :h", {":h": hour_from}
+    if day_from <= day_to:
+        cond += " OR #b BETWEEN :d0 AND :d1"
+        values.update({":d0": day_from, ":d1": day_to})
+    scores, lock = {}, threading.Lock()
+
+    def _fold(items):
+        part = {}
+        for it in items:
+            w = decay(it["bucket"], now)
+            s = part.get(it["schoolId"])
+            if s is None:
+                s = part[it["schoolId"]] = {"score": 0.0, "bookings": 0, "reviews": 0, "likes": 0}
+            for k in KINDS:
+                n = int(it.get(k) or 0)
+                if n:
+                    s[k] += n
+                    s["score"] += w * WEIGHTS[k] * n
+        with lock:
+            for school, s in part.items():
+                t = scores.get(school)
+                if t is None:
+                    scores[school] = s
+                else:
+                    for k, v in s.items():
+                        t[k] += v
+
+    parallel_scan(client, {"TableName": COUNTERS_TABLE, "FilterExpression": cond,
+                   "ProjectionExpression": "schoolId, #b, bookings, reviews, likes",
+                   "ExpressionAttributeNames": {"#b": "bucket"}, "ExpressionAttributeValues": values},
+          segments or SEGMENTS, _fold)
+    return scores
+
+def scan_schools(client, segments=None):
+    """SchoolsStats の表示用の値: {schoolId: {"name", "area", "category", "ratingAvg", "ratingCount"}}"""
+    out = {}
+
+    def _keep(items):
+        for it in items:
+            stats = review_stats.view(it)
+            out[it["id"]] = {"name": it.get("name"), "area": it.get("area"), "category": it.get("category"),
+                             "ratingAvg": stats["ratingAvg"], "ratingCount": stats["ratingCount"]}
+
+    parallel_scan(client, {"TableName": SCHOOLS_STATS_TABLE,
+                   "ProjectionExpression": "id, #n, area, category, ratingSum, ratingCount",
+                   "ExpressionAttributeNames": {"#n": "name"}}, segments or SEGMENTS, _keep)
+    return out
+
+def top_k(scores, profiles, k=None):
+    """範囲ごとに大きさ k のヒープで上位を残す: {scope: [(score, schoolId), ...]}（スコアの高い順）"""
+    k, heaps = k or TOP_K, defaultdict(list)
+    for school, s in scores.items():
+        if s["score"] <= 0:
+            continue
+        entry = (s["score"], school)
+        for sc in scopes(profiles.get(school) or {}):
+            h = heaps[sc]
+            if len(h) < k:
+                heapq.heappush(h, entry)
+            elif entry > h[0]:
+                heapq.heapreplace(h, entry)
+    return {sc: sorted(h, reverse=True) for sc, h in heaps.items()}
+
+def _entry(school, s, profile):
+    return {"schoolId": school, "name": profile.get("name"), "area": profile.get("area"),
+            "category": profile.get("category"), "ratingAvg": profile.get("ratingAvg"),
+            "ratingCount": profile.get("ratingCount", 0), "score": Decimal(str(round(s["score"], 4))),
+            **{k: s[k] for k in KINDS}}
+
+def _batch_write(client, table, ops, workers=8):
+    def _write(chunk):
+        request = {table: chunk}
+        for attempt in range(MAX_RETRIES + 1):
+            r = client.batch_write_item(RequestItems=request)
+            request = r.get("UnprocessedItems") or {}
+            if not request:
+                return len(chunk)
+            _backoff(attempt)
+        raise RuntimeError("BatchWriteItem: unprocessed items remain after retries")
+
+    chunks = [ops[i:i + WRITE_CHUNK] for i in range(0, len(ops), WRITE_CHUNK)]
+    if not chunks:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+        return sum(pool.map(_write, chunks))
+
+def write_rankings(client, tops, scores, profiles, now, segments=None):
+    """範囲ごとに1アイテムを書き、今回上位の無かった範囲のアイテムは消す: (書いた数, 消した数)"""
+    computed = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now))
+    puts = [{"PutRequest": {"Item": {
+        "scope": sc, "computedAt": computed, "windowDays": WINDOW_DAYS, "halfLifeHours": Decimal(str(HALF_LIFE_HOURS)),
+        "items": [_entry(school, scores[school], profiles.get(school) or {}) for _, school in top]}}}
+        for sc, top in sorted(tops.items())]
+    existing = set()
+    parallel_scan(client, {"TableName": RANKINGS_TABLE, "ProjectionExpression": "#s", "ExpressionAttributeNames": {"#s": "scope"}},
+          segments or SEGMENTS, lambda items: existing.update(it["scope"] for it in items))
+    stale = [{"DeleteRequest": {"Key": {"scope": sc}}} for sc in sorted(existing - set(tops))]
+    return _batch_write(client, RANKINGS_TABLE, puts), _batch_write(client, RANKINGS_TABLE, stale)
+
+def recompute(client, now=None, k=None, segments=None, function="ranking_recompute"):
+    """カウンタからスコアを計算し、範囲ごとの上位 k 件を Rankings に書き直す"""
+    now = int(now or time.time())
+    t0 = time.perf_counter()
+    scores = scan_counters(client, now, segments)
+    profiles = scan_schools(client, segments)
+    t1 = time.perf_counter()
+    tops = top_k(scores, profiles, k)
+    t2 = time.perf_counter()
+    written, deleted = write_rankings(client, tops, scores, profiles, now, segments)
+    t3 = time.perf_counter()
+    total = {"schools": len(scores), "profiles": len(profiles), "scopes": written, "deleted": deleted,
+             "computedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)), "seconds": round(t3 - t0, 2),
+             "scanSeconds": round(t1 - t0, 2), "heapSeconds": round(t2 - t1, 3), "writeSeconds": round(t3 - t2, 2)}
+    metrics.emit(function, {
+        "RankingSchools": len(scores), "RankingScopes": written, "RankingDeletedScopes": deleted,
+        "RankingScanMs": round((t1 - t0) * 1000, 1), "RankingRecomputeMs": round((t3 - t0) * 1000, 1)},
+        {"RankingScanMs": "Milliseconds", "RankingRecomputeMs": "Milliseconds"})
+    return total
+
+# --------- 読み出し ---------
+def read(client, area=None, category=None, limit=None):
+    """範囲の上位（事前計算済みの1アイテムを GetItem）"""
+    sc = scope(area, category)
+    item = client.get_item(TableName=RANKINGS_TABLE, Key={"scope": sc}).get("Item") or {}
+    return {"scope": sc, "computedAt": item.get("computedAt"), "windowDays": item.get("windowDays", WINDOW_DAYS),
+            "items": (item.get("items") or [])[:limit or TOP_K]}
+
+# --------- バックフィル（履歴から再構築） ---------
+def replace_counters(client, counters, now, segments=None):
+    """カウンタを counters（deltas() の戻り値の形）で置き換える: (書いた数, 消した数)"""
+    existing = set()
+    parallel_scan(client, {"TableName": COUNTERS_TABLE, "ProjectionExpression": "schoolId, #b",
+                   "ExpressionAttributeNames": {"#b": "bucket"}},
+          segments or SEGMENTS, lambda items: existing.update((it["schoolId"], it["bucket"]) for it in items))
+    puts = [{"PutRequest": {"Item": {"schoolId": school, "bucket": b, "expiresAt": expires_at(b), **d}}}
+            for (school, b), d in sorted(counters.items()) if expires_at(b) > now]
+    stale = [{"DeleteRequest": {"Key": {"schoolId": school, "bucket": b}}}
+             for school, b in sorted(existing - set(counters))]
+    return _batch_write(client, COUNTERS_TABLE, puts), _batch_write(client, COUNTERS_TABLE, stale)
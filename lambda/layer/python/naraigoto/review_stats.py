@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""口コミ評価の集計（SchoolsStats / InstructorsStats / LessonsStats）
+
+Reviews（移行中は旧 ParentReviews / ChildReviews も）の DynamoDB Streams（NEW_AND_OLD_IMAGES）から、
+targetKey（school#id / instructor#id）単位と lessonsId 単位で
+ratingSum / ratingCount / 評価ヒストグラム(r1..r5) / recentReviewAt を ADD で更新する。
+
+冪等性: ストリームレコードの eventID を ReviewStatsEvents に条件付き Put し、
+集計の ADD と同じトランザクションで書く。再処理時は Put の条件で全体がキャンセルされる。
+移行ツールが Reviews へコピーしたアイテム（migratedFrom 付き）は旧テーブル側で集計済みのため数えない。
+"""
+import os, time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, ROUND_HALF_UP
+
+from boto3.dynamodb.types import TypeDeserializer
+
+SCHOOLS_STATS_TABLE = os.getenv("SCHOOLS_STATS_TABLE", "SchoolsStats")
+INSTRUCTORS_STATS_TABLE = os.getenv("INSTRUCTORS_STATS_TABLE", "InstructorsStats")
+LESSONS_STATS_TABLE = os.getenv("LESSONS_STATS_TABLE", "LessonsStats")
+EVENTS_TABLE = os.getenv("REVIEW_STATS_EVENTS_TABLE", "ReviewStatsEvents")
+EVENT_TTL_SEC = int(os.getenv("REVIEW_STATS_EVENT_TTL_SEC", str(3 * 24 * 3600)))  # Streams 保持(24h)より長く
+
+TARGET_TABLES = {"school": SCHOOLS_STATS_TABLE, "instructor": INSTRUCTORS_STATS_TABLE}
+BUCKETS = (1, 2, 3, 4, 5)
+
+_deser = TypeDeserializer()
+
+def _from_ddb(image):
+    return {k: _deser.deserialize(v) for k, v in (image or {}).items()}
+
+def _bucket(rating):
+    b = int(Decimal(rating).to_integral_value(rounding=ROUND_HALF_UP))
+    return min(max(b, BUCKETS[0]), BUCKETS[-1])
+
+def contributions(review):
+    """1件の口コミが寄与する集計先: [((table, id), rating), ...]"""
+    if not review or review.get("rating") is None:
+        return []
+    rating = Decimal(str(review["rating"]))
+    out = []
+    lessons_id = review.get("lessonsId")
+    if lessons_id:
+        out.append(((LESSONS_STATS_TABLE, lessons_id), rating))
+    target_key = review.get("targetKey")
+    if not target_key and review.get("targetType") and review.get("targetId"):
+        target_key = f"{review['targetType']}#{review['targetId']}"
+    if target_key and "#" in target_key:
+        ttype, tid = target_key.split("#", 1)
+        if ttype in TARGET_TABLES and tid:
+            out.append(((TARGET_TABLES[ttype], tid), rating))
+    return out
+
+def deltas(old, new):
+    """旧/新イメージの差分: {(table, id): {"ratingSum": d, "ratingCount": d, "r3": d, ...}}"""
+    acc = defaultdict(lambda: defaultdict(Decimal))
+    for sign, image in ((-1, old), (1, new)):
+        for key, rating in contributions(image):
+            acc[key]["ratingSum"] += sign * rating
+            acc[key]["ratingCount"] += sign
+            acc[key][f"r{_bucket(rating)}"] += sign
+    # 変化なし（例: コメントのみ編集）は書かない
+    return {k: {a: v for a, v in d.items() if v} for k, d in acc.items() if any(d.values())}
+
+def migrated(review):
+    """旧テーブルからのコピー（reviews_migration が migratedFrom を付ける）"""
+    return bool((review or {}).get("migratedFrom"))
+
+def _update_expression(delta):
+    names, values, parts = {}, {}, []
+    for i, (attr, v) in enumerate(sorted(delta.items())):
+        names[f"#a{i}"] = attr
+        values[f":v{i}"] = v
+        parts.append(f"#a{i} :v{i}")
+    return "ADD " + ", ".join(parts), names, values
+
+def apply_record(client, record):
+    """ストリームレコード1件を適用する。重複（再処理）なら False
+
+    client は runtime.client()（resource 付属の client。値は Python 型のまま渡す）
+    """
+    ddb = record.get("dynamodb") or {}
+    old, new = _from_ddb(ddb.get("OldImage")), _from_ddb(ddb.get("NewImage"))
+    if migrated(old) or migrated(new):
+        return True
+    changes = deltas(old, new)
+    if not changes:
+        return True
+
+    items = [{"Put": {
+        "TableName": EVENTS_TABLE,
+        "Item": {"eventId": record["eventID"], "expiresAt": int(time.time()) + EVENT_TTL_SEC},
+        "ConditionExpression": "attribute_not_exists(eventId)",
+    }}]
+    for (table, key_id), delta in sorted(changes.items()):
+        expr, names, values = _update_expression(delta)
+        items.append({"Update": {
+            "TableName": table, "Key": {"id": key_id},
+            "UpdateExpression": expr,
+            "ExpressionAttributeNames": names, "ExpressionAttributeValues": values,
+        }})
+    applied = True
+    try:
+        client.transact_write_items(TransactItems=items)
+    except client.exceptions.TransactionCanceledException as e:
+        reasons = e.response.get("CancellationReasons") or []
+        if not (reasons and reasons[0].get("Code") == "ConditionalCheckFailed"):
+            raise
+        applied = False
+
+    # 前回の処理が集計後に落ちていても recentReviewAt は必ず反映する（冪等）
+    created = (new or {}).get("createdAt")
+    if created:
+        _touch_recent(client, [k for k, d in changes.items() if d.get("ratingCount", 0) > 0], created)
+    return applied
+
+def lesson_ids(record):
+    """レコードで LessonsStats の変わる lessonsId（レッスン詳細キャッシュの破棄用）"""
+    ddb = record.get("dynamodb") or {}
+    old, new = _from_ddb(ddb.get("OldImage")), _from_ddb(ddb.get("NewImage"))
+    if migrated(old) or migrated(new):
+        return []
+    return [key_id for table, key_id in deltas(old, new) if table == LESSONS_STATS_TABLE]
+
+def _touch_recent(client, keys, created_at):
+    # 最大値の保持は条件付き SET で（順不同に届いても巻き戻らない・再実行しても同じ結果）
+    for table, key_id in keys:
+        try:
+            client.update_item(
+                TableName=table, Key={"id": key_id},
+                UpdateExpression="SET recentReviewAt = :t",
+                ConditionExpression="attribute_not_exists(recentReviewAt) OR recentReviewAt < :t",
+                ExpressionAttributeValues={":t": str(created_at)},
+            )
+        except client.exceptions.ConditionalCheckFailedException:
+            pass
+
+# --------- バックフィル（全件から再構築） ---------
+def aggregate(reviews):
+    """口コミの全件イテレータから集計値を計算する: {(table, id): stats}"""
+    acc = {}
+    for r in reviews:
+        for key, rating in contributions(r):
+            s = acc.get(key)
+            if s is None:
+                s = acc[key] = {"ratingSum": Decimal(0), "ratingCount": 0, "recentReviewAt": None,
+                                **{f"r{b}": 0 for b in BUCKETS}}
+            s["ratingSum"] += rating
+            s["ratingCount"] += 1
+            s[f"r{_bucket(rating)}"] += 1
+            created = r.get("createdAt")
+            if created and (s["recentReviewAt"] is None or str(created) > s["recentReviewAt"]):
+                s["recentReviewAt"] = str(created)
+    return acc
+
+def merge_aggregates(parts):
+    """aggregate() の結果（セグメント単位など）を1つにまとめる"""
+    out = {}
+    for acc in parts:
+        for key, s in acc.items():
+            t = out.get(key)
+            if t is None:
+                out[key] = dict(s)
+                continue
+            for k, v in s.items():
+                if k == "recentReviewAt":
+                    if v and (t[k] is None or v > t[k]):
+                        t[k] = v
+                else:
+                    t[k] += v
+    return out
+
+def write_aggregates(client, acc, workers=8):
+    """集計値を絶対値で上書きする（ADD ではなく SET。likesCount など他の属性は残す）"""
+    def _write(entry):
+        (table, key_id), s = entry
+        attrs = {k: v for k, v in s.items() if v is not None}
+        names = {f"#a{i}": k for i, k in enumerate(attrs)}
+        values = {f":v{i}": v for i, v in enumerate(attrs.values())}
+        client.update_item(
+            TableName=table, Key={"id": key_id},
+            UpdateExpression="SET " + ", ".join(f"#a{i} = :v{i}" for i in range(len(attrs))),
+            ExpressionAttributeNames=names, ExpressionAttributeValues=values,
+        )
+        return table
+
+    counts = defaultdict(int)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for table in pool.map(_write, acc.items()):
+            counts[table] += 1
+    return dict(counts)
+
+# --------- 読み出し ---------
+def view(item):
+    """集計アイテム → API 表示用（ratingAvg は読み出し時に計算）"""
+    item = item or {}
+    count = int(item.get("ratingCount") or 0)
+    total = Decimal(str(item.get("ratingSum") or 0))
+    avg = (total / count).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) if count > 0 else None
+    return {
+        "ratingAvg": avg,
+        "ratingCount": count,
+        "histogram": {str(b): int(item.get(f"r{b}") or 0) for b in BUCKETS},
+        "recentReviewAt": item.get("recentReviewAt"),
+    }
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""口コミの取得（単一 Reviews テーブル / 旧 親・子テーブル）と時系列マージ
+
+Reviews（PK lessonsId / SK sk = "<role>#<createdAt>"）:
+  role 指定 … 本体を begins_with(sk, "<role>#") で Query
+  role=all  … LSI byCreatedAt（lessonsId, createdAt）
+  対象別    … GSI byTarget（targetKey, createdAt）。role 指定は FilterExpression
+旧 ParentReviews / ChildReviews（PK lessonsId / SK createdAt）は移行期間中の読み取り元。
+
+REVIEWS_LAYOUT で読み取り元を切り替える:
+  single … Reviews のみ（1ページ1 Query）
+  dual   … Reviews + 旧テーブルを並列 Query してマージ（移行中。同じ口コミは1件にまとめる）
+  split  … 旧テーブルのみ（切り戻し用。post_reviews も旧テーブルへ書く）
+
+各ソースを (createdAt, role, lessonsId, reviewId) の降順で k-way マージし、カーソルにはページ末尾の
+この4つ（透かし）を入れる。移行で Reviews へコピーされた同じ口コミは reviewId で1件にまとめる。次ページは各ソースを createdAt <= 透かし で Query し直して透かし以上を
+読み飛ばすため、レイアウトを切り替えても発行済みのカーソルをそのまま使える。
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Key, Attr
+
+from naraigoto import runtime as rt, cursor
+
+REVIEWS_TABLE = os.getenv("REVIEWS_TABLE", "Reviews")
+PARENT_TABLE = os.getenv("PARENT_REVIEWS_TABLE", "ParentReviews")
+CHILD_TABLE = os.getenv("CHILD_REVIEWS_TABLE", "ChildReviews")
+LAYOUT = os.getenv("REVIEWS_LAYOUT", "dual").lower()
+LAYOUTS = ("single", "dual", "split")
+CREATED_INDEX = "byCreatedAt"
+ROLES = ("parent", "child")
+MAX_LIMIT = 100
+# レスポンスに含めない内部属性
+_INTERNAL_ATTRS = ("sk", "migratedFrom")
+
+# ウォーム起動間で使い回す（boto3 の client はスレッドセーフ、resource は非スレッドセーフ）
+_pool = None
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=len(ROLES) + 1, thread_name_prefix="reviews")
+    return _pool
+
+def sort_key(role, created_at):
+    return f"{role}#{created_at}"
+
+def to_item(review, role=None):
+    """旧テーブルのアイテム → Reviews のアイテム（role と sk を付与）"""
+    item = dict(review)
+    item["role"] = role or item.get("role")
+    item["sk"] = sort_key(item["role"], item["createdAt"])
+    return item
+
+def legacy_table(role):
+    return PARENT_TABLE if role == "parent" else CHILD_TABLE
+
+def write_table(layout=None):
+    """post_reviews の書き込み先。split のときだけ旧テーブル（None を返す → legacy_table(role)）"""
+    return None if (layout or LAYOUT) == "split" else REVIEWS_TABLE
+
+def _roles(role):
+    role = (role or "all").lower()
+    if role == "all":
+        return ROLES
+    if role in ROLES:
+        return (role,)
+    raise ValueError("role must be 'parent', 'child' or 'all'")
+
+def sources(role="all", layout=None):
+    """読み取り元: [(name, table, role)]。Reviews の role=all は role=None"""
+    layout = layout or LAYOUT
+    if layout not in LAYOUTS:
+        raise RuntimeError(f"REVIEWS_LAYOUT must be one of {', '.join(LAYOUTS)}")
+    roles = _roles(role)
+    out = []
+    if layout in ("single", "dual"):
+        out.append(("reviews", REVIEWS_TABLE, roles[0] if len(roles) == 1 else None))
+    if layout in ("dual", "split"):
+        out += [(r, legacy_table(r), r) for r in roles]
+    return out
+
+def _order(item):
+    return (item.get("createdAt") or "", item.get("role") or "", item.get("lessonsId") or "",
+            item.get("reviewId") or "")
+
+def _params(source, key_name, key_value, index, wm):
+    name, table, role = source
+    params = {"TableName": table, "ScanIndexForward": False}
+    key = Key(key_name).eq(key_value)
+    if name == "reviews" and role and not index:
+        # 本体の sk は role ごとに createdAt 順
+        start = sort_key(role, "")
+        key &= Key("sk").between(start, sort_key(role, wm[0])) if wm else Key("sk").begins_with(start)
+    else:
+        if wm:
+            key &= Key("createdAt").lte(wm[0])
+        if index:
+            params["IndexName"] = index
+            if name == "reviews" and role:
+                params["FilterExpression"] = Attr("role").eq(role)
+        elif name == "reviews":
+            params["IndexName"] = CREATED_INDEX
+    params["KeyConditionExpression"] = key
+    return params
+
+def _fetch(client, source, params, wm, need):
+    """透かしより後ろのアイテムを need 件以上（または末尾まで）読む: (items, more)
+
+    続きがある場合、末尾と同じ createdAt のアイテムは次の Query にも残り得るため返さない
+    （同時刻のアイテムの並びを (createdAt, role, lessonsId, reviewId) で確定させるため）。
+    """
+    name, _, role = source
+    items, start = [], None
+    while True:
+        # 透かしの行と、末尾の同時刻判定用に +2
+        params["Limit"] = need + 2
+        if start:
+            params["ExclusiveStartKey"] = start
+        r = client.query(**params)
+        for it in r.get("Items", []):
+            if name != "reviews":
+                it["role"] = role
+            if wm is None or _order(it) < wm:
+                items.append(it)
+        start = r.get("LastEvaluatedKey")
+        if not start:
+            return sorted(items, key=_order, reverse=True), False
+        if items:
+            last = items[-1]["createdAt"]
+            settled = [it for it in items if it["createdAt"] != last]
+            if len(settled) >= need:
+                return sorted(settled, key=_order, reverse=True), True
+
+def query_merged(key_name, key_value, role="all", limit=20, cursor_token=None,
+                 index=None, parallel=True, layout=None):
+    """レビューを新しい順に1ページ返す: (items, next_cursor)
+
+    key_name/key_value: Query のパーティションキー（lessonsId または byTarget の targetKey）
+    各 item には role を付与する。カーソルは key と role に束縛される（レイアウトには依存しない）。
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    srcs = sources(role, layout)
+    scope = f"{index or ''}|{key_value}|{role or 'all'}"
+    state = cursor.decode(cursor_token, scope) or {}
+    if state and not (isinstance(state.get("wm"), list) and len(state["wm"]) == 4
+                      and all(isinstance(v, str) for v in state["wm"])):
+        raise cursor.CursorError("invalid cursor")
+    wm = tuple(state["wm"]) if state else None
+    done = set(state.get("done") or ())
+
+    active = [s for s in srcs if s[0] not in done]
+    client = rt.client()
+    calls = [(client, s, _params(s, key_name, key_value, index, wm), wm, limit) for s in active]
+    if parallel and len(calls) > 1:
+        results = list(_executor().map(lambda a: _fetch(*a), calls))
+    else:
+        results = [_fetch(*a) for a in calls]
+
+    # 各ソースは降順。続きが未読のソースを使い切ったら、その先との大小が分からないので止める
+    bufs = {s[0]: r for s, r in zip(active, results)}
+    pos = {n: 0 for n in bufs}
+    merged, last, seen = [], None, set()
+    while len(merged) < limit:
+        best, blocked = None, False
+        for n, (items, more) in bufs.items():
+            if pos[n] < len(items):
+                if best is None or _order(items[pos[n]]) > _order(bufs[best][0][pos[best]]):
+                    best = n
+            elif more:
+                blocked = True
+        if best is None or blocked:
+            break
+        item = bufs[best][0][pos[best]]
+        pos[best] += 1
+        last = _order(item)
+        if item.get("reviewId") in seen:
+            continue  # dual: 移行済みの同じ口コミ（Reviews 側を採用済み）
+        if item.get("reviewId"):
+            seen.add(item["reviewId"])
+        for a in _INTERNAL_ATTRS:
+            item.pop(a, None)
+        merged.append(item)
+
+    done |= {n for n, (items, more) in bufs.items() if not more and pos[n] == len(items)}
+    if not merged or len(done) == len(srcs):
+        return merged, None
+    return merged, cursor.encode({"wm": list(last), "done": sorted(done)}, scope)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""ハンドラ共通処理: DynamoDB クライアント / CORS / レスポンス生成 / ボディ解析 / 計測"""
+import os, json, base64, inspect, functools
+
+import boto3
+from botocore.config import Config
+
+from naraigoto import metrics
+from naraigoto.jsonenc import dumps
+
+# --------- DynamoDB（コンテナ単位で1回だけ生成し、ウォーム起動で再利用） ---------
+BOTO_CONFIG = Config(
+    connect_timeout=float(os.getenv("DDB_CONNECT_TIMEOUT", "2")),
+    read_timeout=float(os.getenv("DDB_READ_TIMEOUT", "5")),
+    max_pool_connections=int(os.getenv("DDB_MAX_POOL_CONNECTIONS", "16")),
+    tcp_keepalive=True,
+    retries={"max_attempts": int(os.getenv("DDB_MAX_ATTEMPTS", "3")), "mode": "standard"},
+)
+
+_resource = None
+_tables = {}
+
+def dynamodb():
+    """boto3 DynamoDB resource（キャッシュ済み）"""
+    global _resource
+    if _resource is None:
+        # ローカル検証時は AWS_ENDPOINT_URL_DYNAMODB で DynamoDB Local / moto に向ける
+        _resource = boto3.resource("dynamodb", config=BOTO_CONFIG)
+        metrics.instrument(_resource.meta.client)
+    return _resource
+
+def client():
+    """resource 付属の DynamoDB client（接続プールを共有。値は Python 型のまま渡せる）"""
+    return dynamodb().meta.client
+
+def table(name):
+    """Table オブジェクト（テーブル名ごとにキャッシュ）"""
+    t = _tables.get(name)
+    if t is None:
+        t = _tables[name] = dynamodb().Table(name)
+    return t
+
+def reset():
+    """キャッシュ済みクライアントを破棄する（ベンチでのコールドスタート再現用）"""
+    global _resource
+    _resource = None
+    _tables.clear()
+
+# --------- CORS / レスポンス ---------
+ALLOW_HEADERS = "content-type,authorization,x-api-key,idempotency-key"
+
+def cors_headers(methods):
+    return {
+        "Content-Type": "application/json; charset=utf-8",
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Headers": ALLOW_HEADERS,
+        "Access-Control-Allow-Methods": methods
+    }
+
+def respond(code, body, headers):
+    with metrics.phase("serialize"):
+        return {"statusCode": code, "headers": headers, "body": dumps(body)}
+
+def responder(headers):
+    """ハンドラ用の _resp(code, body) を作る"""
+    def _resp(code, body):
+        with metrics.phase("serialize"):
+            return {"statusCode": code, "headers": headers, "body": dumps(body)}
+    return _resp
+
+# --------- リクエスト解析 ---------
+def http_method(event):
+    """API Gateway v2(requestContext.http.method) / v1(httpMethod) 両対応"""
+    http = (event.get("requestContext") or {}).get("http")
+    method = (http.get("method") if isinstance(http, dict) else None) or event.get("httpMethod")
+    return method.upper() if method else ""
+
+def header(event, name):
+    """リクエストヘッダ（大文字小文字を区別しない。v1 の multiValueHeaders も見る）"""
+    name = name.lower()
+    for k, v in (event.get("headers") or {}).items():
+        if k.lower() == name and v:
+            return v
+    for k, v in (event.get("multiValueHeaders") or {}).items():
+        if k.lower() == name and v:
+            return v[0]
+    return None
+
+def json_body(event):
+    """JSON ボディ（base64 対応）。ボディなしは {}、解析不能は None"""
+    with metrics.phase("parse"):
+        return _json_body(event)
+
+def _json_body(event):
+    body = event.get("body")
+    if body is None or body == "":
+        return {}
+    if isinstance(body, (dict, list)):
+        return body
+    if event.get("isBase64Encoded"):
+        try:
+            body = base64.b64decode(body).decode("utf-8")
+        except Exception:
+            return None
+    try:
+        return json.loads(body)
+    except Exception:
+        return None
+
+def http_handler(headers):
+    """CORS プリフライトをボディ解析・DB アクセス前に返し、リクエストを naraigoto.metrics で計測するデコレータ"""
+    preflight = {"statusCode": 204, "headers": headers, "body": ""}
+
+    def wrap(fn):
+        # 関数名は Lambda の環境変数、ローカルではハンドラのディレクトリ名
+        name = os.getenv("AWS_LAMBDA_FUNCTION_NAME") or \
+            os.path.basename(os.path.dirname(inspect.unwrap(fn).__code__.co_filename))
+
+        @functools.wraps(fn)
+        def handler(event, context):
+            with metrics.request(name, context) as req:
+                if http_method(event) == "OPTIONS":
+                    resp = dict(preflight)
+                else:
+                    resp = fn(event, context)
+                req.status = resp.get("statusCode") if isinstance(resp, dict) else None
+                return resp
+        return handler
+    return wrap
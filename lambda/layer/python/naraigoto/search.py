@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""キーワード検索（教室・クラス）と入力補完: PostgreSQL の search_documents
+
+日本語は空白で語に分かれないため、正規化（NFKC・小文字・ひらがな→カタカナ）した文字列の
+2-gram を text[] に持ち、GIN 索引で「クエリの 2-gram をすべて含む」ドキュメントを引いてから
+部分一致で確かめる（database/postgres/01_schema.sql の naraigoto_norm / naraigoto_bigrams）。
+ドキュメントは schools / classes / instructors の変更を文単位のトリガで差分反映する。
+
+- 並び順: 語ごとの一致箇所（タイトル完全一致 8 / 前方一致 4 / 部分一致 2 / 本文 1）の合計 + boost
+- 空白区切りの複数語は AND。2文字以上の語が1つもないクエリはエラー（索引が効かないため）
+- 入力補完: タイトルの前方一致（text_pattern_ops の B-tree）を優先し、2文字以上なら部分一致も足す
+カーソルはページ末尾の (スコア, タイトル長, 種別, id) で、クエリと絞り込み条件に束縛される。
+"""
+import re, unicodedata
+
+from naraigoto import pg, cursor
+
+TYPES = ("school", "class")
+MAX_LIMIT = 50
+MAX_QUERY = 100
+MIN_TERM = 2
+
+_SPLIT = re.compile(r"[\s\W]+")
+
+_SCORE = """
+d.boost + (SELECT sum(CASE WHEN d.title_norm = t THEN 8
+                           WHEN starts_with(d.title_norm, t) THEN 4
+                           WHEN strpos(d.title_norm, t) > 0 THEN 2
+                           ELSE 1 END)
+             FROM unnest(naraigoto_terms(%(q)s)) AS t)"""
+
+SEARCH = f"""
+SELECT doc_type, doc_id, school_id, title, area, category, score, title_len
+  FROM (
+    SELECT d.doc_type, d.doc_id, d.school_id, d.title, d.area, d.category,
+           length(d.title) AS title_len, {_SCORE} AS score
+      FROM search_documents d
+     WHERE d.bigrams @> naraigoto_bigrams(%(q)s)
+       AND NOT EXISTS (SELECT 1 FROM unnest(naraigoto_terms(%(q)s)) AS t
+                        WHERE strpos(d.title_norm, t) = 0 AND strpos(d.body_norm, t) = 0)
+       AND (%(type)s::text IS NULL OR d.doc_type = %(type)s)
+       AND (%(area)s::text IS NULL OR d.area = %(area)s)
+       AND (%(category)s::text IS NULL OR d.category = %(category)s)
+  ) r
+ WHERE NOT %(after)s OR (-score, title_len, doc_type, doc_id) > (%(s)s, %(n)s, %(t)s, %(id)s::uuid)
+ ORDER BY score DESC, title_len, doc_type, doc_id
+ LIMIT %(limit)s"""
+
+# 1文字は前方一致のみ、2文字以上は部分一致も（前方一致を先に）
+SUGGEST_PREFIX = """
+SELECT doc_type, doc_id, title
+  FROM search_documents
+ WHERE title_norm ~>=~ naraigoto_norm(%(q)s) AND title_norm ~<~ naraigoto_norm(%(q)s) || chr(1114111)
+ ORDER BY boost DESC, length(title), title
+ LIMIT %(limit)s"""
+
+SUGGEST = """
+SELECT doc_type, doc_id, title
+  FROM search_documents
+ WHERE (title_norm ~>=~ naraigoto_norm(%(q)s) AND title_norm ~<~ naraigoto_norm(%(q)s) || chr(1114111))
+    OR (bigrams @> naraigoto_bigrams(%(q)s) AND strpos(title_norm, naraigoto_norm(%(q)s)) > 0)
+ ORDER BY starts_with(title_norm, naraigoto_norm(%(q)s)) DESC, boost DESC, length(title), title
+ LIMIT %(limit)s"""
+
+def terms(q):
+    """クエリの語（SQL の naraigoto_terms と同じ区切り。かなの変換は長さに影響しないので省く）"""
+    return [t for t in _SPLIT.split(unicodedata.normalize("NFKC", q or "").lower()) if t]
+
+def _check(q):
+    q = (q or "").strip()
+    if not q:
+        raise ValueError("q required")
+    if len(q) > MAX_QUERY:
+        raise ValueError(f"q must be <= {MAX_QUERY} characters")
+    return q
+
+def _item(r):
+    return {"type": r["doc_type"], "id": str(r["doc_id"]), "schoolId": str(r["school_id"]),
+            "title": r["title"], "area": r["area"], "category": r["category"], "score": round(r["score"], 3)}
+
+def search(q, doc_type=None, area=None, category=None, limit=20, cursor_token=None):
+    """スコア順に1ページ返す: (items, next_cursor)"""
+    q = _check(q)
+    if not any(len(t) >= MIN_TERM for t in terms(q)):
+        raise ValueError(f"q needs a term of at least {MIN_TERM} characters")
+    if doc_type and doc_type not in TYPES:
+        raise ValueError(f"type must be one of {', '.join(TYPES)}")
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    scope = f"search|{q}|{doc_type or ''}|{area or ''}|{category or ''}"
+    start = cursor.decode(cursor_token, scope)
+    if start and not all(k in start for k in ("s", "n", "t", "id")):
+        raise cursor.CursorError("invalid cursor")
+    params = {"q": q, "type": doc_type, "area": area, "category": category, "limit": limit + 1,
+              "after": bool(start), "s": float(start["s"]) if start else 0.0,
+              "n": int(start["n"]) if start else 0, "t": start["t"] if start else "",
+              "id": start["id"] if start else "00000000-0000-0000-0000-000000000000"}
+    rows = pg.fetch_all(SEARCH, params, prepare=True)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if not more:
+        return [_item(r) for r in rows], None
+    last = rows[-1]
+    return [_item(r) for r in rows], cursor.encode(
+        {"s": -last["score"], "n": last["title_len"], "t": last["doc_type"], "id": str(last["doc_id"])}, scope)
+
+def suggest(q, limit=10):
+    """入力補完の候補 [{"type", "id", "title"}]"""
+    q = _check(q)
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    sql = SUGGEST if len("".join(terms(q))) >= MIN_TERM else SUGGEST_PREFIX
+    rows = pg.fetch_all(sql, {"q": q, "limit": limit}, prepare=True)
+    return [{"type": r["doc_type"], "id": str(r["doc_id"]), "title": r["title"]} for r in rows]
+
+def rebuild():
+    """search_documents を全件作り直す（トリガ導入前のデータの取り込み用）。件数を返す"""
+    return pg.fetch_one("SELECT search_rebuild() AS n")["n"]
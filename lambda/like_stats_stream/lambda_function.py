@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# like_stats_stream: Likes の Streams（キーのみ参照） → SchoolsStats.likesCount / LessonsCatalog.likesCount
+# イベントソースマッピングで ReportBatchItemFailures を有効にすること
+import time
+from naraigoto import runtime as rt, like_stats, metrics
+
+def lambda_handler(event, _ctx):
+    client = rt.client()
+    records = event.get("Records") or []
+    try:
+        touched = like_stats.apply_records(client, records, int(time.time()))
+    except Exception as e:
+        # バッチ全体を再試行（適用済みイベントは eventID で重複排除される）
+        metrics.error("like_stats_stream failed", e, records=len(records))
+        return {"batchItemFailures": [{"itemIdentifier": records[0]["dynamodb"]["SequenceNumber"]}]} if records else {}
+    try:
+        like_stats.sync_catalog(client, touched)
+    except Exception as e:
+        # 一覧側のコピーは次の更新か reconcile.py で追いつく
+        metrics.error("like_stats_stream catalog sync failed", e, schools=len(touched))
+    return {"batchItemFailures": []}
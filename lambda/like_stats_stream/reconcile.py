@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""いいね数の再集計（ドリフト修正）
+
+    python lambda/like_stats_stream/reconcile.py --segments 8 [--dry-run]
+
+Likes の bySchool GSI を Segment 並列で数え直し、SchoolsStats.likesCount とずれている教室だけを
+絶対値で上書きして LessonsCatalog へ反映する。
+ストリーム処理と並行して実行すると、数え直し中に届いたいいねが欠落/二重になり得る。
+like_stats_stream のイベントソースマッピングを無効化し、処理中のバッチが終わってから実行して、完了後に再開すること。
+無効化中に書かれたいいねは再開後にも加算されるため、書き込みの少ない時間帯に行い、再開後に --dry-run でずれを確認する。
+"""
+import os, sys, json, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layer", "python"))
+from naraigoto import runtime as rt, like_stats
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--segments", type=int, default=8)
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+
+    client = rt.client()
+    expected = like_stats.recount(client, os.getenv("LIKES_TABLE", "Likes"), args.segments)
+    current = like_stats.current_counts(client, args.segments)
+    drift = {s: {"stats": current.get(s, (0, 0))[0], "likes": n}
+             for s, n in expected.items() if current.get(s, (0, 0))[0] != n}
+    drift.update({s: {"stats": c, "likes": 0} for s, (c, _) in current.items() if c and s not in expected})
+    print(f"schools={len(expected)} drift={len(drift)}")
+    for s, d in sorted(drift.items())[:50]:
+        print(f"  {s}: stats={d['stats']} likes={d['likes']}")
+    if args.dry_run or not drift:
+        return
+    fixed, skipped = like_stats.repair(client, expected, current)
+    synced = like_stats.sync_catalog(client, fixed)
+    print(json.dumps({"fixed": len(fixed), "skipped": skipped, "catalogUpdated": synced}))
+
+if __name__ == "__main__":
+    main()
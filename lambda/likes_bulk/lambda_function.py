@@ -0,0 +1,29 @@
+# likes_bulk: 一括いいね/解除（BatchWriteItem）
+# POST /likes/bulk { userId, like: [schoolId...], unlike: [schoolId...] }
+from naraigoto import runtime as rt, likes, metrics
+
+HEADERS = rt.cors_headers("POST,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+@rt.http_handler(HEADERS)
+def lambda_handler(event, _):
+    b = rt.json_body(event)
+    if not isinstance(b, dict):
+        return _resp(400, {"ok": False, "error": "invalid_json"})
+    if not b.get('userId'):
+        return _resp(400, {"ok": False, "error": "Missing field: userId"})
+    like_ids = likes.parse_ids(b.get('like') or [])
+    unlike_ids = likes.parse_ids(b.get('unlike') or [])
+    if not like_ids and not unlike_ids:
+        return _resp(400, {"ok": False, "error": "like or unlike required"})
+    if len(like_ids) + len(unlike_ids) > likes.MAX_BATCH:
+        return _resp(400, {"ok": False, "error": f"like + unlike must be <= {likes.MAX_BATCH}"})
+
+    try:
+        n_like, n_unlike = likes.write(rt.client(), b['userId'], like_ids, unlike_ids)
+        return _resp(200, {"ok": True, "liked": n_like, "unliked": n_unlike})
+    except ValueError as e:
+        return _resp(400, {"ok": False, "error": str(e)})
+    except Exception as e:
+        metrics.error("likes_bulk failed", e)
+        return _resp(500, {"ok": False, "error": "internal_error"})
@@ -0,0 +1,34 @@
+# likes_check: 一覧カードのいいね状態を一括取得（BatchGetItem）
+# GET /users/{userId}/likes/check?schoolIds=a,b,c  または POST { userId, schoolIds: [...] }
+from naraigoto import runtime as rt, likes, metrics
+
+HEADERS = rt.cors_headers("GET,POST,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+@rt.http_handler(HEADERS)
+def lambda_handler(event, _):
+    pp = event.get('pathParameters') or {}
+    q = event.get('queryStringParameters') or {}
+    b = rt.json_body(event)
+    if not isinstance(b, dict):
+        return _resp(400, {"ok": False, "error": "invalid_json"})
+    if not isinstance(pp, dict):
+        pp = {}
+    if not isinstance(q, dict):
+        q = {}
+
+    user_id = pp.get('userId') or q.get('userId') or b.get('userId')
+    if not user_id:
+        return _resp(400, {"ok": False, "error": "userId required"})
+    school_ids = likes.parse_ids(b.get('schoolIds') if 'schoolIds' in b else q.get('schoolIds'))
+    if not school_ids:
+        return _resp(400, {"ok": False, "error": "schoolIds required"})
+    if len(school_ids) > likes.MAX_BATCH:
+        return _resp(400, {"ok": False, "error": f"schoolIds must be <= {likes.MAX_BATCH}"})
+
+    try:
+        found = likes.liked(rt.client(), user_id, school_ids)
+        return _resp(200, {"ok": True, "userId": user_id, "liked": {s: s in found for s in school_ids}})
+    except Exception as e:
+        metrics.error("likes_check failed", e)
+        return _resp(500, {"ok": False, "error": "internal_error"})
@@ -1,44 +1,35 @@
-import os, json
-import boto3
-from boto3.dynamodb.conditions import Key
+import os
+from naraigoto import runtime as rt, likes
+from naraigoto.cursor import CursorError
 
-dynamodb = boto3.resource('dynamodb')
-LIKES = dynamodb.Table(os.getenv('LIKES_TABLE', 'Likes'))
+LIKES = rt.table(os.getenv('LIKES_TABLE', 'Likes'))
+DEFAULT_LIMIT = 50
 
-HEADERS = {
-    "Content-Type": "application/json; charset=utf-8",
-    "Access-Control-Allow-Origin": "*",
-    "Access-Control-Allow-Headers": "content-type,authorization,x-api-key",
-    "Access-Control-Allow-Methods": "GET,OPTIONS"
-}
-
-def _resp(code, body):
-    return {"statusCode": code, "headers": HEADERS, "body": json.dumps(body, ensure_ascii=False)}
+HEADERS = rt.cors_headers("GET,OPTIONS")
+_resp = rt.responder(HEADERS)
 
+@rt.http_handler(HEADERS)
 def lambda_handler(event, _):
-    method = (event.get('requestContext') or {}).get('http', {}).get('method') or event.get('httpMethod')
-    if method and method.upper() == 'OPTIONS':
-        return {"statusCode": 204, "headers": HEADERS, "body": ""}
-
     pp = event.get('pathParameters') or {}
+    q = event.get('queryStringParameters') or {}
+    if not isinstance(q, dict):
+        q = {}
     user_id = None
     if isinstance(pp, dict):
         user_id = pp.get('userId') or pp.get('id')
     if not user_id:
-        q = event.get('queryStringParameters') or {}
-        if isinstance(q, dict):
-            user_id = q.get('userId')
+        user_id = q.get('userId')
     if not user_id:
         return _resp(400, {"ok": False, "error": "userId required"})
-
     try:
-        r = LIKES.query(IndexName=os.getenv('LIKES_USER_INDEX', ''), KeyConditionExpression=Key('userId').eq(user_id))
-        items = r.get('Items', [])
-    except Exception:
-        # No GSI, use direct query on PK (works as PK is userId)
-        r = LIKES.query(KeyConditionExpression=Key('userId').eq(user_id))
-        items = r.get('Items', [])
-
-    return _resp(200, {"ok": True, "likes": items})
+        limit = int(q.get('limit') or DEFAULT_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
 
+    # PK(userId) の Query。LastEvaluatedKey は nextCursor で返す
+    try:
+        items, next_cursor = likes.list_page(LIKES, user_id, limit, q.get('cursor'))
+    except CursorError as e:
+        return _resp(400, {"ok": False, "error": str(e)})
 
+    return _resp(200, {"ok": True, "likes": items, "nextCursor": next_cursor})
@@ -1,35 +1,29 @@
-import os, json
-import boto3
+import os, time
+from naraigoto import runtime as rt, idempotency, metrics
 
-dynamodb = boto3.resource('dynamodb')
-LIKES = dynamodb.Table(os.getenv('LIKES_TABLE', 'Likes'))
+LIKES = rt.table(os.getenv('LIKES_TABLE', 'Likes'))
 
-HEADERS = {
-    "Content-Type": "application/json; charset=utf-8",
-    "Access-Control-Allow-Origin": "*",
-    "Access-Control-Allow-Headers": "content-type,authorization,x-api-key",
-    "Access-Control-Allow-Methods": "POST,OPTIONS"
-}
+HEADERS = rt.cors_headers("POST,OPTIONS")
+_resp = rt.responder(HEADERS)
 
+@rt.http_handler(HEADERS)
+@idempotency.idempotent("likes_post", HEADERS)
 def lambda_handler(event, _):
-    method = (event.get('requestContext') or {}).get('http', {}).get('method') or event.get('httpMethod')
-    if method and method.upper() == 'OPTIONS':
-        return {"statusCode": 204, "headers": HEADERS, "body": ""}
-
-    b = json.loads(event.get('body') or '{}')
+    b = rt.json_body(event)
+    if not isinstance(b, dict):
+        return _resp(400, {"ok": False, "error": "invalid_json"})
     for k in ('userId', 'schoolId'):
         if not b.get(k):
-            return {"statusCode": 400, "headers": HEADERS, "body": json.dumps({"ok": False, "error": f"Missing field: {k}"}, ensure_ascii=False)}
+            return _resp(400, {"ok": False, "error": f"Missing field: {k}"})
 
     try:
         LIKES.put_item(
-            Item={"userId": b['userId'], "schoolId": b['schoolId']},
+            Item={"userId": b['userId'], "schoolId": b['schoolId'], "createdAt": int(time.time())},
             ConditionExpression="attribute_not_exists(userId) AND attribute_not_exists(schoolId)"
         )
-        return {"statusCode": 201, "headers": HEADERS, "body": json.dumps({"ok": True}, ensure_ascii=False)}
+        return _resp(201, {"ok": True})
     except LIKES.meta.client.exceptions.ConditionalCheckFailedException:
-        return {"statusCode": 200, "headers": HEADERS, "body": json.dumps({"ok": True, "message": "already liked"}, ensure_ascii=False)}
+        return _resp(200, {"ok": True, "message": "already liked"})
     except Exception as e:
-        return {"statusCode": 500, "headers": HEADERS, "body": json.dumps({"ok": False, "error": str(e)}, ensure_ascii=False)}
-
-
+        metrics.error("likes_post failed", e)
+        return _resp(500, {"ok": False, "error": "internal_error"})
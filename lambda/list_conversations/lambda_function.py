@@ -0,0 +1,32 @@
+from naraigoto import runtime as rt, messaging, metrics
+from naraigoto.cursor import CursorError
+
+# 受信箱: GET /conversations?schoolId=...（教室）または ?familyId=...（家庭）&unread=1&limit=&cursor=
+# conversations の要約列（最後のメッセージ・未読数）を1クエリで読む（会話ごとに messages を数えない）。PG_DSN が必要
+DEFAULT_LIMIT = 20
+
+HEADERS = rt.cors_headers("GET,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+@rt.http_handler(HEADERS)
+def lambda_handler(event, _):
+    q = event.get("queryStringParameters") or {}
+    if not isinstance(q, dict):
+        q = {}
+    side = "school" if q.get("schoolId") else "family" if q.get("familyId") else None
+    if side is None:
+        return _resp(400, {"error": "schoolId or familyId required"})
+    try:
+        limit = int(q.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    try:
+        items, next_cursor = messaging.inbox(side, q[f"{side}Id"], limit, q.get("cursor"),
+                                             (q.get("unread") or "").lower() in ("1", "true"))
+    except (ValueError, CursorError) as e:
+        return _resp(400, {"error": str(e)})
+    except Exception as e:
+        metrics.error("list_conversations failed", e)
+        return _resp(500, {"error": "internal_error"})
+
+    return _resp(200, {"items": items, "nextCursor": next_cursor})
@@ -1,49 +1,47 @@
-import os, json
-import boto3
-from decimal import Decimal
+import os
+from naraigoto import runtime as rt, catalog
+from naraigoto.cursor import CursorError
 
-dynamodb = boto3.resource("dynamodb")
-LESSONS = dynamodb.Table(os.getenv("LESSONS_TABLE", "Lessons"))
+# 一覧は LessonsCatalog（Read Model）の GSI Query で返す（Scan しない）
+CATALOG = rt.table(os.getenv("CATALOG_TABLE", "LessonsCatalog"))
+DEFAULT_LIMIT = 20
+MAX_PAGE = 20  # page 番号指定で辿る上限（それ以上は cursor を使う）
 
-HEADERS = {
-    "Content-Type": "application/json; charset=utf-8",
-    "Access-Control-Allow-Origin": "*",
-    "Access-Control-Allow-Headers": "content-type,authorization,x-api-key",
-    "Access-Control-Allow-Methods": "GET,OPTIONS"
-}
+HEADERS = rt.cors_headers("GET,OPTIONS")
+_resp = rt.responder(HEADERS)
 
-def _decimal_to_native(obj):
-    if isinstance(obj, list):
-        return [_decimal_to_native(x) for x in obj]
-    if isinstance(obj, dict):
-        return {k: _decimal_to_native(v) for k, v in obj.items()}
-    if isinstance(obj, Decimal):
-        return int(obj) if obj % 1 == 0 else float(obj)
-    return obj
-
-def _resp(code, body):
-    return {
-        "statusCode": code,
-        "headers": HEADERS,
-        "body": json.dumps(_decimal_to_native(body), ensure_ascii=False)
-    }
+def _int(v, default):
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return default
 
+@rt.http_handler(HEADERS)
 def lambda_handler(event, _):
-    method = (event.get("requestContext") or {}).get("http", {}).get("method", "GET").upper()
-    if method == "OPTIONS":
-        return {"statusCode": 204, "headers": HEADERS, "body": ""}
-
-    resp = LESSONS.scan(Limit=50)
-    items = resp.get("Items", [])
-
-    fixed = []
-    for x in items:
-        if "lessonsId" in x and "lessonId" not in x:
-            x["lessonId"] = x["lessonsId"]
-            del x["lessonsId"]
-        fixed.append(x)
-
-    return _resp(200, fixed)
-
-
-
+    q = event.get("queryStringParameters") or {}
+    if not isinstance(q, dict):
+        q = {}
+    limit = max(1, min(_int(q.get("limit"), DEFAULT_LIMIT), catalog.MAX_LIMIT))
+    page = max(1, _int(q.get("page"), 1))
+    opts = {
+        "area": q.get("area") or None,
+        "category": q.get("category") or q.get("genre") or None,
+        "sort": q.get("sort") or catalog.DEFAULT_SORT,
+        "keyword": (q.get("keyword") or "").strip() or None,
+    }
+    if opts["sort"] not in catalog.SORT_KEYS:
+        return _resp(400, {"error": f"sort must be one of {', '.join(catalog.SORT_KEYS)}"})
+
+    token = q.get("cursor")
+    try:
+        if not token and page > 1:
+            if page > MAX_PAGE:
+                return _resp(400, {"error": f"page must be <= {MAX_PAGE} (use cursor)"})
+            token, exhausted = catalog.skip_pages(CATALOG, page, limit, **opts)
+            if exhausted:
+                return _resp(200, {"items": [], "nextCursor": None, "pagination": {"page": page, "limit": limit}})
+        items, next_cursor, _ = catalog.query_page(CATALOG, limit=limit, cursor_token=token, **opts)
+    except CursorError as e:
+        return _resp(400, {"error": str(e)})
+
+    return _resp(200, {"items": items, "nextCursor": next_cursor, "pagination": {"page": page, "limit": limit}})
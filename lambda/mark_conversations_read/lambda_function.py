@@ -0,0 +1,32 @@
+from naraigoto import runtime as rt, messaging, metrics
+from naraigoto.cursor import CursorError
+
+# 既読: POST /conversations/{conversationId}/read { userId, cursor? }（cursor = 表示したメッセージの latestCursor まで）
+#       POST /conversations/read { userId, conversationIds: [...] }（受信箱の「すべて既読」。最大100件）
+# userId と反対側（家庭 ↔ 教室）の未読を1回の UPDATE で既読にする。未読数はトリガが同じトランザクションで減らす
+HEADERS = rt.cors_headers("POST,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+@rt.http_handler(HEADERS)
+def lambda_handler(event, _):
+    pp = event.get("pathParameters") or {}
+    b = rt.json_body(event)
+    if not isinstance(b, dict):
+        return _resp(400, {"ok": False, "error": "invalid_json"})
+    if not isinstance(pp, dict):
+        pp = {}
+    if not b.get("userId"):
+        return _resp(400, {"ok": False, "error": "Missing field: userId"})
+    ids = [pp["conversationId"]] if pp.get("conversationId") else b.get("conversationIds")
+    if not isinstance(ids, list):
+        return _resp(400, {"ok": False, "error": "conversationIds must be a list"})
+
+    try:
+        n = messaging.mark_read(b["userId"], ids, b.get("cursor"))
+    except (ValueError, CursorError) as e:
+        return _resp(400, {"ok": False, "error": str(e)})
+    except Exception as e:
+        metrics.error("mark_conversations_read failed", e)
+        return _resp(500, {"ok": False, "error": "internal_error"})
+
+    return _resp(200, {"ok": True, "updated": n})
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# outbox_relay: RDS の outbox → LessonsCatalog / SchoolsStats（EventBridge のスケジュールで1分ごと）
+# 複数同時に動いても SKIP LOCKED で別の行を取る。途中で落ちても次の実行で取り直す（投影は版つきで冪等）
+import os
+from naraigoto import runtime as rt, outbox, metrics
+
+# タイムアウト前にバッチを始めない余裕（ミリ秒）
+MARGIN_MS = int(os.getenv("OUTBOX_MARGIN_MS", "10000"))
+MAX_SECONDS = float(os.getenv("OUTBOX_MAX_SECONDS", "50"))
+
+def lambda_handler(event, context):
+    budget = MAX_SECONDS
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        budget = min(budget, max(0.0, (context.get_remaining_time_in_millis() - MARGIN_MS) / 1000.0))
+    try:
+        return outbox.run(rt.client(), budget)
+    except Exception as e:
+        # 取得済みの行はロールバックで outbox に戻り、次の実行で再処理される
+        metrics.error("outbox_relay failed", e)
+        raise
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# points_compaction: ポイント台帳の圧縮（EventBridge のスケジュールで10分ごと）
+# 前回以後に行がある家庭だけ、実行中のトランザクションより古い行を points_balances に畳む。
+# 途中で止まっても畳んだ家庭はそのまま正しく、次の実行が残りを畳む
+import os
+from naraigoto import points, metrics
+
+# タイムアウト前にチャンクを始めない余裕（ミリ秒）
+MARGIN_MS = int(os.getenv("POINTS_COMPACT_MARGIN_MS", "10000"))
+MAX_SECONDS = float(os.getenv("POINTS_COMPACT_MAX_SECONDS", "240"))
+
+def lambda_handler(event, context):
+    budget = MAX_SECONDS
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        budget = min(budget, max(0.0, (context.get_remaining_time_in_millis() - MARGIN_MS) / 1000.0))
+    try:
+        return points.compact(budget)
+    except Exception as e:
+        metrics.error("points_compaction failed", e)
+        raise
@@ -1,41 +1,38 @@
 # ファイル: lambda_function.py
-import json, time, uuid, os
-import boto3
+from naraigoto import runtime as rt, booking, idempotency, metrics
 
-dynamodb = boto3.resource("dynamodb")
-BOOKINGS = dynamodb.Table(os.getenv("BOOKINGS_TABLE", "Bookings"))
-HEADERS = {
-    "Content-Type": "application/json; charset=utf-8",
-    "Access-Control-Allow-Origin": "*",
-    "Access-Control-Allow-Headers": "content-type,authorization,x-api-key",
-    "Access-Control-Allow-Methods": "POST,OPTIONS"
-}
+DEFAULT_SCHEDULE = "2025-09-30T17:00:00Z"
 
+HEADERS = rt.cors_headers("POST,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+@rt.http_handler(HEADERS)
+@idempotency.idempotent("post_booking", HEADERS)
 def lambda_handler(event, _):
     try:
-        method = (event.get("requestContext") or {}).get("http", {}).get("method") or event.get("httpMethod")
-        if method and method.upper() == "OPTIONS":
-            return {"statusCode": 204, "headers": HEADERS, "body": ""}
-
-        body = json.loads(event.get("body") or "{}")
+        body = rt.json_body(event)
+        if not isinstance(body, dict):
+            return _resp(400, {"ok": False, "error": "invalid_json"})
 
         # 最低限の入力チェック（足りなければ 400）
-        for k in ("userId", "lessonId"):
-            if k not in body or not body[k]:
-                return {"statusCode": 400, "headers": HEADERS, "body": json.dumps({"ok": False, "error": f"Missing field: {k}"}, ensure_ascii=False)}
-
-        item = {
-            "bookingId": str(uuid.uuid4()),
-            "userId": body["userId"],
-            "lessonId": body["lessonId"],
-            "schedule": body.get("schedule","2025-09-30T17:00:00Z"),
-            "status": "reserved",
-            "consumedTickets": body.get("consumedTickets", 1),
-            "createdAt": int(time.time())
-        }
-        BOOKINGS.put_item(Item=item)
+        with metrics.phase("validate"):
+            missing = [k for k in ("userId", "lessonId") if k not in body or not body[k]]
+            try:
+                tickets = int(body.get("consumedTickets", 1))
+            except (TypeError, ValueError):
+                tickets = 0
+        if missing:
+            return _resp(400, {"ok": False, "error": f"Missing field: {missing[0]}"})
+        if tickets < 1:
+            return _resp(400, {"ok": False, "error": "consumedTickets must be a positive integer"})
 
-        return {"statusCode": 201, "headers": HEADERS, "body": json.dumps({"ok": True, "booking": item}, ensure_ascii=False)}
+        # 座席確保・二重予約チェック・チケット消費を1トランザクションで
+        item = booking.book(rt.client(), body["userId"], body["lessonId"],
+                            body.get("schedule") or body.get("time") or DEFAULT_SCHEDULE, tickets)
+        return _resp(201, {"ok": True, "booking": item})
 
+    except booking.BookingError as e:
+        return _resp(e.status, {"ok": False, "error": e.code})
     except Exception as e:
-        return {"statusCode": 500, "headers": HEADERS, "body": json.dumps({"ok": False, "error": str(e)}, ensure_ascii=False)}
+        metrics.error("post_booking failed", e)
+        return _resp(500, {"ok": False, "error": "internal_error"})
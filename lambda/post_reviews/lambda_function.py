@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 # post_reviews.py
-import json, os, uuid, boto3, base64, sys, traceback
+import json, uuid
 from datetime import datetime, timezone
 from decimal import Decimal, InvalidOperation
+from naraigoto import runtime as rt, idempotency, cache, reviews, metrics
 
 # --------- Helpers ---------
 PARAM_NAME   = 'lessonsId'   # 受け取り名
@@ -11,46 +12,15 @@ DDB_KEY_NAME = 'lessonsId'   # DynamoDB PK 名
 def _now_iso():
     return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
 
-def _decimal_to_native(obj):
-    """DynamoDBのDecimalをJSONに出せる型(int/float)へ再帰的に変換"""
-    if isinstance(obj, list):
-        return [_decimal_to_native(x) for x in obj]
-    if isinstance(obj, dict):
-        return {k: _decimal_to_native(v) for k, v in obj.items()}
-    if isinstance(obj, Decimal):
-        return int(obj) if obj % 1 == 0 else float(obj)
-    return obj
-
-HEADERS = {
-    "Content-Type": "application/json; charset=utf-8",
-    "Access-Control-Allow-Origin": "*",
-    "Access-Control-Allow-Methods": "OPTIONS,POST",
-    "Access-Control-Allow-Headers": "Content-Type,Authorization,x-api-key"
-}
-
-def _res(code, body, cors=True):
-    headers = HEADERS if cors else {"Content-Type": "application/json; charset=utf-8"}
+HEADERS = rt.cors_headers("OPTIONS,POST")
+
+def _res(code, body):
     try:
-        body_json = json.dumps(_decimal_to_native(body), ensure_ascii=False)
+        return rt.respond(code, body, HEADERS)
     except Exception as e:
         # 返却時に落ちないようフォールバック
-        code = 500
-        body_json = json.dumps({"error": "response_serialize_error", "message": str(e)})
-    return {"statusCode": code, "headers": headers, "body": body_json}
-
-def _parse_body(event):
-    body = event.get("body")
-    if body is None:
-        return None
-    if event.get("isBase64Encoded"):
-        try:
-            body = base64.b64decode(body).decode("utf-8")
-        except Exception:
-            return None
-    try:
-        return json.loads(body) if isinstance(body, str) else body
-    except Exception:
-        return None
+        metrics.error("post_reviews serialize failed", e)
+        return {"statusCode": 500, "headers": HEADERS, "body": json.dumps({"error": "response_serialize_error"})}
 
 def _validate(payload):
     errs = []
@@ -59,6 +29,8 @@ def _validate(payload):
     rating     = payload.get("rating")
     comment    = payload.get("comment")
     role       = payload.get("role")
+    target_type = payload.get("targetType")
+    target_id   = payload.get("targetId")
 
     if not lessons_id:
         errs.append(f"{PARAM_NAME} required")
@@ -82,44 +54,35 @@ def _validate(payload):
     if role not in ("parent", "child"):
         errs.append("role must be 'parent' or 'child'")
 
+    # 対象（教室/先生）は任意。指定時は byTarget GSI / 評価集計用に targetKey を付与
+    if target_type or target_id:
+        if target_type not in ("school", "instructor"):
+            errs.append("targetType must be 'school' or 'instructor'")
+        if not target_id:
+            errs.append("targetId required with targetType")
+
     return errs, {
         "lessons_id": lessons_id,
         "user_id": user_id,
         "rating_dec": rating_dec,
         "comment": comment.strip() if isinstance(comment, str) else comment,
-        "role": role
+        "role": role,
+        "target_type": target_type,
+        "target_id": target_id
     }
 
 # --------- Handler ---------
+@rt.http_handler(HEADERS)
+@idempotency.idempotent("post_reviews", HEADERS)
 def lambda_handler(event, _ctx):
     try:
-        # ログ（長すぎ回避のため先頭だけ）
-        try:
-            print("[post_reviews] event head:", json.dumps(event)[:2000])
-        except Exception:
-            print("[post_reviews] event logging skipped")
-
-        # 環境変数（未設定で落ちないようにここで取得）
-        parent_tbl_name = os.environ.get('PARENT_REVIEWS_TABLE')
-        child_tbl_name  = os.environ.get('CHILD_REVIEWS_TABLE')
-        if not parent_tbl_name or not child_tbl_name:
-            return _res(500, {"error": "env_missing",
-                              "message": "PARENT_REVIEWS_TABLE/CHILD_REVIEWS_TABLE not set"})
-
-        dynamodb = boto3.resource('dynamodb')
-        parent_table = dynamodb.Table(parent_tbl_name)
-        child_table  = dynamodb.Table(child_tbl_name)
-
-        # 事前フライト（必要なら）
-        method = (event.get("requestContext") or {}).get("http", {}).get("method") or event.get("httpMethod")
-        if method and method.upper() == "OPTIONS":
-            return {"statusCode": 204, "headers": HEADERS, "body": ""}
-
-        payload = _parse_body(event)
+        # イベント全体はログに出さない（計測は rt.http_handler → naraigoto.metrics の EMF）
+        payload = rt.json_body(event)
         if not payload or not isinstance(payload, dict):
             return _res(400, {"error": "invalid_json"})
 
-        errs, vals = _validate(payload)
+        with metrics.phase("validate"):
+            errs, vals = _validate(payload)
         if errs:
             return _res(400, {"error": "validation_error", "details": errs})
 
@@ -132,18 +95,27 @@ def lambda_handler(event, _ctx):
             "comment":    vals["comment"],
             "role":       vals["role"]
         }
-
-        table = parent_table if vals["role"] == "parent" else child_table
+        if vals["target_type"]:
+            item["targetType"] = vals["target_type"]
+            item["targetId"]   = vals["target_id"]
+            item["targetKey"]  = f'{vals["target_type"]}#{vals["target_id"]}'
+
+        # 書き込み先は単一 Reviews（SK: <role>#<createdAt>）。REVIEWS_LAYOUT=split の切り戻し時のみ旧テーブル
+        table_name = reviews.write_table()
+        row = reviews.to_item(item) if table_name else item
+        # Table はコンテナ内でキャッシュ済み（呼び出し毎に resource を作らない）
+        table = rt.table(table_name or reviews.legacy_table(vals["role"]))
         # 重複防止（reviewId ユニーク）
         table.put_item(
-            Item=item,
+            Item=row,
             ConditionExpression="attribute_not_exists(reviewId)"
         )
+        # 口コミ一覧のキャッシュを破棄（レッスン詳細の評価は集計後に review_stats_stream が破棄する）
+        cache.REVIEWS.invalidate(vals["lessons_id"])
 
         return _res(201, {"message": "created", "item": item})
 
     except Exception as e:
-        print("[post_reviews] EX:", e)
-        print("[post_reviews] TRACE:", "".join(traceback.format_exception(*sys.exc_info()))[:4000])
-        return _res(500, {"error": "internal_error", "message": f"{e.__class__.__name__}: {e}"})
+        metrics.error("post_reviews failed", e)
+        return _res(500, {"error": "internal_error"})
 
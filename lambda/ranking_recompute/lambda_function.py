@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+# ranking_recompute: 人気ランキングの再計算（EventBridge のスケジュールで10分ごと）
+# RankingCounters の窓内のバケットからスコアを計算し、範囲ごとの上位を Rankings に1アイテムずつ書く
+from naraigoto import runtime as rt, ranking, metrics
+
+def lambda_handler(event, _ctx):
+    try:
+        return ranking.recompute(rt.client(), k=(event or {}).get("k"))
+    except Exception as e:
+        metrics.error("ranking_recompute failed", e)
+        raise
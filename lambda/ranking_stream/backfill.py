@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""人気ランキングのバックフィル（履歴からカウンタを作り直して再計算）
+
+    python lambda/ranking_stream/backfill.py --segments 8 --dry-run
+
+保持期間（RANKING_WINDOW_DAYS + 1 日）内の Bookings（予約中のもの）・口コミ（REVIEWS_LAYOUT の読み取り元。
+移行のコピーは数えない）・Likes（createdAt のあるもの）を並列 Scan し、作成日時のバケットに数えて
+RankingCounters を絶対値で置き換え（窓に無いバケットは消す）、ranking.recompute で Rankings を書き直す。
+キャンセル済みの予約・解除済みのいいねは数えない（ストリームでは差し引く）。
+ストリーム処理と並行して実行すると、実行中に届いたイベントが二重/欠落になり得る。
+ranking_stream のイベントソースマッピングを無効化してから実行し、完了後に再開すること。
+"""
+import os, sys, json, time, argparse, threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layer", "python"))
+from naraigoto import runtime as rt, ranking, reviews, review_stats
+
+def collect(client, now, segments):
+    """保持期間内の履歴 → [(schoolId, 種類, 1, 時刻)]。(signals, 教室の分からなかった件数)"""
+    since = now - (ranking.WINDOW_DAYS + 1) * ranking.DAY
+    since_iso = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(since))
+    out, lessons, lock = [], [], threading.Lock()
+
+    def _bookings(items):
+        with lock:
+            lessons.extend((it["lessonId"], ranking.epoch(it["createdAt"]), "bookings") for it in items if it.get("lessonId"))
+
+    def _reviews(items):
+        with lock:
+            for it in items:
+                if review_stats.migrated(it):
+                    continue
+                school, at = ranking.review_school(it), ranking.epoch(it.get("createdAt"))
+                if at is None:
+                    continue
+                if school:
+                    out.append((school, "reviews", 1, at))
+                elif it.get("lessonsId"):
+                    lessons.append((it["lessonsId"], at, "reviews"))
+
+    def _likes(items):
+        with lock:
+            out.extend((it["schoolId"], "likes", 1, int(it["createdAt"])) for it in items)
+
+    ranking.parallel_scan(client, {
+        "TableName": ranking.BOOKINGS_TABLE, "FilterExpression": "#s = :r AND createdAt >= :t",
+        "ProjectionExpression": "lessonId, createdAt", "ExpressionAttributeNames": {"#s": "status"},
+        "ExpressionAttributeValues": {":r": "reserved", ":t": since}}, segments, _bookings)
+    for table in sorted({t for _, t, _ in reviews.sources()}):
+        ranking.parallel_scan(client, {
+            "TableName": table, "FilterExpression": "createdAt >= :t",
+            "ProjectionExpression": "lessonsId, targetKey, targetType, targetId, createdAt, migratedFrom",
+            "ExpressionAttributeValues": {":t": since_iso}}, segments, _reviews)
+    ranking.parallel_scan(client, {
+        "TableName": ranking.LIKES_TABLE, "FilterExpression": "createdAt >= :t",
+        "ProjectionExpression": "schoolId, createdAt", "ExpressionAttributeValues": {":t": since}}, segments, _likes)
+
+    schools = ranking.lesson_schools(client, [x[0] for x in lessons])
+    unknown = 0
+    for lesson, at, kind in lessons:
+        school = schools.get(lesson)
+        if not school:
+            unknown += 1
+            continue
+        out.append((school, kind, 1, at))
+    return out, unknown
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--segments", type=int, default=8)
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+
+    client, now = rt.client(), int(time.time())
+    signals, unknown = collect(client, now, args.segments)
+    counters = ranking.deltas(signals, now)
+    print(f"collected {len(signals)} events ({unknown} without a school), "
+          f"{len(counters)} buckets for {len({k[0] for k in counters})} schools")
+    if args.dry_run:
+        return
+    written, deleted = ranking.replace_counters(client, counters, now, args.segments)
+    print(f"counters: wrote {written}, deleted {deleted}")
+    print(json.dumps(ranking.recompute(client, now, segments=args.segments), ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# ranking_stream: Bookings / Reviews / Likes の Streams → RankingCounters（教室ごとの時間・日バケット）
+# イベントソースマッピングで ReportBatchItemFailures を有効にすること
+import time
+from naraigoto import runtime as rt, ranking, metrics
+
+def lambda_handler(event, _ctx):
+    records = event.get("Records") or []
+    try:
+        ranking.apply_records(rt.client(), records, int(time.time()))
+    except Exception as e:
+        # バッチ全体を再試行（適用済みイベントは eventID で重複排除される）
+        metrics.error("ranking_stream failed", e, records=len(records))
+        return {"batchItemFailures": [{"itemIdentifier": records[0]["dynamodb"]["SequenceNumber"]}]} if records else {}
+    return {"batchItemFailures": []}
@@ -0,0 +1,32 @@
+from naraigoto import runtime as rt, points, idempotency, metrics
+
+# ポイント引き換え: POST /points/redeem { familyId, amount, reason? }
+# points_balances の行ロックの中で残高を確かめて負の行を書く（同じ家庭の同時引き換えでも残高を超えない）。
+# Idempotency-Key ヘッダで再送を1回にできる。エラー: 409 insufficient_points / 404 not_found
+HEADERS = rt.cors_headers("POST,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+@rt.http_handler(HEADERS)
+@idempotency.idempotent("redeem_points", HEADERS)
+def lambda_handler(event, _):
+    b = rt.json_body(event)
+    if not isinstance(b, dict):
+        return _resp(400, {"ok": False, "error": "invalid_json"})
+    missing = [k for k in ("familyId", "amount") if b.get(k) in (None, "")]
+    if missing:
+        return _resp(400, {"ok": False, "error": f"Missing field: {missing[0]}"})
+    reason = b.get("reason")
+    if reason is not None and (not isinstance(reason, str) or len(reason) > 200):
+        return _resp(400, {"ok": False, "error": "reason must be a string (<=200)"})
+
+    try:
+        item, total = points.redeem(b["familyId"], b["amount"], {"reason": reason} if reason else None)
+    except ValueError as e:
+        return _resp(400, {"ok": False, "error": str(e)})
+    except points.PointsError as e:
+        return _resp(e.status, {"ok": False, "error": e.code})
+    except Exception as e:
+        metrics.error("redeem_points failed", e)
+        return _resp(500, {"ok": False, "error": "internal_error"})
+
+    return _resp(201, {"ok": True, "transaction": item, "points": total})
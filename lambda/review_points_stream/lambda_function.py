@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+# review_points_stream: Reviews の Streams → 口コミ報酬ポイント（新規の口コミ1件につき REVIEW_POINTS）
+# バッチのレコードをまとめて1文で INSERT する（reviewId の一意索引で再処理は付与しない）。
+# イベントソースマッピングで ReportBatchItemFailures を有効にし、バッチサイズは 100 程度に。PG_DSN が必要
+from naraigoto import points, metrics
+
+def lambda_handler(event, _ctx):
+    records = event.get("Records") or []
+    try:
+        r = points.award_reviews(records)
+    except Exception as e:
+        # 1文なので全体をやり直す（付与済みの口コミは ON CONFLICT で捨てられる）
+        metrics.error("review_points_stream failed", e)
+        return {"batchItemFailures": [{"itemIdentifier": records[0]["dynamodb"]["SequenceNumber"]}]}
+    metrics.emit("review_points_stream", {"ReviewRecords": len(records), "ReviewPointsAwarded": r["awarded"]})
+    return {"batchItemFailures": []}
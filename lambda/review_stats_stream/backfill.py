@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""評価集計のバックフィル（全件から再構築して上書き）
+
+    # DynamoDB のテーブルエクスポート（S3 Export, DYNAMODB_JSON 形式）から
+    python lambda/review_stats_stream/backfill.py --export ./export/Reviews
+
+    # エクスポートがない場合は並列 Scan
+    python lambda/review_stats_stream/backfill.py --scan --segments 8
+
+--scan は REVIEWS_LAYOUT の読み取り元（dual なら Reviews + 旧テーブル）を読み、
+移行ツールのコピー（migratedFrom 付き）は数えない。
+ストリーム処理と並行して実行すると、実行中に届いた口コミが二重/欠落になり得る。
+イベントソースマッピングを無効化してから実行し、完了後に再開すること。
+"""
+import os, sys, json, gzip, glob, argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layer", "python"))
+from boto3.dynamodb.types import TypeDeserializer
+from naraigoto import runtime as rt, review_stats, reviews
+
+_deser = TypeDeserializer()
+
+def _export_files(paths):
+    for p in paths:
+        if os.path.isdir(p):
+            yield from sorted(glob.glob(os.path.join(p, "**", "*.json*"), recursive=True))
+        else:
+            yield p
+
+def read_export(paths):
+    """S3 Export（1行1アイテム: {"Item": {...DynamoDB JSON...}}）を逐次読み込む"""
+    for path in _export_files(paths):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                raw = json.loads(line)
+                raw = raw.get("Item", raw)
+                item = {k: _deser.deserialize(v) for k, v in raw.items()}
+                if not review_stats.migrated(item):
+                    yield item
+
+def scan_aggregate(tables, segments):
+    """複数テーブルを Segment 並列で Scan し、セグメントごとに集計してからマージする"""
+    def _items(name, seg):
+        tbl, start = rt.table(name), None
+        params = {"Segment": seg, "TotalSegments": segments,
+                  "ProjectionExpression": "lessonsId, targetKey, targetType, targetId, rating, createdAt, migratedFrom"}
+        while True:
+            if start:
+                params["ExclusiveStartKey"] = start
+            r = tbl.scan(**params)
+            yield from (it for it in r.get("Items", []) if not review_stats.migrated(it))
+            start = r.get("LastEvaluatedKey")
+            if not start:
+                return
+
+    jobs = [(t, s) for t in tables for s in range(segments)]
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        parts = pool.map(lambda job: review_stats.aggregate(_items(*job)), jobs)
+        return review_stats.merge_aggregates(parts)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--export", nargs="+", help="エクスポートのファイル/ディレクトリ")
+    ap.add_argument("--scan", action="store_true", help="テーブルを直接 Scan する")
+    ap.add_argument("--segments", type=int, default=8)
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+    if bool(args.export) == bool(args.scan):
+        ap.error("--export か --scan のどちらか一方を指定")
+
+    if args.export:
+        acc = review_stats.aggregate(read_export(args.export))
+    else:
+        tables = sorted({table for _, table, _ in reviews.sources()})
+        acc = scan_aggregate(tables, args.segments)
+    print(f"aggregated {len(acc)} keys")
+    if args.dry_run:
+        return
+    print(json.dumps(review_stats.write_aggregates(rt.client(), acc), ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# review_stats_stream: Reviews（移行中は ParentReviews / ChildReviews も）の Streams → 評価集計
+# イベントソースマッピングで ReportBatchItemFailures を有効にすること
+from naraigoto import runtime as rt, review_stats, cache, metrics
+
+def lambda_handler(event, _ctx):
+    client = rt.client()
+    touched = set()
+    try:
+        for record in event.get("Records") or []:
+            try:
+                review_stats.apply_record(client, record)
+            except Exception as e:
+                # シャード内の順序を保つため、失敗したレコード以降を再試行させる
+                metrics.error("review_stats_stream failed", e, eventID=record.get("eventID"))
+                return {"batchItemFailures": [{"itemIdentifier": record["dynamodb"]["SequenceNumber"]}]}
+            # 重複（再処理）でも破棄する: 前回は集計の後、破棄の前に落ちたかもしれない
+            touched.update(review_stats.lesson_ids(record))
+        return {"batchItemFailures": []}
+    finally:
+        # 集計のコミット後にレッスン詳細（評価）のキャッシュを破棄（共有の2段目。CACHE_REDIS_URL）
+        for lesson_id in touched:
+            cache.LESSONS.invalidate(lesson_id)
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""旧 ParentReviews / ChildReviews → 単一 Reviews テーブルへの移行
+
+    python lambda/reviews_migration/migrate.py --segments 16 --checkpoint ./reviews-migration.json
+    python lambda/reviews_migration/migrate.py --verify
+
+テーブル × Segment ごとに並列 Scan し、role と sk="<role>#<createdAt>" を付けて
+BatchWriteItem（25件ずつ）で Reviews に書き込む。
+
+- 再開: Segment ごとの LastEvaluatedKey を、そのページの書き込み完了後にチェックポイントへ保存する。
+  中断しても同じ --checkpoint で再実行すれば続きから（やり直したページは同じ内容で上書きされるだけ）
+- スロットリング: ProvisionedThroughputExceeded 等の例外・未処理アイテムで全ワーカー共通の
+  待ち時間を倍に、成功が続けば少しずつ縮める（AIMD）
+- コピーには migratedFrom を付ける（review_stats_stream は旧テーブル側で集計済みとして数えない）
+
+手順: REVIEWS_LAYOUT=dual でデプロイ（post_reviews は Reviews へ書き、読み取りは両方をマージ）
+→ 移行 → --verify → REVIEWS_LAYOUT=single → 旧テーブルのストリーム接続を外す
+"""
+import os, sys, json, time, random, argparse, threading
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layer", "python"))
+from botocore.exceptions import ClientError
+from naraigoto import runtime as rt, reviews
+
+WRITE_CHUNK = 25
+THROTTLE_CODES = ("ProvisionedThroughputExceededException", "ThrottlingException",
+                  "RequestLimitExceeded", "InternalServerError")
+MAX_THROTTLES = 30  # 連続でこれを超えたら中断（チェックポイントから再開できる）
+
+class Throttle:
+    """全ワーカー共通の呼び出し間隔（スロットリングで倍増、成功で漸減）"""
+    def __init__(self, ceiling=5.0):
+        self.delay = 0.0
+        self.ceiling = ceiling
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        d = self.delay
+        if d:
+            time.sleep(d * random.uniform(0.5, 1.0))
+
+    def backoff(self):
+        with self._lock:
+            self.delay = min(self.ceiling, max(self.delay * 2, 0.05))
+            self.throttled += 1
+
+    def success(self):
+        with self._lock:
+            self.delay = self.delay * 0.9 if self.delay > 0.01 else 0.0
+
+    def call(self, fn, **params):
+        for _ in range(MAX_THROTTLES):
+            self.wait()
+            try:
+                r = fn(**params)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in THROTTLE_CODES:
+                    raise
+                self.backoff()
+                continue
+            self.success()
+            return r
+        raise RuntimeError(f"throttled {MAX_THROTTLES} times in a row; rerun to resume")
+
+class Checkpoint:
+    """Segment ごとの再開位置をファイルに保存する（書き込みは一時ファイル + rename）"""
+    def __init__(self, path, segments):
+        self.path = path
+        self.data = {"segments": segments, "progress": {}}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.data = json.load(f, parse_float=Decimal, parse_int=Decimal)
+            if int(self.data.get("segments")) != segments:
+                raise SystemExit(f"checkpoint was written with --segments {self.data['segments']}")
+
+    def get(self, key):
+        return dict(self.data["progress"].get(key) or {})
+
+    def save(self, key, start, copied):
+        with self._lock:
+            self.data["progress"][key] = {"start": start, "done": not start, "copied": copied}
+            if not self.path:
+                return
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(rt.dumps(self.data))
+            os.replace(tmp, self.path)
+
+def write_items(client, throttle, table, items):
+    """BatchWriteItem（25件ずつ）。未処理アイテムは待ち時間を広げて再送"""
+    for i in range(0, len(items), WRITE_CHUNK):
+        request = {table: [{"PutRequest": {"Item": it}} for it in items[i:i + WRITE_CHUNK]]}
+        for _ in range(MAX_THROTTLES):
+            r = throttle.call(client.batch_write_item, RequestItems=request)
+            request = r.get("UnprocessedItems") or {}
+            if not request:
+                break
+            throttle.backoff()
+        else:
+            raise RuntimeError("BatchWriteItem: unprocessed items remain; rerun to resume")
+
+def copy_segment(client, throttle, ckpt, source, role, seg, segments, page_size, target=None):
+    """旧テーブル1 Segment 分をコピーし、コピー件数を返す"""
+    key = f"{source}/{seg}"
+    state = ckpt.get(key)
+    copied = int(state.get("copied") or 0)
+    if state.get("done"):
+        return copied
+    start = state.get("start")
+    target = target or reviews.REVIEWS_TABLE
+    params = {"TableName": source, "Segment": seg, "TotalSegments": segments, "Limit": page_size}
+    while True:
+        if start:
+            params["ExclusiveStartKey"] = start
+        r = throttle.call(client.scan, **params)
+        items = [dict(reviews.to_item(it, role), migratedFrom=source) for it in r.get("Items", [])]
+        write_items(client, throttle, target, items)
+        copied += len(items)
+        start = r.get("LastEvaluatedKey")
+        ckpt.save(key, start, copied)
+        if not start:
+            return copied
+
+def migrate(client, segments=8, page_size=500, checkpoint=None, workers=None, target=None, throttle=None):
+    """全 Segment をコピーする: {"copied", "seconds", "throttled"}"""
+    ckpt = checkpoint if isinstance(checkpoint, Checkpoint) else Checkpoint(checkpoint, segments)
+    throttle = throttle or Throttle()
+    jobs = [(t, r, s) for r, t in ((r, reviews.legacy_table(r)) for r in reviews.ROLES) for s in range(segments)]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers or segments) as pool:
+        copied = sum(pool.map(lambda j: copy_segment(client, throttle, ckpt, j[0], j[1], j[2], segments,
+                                                     page_size, target), jobs))
+    return {"copied": copied, "seconds": round(time.perf_counter() - t0, 2), "throttled": throttle.throttled}
+
+def _count(client, table, segments, projection=None):
+    """Segment 並列 Scan で件数を数える（projection 指定時は migratedFrom ごと）"""
+    def _segment(seg):
+        counts = {}
+        params = {"TableName": table, "Segment": seg, "TotalSegments": segments}
+        if projection:
+            params["ProjectionExpression"] = projection
+        else:
+            params["Select"] = "COUNT"
+        while True:
+            r = client.scan(**params)
+            if projection:
+                for it in r.get("Items", []):
+                    k = it.get("migratedFrom") or ""
+                    counts[k] = counts.get(k, 0) + 1
+            else:
+                counts[table] = counts.get(table, 0) + r.get("Count", 0)
+            if not r.get("LastEvaluatedKey"):
+                return counts
+            params["ExclusiveStartKey"] = r["LastEvaluatedKey"]
+
+    total = {}
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        for part in pool.map(_segment, range(segments)):
+            for k, n in part.items():
+                total[k] = total.get(k, 0) + n
+    return total
+
+def verify(client, segments=8, target=None):
+    """旧テーブルの件数と、Reviews 内の migratedFrom ごとの件数を比べる"""
+    target = target or reviews.REVIEWS_TABLE
+    copies = _count(client, target, segments, projection="migratedFrom")
+    report = {"ok": True, "new": copies.get("", 0), "tables": {}}
+    for role in reviews.ROLES:
+        table = reviews.legacy_table(role)
+        n = _count(client, table, segments).get(table, 0)
+        report["tables"][table] = {"legacy": n, "copied": copies.get(table, 0)}
+        report["ok"] = report["ok"] and n == copies.get(table, 0)
+    return report
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--segments", type=int, default=8, help="テーブルごとの並列 Scan 数")
+    ap.add_argument("--page-size", type=int, default=500)
+    ap.add_argument("--checkpoint", default="reviews-migration.json")
+    ap.add_argument("--verify", action="store_true", help="件数の突き合わせのみ")
+    args = ap.parse_args()
+
+    client = rt.client()
+    if not args.verify:
+        print(json.dumps(migrate(client, args.segments, args.page_size, args.checkpoint)))
+    report = verify(client, args.segments)
+    print(json.dumps(report, ensure_ascii=False))
+    if not report["ok"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
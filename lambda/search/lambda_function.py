@@ -0,0 +1,29 @@
+from naraigoto import runtime as rt, search, metrics
+from naraigoto.cursor import CursorError
+
+# キーワード検索（教室・クラス）: PostgreSQL の 2-gram 転置索引（naraigoto.search）。PG_DSN が必要
+DEFAULT_LIMIT = 20
+
+HEADERS = rt.cors_headers("GET,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+@rt.http_handler(HEADERS)
+def lambda_handler(event, _):
+    q = event.get("queryStringParameters") or {}
+    if not isinstance(q, dict):
+        q = {}
+    try:
+        limit = int(q.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    try:
+        items, next_cursor = search.search(q.get("q") or q.get("keyword"), q.get("type") or None,
+                                           q.get("area") or None, q.get("category") or q.get("genre") or None,
+                                           limit, q.get("cursor"))
+    except (ValueError, CursorError) as e:
+        return _resp(400, {"error": str(e)})
+    except Exception as e:
+        metrics.error("search failed", e)
+        return _resp(500, {"error": "internal_error"})
+
+    return _resp(200, {"items": items, "nextCursor": next_cursor})
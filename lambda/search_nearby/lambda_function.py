@@ -0,0 +1,29 @@
+import os
+from naraigoto import runtime as rt, geo
+from naraigoto.cursor import CursorError
+
+# 近くの教室: LessonsCatalog の geohash GSI（geo / geoCategory）を Query する（Scan しない）
+CATALOG_TABLE = os.getenv("CATALOG_TABLE", "LessonsCatalog")
+DEFAULT_LIMIT = 20
+
+HEADERS = rt.cors_headers("GET,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+@rt.http_handler(HEADERS)
+def lambda_handler(event, _):
+    q = event.get("queryStringParameters") or {}
+    if not isinstance(q, dict):
+        q = {}
+    try:
+        lat, lon = float(q["lat"]), float(q["lon"])
+    except (KeyError, TypeError, ValueError):
+        return _resp(400, {"error": "lat and lon required (query)"})
+    try:
+        radius = float(q["radius"]) if q.get("radius") else None
+        limit = int(q.get("limit") or DEFAULT_LIMIT)
+        items, next_cursor = geo.nearby(lat, lon, radius, q.get("category") or q.get("genre") or None,
+                                        limit, q.get("cursor"), table=CATALOG_TABLE)
+    except (ValueError, CursorError) as e:
+        return _resp(400, {"error": str(e)})
+
+    return _resp(200, {"items": items, "nextCursor": next_cursor})
@@ -0,0 +1,29 @@
+import os
+from naraigoto import runtime as rt, search, metrics
+
+# 検索フォームの入力補完（タイトルの前方一致を優先）。PG_DSN が必要
+DEFAULT_LIMIT = 10
+MAX_AGE = int(os.getenv("HTTP_MAX_AGE", "300"))  # 打鍵ごとに呼ばれるため CloudFront でキャッシュする
+
+HEADERS = rt.cors_headers("GET,OPTIONS")
+_resp = rt.responder(HEADERS)
+_cached = rt.responder({**HEADERS, "Cache-Control": f"public, max-age={MAX_AGE}"})
+
+@rt.http_handler(HEADERS)
+def lambda_handler(event, _):
+    q = event.get("queryStringParameters") or {}
+    if not isinstance(q, dict):
+        q = {}
+    try:
+        limit = int(q.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    try:
+        suggestions = search.suggest(q.get("q"), limit)
+    except ValueError as e:
+        return _resp(400, {"error": str(e)})
+    except Exception as e:
+        metrics.error("search_suggest failed", e)
+        return _resp(500, {"error": "internal_error"})
+
+    return _cached(200, {"suggestions": suggestions})
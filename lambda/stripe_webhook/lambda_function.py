@@ -0,0 +1,32 @@
+import base64
+from naraigoto import runtime as rt, billing, metrics
+
+# Stripe Webhook の受信: POST /webhooks/stripe
+# 署名（Stripe-Signature）を確かめて webhook_events に保存し、すぐ 200 を返す（反映は stripe_webhook_worker）。
+# 同じイベントの再送は ON CONFLICT で捨てる。環境変数: STRIPE_WEBHOOK_SECRET、PG_DSN
+HEADERS = rt.cors_headers("POST,OPTIONS")
+_resp = rt.responder(HEADERS)
+
+def _raw_body(event):
+    # 署名は受け取ったバイト列そのものに対して確かめる（JSON として解析し直さない）
+    body = event.get("body") or ""
+    if event.get("isBase64Encoded"):
+        return base64.b64decode(body)
+    return body.encode("utf-8")
+
+@rt.http_handler(HEADERS)
+def lambda_handler(event, _):
+    try:
+        raw = _raw_body(event)
+        ev = billing.verify(raw, rt.header(event, "Stripe-Signature"))
+    except ValueError as e:
+        return _resp(400, {"error": str(e)})
+
+    try:
+        new = billing.ingest(ev, raw)
+    except Exception as e:
+        # 500 なら Stripe が再送する
+        metrics.error("stripe_webhook failed", e, eventId=ev.get("id"))
+        return _resp(500, {"error": "internal_error"})
+
+    return _resp(200, {"received": True, "duplicate": not new})
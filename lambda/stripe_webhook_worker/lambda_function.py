@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# stripe_webhook_worker: webhook_events の未処理分を顧客ごとに順に反映する（EventBridge のスケジュールで1分ごと）
+# 複数同時に動いても顧客単位の advisory lock で別の顧客を取る。途中で落ちた分はロールバックされ次の実行で再処理
+import os
+from naraigoto import billing, metrics
+
+# タイムアウト前にバッチを始めない余裕（ミリ秒）
+MARGIN_MS = int(os.getenv("WEBHOOK_MARGIN_MS", "10000"))
+MAX_SECONDS = float(os.getenv("WEBHOOK_MAX_SECONDS", "50"))
+
+def lambda_handler(event, context):
+    budget = MAX_SECONDS
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        budget = min(budget, max(0.0, (context.get_remaining_time_in_millis() - MARGIN_MS) / 1000.0))
+    try:
+        return billing.run(budget)
+    except Exception as e:
+        metrics.error("stripe_webhook_worker failed", e)
+        raise
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""正しさのテスト（同時実行・冪等性・クラッシュ耐性）の共通フィクスチャ
+
+DynamoDB は lambda/bench/local.py と同じく moto サーバ（AWS_ENDPOINT_URL_DYNAMODB があればそちら）、
+PostgreSQL は TEST_PG_DSN のテスト専用 DB（テストが 03_reset.sql → 01_schema.sql で作り直すので、
+消えてよい DB を指すこと）。TEST_PG_DSN が無ければ PostgreSQL のテストはスキップ。
+計測はしない（時間は lambda/bench/ のスクリプトで測る）。
+
+    python -m pytest -q
+"""
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
+import local
+
+@pytest.fixture(scope="session")
+def ddb():
+    """テーブルを作成済みの DynamoDB。naraigoto はこのフィクスチャの後で import する"""
+    pytest.importorskip("moto")
+    os.environ.setdefault("DDB_MAX_POOL_CONNECTIONS", "32")
+    local.start_dynamodb()
+    local.create_tables()
+    from naraigoto import runtime as rt
+    yield rt.client()
+    local.stop_dynamodb()
+
+@pytest.fixture(scope="session")
+def pg_dsn():
+    """テスト専用 DB の接続文字列。naraigoto.pg の接続先もここに向ける"""
+    dsn = os.getenv("TEST_PG_DSN")
+    if not dsn:
+        pytest.skip("TEST_PG_DSN is not set")
+    pytest.importorskip("psycopg")
+    from naraigoto import pg
+    pg.DSN = dsn
+    pg.POOL_SIZE = 8
+    pg.reset()
+    return dsn
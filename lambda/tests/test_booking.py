@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""予約エンジン（naraigoto.booking）: 満席への殺到で定員を超えない・キャンセルで座席とチケットが戻る"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+LESSON_ID = "L-TEST-RUSH"
+START_AT = "2025-10-04T10:00:00Z"
+TICKETS = 3
+
+@pytest.fixture
+def rush(ddb):
+    from naraigoto import runtime as rt, booking
+    users = [f"TU{i:03d}" for i in range(40)]
+    with rt.table("TicketBalances").batch_writer() as w:
+        for u in users:
+            w.put_item(Item={"userId": u, "month": booking.ticket_month(), "balance": TICKETS})
+    sched_id = booking.schedule_id(LESSON_ID, START_AT)
+    booking.init_seats(ddb, sched_id, LESSON_ID, START_AT, 5)
+    return users, sched_id
+
+def _state(users, sched_id):
+    from naraigoto import runtime as rt, booking
+    seats = rt.table("ScheduleSeats").get_item(Key={"scheduleId": sched_id, "sk": booking.SEATS_SK},
+                                               ConsistentRead=True)["Item"]
+    rows = [b for b in rt.table("Bookings").scan()["Items"]
+            if b.get("scheduleId") == sched_id and b["status"] == "reserved"]
+    balances = [rt.table("TicketBalances").get_item(Key={"userId": u, "month": booking.ticket_month()},
+                                                    ConsistentRead=True)["Item"]["balance"] for u in users]
+    return int(seats["reserved"]), rows, sum(TICKETS - int(b) for b in balances)
+
+def test_concurrent_rush_never_overbooks_and_cancel_refunds(ddb, rush):
+    from naraigoto import booking
+    users, sched_id = rush
+    # 4件に1件は同じユーザーの二重送信
+    plan = users + users[::4]
+
+    def attempt(user_id):
+        try:
+            return "ok", booking.book(ddb, user_id, LESSON_ID, START_AT, 1)
+        except booking.BookingError as e:
+            return e.code, None
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        results = list(pool.map(attempt, plan))
+    booked = [item for code, item in results if code == "ok"]
+    assert len(booked) == 5
+    assert set(Counter(code for code, _ in results)) <= {"ok", "sold_out", "already_booked"}
+
+    reserved, rows, debited = _state(users, sched_id)
+    assert reserved == 5
+    assert len(rows) == 5
+    assert max(Counter(b["userId"] for b in rows).values()) == 1
+    assert debited == 5
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda b: booking.cancel(ddb, b["bookingId"]), booked))
+    reserved, rows, debited = _state(users, sched_id)
+    assert (reserved, len(rows), debited) == (0, 0, 0)
+
+def test_cancel_twice_is_rejected(ddb, rush):
+    from naraigoto import booking
+    users, _ = rush
+    item = booking.book(ddb, users[-1], LESSON_ID, "2025-10-05T10:00:00Z", 1)
+    booking.cancel(ddb, item["bookingId"])
+    with pytest.raises(booking.BookingError) as e:
+        booking.cancel(ddb, item["bookingId"])
+    assert e.value.code == "not_reserved"
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Idempotency-Key（naraigoto.idempotency）: 同じキーの同時再送で予約は1件・チケット消費は1回"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import local
+
+USER = "U-TEST-IDEM"
+LESSON_ID = "L-TEST-IDEM"
+START_AT = "2025-10-11T10:00:00Z"
+BALANCE = 5
+KEY = {"Idempotency-Key": "test-idem-booking-retry"}
+
+@pytest.fixture(scope="module")
+def post(ddb):
+    from naraigoto import runtime as rt, booking
+    rt.table("TicketBalances").put_item(Item={"userId": USER, "month": booking.ticket_month(), "balance": BALANCE})
+    fn = local.load_handler(local.handler_path("post_booking"), alias="test_post_booking")
+
+    def _post(body, headers=KEY):
+        return fn(local.http_event("POST", "/bookings", body=body, headers=headers), None)
+    return _post
+
+BODY = {"userId": USER, "lessonId": LESSON_ID, "schedule": START_AT}
+
+def test_concurrent_replays_book_once(post):
+    from naraigoto import runtime as rt, booking
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        responses = list(pool.map(lambda _: post(BODY), range(60)))
+    # 実行中の再送は 409（in progress）、それ以外は保存済みの 201
+    assert {r["statusCode"] for r in responses} <= {201, 409}
+    created = {json.loads(r["body"])["booking"]["bookingId"] for r in responses if r["statusCode"] == 201}
+    assert len(created) == 1
+
+    rows = [b for b in rt.table("Bookings").scan()["Items"] if b["userId"] == USER]
+    balance = rt.table("TicketBalances").get_item(Key={"userId": USER, "month": booking.ticket_month()},
+                                                  ConsistentRead=True)["Item"]["balance"]
+    assert len(rows) == 1
+    assert int(balance) == BALANCE - 1
+
+    again = post(BODY)
+    assert again["statusCode"] == 201
+    assert again["headers"].get("Idempotent-Replayed") == "true"
+    assert json.loads(again["body"])["booking"]["bookingId"] in created
+
+def test_reused_key_with_other_payload_is_409(post):
+    post(BODY)
+    other = post({**BODY, "schedule": "2025-10-18T10:00:00Z"})
+    assert other["statusCode"] == 409
+    assert json.loads(other["body"])["error"] == "idempotency_key_reused"
+
+def test_without_key_runs_every_time(post):
+    r1 = post({**BODY, "schedule": "2025-10-25T10:00:00Z"}, headers={})
+    r2 = post({**BODY, "schedule": "2025-10-25T10:00:00Z"}, headers={})
+    assert r1["statusCode"] == 201
+    assert json.loads(r2["body"])["error"] == "already_booked"
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Outbox リレー（naraigoto.outbox）: 並列ワーカーが途中で落ちても、投影が RDS の最新状態と一致する"""
+import time, threading
+
+import bench_outbox as ob
+
+SCHOOLS, CLASSES, RATED, WORKERS = 50, 400, 40, 3
+
+def test_projection_matches_rds_despite_crashes(ddb, pg_dsn):
+    from naraigoto import runtime as rt, catalog, pg
+    ob.load(pg_dsn, SCHOOLS, CLASSES)
+    # 別の投影（評価・いいね数）が持つ項目。リレーに上書きされないこと
+    with rt.table("LessonsCatalog").batch_writer() as w:
+        for c in range(RATED):
+            w.put_item(Item=catalog.to_catalog_item({"lessonId": ob._id("class", c), "ratingAvg": 4, "ratingCount": 2,
+                                                     "likesCount": 5, "createdAt": "2025-01-01T00:00:00Z"}))
+
+    stats = {"events": 0, "written": 0, "stale": 0, "lag": [], "crashes": 0, "writes": 0}
+    lock, stop = threading.Lock(), threading.Event()
+    relays = [threading.Thread(target=ob.relay, args=(i, stop, 0.3, 50, stats, lock)) for i in range(WORKERS)]
+    writer = threading.Thread(target=ob.writer, args=(stop, SCHOOLS, CLASSES, stats))
+    for t in relays + [writer]:
+        t.start()
+    time.sleep(3)
+    stop.set()
+    writer.join()
+    for t in relays:
+        t.join()
+
+    assert stats["crashes"] > 0 and stats["writes"] > 0
+    _, _, _, bad, pending = ob.verify(ddb, SCHOOLS)
+    assert pending == 0
+    assert bad == 0
+    alive = {str(r["id"]) for r in pg.fetch_all("SELECT id FROM classes WHERE id = ANY(%s::uuid[])",
+                                                ([ob._id("class", c) for c in range(RATED)],))}
+    for lesson_id in alive:
+        assert rt.table("LessonsCatalog").get_item(Key={"lessonId": lesson_id})["Item"].get("likesCount") == 5
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""ポイント台帳（naraigoto.points）: スナップショット + 差分 = 全件 SUM、報酬の再処理は0件、同時引き換えで負にならない"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import bench_points as bp
+
+THREADS, REDEEM = 16, 30
+
+@pytest.fixture(scope="module")
+def ledger(pg_dsn):
+    from naraigoto import pg, metrics
+    metrics.set_sink(lambda record: None)
+    heavy, racer = bp.seed(pg_dsn, 5000, 20)
+    pg.reset()
+    pg.POOL_SIZE = THREADS + 4
+    return heavy, racer
+
+def _full(family_id):
+    from naraigoto import pg
+    return pg.fetch_one(bp.FULL_SUM, (family_id,))["points"]
+
+def test_balance_equals_full_sum_around_compaction(ledger):
+    from naraigoto import pg, points
+    heavy, _ = ledger
+    assert points.balance(heavy) == _full(heavy)
+    assert points.compact(3600)["complete"]
+    assert points.balance(heavy) == _full(heavy)
+    pg.many("INSERT INTO points_transactions (family_id, type, amount) VALUES (%s, 'referral', %s)",
+            [(heavy, 10) for _ in range(50)])
+    assert points.balance(heavy) == _full(heavy)
+
+def test_replayed_review_batch_awards_nothing(ledger):
+    from naraigoto import points
+    batch = [bp._record(f"trv-{i}", bp._id("parent", 2 + i % 20), i) for i in range(40)]
+    assert points.award_reviews(batch)["awarded"] == 40
+    assert points.award_reviews(batch)["awarded"] == 0
+
+def _redeem_all(family_id, attempts):
+    from naraigoto import points
+    outcome, lock = {"ok": 0, "insufficient_points": 0}, threading.Lock()
+
+    def _redeem(_):
+        try:
+            points.redeem(family_id, REDEEM)
+            key = "ok"
+        except points.PointsError as e:
+            key = e.code
+        with lock:
+            outcome[key] = outcome.get(key, 0) + 1
+
+    with ThreadPoolExecutor(THREADS) as ex:
+        list(ex.map(_redeem, range(attempts)))
+    return outcome
+
+def test_concurrent_redeems_never_overdraw(ledger):
+    from naraigoto import points
+    _, racer = ledger
+    start = points.balance(racer)
+    points.award(racer, "referral", 1000)
+    total = start + 1000
+    outcome = _redeem_all(racer, THREADS * 4)
+    assert set(outcome) == {"ok", "insufficient_points"}
+    assert outcome["ok"] == total // REDEEM
+    assert points.balance(racer) == total - outcome["ok"] * REDEEM == _full(racer)
+
+def test_redeems_with_awards_and_compaction_match_ledger(ledger):
+    from naraigoto import points
+    _, racer = ledger
+    before = points.balance(racer)
+    stop, awarded = threading.Event(), [0]
+
+    def _awarder():
+        while not stop.is_set():
+            points.award(racer, "referral", 7)
+            awarded[0] += 7
+
+    def _compactor():
+        while not stop.is_set():
+            points.compact(5)
+
+    helpers = [threading.Thread(target=_awarder), threading.Thread(target=_compactor)]
+    for t in helpers:
+        t.start()
+    try:
+        outcome = _redeem_all(racer, THREADS * 8)
+    finally:
+        stop.set()
+        for t in helpers:
+            t.join()
+    points.compact(60)
+    left = points.balance(racer)
+    assert left >= 0
+    assert left == _full(racer) == before + awarded[0] - outcome["ok"] * REDEEM
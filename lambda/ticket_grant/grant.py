@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""月次チケット付与の手動実行・ドライラン
+
+    python lambda/ticket_grant/grant.py --month 2026-11 --dry-run
+    python lambda/ticket_grant/grant.py --month 2026-11 --workers 8
+
+--dry-run は付与せずに、付与される家庭数・新規行・追加枚数と先頭のサンプルを出す。
+付与は ticket_balances.granted との差分だけなので、Lambda（ticket_grant）と同時に動かしても、
+中断して同じコマンドで再実行しても二重には付与しない（--restart は進捗を消して最初から数え直す）。
+"""
+import os, sys, json, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layer", "python"))
+from naraigoto import pg, grants
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--month", help="YYYY-MM（既定は今月。UTC）")
+    ap.add_argument("--segments", type=int, default=grants.SEGMENTS)
+    ap.add_argument("--workers", type=int, default=grants.WORKERS)
+    ap.add_argument("--chunk", type=int, default=grants.CHUNK)
+    ap.add_argument("--max-seconds", type=float, default=3600)
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--restart", action="store_true")
+    args = ap.parse_args()
+
+    pg.POOL_SIZE = max(pg.POOL_SIZE, args.workers)
+    if args.dry_run:
+        print(json.dumps(grants.diff(args.month, args.segments, args.workers, args.chunk), ensure_ascii=False,
+                         indent=2))
+        return
+    if args.restart:
+        grants.restart(args.month)
+    print(json.dumps(grants.run(args.month, args.max_seconds, args.workers, args.segments, args.chunk)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# ticket_grant: 月次チケット付与（EventBridge のスケジュール。毎月1日 00:05 UTC から10分ごと、その日のうちに何度でも）
+# 1回で終わらなければ次の実行が ticket_grant_progress の続きから進める（終わった月は何もしない）。
+# イベントの {"month": "YYYY-MM"} で月を指定できる（既定は今月。UTC）
+import os
+from naraigoto import grants, metrics
+
+# タイムアウト前にチャンクを始めない余裕（ミリ秒）
+MARGIN_MS = int(os.getenv("GRANT_MARGIN_MS", "30000"))
+MAX_SECONDS = float(os.getenv("GRANT_MAX_SECONDS", "840"))
+
+def lambda_handler(event, context):
+    budget = MAX_SECONDS
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        budget = min(budget, max(0.0, (context.get_remaining_time_in_millis() - MARGIN_MS) / 1000.0))
+    try:
+        return grants.run((event or {}).get("month"), budget)
+    except Exception as e:
+        # コミット済みのチャンクは進捗に残り、途中のチャンクはロールバックされて次の実行でやり直す
+        metrics.error("ticket_grant failed", e)
+        raise
@@ -218,12 +218,17 @@
       var $wrap = $('#reviews').empty();
       try{
         var data = await apiGet('/reviews', { lessonsId: lessonId });
-        var parents = (data && data.parents) || [];
-        var children = (data && data.children) || [];
         var rows = [];
   
-        parents.forEach(function(r){ rows.push({ who:'保護者', rating:r.rating, comment:r.comment, userId:r.userId }); });
-        children.forEach(function(r){ rows.push({ who:'子ども', rating:r.rating, comment:r.comment, userId:r.userId }); });
+        if (data && Array.isArray(data.items)){
+          // 新しい順にマージ済み（role: parent|child）
+          data.items.forEach(function(r){ rows.push({ who:(r.role==='child' ? '子ども' : '保護者'), rating:r.rating, comment:r.comment, userId:r.userId }); });
+        } else {
+          var parents = (data && data.parents) || [];
+          var children = (data && data.children) || [];
+          parents.forEach(function(r){ rows.push({ who:'保護者', rating:r.rating, comment:r.comment, userId:r.userId }); });
+          children.forEach(function(r){ rows.push({ who:'子ども', rating:r.rating, comment:r.comment, userId:r.userId }); });
+        }
   
         if(rows.length===0){
           $wrap.append($('<div>').addClass('muted').text('まだ口コミがありません。'));